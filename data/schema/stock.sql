@@ -9,6 +9,28 @@ CREATE TABLE IF NOT EXISTS stocks (
 CREATE INDEX IF NOT EXISTS idx_stocks_board_is_st
     ON stocks(board, is_st);
 
+-- 沪深北股票目录，由 stock/directory.py 定期从 akshare 刷新；pinyin_initials 为简称拼音首字母
+CREATE TABLE IF NOT EXISTS stock_directory (
+    code TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    full_name TEXT,
+    exchange TEXT NOT NULL,
+    pinyin_initials TEXT NOT NULL DEFAULT '',
+    updated_at TEXT NOT NULL
+);
+
+-- 股票到图谱 Company 节点的映射，由 stock/company_mapping.py 在图谱导入后批量重算；
+-- name_key 为解析时所用名称的 normalize_company_name，company_id 为空表示图谱中没有该公司
+CREATE TABLE IF NOT EXISTS stock_company_map (
+    code TEXT PRIMARY KEY,
+    name_key TEXT NOT NULL,
+    full_name_key TEXT NOT NULL DEFAULT '',
+    company_id TEXT,
+    company_name TEXT,
+    match_type TEXT NOT NULL,
+    resolved_at TEXT NOT NULL
+);
+
 CREATE TABLE IF NOT EXISTS latest_market_value (
     code TEXT PRIMARY KEY,
     trade_date TEXT NOT NULL,
@@ -35,32 +57,83 @@ CREATE INDEX IF NOT EXISTS idx_daily_bars_code_date
 CREATE INDEX IF NOT EXISTS idx_daily_bars_trade_date
     ON daily_bars(trade_date DESC);
 
-CREATE TABLE IF NOT EXISTS intraday_bars (
+-- 每只股票日线的覆盖元数据，由日线写入维护；first_close 作为前复权基准签名，
+-- fetched_from 表示从该日起的历史已完整拉取过（上市晚于该日的股票 first_date 会更晚）
+CREATE TABLE IF NOT EXISTS daily_bar_coverage (
+    code TEXT PRIMARY KEY,
+    first_date TEXT NOT NULL,
+    first_close REAL,
+    last_date TEXT NOT NULL,
+    last_close REAL,
+    fetched_from TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    FOREIGN KEY (code) REFERENCES stocks(code)
+);
+
+CREATE TABLE IF NOT EXISTS trade_calendar (
+    trade_date TEXT PRIMARY KEY
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS latest_daily (
+    code TEXT PRIMARY KEY,
+    trade_date TEXT NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume REAL,
+    previous_close REAL,
+    FOREIGN KEY (code) REFERENCES stocks(code)
+);
+
+CREATE INDEX IF NOT EXISTS idx_latest_daily_trade_date
+    ON latest_daily(trade_date);
+
+-- 分钟线按月分区为 intraday_bars_YYYYMM（见 stock/intraday_store.py），过期分钟压缩到日度聚合
+CREATE TABLE IF NOT EXISTS intraday_daily_aggregates (
     code TEXT NOT NULL,
     trade_date TEXT NOT NULL,
-    trade_time TEXT NOT NULL,
-    trade_timestamp TEXT NOT NULL,
     open REAL,
     close REAL,
     high REAL,
     low REAL,
-    avg_price REAL,
     volume REAL,
     amount REAL,
-    change_pct REAL,
-    change_amount REAL,
-    PRIMARY KEY (code, trade_timestamp),
-    FOREIGN KEY (code) REFERENCES stocks(code)
+    vwap REAL,
+    minute_count INTEGER NOT NULL,
+    PRIMARY KEY (code, trade_date)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS intraday_macd_minutes (
+    code TEXT NOT NULL,
+    trade_date TEXT NOT NULL,
+    trade_time TEXT NOT NULL,
+    vwap REAL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    dif REAL,
+    dea REAL,
+    bar REAL,
+    phase TEXT,
+    PRIMARY KEY (code, trade_date, trade_time)
 );
 
-CREATE INDEX IF NOT EXISTS idx_intraday_bars_code_date_time
-    ON intraday_bars(code, trade_date DESC, trade_timestamp DESC);
+-- 盘中 MACD 状态检查点：每只股票一行，终端监控与流水线各自只覆盖自己监控的股票
+CREATE TABLE IF NOT EXISTS macd_code_checkpoints (
+    trade_date TEXT NOT NULL,
+    code TEXT NOT NULL,
+    saved_at TEXT NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (trade_date, code)
+) WITHOUT ROWID;
 
 CREATE TABLE IF NOT EXISTS daily_price_distributions (
     code TEXT NOT NULL,
     trade_date TEXT NOT NULL,
-    buy_sell_bins_json TEXT NOT NULL,
-    price_histogram_json TEXT NOT NULL,
+    bin_count INTEGER NOT NULL,
+    bins BLOB NOT NULL,
     PRIMARY KEY (code, trade_date),
     FOREIGN KEY (code) REFERENCES stocks(code)
 );
@@ -68,6 +141,13 @@ CREATE TABLE IF NOT EXISTS daily_price_distributions (
 CREATE INDEX IF NOT EXISTS idx_daily_price_distributions_code_date
     ON daily_price_distributions(code, trade_date DESC);
 
+-- 每只股票的同步代数，同步写入后 +1，用于让各进程的前端载荷缓存失效
+CREATE TABLE IF NOT EXISTS payload_generations (
+    code TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL,
+    updated_at TEXT NOT NULL
+);
+
 CREATE TABLE IF NOT EXISTS indicator_snapshots (
     run_date TEXT NOT NULL,
     code TEXT NOT NULL,
@@ -91,6 +171,15 @@ CREATE TABLE IF NOT EXISTS indicator_snapshots (
 CREATE INDEX IF NOT EXISTS idx_indicator_snapshots_run_date_score
     ON indicator_snapshots(run_date, score DESC, code ASC);
 
+CREATE TABLE IF NOT EXISTS indicator_state (
+    code TEXT PRIMARY KEY,
+    last_trade_date TEXT NOT NULL,
+    bar_count INTEGER NOT NULL,
+    window_blob BLOB NOT NULL,
+    updated_at TEXT NOT NULL,
+    FOREIGN KEY (code) REFERENCES stocks(code)
+);
+
 CREATE TABLE IF NOT EXISTS review_runs (
     review_date TEXT PRIMARY KEY,
     started_at TEXT NOT NULL,
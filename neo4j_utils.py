@@ -601,6 +601,16 @@ if __name__ == "__main__":
 
     if imported:
         print("数据导入完成！")
+        # 图谱节点有变化，重新计算股票到公司节点的映射
+        from stock.company_mapping import MATCH_CONTAINS, MATCH_EXACT, MATCH_NONE, rebuild_company_mapping
+        try:
+            summary = rebuild_company_mapping(neo4j_manager.graph)
+            print(
+                f"股票公司映射已更新: 精确 {summary[MATCH_EXACT]}，"
+                f"模糊 {summary[MATCH_CONTAINS]}，未匹配 {summary[MATCH_NONE]}"
+            )
+        except RuntimeError as exc:
+            print(f"跳过股票公司映射: {exc}")
     print("\n【如何在网页端查看数据】")
     print("1. 启动 Neo4j Desktop 或 Neo4j 服务，确保数据库已运行。")
     print("2. 在浏览器访问：http://localhost:7474/")
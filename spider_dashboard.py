@@ -18,6 +18,7 @@ from datetime import datetime
 from base_spider import ThreadSafeUniqueQueue, base_spider
 from qxb.spider import QXBSpider
 from tyc.spider import TYCSpider
+from tyc.keyword_queue import keyword_queue, start_keyword_pipeline
 
 app = flask.Flask(__name__)
 app.config['DEBUG'] = True
@@ -77,41 +78,17 @@ def validate_keywords_file(file_obj):
     return True, None
 
 
-def get_keywords_list(
-    keywords_file=None, 
-    keywords_direc=None,
-    keywords_finished_fn=None
-):
+def get_keywords_list():
     """
-    获取当前的关键词列表
+    获取当前的关键词统计
 
-    如果没有指定文件名，则从文件夹下全部读取，拼接返回
+    直接读取进度库中由触发器维护的计数，不再逐个打开关键词文件和已完成文件
     
     Returns:
-        dict: 关键词信息
+        tuple: (已完成关键词数, 关键词总数)
     """
-    if keywords_file:
-        keywords_files = [keywords_file]
-    else:
-        keywords_files = []
-        if keywords_direc:
-            for filename in os.listdir(keywords_direc):
-                fn = os.path.join(keywords_direc, filename)
-                if fn != keywords_finished_fn:
-                    keywords_files.append(fn)
-    
-    finished_keywords = set()
-    if keywords_finished_fn and os.path.exists(keywords_finished_fn):
-        with open(keywords_finished_fn, 'r', encoding='utf-8') as f:
-            finished_keywords = set([line.strip() for line in f if line.strip()])
-            
-    keywords = set()
-    for keywords_file in keywords_files:
-        with open(keywords_file, 'r', encoding='utf-8') as f:
-            file_keywords = [line.strip() for line in f if line.strip()]
-            keywords.update(file_keywords)
-    
-    return len(finished_keywords), len(keywords)
+    stats = keyword_queue.stats()
+    return stats["finished"], stats["total"]
       
 
 @app.route('/')
@@ -344,11 +321,11 @@ def tyc_keywords():
             
             file.save(keywords_file)
             
-            # 返回成功信息
-            _, keywords_cnt = get_keywords_list(keywords_file)
+            # 写入关键词队列，搜索线程立即开始处理
+            keywords_cnt, added_cnt = keyword_queue.enqueue_file(keywords_file)
             return flask.jsonify({
                 "success": True,
-                "message": f"成功上传 {keywords_cnt} 个关键词",
+                "message": f"成功上传 {keywords_cnt} 个关键词，新增待搜索 {added_cnt} 个",
             })
         
         except Exception as e:
@@ -631,66 +608,6 @@ def tyc_stats():
         return f"<h1>❌ 错误</h1><p>获取统计信息失败: {e}</p><a href='/tyc/keywords'>返回</a>", 500
 
 
-# 启动后台线程：定时扫描配置中的 `keywords_direc`，处理新上传的关键词文件
-def _tyc_kw_watcher(poll_interval=10):
-    watcher_spider = TYCSpider(tyc_id_collect_queue)
-    kw_dir_rel = watcher_spider.s_cfg.get("keywords_direc", "./data/tyc_keywords/")
-    kw_dir = os.path.abspath(os.path.join(cur_dir, kw_dir_rel))
-    os.makedirs(kw_dir, exist_ok=True)
-
-    finished_file = watcher_spider.s_cfg.get("keywords_finised_fn", os.path.join(kw_dir, "keywords_finished.txt"))
-    if not os.path.exists(finished_file):
-        open(finished_file, 'a', encoding='utf-8').close()
-
-    def _load_finished():
-        try:
-            with open(finished_file, 'r', encoding='utf-8') as f:
-                return set([l.strip() for l in f if l.strip()])
-        except Exception:
-            return set()
-
-    while True:
-        finished = _load_finished()
-        for fn in os.listdir(kw_dir):
-            if fn == os.path.basename(finished_file):
-                continue
-            if fn.startswith('.'): # 避开重命名为.processed开头，也避开.finished开头
-                continue
-            path = os.path.join(kw_dir, fn)
-            if not os.path.isfile(path):
-                continue
-
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    kws = [ln.strip() for ln in f if ln.strip()]
-            except Exception:
-                watcher_spider.logger.exception(f"读取关键词文件失败: {path}")
-                continue
-
-            for kw in kws:
-                if kw in finished:
-                    continue
-
-                try:
-                    result = watcher_spider.search_companies(kw, max_page=2, save_to_file=True)
-
-                    with open(finished_file, 'a', encoding='utf-8') as ff:
-                        ff.write(kw + '\n')
-                    finished.add(kw)
-                except Exception:
-                    watcher_spider.logger.exception(f"Watcher 搜索失败: {kw}")
-
-            # 尝试将已处理的文件重命名，避免再次扫描同一上传文件
-            try:
-                processed_fn = ".processed" + fn
-                processed_path = os.path.join(kw_dir, processed_fn)
-                if not os.path.exists(processed_path):
-                    os.rename(path, processed_path)
-            except Exception:
-                watcher_spider.logger.debug(f"无法重命名文件: {path}")
-            
-        time.sleep(poll_interval)
-
 # 启动后台线程：定时爬取对外投资和股东
 def _tyc_id_watcher(poll_interval=60):
     watcher_spider = TYCSpider(tyc_id_collect_queue)
@@ -726,9 +643,8 @@ if __name__ == "__main__":
     # 避免 Flask debug 模式下 Reloader 导致的双重进程并发：
     # 只有在确认为 Werkzeug 的工作子进程（WERKZEUG_RUN_MAIN），或者非 debug 模式下，才启动后台监控。
     if os.environ.get("WERKZEUG_RUN_MAIN") == "true" or not app.debug:
-        watcher_thread = threading.Thread(target=_tyc_kw_watcher, args=(10,), daemon=True)
-        watcher_thread.start()
-        print("关键词监控已启动（后台线程）")
+        start_keyword_pipeline(lambda: TYCSpider(tyc_id_collect_queue), tyc_spider_instance.s_cfg)
+        print("关键词队列已启动（后台线程）")
 
         watcher_thread = threading.Thread(target=_tyc_id_watcher, args=(10,), daemon=True)
         watcher_thread.start()
@@ -14,6 +14,7 @@
     --initial-capital: 组合回测初始资金
     --position-size: 单笔固定仓位
     --max-positions: 最大同时持仓数
+    --workers: 信号扫描进程数，0 表示按 CPU 核数自动选择，1 表示单进程
 
 用法：
     - 回测指定时间段：
@@ -34,10 +35,14 @@
 from __future__ import annotations
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import timedelta
+import os
 from pathlib import Path
 import sqlite3
+import tempfile
 
+import numpy as np
 import pandas as pd
 
 try:
@@ -51,11 +56,14 @@ try:
     )
     from review_common import (
         ALLOWED_BOARDS,
+        KLINE_COLUMNS,
         MAX_FLOAT_MV,
         MIN_DAILY_AMOUNT,
         MIN_FLOAT_MV,
         REVIEW_DIR,
         get_db_connection,
+        load_market_trade_dates,
+        load_qfq_bars_batch,
         parse_review_date,
         to_csv_rows,
     )
@@ -70,11 +78,14 @@ except ImportError:
     )
     from .review_common import (
         ALLOWED_BOARDS,
+        KLINE_COLUMNS,
         MAX_FLOAT_MV,
         MIN_DAILY_AMOUNT,
         MIN_FLOAT_MV,
         REVIEW_DIR,
         get_db_connection,
+        load_market_trade_dates,
+        load_qfq_bars_batch,
         parse_review_date,
         to_csv_rows,
     )
@@ -85,6 +96,7 @@ STOP_LOSS_RATIO = 0.10
 TRAILING_PROFIT_ACTIVATION = 0.10
 TRAILING_PROFIT_DRAWDOWN = 0.30
 TAKE_PROFIT_COOLDOWN_DAYS = 30
+TAKE_PROFIT_EXIT_REASONS = ("break_ma20", "trailing_profit")
 DEFAULT_INITIAL_CAPITAL = 100000.0
 DEFAULT_POSITION_SIZE = 10000.0
 DEFAULT_MAX_POSITIONS = 10
@@ -92,6 +104,9 @@ MIN_BACKTEST_HISTORY_ROWS = 20
 STRATEGY_FILTER_ALL = "all"
 STRATEGY_FILTER_CHOICES = (STRATEGY_FILTER_ALL, STRATEGY_TREND_INIT, STRATEGY_BREAKOUT_ACCEL)
 DEFAULT_STRATEGY_FILTER = STRATEGY_FILTER_ALL
+DEFAULT_SCAN_WORKERS = 0
+SCAN_CHUNKS_PER_WORKER = 4
+SCAN_COLUMNS = ("open", "high", "low", "close", "volume", "ma5", "ma10", "ma20", "ma60", "rsi")
 
 
 class MarketDataCache:
@@ -134,6 +149,7 @@ class MarketDataCache:
 
         print("=> Indexing memory slices...", flush=True)
         self.code_dfs = {code: group.reset_index(drop=True) for code, group in df.groupby("code")}
+        self.code_dates = {code: np.asarray(group["date"], dtype="U10") for code, group in self.code_dfs.items()}
         
         all_dates = list(df['date'].unique())
         all_dates.sort()
@@ -144,45 +160,159 @@ class MarketDataCache:
             if end_trade_date and d > end_trade_date:
                 continue
             self.review_dates.append(str(d))
-            
+
+    def export_columnar(self, directory: str | Path) -> Path:
+        """把各股票的日线与指标拼接成连续列写成 .npy，供扫描子进程以 memmap 只读共享。"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        codes = list(self.code_dfs.keys())
+        lengths = [len(self.code_dfs[code]) for code in codes]
+        offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths, dtype=np.int64)
+        np.save(directory / "codes.npy", np.asarray(codes, dtype="U16"))
+        np.save(directory / "offsets.npy", offsets)
+        np.save(directory / "dates.npy", np.concatenate([self.code_dates[code] for code in codes]) if codes else np.asarray([], dtype="U10"))
+        for column in SCAN_COLUMNS:
+            values = [self.code_dfs[code][column].to_numpy(dtype=np.float64) for code in codes]
+            np.save(directory / f"{column}.npy", np.concatenate(values) if values else np.asarray([], dtype=np.float64))
+        return directory
+
     def get_future_bars(self, code: str, review_date: str) -> list[dict]:
         df = self.code_dfs.get(code)
         if df is None: return []
-        idx = df["date"].searchsorted(review_date, side="right")
-        future_df = df.iloc[idx:].copy()
-        future_df["trade_date"] = future_df["date"]
-        return future_df[["trade_date", "open", "high", "low", "close", "ma20"]].to_dict('records')
-
-    def get_close_lookup(self, codes: set[str], start_date: str, end_date: str) -> dict[tuple[str, str], float]:
-        lookup = {}
-        for code in codes:
+        dates = self.code_dates[code]
+        idx = int(dates.searchsorted(review_date, side="right"))
+        future_df = df.iloc[idx:][["open", "high", "low", "close", "ma20"]].copy()
+        future_df.insert(0, "trade_date", dates[idx:].tolist())
+        return future_df.to_dict('records')
+
+    def get_future_arrays(self, code: str, review_date: str) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """返回信号日之后的 (日期, 最低价, 收盘价, MA20) 数组切片，均为视图不复制。"""
+        df = self.code_dfs.get(code)
+        if df is None:
+            empty = np.empty(0, dtype=np.float64)
+            return np.empty(0, dtype="U10"), empty, empty, empty
+        dates = self.code_dates[code]
+        idx = int(dates.searchsorted(review_date, side="right"))
+        return (
+            dates[idx:],
+            df["low"].to_numpy(dtype=np.float64)[idx:],
+            df["close"].to_numpy(dtype=np.float64)[idx:],
+            df["ma20"].to_numpy(dtype=np.float64)[idx:],
+        )
+
+    def get_close_matrix(self, codes: list[str], trading_dates: list[str]) -> np.ndarray:
+        """按 trading_dates × codes 构建稠密收盘价矩阵，缺失处为 NaN。"""
+        date_index = np.asarray(trading_dates, dtype="U10")
+        matrix = np.full((len(trading_dates), len(codes)), np.nan, dtype=np.float64)
+        if not len(date_index):
+            return matrix
+        for column, code in enumerate(codes):
             df = self.code_dfs.get(code)
             if df is None: continue
-            subset = df[(df["date"] >= start_date) & (df["date"] <= end_date)]
-            for _, row in subset.iterrows():
-                lookup[(code, str(row["date"]))] = float(row["close"])
-        return lookup
+            dates = self.code_dates[code]
+            rows = np.searchsorted(date_index, dates)
+            matched = rows < len(date_index)
+            matched[matched] = date_index[rows[matched]] == dates[matched]
+            matrix[rows[matched], column] = df["close"].to_numpy(dtype=np.float64)[matched]
+        return matrix
 
 
-def load_backtest_dates(conn: sqlite3.Connection, start_date: str | None, end_date: str | None) -> list[str]:
-    query = """
-        SELECT DISTINCT trade_date
-        FROM daily_bars
-        WHERE 1 = 1
+class SharedMarketDataCache(MarketDataCache):
+    """扫描子进程使用的只读缓存：日线列以 memmap 方式映射 export_columnar 的输出，不复制数据。"""
+
+    def __init__(self, directory: str | Path, stock_info: dict[str, dict], review_dates: list[str]):
+        directory = Path(directory)
+        self.stock_info = stock_info
+        self.review_dates = review_dates
+        codes = np.load(directory / "codes.npy")
+        offsets = np.load(directory / "offsets.npy")
+        dates = np.load(directory / "dates.npy", mmap_mode="r")
+        columns = {column: np.load(directory / f"{column}.npy", mmap_mode="r") for column in SCAN_COLUMNS}
+        self.code_dfs = {}
+        self.code_dates = {}
+        for index, code in enumerate(codes.tolist()):
+            start, end = int(offsets[index]), int(offsets[index + 1])
+            self.code_dfs[code] = pd.DataFrame({column: values[start:end] for column, values in columns.items()}, copy=False)
+            self.code_dates[code] = dates[start:end]
+
+
+# 扫描子进程内的共享缓存，由进程池 initializer 建立
+_SCAN_CACHE: SharedMarketDataCache | None = None
+
+
+def _init_scan_worker(directory: str, stock_info: dict[str, dict], review_dates: list[str]) -> None:
+    global _SCAN_CACHE
+    _SCAN_CACHE = SharedMarketDataCache(directory, stock_info, review_dates)
+
+
+def _scan_signal_chunk(review_dates: list[str], scan_kwargs: dict) -> list[tuple[str, list[dict]]]:
+    return [(review_date, build_daily_signals_cached(_SCAN_CACHE, review_date, **scan_kwargs)) for review_date in review_dates]
+
+
+def resolve_scan_workers(workers: int, task_count: int) -> int:
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return max(1, min(workers, task_count))
+
+
+def scan_daily_signals(
+    cache: MarketDataCache,
+    review_dates: list[str],
+    top_n: int,
+    limit: int,
+    include_all_boards: bool,
+    scoring_mode: str,
+    strategy_filter: str | None = None,
+    workers: int = DEFAULT_SCAN_WORKERS,
+) -> dict[str, list[dict]]:
+    """第一阶段：逐日扫描原始信号。
+
+    每日信号只依赖当日及之前的行情，与持仓、冷却状态无关，因此可以按日期分片并行；
+    持仓与冷却过滤留在第二阶段顺序执行，保证结果与单进程完全一致。
     """
-    params: list[object] = []
-    conditions: list[str] = []
-    if start_date:
-        conditions.append("trade_date >= ?")
-        params.append(start_date)
-    if end_date:
-        conditions.append("trade_date <= ?")
-        params.append(end_date)
-    if conditions:
-        query += " AND " + " AND ".join(conditions)
-    query += " ORDER BY trade_date"
-    rows = conn.execute(query, params).fetchall()
-    return [str(row[0]) for row in rows]
+    scan_kwargs = {
+        "top_n": top_n,
+        "limit": limit,
+        "include_all_boards": include_all_boards,
+        "scoring_mode": scoring_mode,
+        "is_backtest": True,
+        "strategy_filter": strategy_filter,
+    }
+    total_dates = len(review_dates)
+    signals_by_date: dict[str, list[dict]] = {}
+    worker_count = resolve_scan_workers(workers, total_dates)
+
+    if worker_count <= 1:
+        for i, review_date in enumerate(review_dates):
+            signals_by_date[review_date] = build_daily_signals_cached(cache, review_date, **scan_kwargs)
+            print(f"\rScanning Signals [{scoring_mode}]: {i + 1}/{total_dates} {review_date}", end="", flush=True)
+        print()
+        return signals_by_date
+
+    chunk_count = min(total_dates, worker_count * SCAN_CHUNKS_PER_WORKER)
+    chunks = [list(chunk) for chunk in np.array_split(np.asarray(review_dates, dtype=object), chunk_count) if len(chunk)]
+    with tempfile.TemporaryDirectory(prefix="backtest_scan_") as shared_dir:
+        cache.export_columnar(shared_dir)
+        with ProcessPoolExecutor(
+            max_workers=worker_count,
+            initializer=_init_scan_worker,
+            initargs=(shared_dir, cache.stock_info, list(cache.review_dates)),
+        ) as executor:
+            futures = [executor.submit(_scan_signal_chunk, chunk, scan_kwargs) for chunk in chunks]
+            done_dates = 0
+            for future in as_completed(futures):
+                chunk_result = future.result()
+                for review_date, signals in chunk_result:
+                    signals_by_date[review_date] = signals
+                done_dates += len(chunk_result)
+                print(f"\rScanning Signals [{scoring_mode}] x{worker_count}: {done_dates}/{total_dates}", end="", flush=True)
+    print()
+    return signals_by_date
+
+
+def load_backtest_dates(conn: sqlite3.Connection, start_date: str | None, end_date: str | None) -> list[str]:
+    return load_market_trade_dates(conn, start_date, end_date)
 
 
 def build_daily_signals_cached(
@@ -214,14 +344,15 @@ def build_daily_signals_cached(
         if info["is_st"]:
             continue
 
-        idx = df["date"].searchsorted(review_date, side="right")
+        dates = cache.code_dates[code]
+        idx = int(dates.searchsorted(review_date, side="right"))
         if idx < MIN_BACKTEST_HISTORY_ROWS:
             continue
-            
-        current_bar = df.iloc[idx - 1]
-        if current_bar["date"] != review_date:
+        if dates[idx - 1] != review_date:
             continue
-            
+
+        current_bar = df.iloc[idx - 1]
+
         volume = float(current_bar["volume"])
         if volume < MIN_DAILY_AMOUNT:
             continue
@@ -256,30 +387,31 @@ def load_backtest_candidates(
     include_all_boards: bool,
 ) -> list[sqlite3.Row]:
     board_condition = ""
-    params: list[object] = [review_date, review_date]
+    params: list[object] = [review_date]
     if not include_all_boards:
         placeholders = ",".join("?" for _ in ALLOWED_BOARDS)
         board_condition = f"AND s.board IN ({placeholders})"
         params.extend(ALLOWED_BOARDS)
 
     query = f"""
-        WITH day_bars AS (
+        WITH latest_day_bars AS (
             SELECT
-                code,
-                trade_date,
-                open,
-                high,
-                low,
-                close,
-                volume,
-                LAG(close) OVER (PARTITION BY code ORDER BY trade_date) AS previous_close_calc
-            FROM daily_bars
-            WHERE trade_date <= ?
-        ),
-        latest_day_bars AS (
-            SELECT *
-            FROM day_bars
-            WHERE trade_date = ?
+                d.code,
+                d.trade_date,
+                d.open,
+                d.high,
+                d.low,
+                d.close,
+                d.volume,
+                (
+                    SELECT p.close
+                    FROM daily_bars p
+                    WHERE p.code = d.code AND p.trade_date < d.trade_date
+                    ORDER BY p.trade_date DESC
+                    LIMIT 1
+                ) AS previous_close_calc
+            FROM daily_bars d
+            WHERE d.trade_date = ?
         )
         SELECT
             s.code,
@@ -336,16 +468,8 @@ def load_qfq_bars_as_of(
     review_date: str,
     required_rows: int = LOOKBACK_DAYS + 80,
 ) -> pd.DataFrame:
-    query = """
-        SELECT trade_date AS date, open, high, low, close, volume, volume AS amount
-        FROM daily_bars
-        WHERE code = ? AND trade_date <= ?
-        ORDER BY trade_date
-    """
-    df = pd.read_sql_query(query, conn, params=[code, review_date])
-    if df.empty:
-        return df
-    return df.tail(required_rows)
+    kline = load_qfq_bars_batch(conn, [code], required_rows, review_date).get(code)
+    return kline if kline is not None else pd.DataFrame(columns=KLINE_COLUMNS)
 
 
 def build_daily_signals(
@@ -361,10 +485,11 @@ def build_daily_signals(
     if limit > 0:
         candidates = candidates[:limit]
 
+    klines = load_qfq_bars_batch(conn, [row["code"] for row in candidates], LOOKBACK_DAYS + 80, review_date)
     results: list[dict] = []
     for row in candidates:
-        kline = load_qfq_bars_as_of(conn, row["code"], review_date)
-        if kline.empty or len(kline) < MIN_BACKTEST_HISTORY_ROWS:
+        kline = klines.get(row["code"])
+        if kline is None or len(kline) < MIN_BACKTEST_HISTORY_ROWS:
             continue
         result = analyze_stock(row["code"], row["name"], kline, scoring_mode=scoring_mode)
         if result is None:
@@ -396,117 +521,194 @@ def load_future_bars(conn: sqlite3.Connection, code: str, review_date: str) -> l
     ).fetchall()
 
 
-def build_entry_plan(review_date: str, signal: dict, future_bars: list[sqlite3.Row | dict]) -> dict | None:
+def plan_entry(review_date: str, signal: dict, first_bar_date: str | None, first_bar_close: float | None) -> dict | None:
+    """决定入场日、入场价，以及模拟从信号日之后第几根 K 线开始（bar_offset）。"""
     primary_strategy = signal.get("primary_strategy")
     if primary_strategy == STRATEGY_BREAKOUT_ACCEL:
-        if not future_bars:
+        if first_bar_date is None:
             return None
-        confirm_bar = future_bars[0]
-        confirm_close = float(confirm_bar["close"])
+        confirm_close = float(first_bar_close)
         signal_high = float(signal.get("high") or signal["close"])
         if confirm_close <= signal_high:
             return None
         return {
-            "entry_date": str(confirm_bar["trade_date"]),
+            "entry_date": str(first_bar_date),
             "entry_price": round(confirm_close, 4),
-            "bars": future_bars[1:],
+            "bar_offset": 1,
             "entry_rule": "next_day_confirm_breakout",
         }
 
     return {
         "entry_date": review_date,
         "entry_price": round(float(signal["close"]), 4),
-        "bars": future_bars,
+        "bar_offset": 0,
         "entry_rule": "signal_close",
     }
 
 
-def simulate_trade_from_bars(
+def build_entry_plan(review_date: str, signal: dict, future_bars: list[sqlite3.Row | dict]) -> dict | None:
+    first_bar = future_bars[0] if future_bars else None
+    plan = plan_entry(
+        review_date,
+        signal,
+        str(first_bar["trade_date"]) if first_bar is not None else None,
+        float(first_bar["close"]) if first_bar is not None else None,
+    )
+    if plan is None:
+        return None
+    return {
+        "entry_date": plan["entry_date"],
+        "entry_price": plan["entry_price"],
+        "bars": future_bars[plan["bar_offset"]:],
+        "entry_rule": plan["entry_rule"],
+    }
+
+
+def simulate_trade_from_arrays(
     entry_date: str,
     entry_price: float,
-    bars: list[sqlite3.Row | dict],
+    trade_dates: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    ma20: np.ndarray,
     max_hold_days: int = 0,
+    stop_loss_ratio: float = STOP_LOSS_RATIO,
+    trailing_profit_activation: float | None = None,
+    trailing_profit_drawdown: float = TRAILING_PROFIT_DRAWDOWN,
 ) -> dict:
-    stop_loss_price = entry_price * (1 - STOP_LOSS_RATIO)
-    max_profit = 0.0
-    bars_to_process = bars if max_hold_days <= 0 else bars[:max_hold_days]
+    """向量化地模拟单笔交易：一次性算出每根 K 线的止损、跌破 MA20 与（可选的）移动止盈条件，取最早触发者。
 
-    for bar in bars_to_process:
-        trade_date = str(bar["trade_date"])
-        low_price = float(bar["low"])
-        close_price = float(bar["close"])
-        ma20_price = float(bar["ma20"]) if "ma20" in dict(bar) and not pd.isna(bar["ma20"]) else 0.0
+    同一根 K 线上按 止损 > 跌破 MA20 > 移动止盈 的优先级判定；
+    trailing_profit_activation 为 None 时不启用移动止盈，即默认规则；
+    启用后，最大浮盈达到激活线且收盘浮盈回撤超过 trailing_profit_drawdown 比例时按收盘价离场。
+    """
+    if max_hold_days > 0:
+        trade_dates = trade_dates[:max_hold_days]
+        low = low[:max_hold_days]
+        close = close[:max_hold_days]
+        ma20 = ma20[:max_hold_days]
+    bar_count = len(close)
+    if bar_count == 0:
+        return {
+            "entry_date": entry_date,
+            "exit_date": entry_date,
+            "exit_price": round(entry_price, 4),
+            "return_pct": 0.0,
+            "holding_days": 0,
+            "exit_reason": "no_future_bar",
+            "max_profit_pct": 0.0,
+        }
 
-        if low_price <= stop_loss_price:
+    stop_loss_price = entry_price * (1 - stop_loss_ratio)
+    close_profit = close / entry_price - 1
+    # 截至前一根 K 线的最大收盘浮盈（初值 0，NaN 不参与），与逐日推进时的 max_profit 一致
+    prior_max_profit = np.fmax.accumulate(np.concatenate(([0.0], close_profit[:-1])))
+
+    stop_hits = low <= stop_loss_price
+    ma20_hits = (ma20 > 0) & (close < ma20)
+    exit_hits = stop_hits | ma20_hits
+    trailing_hits = None
+    if trailing_profit_activation is not None:
+        trailing_hits = (prior_max_profit >= trailing_profit_activation) & (close_profit <= prior_max_profit * (1 - trailing_profit_drawdown))
+        exit_hits = exit_hits | trailing_hits
+
+    if exit_hits.any():
+        exit_idx = int(exit_hits.argmax())
+        max_profit_pct = round(float(prior_max_profit[exit_idx]) * 100, 2)
+        if stop_hits[exit_idx]:
             return {
                 "entry_date": entry_date,
-                "exit_date": trade_date,
+                "exit_date": str(trade_dates[exit_idx]),
                 "exit_price": round(stop_loss_price, 4),
-                "return_pct": round(-STOP_LOSS_RATIO * 100, 2),
-                "holding_days": len(bars_to_process[: bars_to_process.index(bar) + 1]),
+                "return_pct": round(-stop_loss_ratio * 100, 2),
+                "holding_days": exit_idx + 1,
                 "exit_reason": "stop_loss",
-                "max_profit_pct": round(max_profit * 100, 2),
+                "max_profit_pct": max_profit_pct,
             }
-
-        historical_max_profit = max_profit
-        current_close_profit = close_price / entry_price - 1
-
         # 新策略：不再看 30% 回撤，只要收盘价跌破 MA20 就止盈/止损出局
-        if ma20_price > 0 and close_price < ma20_price:
-            return {
-                "entry_date": entry_date,
-                "exit_date": trade_date,
-                "exit_price": round(close_price, 4),
-                "return_pct": round(current_close_profit * 100, 2),
-                "holding_days": len(bars_to_process[: bars_to_process.index(bar) + 1]),
-                "exit_reason": "break_ma20",
-                "max_profit_pct": round(historical_max_profit * 100, 2),
-            }
-
-        if current_close_profit > max_profit:
-            max_profit = current_close_profit
-
-    if not bars_to_process:
         return {
             "entry_date": entry_date,
-            "exit_date": entry_date,
-            "exit_price": round(entry_price, 4),
-            "return_pct": 0.0,
-            "holding_days": 0,
-            "exit_reason": "no_future_bar",
-            "max_profit_pct": 0.0,
+            "exit_date": str(trade_dates[exit_idx]),
+            "exit_price": round(float(close[exit_idx]), 4),
+            "return_pct": round(float(close_profit[exit_idx]) * 100, 2),
+            "holding_days": exit_idx + 1,
+            "exit_reason": "break_ma20" if ma20_hits[exit_idx] else "trailing_profit",
+            "max_profit_pct": max_profit_pct,
         }
 
-    last_bar = bars_to_process[-1]
-    final_close = float(last_bar["close"])
+    final_close = float(close[-1])
     final_return = final_close / entry_price - 1
+    max_profit = float(np.fmax(prior_max_profit[-1], close_profit[-1]))
     return {
         "entry_date": entry_date,
-        "exit_date": str(last_bar["trade_date"]),
+        "exit_date": str(trade_dates[-1]),
         "exit_price": round(final_close, 4),
         "return_pct": round(final_return * 100, 2),
-        "holding_days": len(bars_to_process),
+        "holding_days": bar_count,
         "exit_reason": "end_of_data" if max_hold_days <= 0 else "max_hold_days",
         "max_profit_pct": round(max_profit * 100, 2),
     }
 
 
+def simulate_trade_from_bars(
+    entry_date: str,
+    entry_price: float,
+    bars: list[sqlite3.Row | dict],
+    max_hold_days: int = 0,
+    stop_loss_ratio: float = STOP_LOSS_RATIO,
+    trailing_profit_activation: float | None = None,
+    trailing_profit_drawdown: float = TRAILING_PROFIT_DRAWDOWN,
+) -> dict:
+    """逐条 K 线记录的兼容入口，转换为数组后交给 simulate_trade_from_arrays。"""
+    def column(name: str) -> np.ndarray:
+        values = [bar[name] if name in bar.keys() else None for bar in bars]
+        return np.asarray([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+
+    return simulate_trade_from_arrays(
+        entry_date,
+        entry_price,
+        np.asarray([str(bar["trade_date"]) for bar in bars], dtype=object),
+        column("low"),
+        column("close"),
+        column("ma20"),
+        max_hold_days=max_hold_days,
+        stop_loss_ratio=stop_loss_ratio,
+        trailing_profit_activation=trailing_profit_activation,
+        trailing_profit_drawdown=trailing_profit_drawdown,
+    )
+
+
 def simulate_trade(
     cache: MarketDataCache,
     review_date: str,
     signal: dict,
     max_hold_days: int = 0,
+    stop_loss_ratio: float = STOP_LOSS_RATIO,
+    trailing_profit_activation: float | None = None,
+    trailing_profit_drawdown: float = TRAILING_PROFIT_DRAWDOWN,
 ) -> dict | None:
-    future_bars = cache.get_future_bars(signal["code"], review_date)
-    entry_plan = build_entry_plan(review_date, signal, future_bars)
+    trade_dates, low, close, ma20 = cache.get_future_arrays(signal["code"], review_date)
+    entry_plan = plan_entry(
+        review_date,
+        signal,
+        str(trade_dates[0]) if len(trade_dates) else None,
+        float(close[0]) if len(close) else None,
+    )
     if entry_plan is None:
         return None
     entry_price = float(entry_plan["entry_price"])
-    raw_result = simulate_trade_from_bars(
+    offset = entry_plan["bar_offset"]
+    raw_result = simulate_trade_from_arrays(
         entry_plan["entry_date"],
         entry_price,
-        entry_plan["bars"],
+        trade_dates[offset:],
+        low[offset:],
+        close[offset:],
+        ma20[offset:],
         max_hold_days=max_hold_days,
+        stop_loss_ratio=stop_loss_ratio,
+        trailing_profit_activation=trailing_profit_activation,
+        trailing_profit_drawdown=trailing_profit_drawdown,
     )
     signal_names = [item[0] for item in signal["signals"]]
     return {
@@ -556,11 +758,15 @@ def summarize_trades(trades: list[dict]) -> dict:
         "avg_holding_days": round(float(holding_days.mean()), 2),
         "best_trade_pct": round(float(returns.max()), 2),
         "worst_trade_pct": round(float(returns.min()), 2),
-        "take_profit_count": sum(1 for item in trades if item["exit_reason"] == "break_ma20" and item["return_pct"] > 0),
+        "take_profit_count": sum(1 for item in trades if is_take_profit_exit(item)),
         "stop_loss_count": sum(1 for item in trades if item["exit_reason"] in ("stop_loss", "break_ma20") and item["return_pct"] <= 0),
     }
 
 
+def is_take_profit_exit(trade: dict) -> bool:
+    return trade["exit_reason"] in TAKE_PROFIT_EXIT_REASONS and trade["return_pct"] > 0
+
+
 def should_skip_signal_for_cooldown(review_date: str, signal: dict, cooldown_until_by_code: dict[str, str]) -> bool:
     cooldown_until = cooldown_until_by_code.get(str(signal["code"]))
     if not cooldown_until:
@@ -616,11 +822,17 @@ def summarize_equity_curve(curve_rows: list[dict], executed_trades: list[dict],
 def build_portfolio_equity_curve(
     trades: list[dict],
     trading_dates: list[str],
-    close_lookup: dict[tuple[str, str], float],
+    close_matrix: np.ndarray,
+    code_columns: dict[str, int],
     initial_capital: float = DEFAULT_INITIAL_CAPITAL,
     position_size: float = DEFAULT_POSITION_SIZE,
     max_positions: int = DEFAULT_MAX_POSITIONS,
+    show_progress: bool = True,
 ) -> tuple[list[dict], list[dict], list[dict], dict]:
+    """按日推进资金与仓位事件，持仓市值再用 日期 × 股票 的收盘价矩阵一次性计算。
+
+    close_matrix 的行对应 trading_dates、列由 code_columns 映射，缺失收盘价为 NaN（按入场价估值）。
+    """
     entries_by_date: dict[str, list[dict]] = {}
     exits_by_date: dict[str, list[dict]] = {}
     for trade in sorted(trades, key=lambda item: (item["entry_date"], -float(item.get("score", 0)), str(item["code"]))):
@@ -631,16 +843,22 @@ def build_portfolio_equity_curve(
     open_positions: dict[tuple[str, str], dict] = {}
     executed_trades: list[dict] = []
     skipped_trades: list[dict] = []
-    curve_rows: list[dict] = []
     realized_pnl = 0.0
-
     total_dates = len(trading_dates)
+    cash_by_date: list[float] = []
+    realized_by_date: list[float] = []
+    open_count_by_date: list[int] = []
+    # 每笔成交持仓的 (市值矩阵列号, 股数, 入场价, 开仓日下标)，以及平仓日下标（未平仓为 total_dates）
+    position_slots: list[tuple[int, int, float, int]] = []
+    position_exit_idx: list[int] = []
+
     for i, trade_date in enumerate(trading_dates):
         for trade in exits_by_date.get(trade_date, []):
             position_key = (str(trade["code"]), str(trade["entry_date"]))
             position = open_positions.pop(position_key, None)
             if position is None:
                 continue
+            position_exit_idx[position["slot"]] = i
             exit_value = position["shares"] * float(trade["exit_price"])
             
             # 手续费和印花税计算
@@ -685,38 +903,127 @@ def build_portfolio_equity_curve(
                 **trade,
                 "shares": shares,
                 "cost": actual_total_cost,
-                "buy_commission": round(buy_commission, 2)
+                "buy_commission": round(buy_commission, 2),
+                "slot": len(position_slots),
             }
+            position_slots.append((code_columns[str(trade["code"])], shares, entry_price, i))
+            position_exit_idx.append(total_dates)
             executed_trades.append({**trade, "allocated_capital": round(actual_total_cost, 2), "shares": shares})
 
-        market_value = 0.0
-        for position in open_positions.values():
-            close_price = close_lookup.get((str(position["code"]), trade_date))
-            if close_price is None:
-                close_price = float(position["entry_price"])
-            market_value += position["shares"] * close_price
+        cash_by_date.append(cash)
+        realized_by_date.append(realized_pnl)
+        open_count_by_date.append(len(open_positions))
 
-        equity = cash + market_value
-        pct = (equity / initial_capital) * 100
-        print(f"\rAllocating Portfolio: {i + 1}/{total_dates} ({trade_date}) - Equity: {pct:.2f}%", end="", flush=True)
+    # 持仓市值：按成交顺序逐笔累加（与按持仓字典顺序逐笔相加的结果逐位一致），每笔在全部日期上向量化
+    market_values = np.zeros(total_dates, dtype=np.float64)
+    for (column, shares, entry_price, entry_idx), exit_idx in zip(position_slots, position_exit_idx):
+        if exit_idx <= entry_idx:
+            continue
+        prices = close_matrix[entry_idx:exit_idx, column]
+        prices = np.where(np.isnan(prices), entry_price, prices)
+        market_values[entry_idx:exit_idx] += shares * prices
 
+    curve_rows: list[dict] = []
+    for i, trade_date in enumerate(trading_dates):
+        market_value = float(market_values[i])
+        equity = cash_by_date[i] + market_value
         curve_rows.append(
             {
                 "date": trade_date,
                 "initial_capital": round(initial_capital, 2),
-                "cash": round(cash, 2),
+                "cash": round(cash_by_date[i], 2),
                 "market_value": round(market_value, 2),
                 "equity": round(equity, 2),
-                "open_positions": len(open_positions),
-                "realized_pnl": round(realized_pnl, 2),
+                "open_positions": open_count_by_date[i],
+                "realized_pnl": round(realized_by_date[i], 2),
             }
         )
-    print()
+    if show_progress and curve_rows:
+        print(f"Allocating Portfolio: {total_dates} dates - Equity: {curve_rows[-1]['equity'] / initial_capital * 100:.2f}%")
 
     portfolio_summary = summarize_equity_curve(curve_rows, executed_trades, skipped_trades)
     return executed_trades, skipped_trades, curve_rows, portfolio_summary
 
 
+def replay_signals(
+    cache: MarketDataCache,
+    review_dates: list[str],
+    signals_by_date: dict[str, list[dict]],
+    top_n: int | None = None,
+    max_hold_days: int = 0,
+    stop_loss_ratio: float = STOP_LOSS_RATIO,
+    take_profit_cooldown_days: int = TAKE_PROFIT_COOLDOWN_DAYS,
+    trailing_profit_activation: float | None = None,
+    trailing_profit_drawdown: float = TRAILING_PROFIT_DRAWDOWN,
+) -> tuple[list[dict], list[dict]]:
+    """第二阶段：按日期顺序套用持仓/冷却规则并模拟交易。
+
+    top_n 不为空时只取每日信号的前 N 个（信号已按得分降序），便于同一批信号复用于不同 top_n。
+    """
+    trades: list[dict] = []
+    signal_rows: list[dict] = []
+    cooldown_until_by_code: dict[str, str] = {}
+    holding_until_by_code: dict[str, str] = {}
+    for review_date in review_dates:
+        signals = signals_by_date.get(review_date, [])
+        if top_n is not None:
+            signals = signals[:top_n]
+        for signal in signals:
+            code_str = str(signal["code"])
+            # 如果这只股票处于被持仓的状态，则在卖出之前不再响应它的新信号
+            if holding_until_by_code.get(code_str) and review_date <= holding_until_by_code[code_str]:
+                continue
+            if should_skip_signal_for_cooldown(review_date, signal, cooldown_until_by_code):
+                continue
+            signal_rows.append({"run_date": review_date, **signal})
+            trade = simulate_trade(
+                cache,
+                review_date,
+                signal,
+                max_hold_days=max_hold_days,
+                stop_loss_ratio=stop_loss_ratio,
+                trailing_profit_activation=trailing_profit_activation,
+                trailing_profit_drawdown=trailing_profit_drawdown,
+            )
+            if trade is None:
+                continue
+            trades.append(trade)
+
+            # 记录这笔独立交易的下车时间，在它下车前不再买它
+            holding_until_by_code[code_str] = str(trade["exit_date"])
+
+            if is_take_profit_exit(trade):
+                cooldown_until = (pd.Timestamp(trade["exit_date"]) + timedelta(days=take_profit_cooldown_days)).strftime("%Y-%m-%d")
+                cooldown_until_by_code[str(trade["code"])] = cooldown_until
+    return trades, signal_rows
+
+
+def simulate_portfolio(
+    cache: MarketDataCache,
+    trades: list[dict],
+    effective_start: str,
+    effective_end: str,
+    initial_capital: float = DEFAULT_INITIAL_CAPITAL,
+    position_size: float = DEFAULT_POSITION_SIZE,
+    max_positions: int = DEFAULT_MAX_POSITIONS,
+    show_progress: bool = True,
+) -> tuple[list[dict], list[dict], list[dict], dict]:
+    portfolio_end_date = max((str(item["exit_date"]) for item in trades), default=effective_end)
+    portfolio_trading_dates = [d for d in cache.review_dates if effective_start <= d <= portfolio_end_date]
+    codes = sorted(set(str(item["code"]) for item in trades))
+    close_matrix = cache.get_close_matrix(codes, portfolio_trading_dates)
+    return build_portfolio_equity_curve(
+        trades,
+        portfolio_trading_dates,
+        close_matrix,
+        {code: column for column, code in enumerate(codes)},
+        initial_capital=initial_capital,
+        position_size=position_size,
+        max_positions=max_positions,
+        show_progress=show_progress,
+    )
+
+
 def write_backtest_markdown(output_path: Path, summary: dict, shrink_summary: dict, plain_summary: dict, notes: list[str]) -> None:
     output_path.parent.mkdir(parents=True, exist_ok=True)
     lines = [
@@ -807,6 +1114,7 @@ def run_backtest(
     max_positions: int = DEFAULT_MAX_POSITIONS,
     cache: MarketDataCache | None = None,
     strategy_filter: str = DEFAULT_STRATEGY_FILTER,
+    workers: int = DEFAULT_SCAN_WORKERS,
 ) -> dict:
     start_trade_date = parse_review_date(start_date)[0] if start_date else None
     end_trade_date = parse_review_date(end_date)[0] if end_date else None
@@ -817,44 +1125,19 @@ def run_backtest(
         conn.close()
         
     review_dates = cache.review_dates
+    signals_by_date = scan_daily_signals(
+        cache,
+        review_dates,
+        top_n=top_n,
+        limit=limit,
+        include_all_boards=include_all_boards,
+        scoring_mode=scoring_mode,
+        strategy_filter=strategy_filter,
+        workers=workers,
+    )
 
-    trades: list[dict] = []
-    signal_rows: list[dict] = []
-    cooldown_until_by_code: dict[str, str] = {}
-    holding_until_by_code: dict[str, str] = {}
-    total_dates = len(review_dates)
-    for i, review_date in enumerate(review_dates):
-        print(f"\rScanning Signals [{scoring_mode}]: {i + 1}/{total_dates} {review_date} - Matched: {len(trades)} trades", end="", flush=True)
-        signals = build_daily_signals_cached(
-            cache,
-            review_date,
-            top_n=top_n,
-            limit=limit,
-            include_all_boards=include_all_boards,
-            scoring_mode=scoring_mode,
-            is_backtest=True,
-            strategy_filter=strategy_filter,
-        )
-        for signal in signals:
-            code_str = str(signal["code"])
-            # 如果这只股票处于被持仓的状态，则在卖出之前不再响应它的新信号
-            if holding_until_by_code.get(code_str) and review_date <= holding_until_by_code[code_str]:
-                continue
-            if should_skip_signal_for_cooldown(review_date, signal, cooldown_until_by_code):
-                continue
-            signal_rows.append({"run_date": review_date, **signal})
-            trade = simulate_trade(cache, review_date, signal, max_hold_days=max_hold_days)
-            if trade is None:
-                continue
-            trades.append(trade)
-            
-            # 记录这笔独立交易的下车时间，在它下车前不再买它
-            holding_until_by_code[code_str] = str(trade["exit_date"])
-            
-            if trade["exit_reason"] == "break_ma20" and trade["return_pct"] > 0:
-                cooldown_until = (pd.Timestamp(trade["exit_date"]) + timedelta(days=TAKE_PROFIT_COOLDOWN_DAYS)).strftime("%Y-%m-%d")
-                cooldown_until_by_code[str(trade["code"])] = cooldown_until
-    print()  # 换行结束进度条显示
+    trades, signal_rows = replay_signals(cache, review_dates, signals_by_date, max_hold_days=max_hold_days)
+    print(f"Matched [{scoring_mode}]: {len(trades)} trades")
 
     overall_summary = summarize_trades(trades)
     shrink_trades = [item for item in trades if item["has_pullback_shrink_twice"]]
@@ -866,14 +1149,11 @@ def run_backtest(
     effective_end = review_dates[-1] if review_dates else end_trade_date or "na"
     strategy_suffix = strategy_filter or STRATEGY_FILTER_ALL
     file_suffix = f"{strategy_suffix}_{effective_start.replace('-', '')}_{effective_end.replace('-', '')}"
-    portfolio_end_date = max((str(item["exit_date"]) for item in trades), default=effective_end)
-    close_lookup = cache.get_close_lookup(set([str(item["code"]) for item in trades]), effective_start, portfolio_end_date)
-    portfolio_trading_dates = [d for d in cache.review_dates if effective_start <= d <= portfolio_end_date]
-    
-    executed_trades, skipped_trades, equity_curve_rows, portfolio_summary = build_portfolio_equity_curve(
+    executed_trades, skipped_trades, equity_curve_rows, portfolio_summary = simulate_portfolio(
+        cache,
         trades,
-        portfolio_trading_dates,
-        close_lookup,
+        effective_start,
+        effective_end,
         initial_capital=initial_capital,
         position_size=position_size,
         max_positions=max_positions,
@@ -936,6 +1216,7 @@ def compare_scoring_modes(
     position_size: float = DEFAULT_POSITION_SIZE,
     max_positions: int = DEFAULT_MAX_POSITIONS,
     strategy_filter: str = DEFAULT_STRATEGY_FILTER,
+    workers: int = DEFAULT_SCAN_WORKERS,
 ) -> dict:
     start_trade_date = parse_review_date(start_date)[0] if start_date else None
     end_trade_date = parse_review_date(end_date)[0] if end_date else None
@@ -957,6 +1238,7 @@ def compare_scoring_modes(
         max_positions=max_positions,
         cache=cache,
         strategy_filter=strategy_filter,
+        workers=workers,
     )
     dedup_summary = run_backtest(
         start_date=start_date,
@@ -971,6 +1253,7 @@ def compare_scoring_modes(
         max_positions=max_positions,
         cache=cache,
         strategy_filter=strategy_filter,
+        workers=workers,
     )
     compare_summary = {
         "start_date": legacy_summary["start_date"],
@@ -997,6 +1280,7 @@ def compare_strategies(
     initial_capital: float = DEFAULT_INITIAL_CAPITAL,
     position_size: float = DEFAULT_POSITION_SIZE,
     max_positions: int = DEFAULT_MAX_POSITIONS,
+    workers: int = DEFAULT_SCAN_WORKERS,
 ) -> dict:
     start_trade_date = parse_review_date(start_date)[0] if start_date else None
     end_trade_date = parse_review_date(end_date)[0] if end_date else None
@@ -1018,6 +1302,7 @@ def compare_strategies(
         max_positions=max_positions,
         cache=cache,
         strategy_filter=STRATEGY_TREND_INIT,
+        workers=workers,
     )
     breakout_accel_summary = run_backtest(
         start_date=start_date,
@@ -1032,6 +1317,7 @@ def compare_strategies(
         max_positions=max_positions,
         cache=cache,
         strategy_filter=STRATEGY_BREAKOUT_ACCEL,
+        workers=workers,
     )
     compare_summary = {
         "start_date": trend_init_summary["start_date"],
@@ -1063,6 +1349,7 @@ def build_arg_parser() -> argparse.ArgumentParser:
     parser.add_argument("--initial-capital", type=float, default=DEFAULT_INITIAL_CAPITAL, help="组合回测初始资金")
     parser.add_argument("--position-size", type=float, default=DEFAULT_POSITION_SIZE, help="单笔固定仓位")
     parser.add_argument("--max-positions", type=int, default=DEFAULT_MAX_POSITIONS, help="最大同时持仓数")
+    parser.add_argument("--workers", type=int, default=DEFAULT_SCAN_WORKERS, help="信号扫描进程数，0 表示按 CPU 核数自动选择")
     return parser
 
 
@@ -1080,6 +1367,7 @@ def main() -> None:
             initial_capital=args.initial_capital,
             position_size=args.position_size,
             max_positions=args.max_positions,
+            workers=args.workers,
         )
         print(
             f"策略对比回测完成: {summary['start_date']} -> {summary['end_date']}, "
@@ -1100,6 +1388,7 @@ def main() -> None:
             initial_capital=args.initial_capital,
             position_size=args.position_size,
             max_positions=args.max_positions,
+            workers=args.workers,
             strategy_filter=args.strategy_filter,
         )
         print(
@@ -1121,6 +1410,7 @@ def main() -> None:
         initial_capital=args.initial_capital,
         position_size=args.position_size,
         max_positions=args.max_positions,
+        workers=args.workers,
         strategy_filter=args.strategy_filter,
     )
     print(
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+
+"""回测参数网格扫描：信号只扫描一次，多组出场/仓位参数并行模拟，汇总成一张结果表。
+
+参数：
+    --start-date: 回测起始日期，格式 YYYYMMDD 或 YYYY-MM-DD
+    --end-date: 回测结束日期，格式 YYYYMMDD 或 YYYY-MM-DD
+    --grid: 参数网格 JSON，键为可扫描参数名，值为候选值列表
+    --grid-file: 参数网格 JSON 文件路径，与 --grid 二选一
+    --limit: 仅分析前 N 只候选股票，便于调试
+    --all-boards: 分析全部板块，不限制默认允许板块
+    --scoring-mode: 评分模式，legacy 或 dedup
+    --strategy-filter: 买入策略过滤：all、trend_init、breakout_accel
+    --workers: 扫描与模拟使用的进程数，0 表示按 CPU 核数自动选择
+
+可扫描参数：
+    stop_loss_ratio, trailing_profit_activation, trailing_profit_drawdown,
+    take_profit_cooldown_days, top_n, max_positions, max_hold_days,
+    position_size, initial_capital
+    trailing_profit_activation 取 null 表示不启用移动止盈（即默认出场规则）。
+
+用法：
+    - 扫描止损比例与每日信号数：
+        python -m stock.backtest_sweep --start-date 2024-01-01 --end-date 2024-12-31 \
+            --grid '{"stop_loss_ratio": [0.08, 0.10, 0.12], "top_n": [5, 10]}'
+
+    - 从文件读取网格：
+        python -m stock.backtest_sweep --grid-file sweep.json --workers 8
+
+注意：
+    - 信号按网格中最大的 top_n 扫描一次，较小的 top_n 直接取每日信号前缀，结果与单独回测一致
+    - 每组参数只输出汇总指标，不写交易明细；需要明细时用 stock.backtest 单独回测该组参数
+"""
+
+from __future__ import annotations
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import itertools
+import json
+from pathlib import Path
+import tempfile
+
+import pandas as pd
+
+try:
+    from backtest import (
+        BACKTEST_DIR,
+        DEFAULT_INITIAL_CAPITAL,
+        DEFAULT_MAX_POSITIONS,
+        DEFAULT_POSITION_SIZE,
+        DEFAULT_SCAN_WORKERS,
+        DEFAULT_STRATEGY_FILTER,
+        STOP_LOSS_RATIO,
+        STRATEGY_FILTER_ALL,
+        STRATEGY_FILTER_CHOICES,
+        TAKE_PROFIT_COOLDOWN_DAYS,
+        TRAILING_PROFIT_DRAWDOWN,
+        MarketDataCache,
+        SharedMarketDataCache,
+        replay_signals,
+        resolve_scan_workers,
+        scan_daily_signals,
+        simulate_portfolio,
+        summarize_trades,
+    )
+    from review_common import get_db_connection, parse_review_date
+except ImportError:
+    from .backtest import (
+        BACKTEST_DIR,
+        DEFAULT_INITIAL_CAPITAL,
+        DEFAULT_MAX_POSITIONS,
+        DEFAULT_POSITION_SIZE,
+        DEFAULT_SCAN_WORKERS,
+        DEFAULT_STRATEGY_FILTER,
+        STOP_LOSS_RATIO,
+        STRATEGY_FILTER_ALL,
+        STRATEGY_FILTER_CHOICES,
+        TAKE_PROFIT_COOLDOWN_DAYS,
+        TRAILING_PROFIT_DRAWDOWN,
+        MarketDataCache,
+        SharedMarketDataCache,
+        replay_signals,
+        resolve_scan_workers,
+        scan_daily_signals,
+        simulate_portfolio,
+        summarize_trades,
+    )
+    from .review_common import get_db_connection, parse_review_date
+
+
+SWEEP_DEFAULTS = {
+    "stop_loss_ratio": STOP_LOSS_RATIO,
+    "trailing_profit_activation": None,
+    "trailing_profit_drawdown": TRAILING_PROFIT_DRAWDOWN,
+    "take_profit_cooldown_days": TAKE_PROFIT_COOLDOWN_DAYS,
+    "top_n": 10,
+    "max_positions": DEFAULT_MAX_POSITIONS,
+    "max_hold_days": 0,
+    "position_size": DEFAULT_POSITION_SIZE,
+    "initial_capital": DEFAULT_INITIAL_CAPITAL,
+}
+SWEEP_SORT_COLUMN = "portfolio_total_return_pct"
+
+
+def expand_grid(grid: dict[str, list]) -> list[dict]:
+    unknown = sorted(set(grid) - set(SWEEP_DEFAULTS))
+    if unknown:
+        raise ValueError(f"不支持扫描的参数: {', '.join(unknown)}")
+    keys = list(grid.keys())
+    values = [grid[key] if isinstance(grid[key], list) else [grid[key]] for key in keys]
+    if any(not item for item in values):
+        raise ValueError("参数网格中存在空的候选值列表")
+    return [{**SWEEP_DEFAULTS, **dict(zip(keys, combo))} for combo in itertools.product(*values)]
+
+
+def run_sweep_case(
+    cache: MarketDataCache,
+    review_dates: list[str],
+    signals_by_date: dict[str, list[dict]],
+    params: dict,
+) -> dict:
+    trades, _ = replay_signals(
+        cache,
+        review_dates,
+        signals_by_date,
+        top_n=int(params["top_n"]),
+        max_hold_days=int(params["max_hold_days"]),
+        stop_loss_ratio=float(params["stop_loss_ratio"]),
+        take_profit_cooldown_days=int(params["take_profit_cooldown_days"]),
+        trailing_profit_activation=params["trailing_profit_activation"],
+        trailing_profit_drawdown=float(params["trailing_profit_drawdown"]),
+    )
+    effective_start = review_dates[0] if review_dates else "na"
+    effective_end = review_dates[-1] if review_dates else "na"
+    _, _, _, portfolio_summary = simulate_portfolio(
+        cache,
+        trades,
+        effective_start,
+        effective_end,
+        initial_capital=float(params["initial_capital"]),
+        position_size=float(params["position_size"]),
+        max_positions=int(params["max_positions"]),
+        show_progress=False,
+    )
+    row = dict(params)
+    row.update({f"trade_{key}": value for key, value in summarize_trades(trades).items()})
+    row.update({f"portfolio_{key}": value for key, value in portfolio_summary.items()})
+    return row
+
+
+# 模拟子进程内的共享状态，由进程池 initializer 建立
+_SWEEP_STATE: tuple[SharedMarketDataCache, list[str], dict[str, list[dict]]] | None = None
+
+
+def _init_sweep_worker(
+    directory: str,
+    stock_info: dict[str, dict],
+    review_dates: list[str],
+    signals_by_date: dict[str, list[dict]],
+) -> None:
+    global _SWEEP_STATE
+    cache = SharedMarketDataCache(directory, stock_info, review_dates)
+    _SWEEP_STATE = (cache, review_dates, signals_by_date)
+
+
+def _run_sweep_case_in_worker(index: int, params: dict) -> tuple[int, dict]:
+    cache, review_dates, signals_by_date = _SWEEP_STATE
+    return index, run_sweep_case(cache, review_dates, signals_by_date, params)
+
+
+def run_sweep(
+    grid: dict[str, list],
+    start_date: str | None = None,
+    end_date: str | None = None,
+    limit: int = 0,
+    include_all_boards: bool = False,
+    scoring_mode: str = "dedup",
+    strategy_filter: str = DEFAULT_STRATEGY_FILTER,
+    workers: int = DEFAULT_SCAN_WORKERS,
+    cache: MarketDataCache | None = None,
+) -> dict:
+    cases = expand_grid(grid)
+    start_trade_date = parse_review_date(start_date)[0] if start_date else None
+    end_trade_date = parse_review_date(end_date)[0] if end_date else None
+
+    if cache is None:
+        conn = get_db_connection()
+        cache = MarketDataCache(conn, start_trade_date, end_trade_date)
+        conn.close()
+    review_dates = list(cache.review_dates)
+
+    max_top_n = max(int(case["top_n"]) for case in cases)
+    signals_by_date = scan_daily_signals(
+        cache,
+        review_dates,
+        top_n=max_top_n,
+        limit=limit,
+        include_all_boards=include_all_boards,
+        scoring_mode=scoring_mode,
+        strategy_filter=strategy_filter,
+        workers=workers,
+    )
+
+    rows: list[dict | None] = [None] * len(cases)
+    worker_count = resolve_scan_workers(workers, len(cases))
+    total_cases = len(cases)
+    if worker_count <= 1:
+        for index, params in enumerate(cases):
+            rows[index] = run_sweep_case(cache, review_dates, signals_by_date, params)
+            print(f"\rSimulating Sweep: {index + 1}/{total_cases}", end="", flush=True)
+    else:
+        with tempfile.TemporaryDirectory(prefix="backtest_sweep_") as shared_dir:
+            cache.export_columnar(shared_dir)
+            with ProcessPoolExecutor(
+                max_workers=worker_count,
+                initializer=_init_sweep_worker,
+                initargs=(shared_dir, cache.stock_info, review_dates, signals_by_date),
+            ) as executor:
+                futures = [executor.submit(_run_sweep_case_in_worker, index, params) for index, params in enumerate(cases)]
+                for done, future in enumerate(as_completed(futures), start=1):
+                    index, row = future.result()
+                    rows[index] = row
+                    print(f"\rSimulating Sweep x{worker_count}: {done}/{total_cases}", end="", flush=True)
+    print()
+
+    effective_start = review_dates[0] if review_dates else start_trade_date or "na"
+    effective_end = review_dates[-1] if review_dates else end_trade_date or "na"
+    result_df = pd.DataFrame(rows).sort_values(SWEEP_SORT_COLUMN, ascending=False, kind="stable")
+    strategy_suffix = strategy_filter or STRATEGY_FILTER_ALL
+    output_path = BACKTEST_DIR / (
+        f"backtest_sweep_{scoring_mode}_{strategy_suffix}_{effective_start.replace('-', '')}_{effective_end.replace('-', '')}.csv"
+    )
+    BACKTEST_DIR.mkdir(parents=True, exist_ok=True)
+    result_df.to_csv(output_path, index=False, encoding="utf-8-sig")
+    return {
+        "start_date": effective_start,
+        "end_date": effective_end,
+        "case_count": total_cases,
+        "results": result_df,
+        "output_path": str(output_path),
+    }
+
+
+def load_grid(grid_text: str | None, grid_file: str | None) -> dict[str, list]:
+    if grid_file:
+        return json.loads(Path(grid_file).read_text(encoding="utf-8"))
+    if grid_text:
+        return json.loads(grid_text)
+    raise ValueError("必须通过 --grid 或 --grid-file 指定参数网格")
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="回测参数网格扫描")
+    parser.add_argument("--start-date", type=str, default=None, help="起始日期，格式 YYYYMMDD 或 YYYY-MM-DD")
+    parser.add_argument("--end-date", type=str, default=None, help="结束日期，格式 YYYYMMDD 或 YYYY-MM-DD")
+    parser.add_argument("--grid", type=str, default=None, help="参数网格 JSON，例如 '{\"top_n\": [5, 10]}'")
+    parser.add_argument("--grid-file", type=str, default=None, help="参数网格 JSON 文件路径")
+    parser.add_argument("--limit", type=int, default=0, help="仅分析前 N 只候选股票")
+    parser.add_argument("--all-boards", action="store_true", help="分析全部板块")
+    parser.add_argument("--scoring-mode", choices=["legacy", "dedup"], default="dedup", help="评分模式")
+    parser.add_argument("--strategy-filter", choices=list(STRATEGY_FILTER_CHOICES), default=DEFAULT_STRATEGY_FILTER, help="买入策略过滤：all、trend_init、breakout_accel")
+    parser.add_argument("--workers", type=int, default=DEFAULT_SCAN_WORKERS, help="进程数，0 表示按 CPU 核数自动选择")
+    return parser
+
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    summary = run_sweep(
+        load_grid(args.grid, args.grid_file),
+        start_date=args.start_date,
+        end_date=args.end_date,
+        limit=args.limit,
+        include_all_boards=args.all_boards,
+        scoring_mode=args.scoring_mode,
+        strategy_filter=args.strategy_filter,
+        workers=args.workers,
+    )
+    print(f"参数扫描完成: {summary['start_date']} -> {summary['end_date']}, 共 {summary['case_count']} 组参数")
+    print(summary["results"].head(10).to_string(index=False))
+    print(f"结果表: {summary['output_path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""A 股股票 → 图谱 Company 节点的预计算映射。
+
+股票对应哪个 Company 节点几乎不变，不必每次请求都到 Neo4j 里做 IN 精确查询再做 CONTAINS 模糊扫描。
+批处理任务一次性遍历图谱中的 Company 节点，按 normalize_company_name 建立名称键，
+为目录中的全部上市公司（全称优先、简称其次）解析出节点 id，精确匹配不到的再回退到原来的
+模糊规则，结果（包括没有匹配的）写入 stock.db 的 stock_company_map 表。
+
+请求时按代码查表，记录的简称键与当前简称一致即直接使用（全称只在两边都有时才比对，
+请求时补全的全称不会让批处理结果失效）；表中没有的新股票才实时解析一次并写回。
+建表与旧表补列只在批处理和 Web 启动时各做一次（migrate_company_mapping），请求路径只读写已有的表。
+图谱导入完成后重新运行：
+    python stock/company_mapping.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    from directory import DB_PATH, load_directory, normalize_company_name
+except ImportError:
+    from .directory import DB_PATH, load_directory, normalize_company_name
+
+MATCH_EXACT = "exact"
+MATCH_CONTAINS = "contains"
+MATCH_NONE = "none"
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    return sqlite3.connect(str(db_path), timeout=10)
+
+
+def migrate_company_mapping(db_path: Path = DB_PATH) -> None:
+    """建表并给旧表补列；由批处理和 Web 启动调用，请求路径不再检查表结构。"""
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = _connect(db_path)
+    try:
+        _ensure_schema(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _ensure_schema(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stock_company_map (
+            code TEXT PRIMARY KEY,
+            name_key TEXT NOT NULL,
+            full_name_key TEXT NOT NULL DEFAULT '',
+            company_id TEXT,
+            company_name TEXT,
+            match_type TEXT NOT NULL,
+            resolved_at TEXT NOT NULL
+        )
+        """
+    )
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(stock_company_map)").fetchall()}
+    if "full_name_key" not in columns:
+        # 旧表的 name_key 可能是全称键，校验不通过的行会在下次请求时实时解析并改写
+        conn.execute("ALTER TABLE stock_company_map ADD COLUMN full_name_key TEXT NOT NULL DEFAULT ''")
+
+
+def stock_name_key(stock_info: dict) -> str:
+    """映射校验所依据的简称键；深市、北交所股票在目录里起初只有简称，全称是请求时才补全的。"""
+    return normalize_company_name(stock_info.get("name"))
+
+
+def stock_full_name_key(stock_info: dict) -> str:
+    return normalize_company_name(stock_info.get("full_name"))
+
+
+def mapping_is_current(row_name_key: str, row_full_name_key: str, stock_info: dict) -> bool:
+    """简称一致即有效；全称只在映射和当前信息都有时比对，补全全称不会让映射失效。"""
+    if row_name_key != stock_name_key(stock_info):
+        return False
+    full_name_key = stock_full_name_key(stock_info)
+    return not (row_full_name_key and full_name_key and row_full_name_key != full_name_key)
+
+
+def _candidate_names(stock_info: dict) -> List[str]:
+    candidate_names = []
+    for value in [stock_info.get("full_name"), stock_info.get("name")]:
+        cleaned = str(value).strip() if value else ""
+        if cleaned and cleaned not in candidate_names:
+            candidate_names.append(cleaned)
+    return candidate_names
+
+
+def _shortest(matches: List[dict]) -> dict:
+    return sorted(matches, key=lambda item: (len(str(item.get("name", ""))), str(item.get("id"))))[0]
+
+
+def resolve_company(graph, stock_info: dict) -> tuple[Optional[dict], str]:
+    """实时在图谱中解析股票对应的公司，返回 (公司, 匹配方式)。
+
+    名称精确匹配或 CONTAINS 结果中规范化名称相同算 exact，否则按全称、简称唯一包含算 contains。
+    """
+    candidate_names = _candidate_names(stock_info)
+    if not candidate_names:
+        return None, MATCH_NONE
+
+    exact_query = """
+    MATCH (c:Company)
+    WHERE c.name IN $candidate_names
+    RETURN c.id AS id, c.name AS name
+    LIMIT 5
+    """
+    exact_matches = graph.run(exact_query, candidate_names=candidate_names).data()
+    if exact_matches:
+        exact_matches.sort(key=lambda item: len(str(item.get("name", ""))))
+        return exact_matches[0], MATCH_EXACT
+
+    contains_query = """
+    MATCH (c:Company)
+    WHERE ANY(name IN $candidate_names WHERE c.name CONTAINS name)
+    RETURN c.id AS id, c.name AS name
+    LIMIT 20
+    """
+    contains_matches = graph.run(contains_query, candidate_names=candidate_names).data()
+    if not contains_matches:
+        return None, MATCH_NONE
+
+    normalized_targets = {normalize_company_name(name) for name in candidate_names if name}
+    normalized_exact = [
+        row for row in contains_matches
+        if normalize_company_name(row.get("name")) in normalized_targets
+    ]
+    if normalized_exact:
+        normalized_exact.sort(key=lambda item: len(str(item.get("name", ""))))
+        return normalized_exact[0], MATCH_EXACT
+
+    if stock_info.get("full_name"):
+        full_name = str(stock_info["full_name"]).strip()
+        full_name_matches = [row for row in contains_matches if full_name in str(row.get("name", ""))]
+        if len(full_name_matches) == 1:
+            return full_name_matches[0], MATCH_CONTAINS
+
+    short_name = str(stock_info.get("name") or "").strip()
+    short_name_matches = [row for row in contains_matches if short_name and short_name in str(row.get("name", ""))]
+    if len(short_name_matches) == 1:
+        return short_name_matches[0], MATCH_CONTAINS
+
+    return None, MATCH_NONE
+
+
+def load_company_keys(graph, wanted_keys: set) -> Dict[str, List[dict]]:
+    """流式遍历全部 Company 节点，只保留名称键在 wanted_keys 中的节点。"""
+    companies: Dict[str, List[dict]] = {}
+    cursor = graph.run("MATCH (c:Company) WHERE c.name IS NOT NULL RETURN c.id AS id, c.name AS name")
+    for record in cursor:
+        key = normalize_company_name(record["name"])
+        if key in wanted_keys:
+            companies.setdefault(key, []).append({"id": record["id"], "name": record["name"]})
+    return companies
+
+
+def _mapping_row(stock_info: dict, company: Optional[dict], match_type: str, resolved_at: str) -> tuple:
+    return (
+        stock_info["code"],
+        stock_name_key(stock_info),
+        stock_full_name_key(stock_info),
+        str(company["id"]) if company else None,
+        company.get("name") if company else None,
+        match_type if company else MATCH_NONE,
+        resolved_at,
+    )
+
+
+def save_company_mapping(db_path: Path, rows: List[tuple], replace_all: bool = False) -> int:
+    conn = _connect(db_path)
+    try:
+        with conn:
+            if replace_all:
+                conn.execute("DELETE FROM stock_company_map")
+            conn.executemany(
+                """
+                INSERT INTO stock_company_map(code, name_key, full_name_key, company_id, company_name, match_type, resolved_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(code) DO UPDATE SET
+                    name_key = excluded.name_key,
+                    full_name_key = excluded.full_name_key,
+                    company_id = excluded.company_id,
+                    company_name = excluded.company_name,
+                    match_type = excluded.match_type,
+                    resolved_at = excluded.resolved_at
+                """,
+                rows,
+            )
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def rebuild_company_mapping(graph, db_path: Path = DB_PATH, records: Optional[List[dict]] = None) -> dict:
+    """为目录中的全部股票重新解析图谱公司节点并整表替换映射。"""
+    started = time.perf_counter()
+    if records is None:
+        records = load_directory(db_path).records
+    if not records:
+        raise RuntimeError("stock_directory 为空，请先加载股票目录")
+
+    migrate_company_mapping(db_path)
+    wanted_keys = set()
+    for record in records:
+        wanted_keys.update(key for key in (normalize_company_name(record.get("full_name")), normalize_company_name(record.get("name"))) if key)
+    companies = load_company_keys(graph, wanted_keys)
+
+    resolved_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = []
+    summary = {"stocks": len(records), MATCH_EXACT: 0, MATCH_CONTAINS: 0, MATCH_NONE: 0}
+    for record in records:
+        matches = []
+        for key in (normalize_company_name(record.get("full_name")), normalize_company_name(record.get("name"))):
+            matches.extend(companies.get(key, []))
+        if matches:
+            company, match_type = _shortest(matches), MATCH_EXACT
+        else:
+            company, match_type = resolve_company(graph, record)
+        row = _mapping_row(record, company, match_type, resolved_at)
+        summary[row[5]] += 1
+        rows.append(row)
+
+    save_company_mapping(db_path, rows, replace_all=True)
+    summary["seconds"] = round(time.perf_counter() - started, 2)
+    return summary
+
+
+def lookup_company_mapping(stock_info: dict, db_path: Path = DB_PATH):
+    """返回 (是否有有效映射, 公司)；映射缺失或股票简称（或已知的全称）变化时返回 (False, None)。"""
+    conn = _connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT name_key, full_name_key, company_id, company_name FROM stock_company_map WHERE code = ?",
+            (stock_info["code"],),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # 表还没建（批处理和启动迁移都没跑过），按没有映射处理
+        row = None
+    finally:
+        conn.close()
+    if row is None or not mapping_is_current(row[0], row[1], stock_info):
+        return False, None
+    if row[2] is None:
+        return True, None
+    return True, {"id": row[2], "name": row[3]}
+
+
+def remember_company_mapping(stock_info: dict, company: Optional[dict], match_type: str, db_path: Path = DB_PATH) -> None:
+    """实时解析后连同匹配方式写回映射，下次同一股票不再查询图谱；表不存在时不写。"""
+    resolved_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        save_company_mapping(db_path, [_mapping_row(stock_info, company, match_type, resolved_at)])
+    except sqlite3.OperationalError:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="预计算股票到图谱公司节点的映射")
+    parser.add_argument("--code", help="只查看某只股票的映射")
+    args = parser.parse_args()
+
+    if args.code:
+        conn = _connect(DB_PATH)
+        try:
+            row = conn.execute("SELECT * FROM stock_company_map WHERE code = ?", (args.code.zfill(6),)).fetchone()
+        finally:
+            conn.close()
+        print(row)
+        return
+
+    import os
+    import sys
+
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from neo4j_utils import Neo4jManager
+
+    summary = rebuild_company_mapping(Neo4jManager().graph)
+    print(
+        f"股票公司映射完成: {summary['stocks']} 只，精确 {summary[MATCH_EXACT]}，"
+        f"模糊 {summary[MATCH_CONTAINS]}，未匹配 {summary[MATCH_NONE]}，耗时 {summary['seconds']}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,11 @@ import math
 import numpy as np
 import pandas as pd
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 
 SIGNAL_WEIGHTS = {
     "golden_cross_first": 50,
@@ -92,6 +97,62 @@ def calc_rsi(series: pd.Series, period: int = 14) -> pd.Series:
     return 100 - (100 / (1 + rs))
 
 
+# 增量复盘的滚动状态：每只股票保留最近 INDICATOR_STATE_ROWS 根 K 线及其均线/RSI，
+# 列顺序固定，便于整体存成 float64 二进制块
+INDICATOR_STATE_COLUMNS = ("open", "high", "low", "close", "volume", "ma5", "ma10", "ma20", "ma60", "rsi")
+INDICATOR_STATE_BAR_COLUMNS = INDICATOR_STATE_COLUMNS[:5]
+INDICATOR_STATE_MA_WINDOWS = {"ma5": MA_SHORT, "ma10": 10, "ma20": MA_LONG, "ma60": 60}
+INDICATOR_STATE_ROWS = LOOKBACK_DAYS
+RSI_PERIOD = 14
+
+
+def build_indicator_window(kline: pd.DataFrame, max_rows: int = INDICATOR_STATE_ROWS) -> np.ndarray:
+    """全量计算均线与 RSI，返回最近 max_rows 行的状态矩阵。"""
+    close = kline["close"].astype(float)
+    columns = [kline[name].astype(float) for name in INDICATOR_STATE_BAR_COLUMNS]
+    columns.extend(calc_ma(close, window) for window in INDICATOR_STATE_MA_WINDOWS.values())
+    columns.append(calc_rsi(close, RSI_PERIOD))
+    window = np.column_stack([column.to_numpy(dtype=float) for column in columns])
+    return np.ascontiguousarray(window[-max_rows:])
+
+
+def append_indicator_bars(window: np.ndarray, bars: np.ndarray, max_rows: int = INDICATOR_STATE_ROWS) -> np.ndarray:
+    """把新 K 线（open/high/low/close/volume）逐根追加到状态矩阵，只用窗口尾部更新均线与 RSI。
+
+    与 calc_ma / calc_rsi 的口径一致：窗口内有 NaN 时均线为 NaN，RSI 的涨跌幅把 NaN 当 0；
+    窗口不足周期长度时为 NaN。
+    """
+    close_col = INDICATOR_STATE_COLUMNS.index("close")
+    rsi_col = INDICATOR_STATE_COLUMNS.index("rsi")
+    ma_cols = [(INDICATOR_STATE_COLUMNS.index(name), size) for name, size in INDICATOR_STATE_MA_WINDOWS.items()]
+    bar_width = len(INDICATOR_STATE_BAR_COLUMNS)
+
+    rows = np.full((len(window) + len(bars), len(INDICATOR_STATE_COLUMNS)), np.nan)
+    rows[: len(window)] = window
+    for offset, bar in enumerate(np.asarray(bars, dtype=float).reshape(-1, bar_width)):
+        index = len(window) + offset
+        rows[index, :bar_width] = bar
+        close = rows[: index + 1, close_col]
+        count = index + 1
+        for col, size in ma_cols:
+            if count >= size:
+                rows[index, col] = close[-size:].mean()
+        if count >= RSI_PERIOD:
+            delta = np.diff(close[-(RSI_PERIOD + 1):])
+            if len(delta) < RSI_PERIOD:
+                # calc_rsi 的首个 diff 为 NaN，会被当作 0 计入第一个周期
+                delta = np.concatenate(([0.0], delta))
+            gain = np.where(delta > 0, delta, 0.0).mean()
+            loss = np.where(delta < 0, -delta, 0.0).mean()
+            with np.errstate(divide="ignore", invalid="ignore"):
+                rows[index, rsi_col] = 100 - (100 / (1 + gain / loss))
+    return np.ascontiguousarray(rows[-max_rows:])
+
+
+def indicator_window_frame(window: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame(window, columns=list(INDICATOR_STATE_COLUMNS))
+
+
 def calc_ma_angle(ma_short_val: float, ma_long_val: float, ma_short_prev: float, ma_long_prev: float) -> float:
     try:
         slope_short = (ma_short_val - ma_short_prev) / ma_short_prev * 100
@@ -132,55 +193,158 @@ def score_liquidity_ratio(liquidity_ratio_pct: float | None) -> tuple[str | None
     return f"流动性过热({ratio:.1f}%)", penalty
 
 
-def detect_golden_cross_type_and_age(ma5: pd.Series, ma20: pd.Series, close: pd.Series) -> tuple[str, int | None]:
-    n = len(ma5)
-    if n < MA_LONG + 5:
-        return "none", None
-    if pd.isna(ma5.iloc[-1]) or pd.isna(ma20.iloc[-1]) or ma5.iloc[-1] <= ma20.iloc[-1]:
-        return "none", None
+# 金叉类型编码：内核只返回整数，外层再映射回字符串，方便 numba 编译
+CROSS_TYPE_NAMES = ("none", "first", "second", "high")
+CROSS_HIGH_RATIO = 0.30
+CROSS_SEARCH_DAYS = 60
+SECOND_CROSS_LOOKBACK = 30
 
-    cross_idx = None
-    for index in range(n - 1, max(0, n - GOLDEN_CROSS_DECAY_DAYS - 1), -1):
-        if index - 1 < 0:
-            break
-        if any(pd.isna(series.iloc[index]) or pd.isna(series.iloc[index - 1]) for series in (ma5, ma20)):
-            continue
-        if ma5.iloc[index] > ma20.iloc[index] and ma5.iloc[index - 1] <= ma20.iloc[index - 1]:
+
+def _maybe_njit(func):
+    """安装了 numba 时编译为机器码，否则原样返回（仅用于循环版内核）。"""
+    if njit is None:
+        return func
+    return njit(cache=True)(func)
+
+
+def _as_float_array(values) -> np.ndarray:
+    if isinstance(values, np.ndarray) and values.dtype == np.float64:
+        return values
+    if hasattr(values, "to_numpy"):
+        return values.to_numpy(dtype=np.float64, na_value=np.nan)
+    return np.asarray(values, dtype=np.float64)
+
+
+@_maybe_njit
+def _golden_cross_loop_kernel(ma5, ma20, close):
+    # 与 numpy 版语义一致的逐元素循环；NaN 参与比较结果恒为 False，等价于跳过
+    n = ma5.shape[0]
+    if n < MA_LONG + 5:
+        return 0, -1
+    if not ma5[n - 1] > ma20[n - 1]:
+        return 0, -1
+
+    cross_idx = -1
+    lower = max(0, n - CROSS_SEARCH_DAYS)
+    for index in range(n - 1, lower, -1):
+        if ma5[index] > ma20[index] and ma5[index - 1] <= ma20[index - 1]:
             cross_idx = index
             break
+    if cross_idx < 0:
+        return 0, -1
 
-    if cross_idx is None:
-        for index in range(max(0, n - GOLDEN_CROSS_DECAY_DAYS - 1), max(0, n - 60), -1):
-            if index - 1 < 0:
-                break
-            if any(pd.isna(series.iloc[index]) or pd.isna(series.iloc[index - 1]) for series in (ma5, ma20)):
-                continue
-            if ma5.iloc[index] > ma20.iloc[index] and ma5.iloc[index - 1] <= ma20.iloc[index - 1]:
-                cross_idx = index
-                break
+    cross_age = n - 1 - cross_idx
+    if cross_age > GOLDEN_CROSS_DECAY_DAYS:
+        return 0, -1
+
+    close_len = close.shape[0]
+    lookback = min(CROSS_SEARCH_DAYS, close_len)
+    low_60 = np.nan
+    for index in range(close_len - lookback, close_len):
+        value = close[index]
+        if not np.isnan(value) and (np.isnan(low_60) or value < low_60):
+            low_60 = value
+    if low_60 > 0 and (close[close_len - 1] / low_60 - 1) > CROSS_HIGH_RATIO:
+        return 3, cross_age
+
+    start = max(0, cross_idx - min(SECOND_CROSS_LOOKBACK, n - 1))
+    for index in range(cross_idx - 1, start, -1):
+        if ma5[index] < ma20[index] and ma5[index - 1] >= ma20[index - 1]:
+            return 2, cross_age
 
-    if cross_idx is None:
-        return "none", None
+    return 1, cross_age
 
+
+def _golden_cross_numpy_kernel(ma5: np.ndarray, ma20: np.ndarray, close: np.ndarray) -> tuple[int, int]:
+    n = ma5.shape[0]
+    if n < MA_LONG + 5:
+        return 0, -1
+    if not ma5[-1] > ma20[-1]:
+        return 0, -1
+
+    # 在 (n-60, n-1] 区间内一次性找出全部上穿点，取最近的一个
+    lower = max(0, n - CROSS_SEARCH_DAYS)
+    crosses = np.flatnonzero((ma5[lower + 1:] > ma20[lower + 1:]) & (ma5[lower:-1] <= ma20[lower:-1]))
+    if crosses.size == 0:
+        return 0, -1
+
+    cross_idx = lower + 1 + int(crosses[-1])
     cross_age = n - 1 - cross_idx
     if cross_age > GOLDEN_CROSS_DECAY_DAYS:
-        return "none", None
+        return 0, -1
+
+    recent_close = close[-min(CROSS_SEARCH_DAYS, close.shape[0]):]
+    valid_close = recent_close[~np.isnan(recent_close)]
+    if valid_close.size:
+        low_60 = valid_close.min()
+        if low_60 > 0 and (close[-1] / low_60 - 1) > CROSS_HIGH_RATIO:
+            return 3, cross_age
+
+    start = max(0, cross_idx - min(SECOND_CROSS_LOOKBACK, n - 1))
+    if cross_idx - 1 > start:
+        death_crosses = (ma5[start + 1:cross_idx] < ma20[start + 1:cross_idx]) & (ma5[start:cross_idx - 1] >= ma20[start:cross_idx - 1])
+        if death_crosses.any():
+            return 2, cross_age
+
+    return 1, cross_age
+
+
+@_maybe_njit
+def _shrinking_down_loop_kernel(recent_close, recent_volume, volume_threshold):
+    size = recent_close.shape[0]
+    pre_high_idx = -1
+    for index in range(size):
+        value = recent_close[index]
+        if not np.isnan(value) and (pre_high_idx < 0 or value > recent_close[pre_high_idx]):
+            pre_high_idx = index
+
+    hits = np.empty(size, dtype=np.float64)
+    count = 0
+    if pre_high_idx < 0:
+        return hits[:0]
+    for index in range(pre_high_idx + 1, size):
+        volume_value = recent_volume[index]
+        if (
+            recent_close[index] < recent_close[index - 1]
+            and volume_value < volume_threshold
+            and volume_value < recent_volume[index - 1]
+        ):
+            hits[count] = volume_value
+            count += 1
+    return hits[:count]
+
+
+def _shrinking_down_numpy_kernel(recent_close: np.ndarray, recent_volume: np.ndarray, volume_threshold: float) -> np.ndarray:
+    # 收盘价全为 NaN 时没有前高，与循环版一样返回空（np.nanargmax 会抛 ValueError）
+    if np.isnan(recent_close).all():
+        return recent_close[:0]
+    pre_high_idx = int(np.nanargmax(recent_close))
+    current = slice(pre_high_idx + 1, recent_close.shape[0])
+    previous = slice(pre_high_idx, recent_close.shape[0] - 1)
+    volume_values = recent_volume[current]
+    mask = (
+        (recent_close[current] < recent_close[previous])
+        & (volume_values < volume_threshold)
+        & (volume_values < recent_volume[previous])
+    )
+    return volume_values[mask]
 
-    lookback = min(60, len(close))
-    low_60 = close.iloc[-lookback:].min()
-    if low_60 > 0 and (close.iloc[-1] / low_60 - 1) > 0.30:
-        return "high", cross_age
 
-    start = max(0, cross_idx - min(30, n - 1))
-    for index in range(cross_idx - 1, start, -1):
-        if index - 1 < 0:
-            break
-        if any(pd.isna(series.iloc[index]) or pd.isna(series.iloc[index - 1]) for series in (ma5, ma20)):
-            continue
-        if ma5.iloc[index] < ma20.iloc[index] and ma5.iloc[index - 1] >= ma20.iloc[index - 1]:
-            return "second", cross_age
+if njit is None:
+    INDICATOR_KERNEL_BACKEND = "numpy"
+    _golden_cross_kernel = _golden_cross_numpy_kernel
+    _shrinking_down_kernel = _shrinking_down_numpy_kernel
+else:
+    INDICATOR_KERNEL_BACKEND = "numba"
+    _golden_cross_kernel = _golden_cross_loop_kernel
+    _shrinking_down_kernel = _shrinking_down_loop_kernel
 
-    return "first", cross_age
+
+def detect_golden_cross_type_and_age(ma5: pd.Series, ma20: pd.Series, close: pd.Series) -> tuple[str, int | None]:
+    cross_code, cross_age = _golden_cross_kernel(_as_float_array(ma5), _as_float_array(ma20), _as_float_array(close))
+    if cross_code == 0:
+        return "none", None
+    return CROSS_TYPE_NAMES[cross_code], int(cross_age)
 
 
 def detect_golden_cross_type(ma5: pd.Series, ma20: pd.Series, close: pd.Series) -> str:
@@ -196,28 +360,22 @@ def get_shrinking_down_day_volumes(
     if len(close) < 2 or len(volume) < lookback:
         return []
 
-    recent_close = close.iloc[-lookback:]
-    recent_volume = volume.iloc[-lookback:]
-    
-    # 寻找这 60 天内的“前高”（收盘价最高点）所在索引
-    # 这样回踩的时间段就被严格限制在 MIN(60, 距离前高的天数)
-    pre_high_idx = int(recent_close.argmax())
-    
-    volume_mean = recent_volume.mean()
+    recent_close = _as_float_array(close)[-lookback:]
+    recent_volume = _as_float_array(volume)[-lookback:]
+
+    # 均值与 pandas 的 skipna 口径保持一致：NaN 记 0 求和，再除以有效样本数
+    volume_nan = np.isnan(recent_volume)
+    valid_count = int(recent_volume.shape[0] - volume_nan.sum())
+    if valid_count == 0:
+        return []
+    volume_mean = np.where(volume_nan, 0.0, recent_volume).sum() / valid_count
     if volume_mean <= 0 or math.isnan(volume_mean):
         return []
 
-    shrinking_down_volumes: list[float] = []
-    # 只从“前高”那一天之后开始往后统计缩量回踩，之前的缩量将不纳入本次统计
-    for index in range(pre_high_idx + 1, len(recent_close)):
-        is_down_day = recent_close.iloc[index] < recent_close.iloc[index - 1]
-        volume_value = recent_volume.iloc[index]
-        prev_volume = recent_volume.iloc[index - 1]
-        is_shrinking_volume = volume_value < volume_mean * SHRINKING_DOWN_RATIO and volume_value < prev_volume
-        if is_down_day and is_shrinking_volume:
-            shrinking_down_volumes.append(float(volume_value))
-
-    return shrinking_down_volumes
+    # 以 60 天内收盘价“前高”为起点，只统计其后的缩量回踩
+    # 这样回踩的时间段就被严格限制在 MIN(60, 距离前高的天数)
+    volumes = _shrinking_down_kernel(recent_close, recent_volume, volume_mean * SHRINKING_DOWN_RATIO)
+    return [float(value) for value in volumes]
 
 
 def count_shrinking_down_days(close: pd.Series, volume: pd.Series, lookback: int = SHRINKING_DOWN_LOOKBACK) -> int:
@@ -2,20 +2,53 @@
 
 负责从 akshare 拉取沪深北股票基础信息，构建代码和名称索引，
 并提供带缓存的股票查询能力。
+
+目录持久化在 stock.db 的 stock_directory 表：进程启动时从库中加载（毫秒级），
+超过刷新间隔后在后台线程重新拉取 akshare 并写回库，再整体替换内存索引（写时复制），
+读者始终拿到一份完整的旧索引或新索引，不需要加锁。
+
+索引除代码、规范化名称的精确匹配外，还对简称、全称和拼音首字母建立单字/双字 n-gram
+倒排表，支持按名称片段或拼音首字母（如 PAYH → 平安银行）返回排序后的候选。
+拼音首字母在刷新时由可选依赖 pypinyin 计算并随目录落库，未安装时不提供拼音检索。
 """
 
 from __future__ import annotations
 
+import bisect
+import sqlite3
 import threading
 import time
 import unicodedata
+from datetime import datetime
+from pathlib import Path
 from typing import Dict, List, Optional
 
+import pandas as pd
+
 try:
     import akshare as ak
 except ImportError:
     ak = None
 
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DB_PATH = BASE_DIR / "data" / "stock.db"
+
+DIRECTORY_REFRESH_SECONDS = 6 * 60 * 60
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+
+# 匹配字段，数值越小排序越靠前
+FIELD_CODE = 0
+FIELD_NAME = 1
+FIELD_FULL_NAME = 2
+FIELD_PINYIN = 3
+FIELD_LABELS = {FIELD_CODE: "code", FIELD_NAME: "name", FIELD_FULL_NAME: "full_name", FIELD_PINYIN: "pinyin"}
+
 
 def normalize_company_name(value: Optional[str]) -> str:
     if not value:
@@ -24,96 +57,365 @@ def normalize_company_name(value: Optional[str]) -> str:
     return "".join(normalized.split()).upper()
 
 
-class StockDirectoryService:
-    def __init__(self, refresh_interval_seconds: int = 6 * 60 * 60):
-        self.refresh_interval_seconds = refresh_interval_seconds
-        self._lock = threading.Lock()
-        self._last_loaded_at = 0.0
-        self._records_by_code: Dict[str, Dict[str, Optional[str]]] = {}
-        self._records_by_name: Dict[str, List[Dict[str, Optional[str]]]] = {}
-
-    def _build_record(self, code: str, name: str, exchange: str, full_name: Optional[str] = None):
-        normalized_code = str(code).strip().zfill(6)
-        normalized_name = str(name).strip()
-        normalized_full_name = str(full_name).strip() if full_name else None
-        return {
-            "code": normalized_code,
-            "name": normalized_name,
-            "full_name": normalized_full_name,
-            "exchange": exchange,
-        }
-
-    def _index_record(self, record: Dict[str, Optional[str]]):
-        self._records_by_code[record["code"]] = record
-        for raw_name in (record.get("name"), record.get("full_name")):
-            key = normalize_company_name(raw_name)
-            if not key:
+def normalize_company_names(values: pd.Series) -> pd.Series:
+    """normalize_company_name 的列式版本，空值得到空串。"""
+    text = values.fillna("").astype(str).str.normalize("NFKC")
+    return text.str.replace(r"\s+", "", regex=True).str.upper()
+
+
+def pinyin_initials(name: Optional[str]) -> str:
+    """简称的拼音首字母（大写，只保留字母数字），未安装 pypinyin 时为空串。"""
+    key = normalize_company_name(name)
+    if lazy_pinyin is None or not key:
+        return ""
+    letters = "".join(lazy_pinyin(key, style=Style.FIRST_LETTER, errors="default")).upper()
+    return "".join(ch for ch in letters if ch.isascii() and ch.isalnum())
+
+
+def build_directory_records(
+    df: pd.DataFrame,
+    code_column: str,
+    name_column: str,
+    exchange: str,
+    full_name_column: Optional[str] = None,
+) -> List[Dict[str, Optional[str]]]:
+    """把交易所的代码表整列转换为目录记录，代码补足 6 位，名称去掉首尾空白。"""
+    codes = df[code_column].astype(str).str.strip().str.zfill(6).tolist()
+    names = df[name_column].astype(str).str.strip().tolist()
+    if full_name_column and full_name_column in df.columns:
+        raw = df[full_name_column]
+        present = (raw.notna() & (raw.astype(str) != "")).tolist()
+        stripped = raw.astype(str).str.strip().tolist()
+        full_names = [value if ok else None for value, ok in zip(stripped, present)]
+    else:
+        full_names = [None] * len(codes)
+    return [
+        {"code": code, "name": name, "full_name": full_name, "exchange": exchange}
+        for code, name, full_name in zip(codes, names, full_names)
+    ]
+
+
+def _name_keys(records: List[Dict[str, Optional[str]]]):
+    name_keys = normalize_company_names(pd.Series([record["name"] for record in records], dtype=object)).tolist()
+    full_name_keys = normalize_company_names(pd.Series([record["full_name"] for record in records], dtype=object)).tolist()
+    return name_keys, full_name_keys
+
+
+def index_directory_records(records: List[Dict[str, Optional[str]]], keys=None):
+    """按代码和规范化名称（简称、全称）建立索引，名称键整列计算。"""
+    name_keys, full_name_keys = keys if keys is not None else _name_keys(records)
+
+    records_by_code: Dict[str, Dict[str, Optional[str]]] = {}
+    records_by_name: Dict[str, List[Dict[str, Optional[str]]]] = {}
+    for record, name_key, full_name_key in zip(records, name_keys, full_name_keys):
+        records_by_code[record["code"]] = record
+        for key in (name_key, full_name_key):
+            if key:
+                records_by_name.setdefault(key, []).append(record)
+    return records_by_code, records_by_name
+
+
+def _grams(text: str) -> set:
+    """单字和双字片段；查询一个字时用单字表，否则用双字表求交集。"""
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _query_grams(key: str) -> set:
+    return {key} if len(key) == 1 else {key[i:i + 2] for i in range(len(key) - 1)}
+
+
+class DirectoryIndex:
+    """一份不可变的目录索引；刷新时整体重建，补全全称时复制受影响部分，之后替换引用。"""
+
+    def __init__(self, records: List[Dict[str, Optional[str]]], initials: Optional[List[str]] = None, loaded_at: float = 0.0):
+        self.records = records
+        self.initials = initials if initials is not None else [""] * len(records)
+        self.loaded_at = loaded_at
+
+        keys = _name_keys(records)
+        self.records_by_code, self.records_by_name = index_directory_records(records, keys=keys)
+        self.codes = sorted(self.records_by_code)
+
+        # n-gram 倒排表在第一次检索时才构建，启动加载只需精确匹配所需的两张表
+        self._keys = keys
+        self._texts: List[tuple] = []
+        self._postings: Optional[Dict[str, List[int]]] = None
+        self._postings_lock = threading.Lock()
+
+    def _build_postings(self) -> Dict[str, List[int]]:
+        """_texts[i] = (记录位置, 字段, 规范化文本)；倒排表: 片段 → 升序的文本编号。"""
+        with self._postings_lock:
+            if self._postings is not None:
+                return self._postings
+            texts: List[tuple] = []
+            postings: Dict[str, List[int]] = {}
+            for position, values in enumerate(zip(*self._keys, self.initials)):
+                for field, text in zip((FIELD_NAME, FIELD_FULL_NAME, FIELD_PINYIN), values):
+                    if not text:
+                        continue
+                    text_id = len(texts)
+                    texts.append((position, field, text))
+                    for gram in _grams(text):
+                        postings.setdefault(gram, []).append(text_id)
+            self._texts = texts
+            self._postings = postings
+            return postings
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def with_full_name(self, code: str, full_name: str) -> "DirectoryIndex":
+        """补全一只股票的全称，返回新索引；只复制受影响的列表和字典，已建好的倒排表追加新片段后沿用。"""
+        old_record = self.records_by_code.get(code)
+        if old_record is None:
+            return self
+        if old_record.get("full_name"):
+            records = [{**record, "full_name": full_name} if record["code"] == code else record for record in self.records]
+            return DirectoryIndex(records, self.initials, self.loaded_at)
+
+        position = self.records.index(old_record)
+        record = {**old_record, "full_name": full_name}
+        full_name_key = normalize_company_name(full_name)
+
+        patched = DirectoryIndex.__new__(DirectoryIndex)
+        patched.initials = self.initials
+        patched.loaded_at = self.loaded_at
+        patched.codes = self.codes
+        patched.records = list(self.records)
+        patched.records[position] = record
+        patched.records_by_code = {**self.records_by_code, code: record}
+        patched.records_by_name = dict(self.records_by_name)
+        name_key = self._keys[0][position]
+        if name_key:
+            patched.records_by_name[name_key] = [record if item is old_record else item for item in self.records_by_name[name_key]]
+        if full_name_key:
+            patched.records_by_name[full_name_key] = [
+                record if item is old_record else item for item in self.records_by_name.get(full_name_key, [])
+            ]
+            if record not in patched.records_by_name[full_name_key]:
+                patched.records_by_name[full_name_key].append(record)
+
+        full_name_keys = list(self._keys[1])
+        full_name_keys[position] = full_name_key
+        patched._keys = (self._keys[0], full_name_keys)
+        patched._postings_lock = threading.Lock()
+        patched._texts = []
+        patched._postings = None
+        if self._postings is not None and full_name_key:
+            # 新文本编号最大，追加到各片段列表末尾后仍保持升序
+            text_id = len(self._texts)
+            patched._texts = self._texts + [(position, FIELD_FULL_NAME, full_name_key)]
+            patched._postings = dict(self._postings)
+            for gram in _grams(full_name_key):
+                patched._postings[gram] = self._postings.get(gram, []) + [text_id]
+        elif self._postings is not None:
+            patched._texts = self._texts
+            patched._postings = self._postings
+        return patched
+
+    def _candidate_texts(self, key: str) -> set:
+        index = self._postings if self._postings is not None else self._build_postings()
+        postings = [index.get(gram) for gram in _query_grams(key)]
+        if not postings or any(posting is None for posting in postings):
+            return set()
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return candidates
+
+    def search(self, keyword: str, limit: int = SEARCH_DEFAULT_LIMIT) -> List[Dict[str, Optional[str]]]:
+        """按代码前缀、名称片段、拼音首字母检索；完全匹配 > 前缀 > 包含，同档按字段、名称长度排序。"""
+        key = normalize_company_name(keyword)
+        if not key or limit <= 0:
+            return []
+
+        best: Dict[str, tuple] = {}
+
+        def offer(record, rank):
+            code = record["code"]
+            if code not in best or rank < best[code][0]:
+                best[code] = (rank, record)
+
+        if key.isdigit():
+            position = bisect.bisect_left(self.codes, key)
+            while position < len(self.codes) and self.codes[position].startswith(key):
+                code = self.codes[position]
+                offer(self.records_by_code[code], (0 if code == key else 1, FIELD_CODE, len(code), code))
+                position += 1
+
+        for text_id in self._candidate_texts(key):
+            position, field, text = self._texts[text_id]
+            if key not in text:
                 continue
-            bucket = self._records_by_name.setdefault(key, [])
-            if all(existing["code"] != record["code"] for existing in bucket):
-                bucket.append(record)
+            tier = 0 if text == key else 1 if text.startswith(key) else 2
+            record = self.records[position]
+            offer(record, (tier, field, len(text), record["code"]))
 
-    def _reload_directory(self):
-        if ak is None:
-            raise RuntimeError("akshare is not installed")
-
-        records: List[Dict[str, Optional[str]]] = []
-
-        sh_df = ak.stock_info_sh_name_code()
-        for _, row in sh_df.iterrows():
-            records.append(
-                self._build_record(
-                    code=row["证券代码"],
-                    name=row["证券简称"],
-                    full_name=row.get("公司全称"),
-                    exchange="SH",
-                )
-            )
+        ranked = sorted(best.values(), key=lambda item: item[0])[:limit]
+        return [{**record, "matched_by": FIELD_LABELS[rank[1]]} for rank, record in ranked]
 
-        sz_df = ak.stock_info_sz_name_code()
-        for _, row in sz_df.iterrows():
-            records.append(
-                self._build_record(
-                    code=row["A股代码"],
-                    name=row["A股简称"],
-                    exchange="SZ",
-                )
-            )
 
-        bj_df = ak.stock_info_bj_name_code()
-        for _, row in bj_df.iterrows():
-            records.append(
-                self._build_record(
-                    code=row["证券代码"],
-                    name=row["证券简称"],
-                    exchange="BJ",
-                )
+def _connect(db_path: Path) -> sqlite3.Connection:
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), timeout=10)
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS stock_directory (
+            code TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            full_name TEXT,
+            exchange TEXT NOT NULL,
+            pinyin_initials TEXT NOT NULL DEFAULT '',
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+    return conn
+
+
+def load_directory(db_path: Path = DB_PATH) -> DirectoryIndex:
+    """从库中加载目录；loaded_at 取最近一次刷新时间，库中没有目录时返回空索引。"""
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT code, name, full_name, exchange, pinyin_initials, updated_at FROM stock_directory ORDER BY exchange, code"
+        ).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        return DirectoryIndex([])
+    records = [{"code": row[0], "name": row[1], "full_name": row[2], "exchange": row[3]} for row in rows]
+    loaded_at = datetime.strptime(max(row[5] for row in rows), "%Y-%m-%d %H:%M:%S").timestamp()
+    return DirectoryIndex(records, [row[4] or "" for row in rows], loaded_at=loaded_at)
+
+
+def save_directory(db_path: Path, records: List[Dict[str, Optional[str]]]) -> int:
+    """整表替换目录；新数据缺全称时保留库中此前补全的全称。"""
+    updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    rows = [
+        (record["code"], record["name"], record["full_name"], record["exchange"], pinyin_initials(record["name"]), updated_at)
+        for record in records
+    ]
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO stock_directory(code, name, full_name, exchange, pinyin_initials, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(code) DO UPDATE SET
+                    name = excluded.name,
+                    full_name = COALESCE(excluded.full_name, stock_directory.full_name),
+                    exchange = excluded.exchange,
+                    pinyin_initials = excluded.pinyin_initials,
+                    updated_at = excluded.updated_at
+                """,
+                rows,
             )
+            conn.execute("DELETE FROM stock_directory WHERE updated_at <> ?", (updated_at,))
+    finally:
+        conn.close()
+    return len(rows)
 
-        records_by_code: Dict[str, Dict[str, Optional[str]]] = {}
-        records_by_name: Dict[str, List[Dict[str, Optional[str]]]] = {}
-        for record in records:
-            records_by_code[record["code"]] = record
-            for raw_name in (record.get("name"), record.get("full_name")):
-                key = normalize_company_name(raw_name)
-                if not key:
-                    continue
-                records_by_name.setdefault(key, []).append(record)
 
-        self._records_by_code = records_by_code
-        self._records_by_name = records_by_name
-        self._last_loaded_at = time.time()
+def save_full_name(db_path: Path, code: str, full_name: str) -> None:
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute("UPDATE stock_directory SET full_name = ? WHERE code = ?", (full_name, code))
+    finally:
+        conn.close()
 
-    def _ensure_loaded(self):
-        now = time.time()
-        if self._records_by_code and now - self._last_loaded_at < self.refresh_interval_seconds:
-            return
 
+def fetch_directory_records() -> List[Dict[str, Optional[str]]]:
+    if ak is None:
+        raise RuntimeError("akshare is not installed")
+
+    records: List[Dict[str, Optional[str]]] = []
+    records += build_directory_records(
+        ak.stock_info_sh_name_code(), "证券代码", "证券简称", "SH", full_name_column="公司全称"
+    )
+    records += build_directory_records(ak.stock_info_sz_name_code(), "A股代码", "A股简称", "SZ")
+    records += build_directory_records(ak.stock_info_bj_name_code(), "证券代码", "证券简称", "BJ")
+    return records
+
+
+class StockDirectoryService:
+    def __init__(self, refresh_interval_seconds: int = DIRECTORY_REFRESH_SECONDS, db_path: Path = DB_PATH):
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.db_path = Path(db_path)
+        # _lock 保护索引替换和后台刷新标记；_refresh_lock 保证同一时间只有一次远程刷新
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+        self._enriching: set = set()
+        self._index: Optional[DirectoryIndex] = None
+
+    def _refresh_locked(self) -> int:
+        records = fetch_directory_records()
+        if not records:
+            raise RuntimeError("akshare 返回的股票目录为空")
+        count = save_directory(self.db_path, records)
+        index = load_directory(self.db_path)
+        with self._lock:
+            self._index = index
+        return count
+
+    def refresh(self) -> int:
+        """从 akshare 重新拉取目录并落库，再从库中重建索引后整体替换。"""
+        with self._refresh_lock:
+            return self._refresh_locked()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as exc:
+            print(f"股票目录后台刷新失败: {exc}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _schedule_refresh(self):
+        if ak is None:
+            return
         with self._lock:
-            now = time.time()
-            if self._records_by_code and now - self._last_loaded_at < self.refresh_interval_seconds:
+            if self._refreshing:
                 return
-            self._reload_directory()
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, name="stock-directory-refresh", daemon=True).start()
+
+    def _current_index(self) -> DirectoryIndex:
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = load_directory(self.db_path)
+                index = self._index
+
+        if not len(index):
+            # 库中还没有目录，只能同步拉取一次；并发的首次查询等待同一次刷新
+            with self._refresh_lock:
+                if not len(self._index):
+                    self._refresh_locked()
+            return self._index
+
+        if time.time() - index.loaded_at >= self.refresh_interval_seconds:
+            self._schedule_refresh()
+        return index
+
+    def warm(self):
+        """启动时调用：从库中加载目录，缺失或过期时交给后台线程刷新，不阻塞启动。"""
+        if lazy_pinyin is None:
+            print("[目录] 未安装 pypinyin，拼音首字母搜索不可用（pip install pypinyin）")
+        with self._lock:
+            if self._index is None:
+                self._index = load_directory(self.db_path)
+            index = self._index
+        if not len(index) or time.time() - index.loaded_at >= self.refresh_interval_seconds:
+            self._schedule_refresh()
 
     def _enrich_full_name(self, record: Dict[str, Optional[str]]):
         if record.get("full_name"):
@@ -122,21 +424,32 @@ class StockDirectoryService:
         if ak is None:
             return record
 
+        code = record["code"]
         with self._lock:
-            current = self._records_by_code.get(record["code"], record)
-            if current.get("full_name"):
-                return current
-
-            profile_df = ak.stock_profile_cninfo(symbol=current["code"])
-            if not profile_df.empty:
-                full_name = profile_df.iloc[0].get("公司名称")
-                if full_name:
-                    current["full_name"] = str(full_name).strip()
-                    self._index_record(current)
-            return current
+            if code in self._enriching:
+                return record
+            self._enriching.add(code)
+        try:
+            # 网络请求在锁外执行，不阻塞其他查询
+            profile_df = ak.stock_profile_cninfo(symbol=code)
+            full_name = profile_df.iloc[0].get("公司名称") if not profile_df.empty else None
+        finally:
+            with self._lock:
+                self._enriching.discard(code)
+        if not full_name:
+            return record
+
+        full_name = str(full_name).strip()
+        save_full_name(self.db_path, code, full_name)
+        with self._lock:
+            self._index = self._index.with_full_name(code, full_name)
+        return {**record, "full_name": full_name}
+
+    def search(self, keyword: str, limit: int = SEARCH_DEFAULT_LIMIT):
+        return self._current_index().search(keyword, limit=min(max(int(limit), 1), SEARCH_MAX_LIMIT))
 
     def lookup(self, query_type: str, keyword: str):
-        self._ensure_loaded()
+        index = self._current_index()
 
         raw_keyword = str(keyword or "").strip()
         if not raw_keyword:
@@ -144,10 +457,15 @@ class StockDirectoryService:
 
         if query_type == "code":
             code = raw_keyword.zfill(6)
-            record = self._records_by_code.get(code)
+            record = index.records_by_code.get(code)
         elif query_type == "name":
-            matched_records = self._records_by_name.get(normalize_company_name(raw_keyword), [])
+            matched_records = index.records_by_name.get(normalize_company_name(raw_keyword), [])
             record = matched_records[0] if matched_records else None
+            if record is None:
+                # 没有完全同名时取排序第一的名称片段/拼音首字母匹配
+                matches = index.search(raw_keyword, limit=1)
+                if matches:
+                    record = index.records_by_code.get(matches[0]["code"])
         else:
             raise ValueError("query_type must be 'code' or 'name'")
 
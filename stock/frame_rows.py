@@ -0,0 +1,54 @@
+"""DataFrame → executemany 行的列式转换。
+
+写库前不再用 itertuples/iterrows 逐行取属性：每列先整体 tolist() 转成 Python 原生类型
+（sqlite3 不接受 numpy.int64），再按列 zip 成元组；固定值（如股票代码、更新时间）用 repeat 补齐。
+"""
+
+from __future__ import annotations
+
+from itertools import repeat
+from typing import Iterable, Sequence
+
+import pandas as pd
+
+
+def column_values(df: pd.DataFrame, column: str) -> list:
+    return df[column].to_numpy().tolist()
+
+
+def frame_rows(
+    df: pd.DataFrame,
+    columns: Sequence[str],
+    prefix: Iterable = (),
+    suffix: Iterable = (),
+) -> list[tuple]:
+    """按 columns 顺序取出各行，prefix/suffix 中的常量分别放在每行首尾。"""
+    count = len(df)
+    leading = [repeat(value, count) for value in prefix]
+    trailing = [repeat(value, count) for value in suffix]
+    return list(zip(*leading, *(column_values(df, column) for column in columns), *trailing))
+
+
+def stock_rows(stocks_df: pd.DataFrame, updated_at: str) -> list[tuple]:
+    """stocks 表的 (code, name, board, is_st, updated_at) 行。"""
+    return list(zip(
+        column_values(stocks_df, "code"),
+        column_values(stocks_df, "name"),
+        column_values(stocks_df, "board"),
+        stocks_df["is_st"].astype(int).tolist(),
+        repeat(updated_at, len(stocks_df)),
+    ))
+
+
+def daily_bar_rows(code: str, bars_df: pd.DataFrame) -> list[tuple]:
+    """daily_bars 表的 (code, trade_date, open, high, low, close, volume) 行。"""
+    return frame_rows(bars_df, ["date", "open", "high", "low", "close", "volume"], prefix=(code,))
+
+
+INTRADAY_ROW_COLUMNS = ["open", "close", "high", "low", "avg_price", "volume", "amount", "change_pct", "change_amount"]
+
+
+def intraday_bar_rows(intra_df: pd.DataFrame) -> list[tuple]:
+    """分钟线写入行：首列为 trade_timestamp 的 epoch 秒，其余按 INTRADAY_ROW_COLUMNS。"""
+    epochs = (pd.to_datetime(intra_df["trade_timestamp"]) - pd.Timestamp("1970-01-01")) // pd.Timedelta(seconds=1)
+    return list(zip(epochs.astype("int64").tolist(), *(column_values(intra_df, column) for column in INTRADAY_ROW_COLUMNS)))
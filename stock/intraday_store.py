@@ -0,0 +1,300 @@
+"""分时数据的按月分区存储。
+
+分钟线按交易月份拆成 intraday_bars_YYYYMM 分区表，主键 (code, ts) 且 WITHOUT ROWID，
+同一只股票的分钟按时间聚簇存放，读取某只股票最近几天只需在最新一两个分区里做一次范围扫描。
+
+ts 为整数秒：把北京时间的墙上时间按 UTC 换算（即 strftime('%s', 'YYYY-MM-DD HH:MM:SS')），
+这样 date(ts, 'unixepoch') / time(ts, 'unixepoch') 直接得到交易日期和时间，无需时区换算。
+
+保留策略：只保留最近 INTRADAY_RETENTION_DAYS 天的分钟线；compact_intraday 把更早的分钟
+汇总成 intraday_daily_aggregates 的日度聚合，再删除过期分钟，整月过期的分区直接 DROP。
+"""
+
+from __future__ import annotations
+
+import calendar
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+# 分钟线保留天数（自然日），需大于同步时的分时抓取窗口，避免刚压缩的分钟又被写回
+INTRADAY_RETENTION_DAYS = 30
+INTRADAY_PARTITION_PREFIX = "intraday_bars_"
+INTRADAY_PARTITION_GLOB = "intraday_bars_[0-9][0-9][0-9][0-9][0-9][0-9]"
+INTRADAY_VALUE_COLUMNS = (
+    "open", "close", "high", "low", "avg_price", "volume", "amount", "change_pct", "change_amount",
+)
+SECONDS_PER_DAY = 86400
+EPOCH = datetime(1970, 1, 1)
+
+
+def timestamp_to_epoch(value: str) -> int:
+    """'YYYY-MM-DD HH:MM:SS' → 墙上时间按 UTC 换算的整数秒。"""
+    return calendar.timegm(datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S").timetuple())
+
+
+def date_to_epoch(trade_date: str) -> int:
+    return calendar.timegm(datetime.strptime(trade_date, "%Y-%m-%d").timetuple())
+
+
+def epoch_to_timestamp(ts: int) -> str:
+    return (EPOCH + timedelta(seconds=int(ts))).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def partition_name(trade_date: str) -> str:
+    return f"{INTRADAY_PARTITION_PREFIX}{trade_date[:4]}{trade_date[5:7]}"
+
+
+def partition_for_epoch(ts: int) -> str:
+    return partition_name(epoch_to_timestamp(ts))
+
+
+def list_partitions(conn: sqlite3.Connection) -> list[str]:
+    """已有分区表名，按月份升序。"""
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name",
+        (INTRADAY_PARTITION_GLOB,),
+    ).fetchall()
+    return [str(row[0]) for row in rows]
+
+
+def ensure_partition(conn: sqlite3.Connection, name: str) -> None:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            code TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            open REAL,
+            close REAL,
+            high REAL,
+            low REAL,
+            avg_price REAL,
+            volume REAL,
+            amount REAL,
+            change_pct REAL,
+            change_amount REAL,
+            PRIMARY KEY (code, ts)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def migrate_legacy_intraday(conn: sqlite3.Connection) -> int:
+    """把旧的单表 intraday_bars（TEXT 时间戳）按月搬入分区表后删除旧表，返回迁移行数。"""
+    legacy = conn.execute(
+        "SELECT type FROM sqlite_master WHERE name = 'intraday_bars'"
+    ).fetchone()
+    if not legacy:
+        return 0
+    if str(legacy[0]) == "view":
+        conn.execute("DROP VIEW intraday_bars")
+        return 0
+
+    migrated = 0
+    months = [str(row[0]) for row in conn.execute("SELECT DISTINCT substr(trade_date, 1, 7) FROM intraday_bars").fetchall()]
+    with conn:
+        for month in months:
+            name = partition_name(f"{month}-01")
+            ensure_partition(conn, name)
+            cursor = conn.execute(
+                f"""
+                INSERT OR REPLACE INTO {name}(code, ts, {', '.join(INTRADAY_VALUE_COLUMNS)})
+                SELECT code, CAST(strftime('%s', trade_timestamp) AS INTEGER), {', '.join(INTRADAY_VALUE_COLUMNS)}
+                FROM intraday_bars
+                WHERE trade_date >= ? AND trade_date < ?
+                """,
+                (f"{month}-01", f"{month}-32"),
+            )
+            migrated += cursor.rowcount
+        conn.execute("DROP INDEX IF EXISTS idx_intraday_bars_code_date_time")
+        conn.execute("DROP TABLE intraday_bars")
+    return migrated
+
+
+def latest_epoch(conn: sqlite3.Connection, code: str, partitions: Optional[list[str]] = None) -> Optional[int]:
+    """该股票已入库的最新分钟；从最新分区往前找，命中即停。"""
+    for name in reversed(partitions if partitions is not None else list_partitions(conn)):
+        row = conn.execute(f"SELECT MAX(ts) FROM {name} WHERE code = ?", (code,)).fetchone()
+        if row and row[0] is not None:
+            return int(row[0])
+    return None
+
+
+def write_intraday_bars(conn: sqlite3.Connection, code: str, rows: Iterable[tuple]) -> int:
+    """只写入比库中最新分钟更新的分钟（含最新那一分钟，盘中同步时它可能尚未走完）。
+
+    rows 为 (ts, open, close, high, low, avg_price, volume, amount, change_pct, change_amount)，返回写入行数。
+    调用方负责提交事务。
+    """
+    partitions = list_partitions(conn)
+    since = latest_epoch(conn, code, partitions)
+    rows_by_partition: dict[str, list[tuple]] = {}
+    for row in rows:
+        if since is not None and row[0] < since:
+            continue
+        rows_by_partition.setdefault(partition_for_epoch(row[0]), []).append((code, *row))
+
+    written = 0
+    placeholders = ", ".join("?" for _ in range(len(INTRADAY_VALUE_COLUMNS) + 2))
+    for name, partition_rows in rows_by_partition.items():
+        if name not in partitions:
+            ensure_partition(conn, name)
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {name}(code, ts, {', '.join(INTRADAY_VALUE_COLUMNS)}) VALUES ({placeholders})",
+            partition_rows,
+        )
+        written += len(partition_rows)
+    return written
+
+
+def recent_trade_dates(conn: sqlite3.Connection, code: str, lookback_days: int) -> list[str]:
+    """该股票最近 lookback_days 个有分钟数据的交易日（升序）。
+
+    每个交易日只做一次 (code, ts) 主键上的倒序定位，从最新分区往前，够数即停。
+    """
+    dates: list[str] = []
+    bound: Optional[int] = None
+    for name in reversed(list_partitions(conn)):
+        while len(dates) < lookback_days:
+            if bound is None:
+                row = conn.execute(f"SELECT MAX(ts) FROM {name} WHERE code = ?", (code,)).fetchone()
+            else:
+                row = conn.execute(f"SELECT MAX(ts) FROM {name} WHERE code = ? AND ts < ?", (code, bound)).fetchone()
+            if row is None or row[0] is None:
+                break
+            bound = int(row[0]) // SECONDS_PER_DAY * SECONDS_PER_DAY
+            dates.append(epoch_to_timestamp(bound)[:10])
+        if len(dates) >= lookback_days:
+            break
+    return sorted(dates)
+
+
+def load_intraday_rows(conn: sqlite3.Connection, code: str, start_date: str, end_date: Optional[str] = None) -> list[tuple]:
+    """读取 [start_date, end_date] 内的分钟线，只访问与日期范围相交的分区。
+
+    返回 (trade_timestamp, trade_date, trade_time, open, close, high, low, avg_price, volume, amount,
+    change_pct, change_amount) 元组，按时间升序。
+    """
+    start_ts = date_to_epoch(start_date)
+    end_ts = date_to_epoch(end_date) + SECONDS_PER_DAY if end_date else None
+    first, last = partition_name(start_date), partition_name(end_date) if end_date else None
+    result: list[tuple] = []
+    for name in list_partitions(conn):
+        if name < first or (last is not None and name > last):
+            continue
+        query = (
+            f"SELECT datetime(ts, 'unixepoch'), date(ts, 'unixepoch'), time(ts, 'unixepoch'), "
+            f"{', '.join(INTRADAY_VALUE_COLUMNS)} FROM {name} WHERE code = ? AND ts >= ?"
+        )
+        params: list = [code, start_ts]
+        if end_ts is not None:
+            query += " AND ts < ?"
+            params.append(end_ts)
+        result.extend(tuple(row) for row in conn.execute(query + " ORDER BY ts", params).fetchall())
+    return result
+
+
+def load_last_day_avg_prices(conn: sqlite3.Connection, codes: list[str]) -> dict[str, tuple[str, list[float]]]:
+    """批量取各股最近一个交易日的分钟均价，返回 {code: (trade_date, prices)}。
+
+    从最新分区往前查，已找到的代码不再访问更早的分区；代码列表以 JSON 数组整体绑定。
+    """
+    result: dict[str, tuple[str, list[float]]] = {}
+    pending = list(codes)
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    for name in reversed(list_partitions(conn)):
+        if not pending:
+            break
+        rows = cursor.execute(
+            f"""
+            WITH last_day AS (
+                SELECT
+                    w.value AS code,
+                    (SELECT MAX(x.ts) FROM {name} x WHERE x.code = w.value) / {SECONDS_PER_DAY} * {SECONDS_PER_DAY} AS day_start
+                FROM json_each(?) w
+            )
+            SELECT b.code, date(d.day_start, 'unixepoch'), b.avg_price
+            FROM last_day d
+            INNER JOIN {name} b ON b.code = d.code AND b.ts >= d.day_start AND b.ts < d.day_start + {SECONDS_PER_DAY}
+            WHERE b.avg_price > 0
+            ORDER BY b.code, b.ts
+            """,
+            (json.dumps(pending),),
+        ).fetchall()
+        for code, trade_date, avg_price in rows:
+            result.setdefault(code, (trade_date, []))[1].append(avg_price)
+        pending = [code for code in pending if code not in result]
+    return result
+
+
+def count_bars_on(conn: sqlite3.Connection, trade_date: str) -> int:
+    name = partition_name(trade_date)
+    if name not in list_partitions(conn):
+        return 0
+    start_ts = date_to_epoch(trade_date)
+    row = conn.execute(
+        f"SELECT COUNT(*) FROM {name} WHERE ts >= ? AND ts < ?",
+        (start_ts, start_ts + SECONDS_PER_DAY),
+    ).fetchone()
+    return int(row[0])
+
+
+def compact_intraday(
+    conn: sqlite3.Connection,
+    retention_days: int = INTRADAY_RETENTION_DAYS,
+    today: Optional[str] = None,
+) -> dict:
+    """把保留期之前的分钟线汇总为日度聚合并删除；整月过期的分区直接 DROP。
+
+    返回 {"aggregated_days", "deleted_rows", "dropped_partitions"}。
+    """
+    today_dt = datetime.strptime(today, "%Y-%m-%d") if today else datetime.now()
+    cutoff_date = (today_dt - timedelta(days=retention_days)).strftime("%Y-%m-%d")
+    cutoff_ts = date_to_epoch(cutoff_date)
+    summary = {"aggregated_days": 0, "deleted_rows": 0, "dropped_partitions": []}
+
+    for name in list_partitions(conn):
+        if name > partition_name(cutoff_date):
+            break
+        with conn:
+            conn.execute(
+                f"""
+                WITH days AS (
+                    SELECT
+                        code,
+                        ts / {SECONDS_PER_DAY} AS day,
+                        MIN(ts) AS first_ts,
+                        MAX(ts) AS last_ts,
+                        MAX(high) AS high,
+                        MIN(low) AS low,
+                        SUM(volume) AS volume,
+                        SUM(amount) AS amount,
+                        SUM(avg_price * volume) / NULLIF(SUM(CASE WHEN avg_price IS NOT NULL THEN volume END), 0) AS vwap,
+                        COUNT(*) AS minute_count
+                    FROM {name}
+                    WHERE ts < ?
+                    GROUP BY code, day
+                )
+                INSERT OR REPLACE INTO intraday_daily_aggregates(
+                    code, trade_date, open, close, high, low, volume, amount, vwap, minute_count
+                )
+                SELECT
+                    d.code, date(d.day * {SECONDS_PER_DAY}, 'unixepoch'),
+                    f.open, l.close, d.high, d.low, d.volume, d.amount, d.vwap, d.minute_count
+                FROM days d
+                INNER JOIN {name} f ON f.code = d.code AND f.ts = d.first_ts
+                INNER JOIN {name} l ON l.code = d.code AND l.ts = d.last_ts
+                """,
+                (cutoff_ts,),
+            )
+            summary["aggregated_days"] += int(conn.execute("SELECT changes()").fetchone()[0])
+            remaining = conn.execute(f"SELECT 1 FROM {name} WHERE ts >= ? LIMIT 1", (cutoff_ts,)).fetchone()
+            if remaining is None:
+                summary["deleted_rows"] += int(conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0])
+                conn.execute(f"DROP TABLE {name}")
+                summary["dropped_partitions"].append(name)
+            else:
+                summary["deleted_rows"] += conn.execute(f"DELETE FROM {name} WHERE ts < ?", (cutoff_ts,)).rowcount
+    return summary
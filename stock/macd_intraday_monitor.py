@@ -5,9 +5,11 @@
 支持 ANSI 彩色终端输出、盘中热恢复、柱体阶段极值价格追踪。
 
 工作逻辑：
-  1. 晨间预热 — 从数据库回放昨日分钟数据，恢复 MACD 状态
-  2. 盘中重启 — 从今日 CSV 热恢复 MACD 状态，跳过预热
-  3. 监控循环 — 每秒拉取实时 tick，更新动态 MACD（每 tick 价格递推）
+  1. 晨间预热 — 一次查询取出全部股票昨日分钟数据，跨股票向量化回放，恢复 MACD 状态
+  2. 盘中重启 — 优先从今日 SQLite 检查点（每分钟写一次）精确恢复 MACD 状态，
+     没有检查点的股票从今日 CSV 热恢复，均跳过预热
+  3. 监控循环 — 每 1~3 秒用一条 keep-alive 连接批量拉取全部监控股票的实时 tick，
+     更新动态 MACD（每 tick 价格递推），每分钟输出一次轮询耗时
   4. 分钟固化 — 跨分钟时用 VWAP 反算分钟均价，更新静态 MACD，写入 CSV
   5. ANSI 颜色 — 当前 BAR 与上一静态 BAR 比较：
      红柱：增强(红) / 衰减(粉) ； 绿柱：伸长(深绿) / 缩短(浅绿)
@@ -23,6 +25,7 @@ from __future__ import annotations
 
 import argparse
 import csv
+import http.client
 import json
 import os
 import random
@@ -30,18 +33,33 @@ import re
 import sqlite3
 import sys
 import time
-import urllib.error
 import urllib.request
 from dataclasses import dataclass
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional
 
+import numpy as np
+
+try:
+    from intraday_store import load_last_day_avg_prices
+    from trade_calendar import get_trade_calendar
+except ImportError:
+    from .intraday_store import load_last_day_avg_prices
+    from .trade_calendar import get_trade_calendar
+
 # ---------------------------------------------------------------------------
 # 常量
 # ---------------------------------------------------------------------------
 
 API_TEMPLATE = "http://qt.gtimg.cn/q={}"
+QUOTE_HOST = "qt.gtimg.cn"
+# 单次请求合并的代码数，与同步链路的腾讯快照批量保持一致
+QUOTE_BATCH_SIZE = 50
+QUOTE_TIMEOUT_SECONDS = 10
+# 批量响应中每只股票一段：v_sh601689="1~名称~601689~...";
+QUOTE_LINE_RE = re.compile(r'v_(\w+)="([^"]*)"')
 
 # stock_monitor.py 原始字段
 TICK_CSV_FIELDS = [
@@ -66,8 +84,19 @@ ALPHA_FAST = 2.0 / 13.0   # EMA12: 2/(12+1)
 ALPHA_SLOW = 2.0 / 27.0   # EMA26: 2/(26+1)
 ALPHA_SIGNAL = 0.2         # DEA9:  2/(9+1)
 
+# 状态矩阵列：replay_day_batch 输出 MACD_STATE_COLUMNS；检查点为动态、静态两组状态加颜色/阶段字段
+MACD_STATE_COLUMNS = ("ema12", "ema26", "diff", "dea", "bar")
+CHECKPOINT_COLUMNS = (
+    tuple(f"dyn_{name}" for name in MACD_STATE_COLUMNS)
+    + tuple(f"sta_{name}" for name in MACD_STATE_COLUMNS)
+    + ("prev_sta_bar", "phase", "phase_high", "phase_low")
+)
+# 阶段编码：红柱 1、绿柱 -1、无阶段 0；极值为空时存 NaN
+PHASE_VALUES = {"red": 1.0, "green": -1.0}
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 DB_PATH = BASE_DIR / "data" / "stock.db"
+SCHEMA_PATH = BASE_DIR / "data" / "schema" / "stock.sql"
 MONITOR_DIR = BASE_DIR / "data" / "macd_monitor"
 
 # ANSI 终端颜色
@@ -114,16 +143,72 @@ def fetch_raw(stock_code: str) -> str:
         return resp.read().decode("gbk")
 
 
+class QuoteClient:
+    """腾讯行情 keep-alive 客户端：复用一条 HTTP 连接，一次请求拉取一批股票。"""
+
+    def __init__(self, host: str = QUOTE_HOST, timeout: float = QUOTE_TIMEOUT_SECONDS):
+        self.host = host
+        self.timeout = timeout
+        self._conn: Optional[http.client.HTTPConnection] = None
+
+    def _request(self, path: str) -> str:
+        if self._conn is None:
+            self._conn = http.client.HTTPConnection(self.host, timeout=self.timeout)
+        self._conn.request("GET", path, headers={"User-Agent": "Mozilla/5.0", "Connection": "keep-alive"})
+        resp = self._conn.getresponse()
+        body = resp.read()
+        if resp.will_close:
+            self.close()
+        if resp.status != 200:
+            raise http.client.HTTPException(f"HTTP {resp.status}")
+        return body.decode("gbk", errors="replace")
+
+    def fetch(self, symbols: list[str]) -> str:
+        path = "/q=" + ",".join(symbols)
+        try:
+            return self._request(path)
+        except (OSError, http.client.HTTPException):
+            # 服务端可能已关闭空闲连接，重建后重试一次
+            self.close()
+            return self._request(path)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def parse_batch(raw: str) -> dict[str, dict]:
+    """一次解析批量响应，返回 {symbol: tick}；无效代码或字段不全的段落直接跳过。"""
+    ticks: dict[str, dict] = {}
+    for symbol, body in QUOTE_LINE_RE.findall(raw):
+        if "~" not in body:
+            continue
+        try:
+            ticks[symbol] = parse_fields(body.split("~"))
+        except (IndexError, ValueError):
+            continue
+    return ticks
+
+
 def parse(raw: str) -> Optional[dict]:
     """解析 tilde 分隔的行情字符串为 dict。"""
     m = re.search(r'="(.+)"', raw)
     if not m:
         return None
+    return parse_fields(m.group(1).split("~"))
+
 
-    fields = m.group(1).split("~")
+@lru_cache(maxsize=1024)
+def parse_quote_time(ts_str: str) -> datetime:
+    """行情时间戳按秒取值，同一轮数千只股票只有少数几个不同值，缓存后省掉逐只 strptime。"""
+    return datetime.strptime(ts_str, "%Y%m%d%H%M%S")
 
+
+def parse_fields(fields: list[str]) -> dict:
+    """按腾讯行情字段下标取值。"""
     ts_str = fields[30]
-    ts = datetime.strptime(ts_str, "%Y%m%d%H%M%S") if ts_str else None
+    ts = parse_quote_time(ts_str) if ts_str else None
 
     return {
         "股票名称":     fields[1],
@@ -217,6 +302,101 @@ def replay_day(prices: list[float]) -> list[MACDState]:
     return states
 
 
+def replay_day_batch(price_lists: list[list[float]]) -> np.ndarray:
+    """多只股票一起回放分钟 VWAP 序列，返回每只股票最后一分钟的状态矩阵 (n, 5)。
+
+    列顺序为 MACD_STATE_COLUMNS。按分钟递推、跨股票向量化，每只股票的序列长度可以不同
+    （序列结束后状态保持不变），结果与逐只调用 replay_day 逐位一致。
+    """
+    count = len(price_lists)
+    lengths = np.fromiter((len(prices) for prices in price_lists), dtype=np.int64, count=count)
+    if count == 0 or lengths.min() == 0:
+        raise ValueError("replay_day_batch 需要每只股票至少一个价格")
+    width = int(lengths.max())
+    matrix = np.zeros((count, width), dtype=np.float64)
+    for index, prices in enumerate(price_lists):
+        matrix[index, :len(prices)] = prices
+
+    ema12 = matrix[:, 0].copy()
+    ema26 = matrix[:, 0].copy()
+    diff = np.zeros(count)
+    dea = np.zeros(count)
+    bar = np.zeros(count)
+    for minute in range(1, width):
+        active = lengths > minute
+        price = matrix[:, minute]
+        next_ema12 = price * ALPHA_FAST + ema12 * (1.0 - ALPHA_FAST)
+        next_ema26 = price * ALPHA_SLOW + ema26 * (1.0 - ALPHA_SLOW)
+        next_diff = next_ema12 - next_ema26
+        next_dea = next_diff * ALPHA_SIGNAL + dea * (1.0 - ALPHA_SIGNAL)
+        ema12 = np.where(active, next_ema12, ema12)
+        ema26 = np.where(active, next_ema26, ema26)
+        diff = np.where(active, next_diff, diff)
+        dea = np.where(active, next_dea, dea)
+        bar = np.where(active, 2.0 * (next_diff - next_dea), bar)
+    return np.column_stack([ema12, ema26, diff, dea, bar])
+
+
+def state_from_row(row) -> MACDState:
+    return MACDState(ema12=float(row[0]), ema26=float(row[1]), diff=float(row[2]), dea=float(row[3]), bar=float(row[4]))
+
+
+def state_to_row(state: MACDState) -> list[float]:
+    return [state.ema12, state.ema26, state.diff, state.dea, state.bar]
+
+
+# ---------------------------------------------------------------------------
+# 盘中状态检查点
+# ---------------------------------------------------------------------------
+
+def save_state_checkpoint(conn: sqlite3.Connection, trade_date: str, codes: list[str], matrix: np.ndarray) -> None:
+    """按 (交易日, 代码) 逐只覆盖写入检查点，每行是 CHECKPOINT_COLUMNS 列的 float64 状态。
+
+    只覆盖本次传入的股票：终端监控和流水线同时运行时各自的检查点互不冲掉；前一交易日的检查点一并清理。
+    """
+    saved_at = datetime.now().isoformat(timespec="seconds")
+    matrix = np.ascontiguousarray(matrix, dtype=np.float64)
+    with conn:
+        conn.execute("DELETE FROM macd_code_checkpoints WHERE trade_date < ?", (trade_date,))
+        conn.executemany(
+            """
+            INSERT INTO macd_code_checkpoints(trade_date, code, saved_at, state)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(trade_date, code) DO UPDATE SET
+                saved_at = excluded.saved_at,
+                state = excluded.state
+            """,
+            [(trade_date, code, saved_at, row.tobytes()) for code, row in zip(codes, matrix)],
+        )
+
+
+def load_state_checkpoint(conn: sqlite3.Connection, trade_date: str) -> Optional[tuple[str, dict[str, np.ndarray]]]:
+    """读取当日检查点，返回 (最近一次保存时间, {code: 状态行})；没有检查点时返回 None。"""
+    try:
+        rows = conn.execute(
+            "SELECT code, saved_at, state FROM macd_code_checkpoints WHERE trade_date = ?",
+            (trade_date,),
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None
+    if not rows:
+        return None
+    saved_at = max(row[1] for row in rows)
+    return saved_at, {code: np.frombuffer(state, dtype=np.float64) for code, _, state in rows}
+
+
+def phase_to_value(phase: Optional[str]) -> float:
+    return PHASE_VALUES.get(phase, 0.0)
+
+
+def phase_from_value(value: float) -> Optional[str]:
+    return {1.0: "red", -1.0: "green"}.get(float(value))
+
+
+def optional_price(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
 # ---------------------------------------------------------------------------
 # 分钟 VWAP 反算
 # ---------------------------------------------------------------------------
@@ -287,6 +467,13 @@ class MACDMonitor:
         # 动态行覆写追踪
         self._dyn_lines_printed: int = 0
         self._max_dyn_len: dict[str, int] = {}
+        # 批量行情连接与每轮轮询耗时（拉取 ms, 处理 ms）
+        self._quote_client = QuoteClient()
+        self._latency_minute: Optional[str] = None
+        self._latency_samples: list[tuple[float, float]] = []
+        # 状态检查点：上次写入的分钟
+        self._checkpoint_minute: Optional[str] = None
+        self._checkpoint_schema_ready = False
 
     # ---- 数据库 ----
 
@@ -332,6 +519,61 @@ class MACDMonitor:
             return DEEP_GREEN if abs(current_bar) > abs(prev_sta_bar) else LIGHT_GREEN
         return ""
 
+    # ---- 状态检查点 ----
+
+    def _save_checkpoint(self, now: datetime) -> None:
+        """把已初始化股票的动态/静态 MACD 与阶段极值写入当日检查点（每分钟一次）。"""
+        codes = [code for code in self.codes if self.dyn_states.get(code) and self.dyn_states[code].ema12 != 0]
+        if not codes:
+            return
+        matrix = np.array([
+            state_to_row(self.dyn_states[code])
+            + state_to_row(self.sta_states[code])
+            + [
+                self._prev_sta_bar.get(code, 0.0),
+                phase_to_value(self._bar_phase.get(code)),
+                np.nan if self._phase_high.get(code) is None else self._phase_high[code],
+                np.nan if self._phase_low.get(code) is None else self._phase_low[code],
+            ]
+            for code in codes
+        ], dtype=np.float64)
+        conn = self._get_db_connection()
+        try:
+            if not self._checkpoint_schema_ready:
+                conn.executescript(SCHEMA_PATH.read_text(encoding="utf-8"))
+                self._checkpoint_schema_ready = True
+            save_state_checkpoint(conn, now.strftime("%Y-%m-%d"), codes, matrix)
+        except sqlite3.Error as e:
+            print(f"[!] 写入 MACD 检查点失败: {e}")
+        finally:
+            conn.close()
+
+    def _restore_checkpoint(self) -> set[str]:
+        """从当日检查点恢复精确的 EMA 状态（盘中重启用），返回已恢复的代码集合。"""
+        conn = self._get_db_connection()
+        try:
+            checkpoint = load_state_checkpoint(conn, datetime.now().strftime("%Y-%m-%d"))
+        finally:
+            conn.close()
+        if checkpoint is None:
+            return set()
+
+        saved_at, rows = checkpoint
+        restored: set[str] = set()
+        for code in self.codes:
+            row = rows.get(code)
+            if row is None:
+                continue
+            self.dyn_states[code] = state_from_row(row[0:5])
+            self.sta_states[code] = state_from_row(row[5:10])
+            self._prev_sta_bar[code] = float(row[10])
+            self._bar_phase[code] = phase_from_value(row[11])
+            self._phase_high[code] = optional_price(row[12])
+            self._phase_low[code] = optional_price(row[13])
+            restored.add(code)
+        print(f"  从检查点({saved_at})恢复 {len(restored)}/{len(self.codes)} 只股票的 MACD 状态")
+        return restored
+
     # ---- CSV 热恢复 ----
 
     def _load_state_from_csv(self, code: str) -> Optional[MACDState]:
@@ -421,7 +663,7 @@ class MACDMonitor:
     # ---- 晨间预热 ----
 
     def warmup(self, csv_recovered: set | None = None) -> None:
-        """晨间预热：拉昨日 intraday_bars，回放得到 15:00 MACD 状态。
+        """晨间预热：拉昨日分钟线（intraday_bars_YYYYMM 分区），回放得到 15:00 MACD 状态。
 
         csv_recovered: 已从 CSV 热恢复的 code 集合，跳过这些 code 的 intraday 回放。
         """
@@ -430,48 +672,36 @@ class MACDMonitor:
         print("  晨间预热：从昨日分钟数据回放 MACD ...")
         print("=" * 60)
 
+        pending = [code for code in self.codes if code not in csv_recovered]
+        for code in csv_recovered:
+            print(f"  {code}  已从检查点/CSV 热恢复，跳过 intraday 预热")
+
         conn = self._get_db_connection()
         try:
-            for code in self.codes:
-                if code in csv_recovered:
-                    print(f"  {code}  已从 CSV 热恢复，跳过 intraday 预热")
-                    continue
-
-                raw_code = code.removeprefix("sh").removeprefix("sz").removeprefix("bj")
-                # 取最近一个交易日
-                row = conn.execute(
-                    "SELECT DISTINCT trade_date FROM intraday_bars WHERE code = ? "
-                    "ORDER BY trade_date DESC LIMIT 1",
-                    (raw_code,),
-                ).fetchone()
-
-                if not row:
-                    print(f"  {code}  无历史 intraday 数据，将以当日成交均价冷启动")
-                    continue
-
-                trade_date = row["trade_date"]
-                rows = conn.execute(
-                    "SELECT trade_time, avg_price FROM intraday_bars "
-                    "WHERE code = ? AND trade_date = ? "
-                    "ORDER BY trade_time",
-                    (raw_code, trade_date),
-                ).fetchall()
-
-                prices = [r["avg_price"] for r in rows if r["avg_price"] and r["avg_price"] > 0]
-                if not prices:
-                    print(f"  {code}  {trade_date}  无有效价格，将以当日成交均价冷启动")
-                    continue
+            prices_by_code = load_last_day_avg_prices(
+                conn, [code.removeprefix("sh").removeprefix("sz").removeprefix("bj") for code in pending]
+            ) if pending else {}
+        finally:
+            conn.close()
 
-                states = replay_day(prices)
-                last_state = states[-1]
+        replay_codes: list[str] = []
+        for code in pending:
+            raw_code = code.removeprefix("sh").removeprefix("sz").removeprefix("bj")
+            if raw_code in prices_by_code:
+                replay_codes.append(code)
+            else:
+                print(f"  {code}  无历史 intraday 数据，将以当日成交均价冷启动")
+
+        if replay_codes:
+            day_prices = [
+                prices_by_code[code.removeprefix("sh").removeprefix("sz").removeprefix("bj")]
+                for code in replay_codes
+            ]
+            final_states = replay_day_batch([prices for _, prices in day_prices])
+            for code, (trade_date, prices), row in zip(replay_codes, day_prices, final_states):
+                last_state = state_from_row(row)
                 self.dyn_states[code] = last_state
-                self.sta_states[code] = MACDState(
-                    ema12=last_state.ema12,
-                    ema26=last_state.ema26,
-                    diff=last_state.diff,
-                    dea=last_state.dea,
-                    bar=last_state.bar,
-                )
+                self.sta_states[code] = state_from_row(row)
                 # 首个 prev_sta_bar 即为昨日收盘的 sta_BAR
                 self._prev_sta_bar[code] = last_state.bar
                 # 阶段和极值初始化（基于昨日收盘 BAR）
@@ -488,9 +718,6 @@ class MACDMonitor:
                       f"昨日({trade_date}) {len(prices)} 分钟 → "
                       f"15:00 EMA12={last_state.ema12:.2f} DIFF={last_state.diff:+.4f}")
 
-        finally:
-            conn.close()
-
         # 对于冷启动的股票，标记为待初始化（首个 tick 到达时用当日成交均价 init）
         for code in self.codes:
             if code not in self.dyn_states:
@@ -542,6 +769,10 @@ class MACDMonitor:
         now = datetime.now()
         hm = now.hour * 60 + now.minute
 
+        if not get_trade_calendar(DB_PATH).is_trading_day(now.strftime("%Y-%m-%d")):
+            print("今日非交易日，不启动监控")
+            sys.exit(0)
+
         if hm >= 15 * 60:
             print("已过 15:00，今日已收盘")
             sys.exit(0)
@@ -555,18 +786,21 @@ class MACDMonitor:
     # ---- 主循环 ----
 
     def run(self) -> None:
-        """主入口：CSV 热恢复 → 预热 → 等待 → 监控循环 → 收盘退出。"""
+        """主入口：检查点/CSV 热恢复 → 预热 → 等待 → 监控循环 → 收盘退出。"""
         self._lookup_names()
 
         # 先尝试 CSV 热恢复（盘中重启 / 延迟启动场景）
         csv_recovered: set[str] = set()
         now = datetime.now()
         hm = now.hour * 60 + now.minute
-        if hm >= 9 * 60 + 30:  # 已过 09:30，尝试从今日 CSV 恢复
+        if hm >= 9 * 60 + 30:  # 已过 09:30，优先从今日检查点恢复，其余尝试今日 CSV
             print("=" * 60)
-            print("  尝试从今日 CSV 热恢复 MACD 状态 ...")
+            print("  尝试从今日检查点 / CSV 热恢复 MACD 状态 ...")
             print("=" * 60)
+            csv_recovered = self._restore_checkpoint()
             for code in self.codes:
+                if code in csv_recovered:
+                    continue
                 state = self._load_state_from_csv(code)
                 if state is not None:
                     self.dyn_states[code] = state
@@ -601,6 +835,8 @@ class MACDMonitor:
                         end_vol=self._last_vol.get(code, 0),
                         end_amount=self._last_amount.get(code, 0.0),
                     )
+                self._save_checkpoint(now)
+                self._quote_client.close()
                 break
 
             # 午休等待至 13:00
@@ -609,11 +845,17 @@ class MACDMonitor:
                 continue
 
             self._dyn_printed_this_cycle = 0
+            cycle_start = time.perf_counter()
+            ticks, fetch_errors = self._fetch_ticks()
+            fetch_done = time.perf_counter()
             for code in self.codes:
                 try:
-                    symbol = normalize_code(code)
-                    raw = fetch_raw(symbol)
-                    tick = parse(raw)
+                    if code in fetch_errors:
+                        self._net_errors[code] += 1
+                        if self._net_errors[code] > 10:
+                            print(f"[!] {code} 连续网络失败 > 10 次: {fetch_errors[code]}")
+                        continue
+                    tick = ticks.get(code)
                     if tick is None:
                         self._net_errors[code] += 1
                         if self._net_errors[code] > 10:
@@ -652,19 +894,56 @@ class MACDMonitor:
                     # 处理这一个 tick
                     self._on_tick(code, tick)
 
-                except urllib.error.URLError as e:
-                    self._net_errors[code] += 1
-                    if self._net_errors[code] > 10:
-                        print(f"[!] {code} 连续网络失败 > 10 次: {e}")
                 except Exception as e:
                     print(f"[!] {code} 错误: {e}")
 
+            # 跨分钟时写一次检查点，盘中重启可精确恢复
+            minute = now.strftime("%H:%M")
+            if minute != self._checkpoint_minute:
+                self._save_checkpoint(now)
+                self._checkpoint_minute = minute
+
+            self._record_cycle_latency(
+                now,
+                fetch_ms=(fetch_done - cycle_start) * 1000,
+                dispatch_ms=(time.perf_counter() - fetch_done) * 1000,
+            )
+
             if len(self.codes) > 1:
                 self._dyn_lines_printed = self._dyn_printed_this_cycle
 
             # 随机抖动 1~3 秒
             time.sleep(random.uniform(1, 3))
 
+    # ---- 行情拉取 ----
+
+    def _fetch_ticks(self) -> tuple[dict[str, dict], dict[str, Exception]]:
+        """按 QUOTE_BATCH_SIZE 分批拉取全部监控代码，返回 (ticks, 网络失败的代码及异常)。"""
+        ticks: dict[str, dict] = {}
+        errors: dict[str, Exception] = {}
+        for index in range(0, len(self.codes), QUOTE_BATCH_SIZE):
+            batch = self.codes[index:index + QUOTE_BATCH_SIZE]
+            try:
+                ticks.update(parse_batch(self._quote_client.fetch(batch)))
+            except (OSError, http.client.HTTPException) as e:
+                errors.update({code: e for code in batch})
+        return ticks, errors
+
+    def _record_cycle_latency(self, now: datetime, fetch_ms: float, dispatch_ms: float) -> None:
+        """累计每轮轮询耗时，跨分钟时输出上一分钟的汇总。"""
+        minute = now.strftime("%H:%M")
+        if self._latency_minute is not None and minute != self._latency_minute and self._latency_samples:
+            fetch_values = [item[0] for item in self._latency_samples]
+            dispatch_values = [item[1] for item in self._latency_samples]
+            batch_count = -(-len(self.codes) // QUOTE_BATCH_SIZE)
+            print(f"\r── {self._latency_minute} 轮询 {len(self._latency_samples)} 轮 × {batch_count} 批  "
+                  f"拉取 avg {sum(fetch_values) / len(fetch_values):.0f}ms / max {max(fetch_values):.0f}ms  "
+                  f"处理 avg {sum(dispatch_values) / len(dispatch_values):.1f}ms ──\033[K")
+            self._dyn_lines_printed = 0
+            self._latency_samples = []
+        self._latency_minute = minute
+        self._latency_samples.append((fetch_ms, dispatch_ms))
+
     # ---- Tick 处理 ----
 
     def _on_tick(self, code: str, tick: dict) -> None:
@@ -0,0 +1,908 @@
+#!/usr/bin/env python3
+"""日内分钟级 MACD 流式监控管线，面向整板块（约 3000 只）股票。
+
+与 macd_intraday_monitor.MACDMonitor 的 MACD 口径完全一致（动态/静态 MACD、分钟 VWAP 固化、
+红绿柱阶段与极值），但拆成 asyncio 流水线，各阶段之间用有界队列连接：
+
+  1. 拉取 — 每个周期把全部代码按 QUOTE_BATCH_SIZE 分批，多条 keep-alive 连接并发拉取
+  2. 解析 — parse_batch 一次解析整批响应
+  3. 状态机 — 每只股票一个 MinuteMACDMachine，逐 tick 递推，产出 tick / minute / phase 事件
+  4. 落地 — 事件扇出到各 sink：缓冲 CSV（或 Parquet）、SQLite 分钟表、Web 推送用的 EventHub
+
+下游处理不过来时队列写满，上游 await 阻塞，拉取周期随之拉长（背压），不会无限堆积内存；
+只有 EventHub 的订阅者队列写满时丢弃事件，保证慢订阅者拖不住管线。
+
+用法:
+    python stock/macd_stream.py --stocks 601689,002841
+    python stock/macd_stream.py --allowed-boards --cadence 3
+    python stock/macd_stream.py --allowed-boards --format parquet --no-sqlite
+
+数据落盘:
+    CSV:     data/macd_monitor/{code}_{date}.csv（与 MACDMonitor 相同格式，可用于其盘中热恢复）
+    Parquet: data/macd_monitor/{date}/ticks_{HHMMSS}_{n}.parquet
+    SQLite:  intraday_macd_minutes（分钟固化后的静态 MACD）
+             macd_code_checkpoints（每分钟一次、每只股票一行的状态检查点，盘中重启时秒级恢复）
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+try:
+    import pandas as pd
+    import pyarrow  # noqa: F401
+except ImportError:
+    pd = None
+
+try:
+    from intraday_store import load_last_day_avg_prices
+    from trade_calendar import get_trade_calendar
+    from macd_intraday_monitor import (
+        CSV_FIELDS,
+        DB_PATH,
+        MONITOR_DIR,
+        SCHEMA_PATH,
+        QUOTE_BATCH_SIZE,
+        TICK_CSV_FIELDS,
+        MACDState,
+        QuoteClient,
+        calc_minute_vwap,
+        csv_path,
+        init_macd,
+        load_state_checkpoint,
+        normalize_code,
+        parse_batch,
+        optional_price,
+        phase_from_value,
+        phase_to_value,
+        replay_day_batch,
+        save_state_checkpoint,
+        state_from_row,
+        state_to_row,
+        step_macd,
+    )
+except ImportError:
+    from .intraday_store import load_last_day_avg_prices
+    from .trade_calendar import get_trade_calendar
+    from .macd_intraday_monitor import (
+        CSV_FIELDS,
+        DB_PATH,
+        MONITOR_DIR,
+        SCHEMA_PATH,
+        QUOTE_BATCH_SIZE,
+        TICK_CSV_FIELDS,
+        MACDState,
+        QuoteClient,
+        calc_minute_vwap,
+        csv_path,
+        init_macd,
+        load_state_checkpoint,
+        normalize_code,
+        parse_batch,
+        optional_price,
+        phase_from_value,
+        phase_to_value,
+        replay_day_batch,
+        save_state_checkpoint,
+        state_from_row,
+        state_to_row,
+        step_macd,
+    )
+
+# ---------------------------------------------------------------------------
+# 常量
+# ---------------------------------------------------------------------------
+
+ALLOWED_BOARDS = ["主板-沪（60）", "主板-深（00）", "中小板（002/003）"]
+
+STREAM_CADENCE_SECONDS = 3.0
+# 并发 keep-alive 连接数；3000 只 / 50 = 60 批，8 条连接一个周期约 8 轮请求
+FETCH_CONCURRENCY = 8
+RAW_QUEUE_SIZE = 64
+TICK_QUEUE_SIZE = 256
+SINK_QUEUE_SIZE = 20000
+SUBSCRIBER_QUEUE_SIZE = 1000
+HISTORY_SIZE = 5000
+LATEST_STATE_FIELDS = ("ts", "price", "change_pct", "dyn", "sta", "phase", "phase_high", "phase_low", "minute", "vwap")
+CSV_FLUSH_ROWS = 5000
+CSV_FLUSH_SECONDS = 10.0
+SQLITE_FLUSH_ROWS = 500
+STATUS_INTERVAL_SECONDS = 60.0
+
+SESSION_OPEN = 9 * 60 + 30
+SESSION_LUNCH_START = 11 * 60 + 30
+SESSION_LUNCH_END = 13 * 60
+SESSION_CLOSE = 15 * 60
+
+
+def raw_code(symbol: str) -> str:
+    return symbol.removeprefix("sh").removeprefix("sz").removeprefix("bj")
+
+
+def copy_state(state: MACDState) -> MACDState:
+    return MACDState(ema12=state.ema12, ema26=state.ema26, diff=state.diff, dea=state.dea, bar=state.bar)
+
+
+def state_dict(state: MACDState) -> dict:
+    return {"dif": round(state.diff, 6), "dea": round(state.dea, 6), "bar": round(state.bar, 6)}
+
+
+# ---------------------------------------------------------------------------
+# 单股 MACD 状态机
+# ---------------------------------------------------------------------------
+
+@dataclass
+class MinuteMACDMachine:
+    """一只股票的 tick → MACD 状态机，逻辑对应 MACDMonitor._on_tick / _finalize_current_minute，只产出事件不打印。"""
+
+    code: str
+    dyn: Optional[MACDState] = None
+    sta: Optional[MACDState] = None
+    phase: Optional[str] = None
+    phase_high: Optional[float] = None
+    phase_low: Optional[float] = None
+    prev_ts: Optional[datetime] = None
+    current_minute: Optional[str] = None
+    trade_date: Optional[str] = None
+    minute_start_vol: int = 0
+    minute_start_amount: float = 0.0
+    minute_open: Optional[float] = None
+    minute_high: float = 0.0
+    minute_low: float = 1e9
+    minute_close: Optional[float] = None
+    last_vol: int = 0
+    last_amount: float = 0.0
+    events: list[dict] = field(default_factory=list)
+    # 静态 MACD 每分钟才变一次，tick 事件复用同一份 state_dict
+    _sta_dict: Optional[dict] = field(default=None, repr=False)
+    _sta_dict_of: Optional[MACDState] = field(default=None, repr=False)
+
+    def sta_dict(self) -> dict:
+        if self._sta_dict_of is not self.sta:
+            self._sta_dict = state_dict(self.sta)
+            self._sta_dict_of = self.sta
+        return self._sta_dict
+
+    def warm_start(self, last_state: MACDState, last_price: float) -> None:
+        """用昨日回放的 15:00 状态预热，与 MACDMonitor.warmup 一致。"""
+        self.dyn = last_state
+        self.sta = copy_state(last_state)
+        if last_state.bar > 0:
+            self.phase = "red"
+        elif last_state.bar < 0:
+            self.phase = "green"
+        if self.phase is not None:
+            self.phase_high = last_price
+            self.phase_low = last_price
+
+    def restore(self, row) -> None:
+        """从检查点行（CHECKPOINT_COLUMNS）还原。"""
+        self.dyn = state_from_row(row[0:5])
+        self.sta = state_from_row(row[5:10])
+        self.phase = phase_from_value(row[11])
+        self.phase_high = optional_price(row[12])
+        self.phase_low = optional_price(row[13])
+
+    def checkpoint_row(self) -> list[float]:
+        return (
+            state_to_row(self.dyn)
+            + state_to_row(self.sta)
+            + [
+                self.sta.bar,
+                phase_to_value(self.phase),
+                np.nan if self.phase_high is None else self.phase_high,
+                np.nan if self.phase_low is None else self.phase_low,
+            ]
+        )
+
+    def on_tick(self, tick: dict) -> list[dict]:
+        self.events = []
+        price = tick["当前价格"]
+        # 冷启动：首个 tick 用当日成交均价初始化，不可用时用当前价格
+        if self.dyn is None:
+            init_price = tick["加权均价"] if tick["加权均价"] and tick["加权均价"] > 0 else price
+            if init_price and init_price > 0:
+                self.dyn = init_macd(init_price)
+                self.sta = copy_state(self.dyn)
+
+        current_ts = tick["时间戳"]
+        if self.prev_ts and current_ts and current_ts == self.prev_ts:
+            return self.events
+        self.prev_ts = current_ts
+        if price is None or price <= 0 or self.dyn is None:
+            return self.events
+
+        ts = current_ts or datetime.now()
+        tick_minute = f"{ts.hour:02d}:{ts.minute:02d}"
+        vol = tick["总成交量(手)"] or 0
+        amount = tick["成交额(万元)"] or 0.0
+
+        if self.current_minute is not None and tick_minute != self.current_minute:
+            self.finalize_minute(end_vol=vol, end_amount=amount)
+
+        if self.current_minute != tick_minute:
+            self.current_minute = tick_minute
+            self.trade_date = ts.strftime("%Y-%m-%d")
+            self.minute_start_vol = vol
+            self.minute_start_amount = amount
+            self.minute_open = price
+            self.minute_high = price
+            self.minute_low = price
+            self.minute_close = price
+
+        self.last_vol = vol
+        self.last_amount = amount
+        self.minute_high = max(self.minute_high, price)
+        self.minute_low = min(self.minute_low, price)
+        self.minute_close = price
+
+        self.dyn = step_macd(self.dyn, price)
+        self.events.append({
+            "type": "tick",
+            "code": self.code,
+            "ts": ts.isoformat(),
+            "price": price,
+            "change_pct": tick["涨跌幅(%)"],
+            "dyn": state_dict(self.dyn),
+            "sta": self.sta_dict(),
+            "phase": self.phase,
+            "tick": tick,
+        })
+        return self.events
+
+    def finalize_minute(self, end_vol: int, end_amount: float) -> None:
+        if self.current_minute is None or self.sta is None:
+            return
+        vwap = calc_minute_vwap(self.minute_start_vol, self.minute_start_amount, end_vol, end_amount)
+        if vwap is None:
+            vwap = self.minute_close
+        if vwap is None or vwap <= 0:
+            return
+
+        old_phase = self.phase
+        self.sta = step_macd(self.sta, vwap)
+        if self.sta.bar > 0:
+            new_phase = "red"
+        elif self.sta.bar < 0:
+            new_phase = "green"
+        else:
+            new_phase = old_phase
+
+        if new_phase != old_phase:
+            self.phase_high = vwap if new_phase is not None else None
+            self.phase_low = vwap if new_phase is not None else None
+        elif new_phase is not None:
+            self.phase_high = vwap if self.phase_high is None else max(self.phase_high, vwap)
+            self.phase_low = vwap if self.phase_low is None else min(self.phase_low, vwap)
+        self.phase = new_phase
+
+        minute_event = {
+            "type": "minute",
+            "code": self.code,
+            "trade_date": self.trade_date,
+            "minute": self.current_minute,
+            "vwap": vwap,
+            "open": self.minute_open,
+            "high": self.minute_high,
+            "low": self.minute_low,
+            "close": self.minute_close,
+            "sta": state_dict(self.sta),
+            "phase": new_phase,
+            "phase_high": self.phase_high,
+            "phase_low": self.phase_low,
+        }
+        self.events.append(minute_event)
+        if new_phase != old_phase and old_phase is not None:
+            self.events.append({**minute_event, "type": "phase", "previous_phase": old_phase})
+
+    def close_session(self) -> list[dict]:
+        """收盘时固化最后一分钟。"""
+        self.events = []
+        self.finalize_minute(end_vol=self.last_vol, end_amount=self.last_amount)
+        return self.events
+
+
+def warmup_machines(codes: list[str], db_path: Path = DB_PATH) -> dict[str, MinuteMACDMachine]:
+    """恢复各股 MACD 状态：当日有检查点（盘中重启）的直接还原，其余一次查询取昨日分钟均价向量化回放；
+    两者都没有的股票首 tick 冷启动。"""
+    machines = {code: MinuteMACDMachine(code) for code in codes}
+    if not Path(db_path).exists():
+        return machines
+    conn = sqlite3.connect(str(db_path))
+    try:
+        checkpoint = load_state_checkpoint(conn, datetime.now().strftime("%Y-%m-%d"))
+        restored: set[str] = set()
+        if checkpoint is not None:
+            saved_at, rows = checkpoint
+            for code in codes:
+                if code in rows:
+                    machines[code].restore(rows[code])
+                    restored.add(code)
+            print(f"[预热] 从检查点({saved_at})恢复 {len(restored)} 只")
+        pending = [code for code in codes if code not in restored]
+        prices_by_code = load_last_day_avg_prices(conn, [raw_code(code) for code in pending]) if pending else {}
+    except sqlite3.OperationalError as e:
+        print(f"[预热] 读取分钟线失败，全部冷启动: {e}")
+        return machines
+    finally:
+        conn.close()
+
+    replay_codes = [code for code in pending if raw_code(code) in prices_by_code]
+    if replay_codes:
+        price_lists = [prices_by_code[raw_code(code)][1] for code in replay_codes]
+        for code, prices, row in zip(replay_codes, price_lists, replay_day_batch(price_lists)):
+            machines[code].warm_start(state_from_row(row), prices[-1])
+    return machines
+
+
+def machine_checkpoint(machines: dict[str, MinuteMACDMachine]) -> tuple[list[str], np.ndarray]:
+    """已初始化状态机的检查点矩阵，格式与 MACDMonitor 相同，两者可互相恢复。需在事件循环内调用。"""
+    codes = [code for code, machine in machines.items() if machine.dyn is not None]
+    return codes, np.array([machines[code].checkpoint_row() for code in codes], dtype=np.float64)
+
+
+def apply_stream_schema(db_path: Path = DB_PATH) -> None:
+    """建好分钟表与检查点表；流水线启动时执行一次，之后的写入不再跑建表脚本。"""
+    conn = sqlite3.connect(str(db_path), timeout=10)
+    try:
+        conn.executescript(SCHEMA_PATH.read_text(encoding="utf-8"))
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# 事件落地
+# ---------------------------------------------------------------------------
+
+class Sink:
+    """sink 基类：独占一个有界队列，收到 None 时 flush 并退出。"""
+
+    name = "sink"
+    inline = False
+
+    def __init__(self, queue_size: int = SINK_QUEUE_SIZE):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def run(self) -> None:
+        while True:
+            event = await self.queue.get()
+            if event is None:
+                await self.flush()
+                return
+            await self.handle(event)
+
+    async def handle(self, event: dict) -> None:
+        raise NotImplementedError
+
+    async def flush(self) -> None:
+        return None
+
+
+class TickFileSink(Sink):
+    """缓冲写 tick 行：攒够 CSV_FLUSH_ROWS 行或 CSV_FLUSH_SECONDS 秒后在线程里批量落盘。"""
+
+    name = "file"
+
+    def __init__(self, file_format: str = "csv", output_dir: Path = MONITOR_DIR, **kwargs):
+        super().__init__(**kwargs)
+        if file_format == "parquet" and pd is None:
+            raise RuntimeError("Parquet 输出需要安装 pandas 与 pyarrow")
+        self.file_format = file_format
+        self.output_dir = Path(output_dir)
+        self.rows: list[dict] = []
+        self.last_flush = time.monotonic()
+        self.part_index = 0
+
+    async def handle(self, event: dict) -> None:
+        if event["type"] != "tick":
+            return
+        row = {name: event["tick"].get(name) for name in TICK_CSV_FIELDS}
+        for prefix in ("dyn", "sta"):
+            row[f"{prefix}_DIF"] = event[prefix]["dif"]
+            row[f"{prefix}_DEA"] = event[prefix]["dea"]
+            row[f"{prefix}_BAR"] = event[prefix]["bar"]
+        row["_code"] = event["code"]
+        self.rows.append(row)
+        if len(self.rows) >= CSV_FLUSH_ROWS or time.monotonic() - self.last_flush >= CSV_FLUSH_SECONDS:
+            await self.flush()
+
+    async def flush(self) -> None:
+        rows, self.rows = self.rows, []
+        self.last_flush = time.monotonic()
+        if not rows:
+            return
+        if self.file_format == "parquet":
+            self.part_index += 1
+            await asyncio.to_thread(self._write_parquet, rows, self.part_index)
+        else:
+            await asyncio.to_thread(self._write_csv, rows)
+
+    @staticmethod
+    def _write_csv(rows: list[dict]) -> None:
+        rows_by_code: dict[str, list[dict]] = {}
+        for row in rows:
+            rows_by_code.setdefault(row["_code"], []).append(row)
+        for code, code_rows in rows_by_code.items():
+            filepath = csv_path(code)
+            file_exists = os.path.exists(filepath)
+            with open(filepath, "a", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+                if not file_exists:
+                    writer.writeheader()
+                writer.writerows(code_rows)
+
+    def _write_parquet(self, rows: list[dict], part_index: int) -> None:
+        now = datetime.now()
+        directory = self.output_dir / now.strftime("%Y%m%d")
+        directory.mkdir(parents=True, exist_ok=True)
+        frame = pd.DataFrame(rows).rename(columns={"_code": "symbol"})
+        frame.to_parquet(directory / f"ticks_{now.strftime('%H%M%S')}_{part_index}.parquet", index=False)
+
+
+class SqliteMinuteSink(Sink):
+    """分钟固化事件批量写入 intraday_macd_minutes。"""
+
+    name = "sqlite"
+
+    def __init__(self, db_path: Path = DB_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.db_path = Path(db_path)
+        self.rows: list[tuple] = []
+        self._conn: Optional[sqlite3.Connection] = None
+
+    async def handle(self, event: dict) -> None:
+        if event["type"] != "minute":
+            return
+        sta = event["sta"]
+        self.rows.append((
+            raw_code(event["code"]), event["trade_date"], event["minute"],
+            event["vwap"], event["open"], event["high"], event["low"], event["close"],
+            sta["dif"], sta["dea"], sta["bar"], event["phase"],
+        ))
+        if len(self.rows) >= SQLITE_FLUSH_ROWS:
+            await self.flush()
+
+    async def flush(self) -> None:
+        rows, self.rows = self.rows, []
+        if rows:
+            await asyncio.to_thread(self._write, rows)
+
+    async def run(self) -> None:
+        try:
+            await super().run()
+        finally:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _write(self, rows: list[tuple]) -> None:
+        # 表结构由 apply_stream_schema 在流水线启动时建好
+        if self._conn is None:
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=10)
+        with self._conn:
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO intraday_macd_minutes(
+                    code, trade_date, trade_time, vwap, open, high, low, close, dif, dea, bar, phase
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+
+
+class EventHub:
+    """进程内发布/订阅，供 Web 推送使用。
+
+    - 每个事件分配递增序号，最近 HISTORY_SIZE 条保存在环形缓冲里，晚加入或断线重连的订阅者可从指定序号补齐
+    - latest 保存每只股票最新一次 MACD 状态，新订阅者先拿快照
+    - 每个订阅者一个有界队列；写满说明该订阅者消费太慢，直接踢掉（队列清空后放入 None），不阻塞发布方
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE, history_size: int = HISTORY_SIZE):
+        self.queue_size = queue_size
+        self.history: deque[dict] = deque(maxlen=history_size)
+        self.latest: dict[str, dict] = {}
+        self.subscribers: set[asyncio.Queue] = set()
+        self.seq = 0
+        self.dropped = 0
+
+    def subscribe(self, since: Optional[int] = None) -> asyncio.Queue:
+        """订阅事件；since 为已收到的最后序号时，先补发环形缓冲中更新的事件。"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        if since is not None:
+            backlog = [event for event in self.history if event["seq"] > since]
+            for event in backlog[-self.queue_size:]:
+                queue.put_nowait(event)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+
+    def snapshot(self) -> dict:
+        return {"seq": self.seq, "states": list(self.latest.values())}
+
+    def publish(self, event: dict) -> None:
+        self.seq += 1
+        event = {**event, "seq": self.seq}
+        self.history.append(event)
+        if event["type"] in ("tick", "minute"):
+            state = self.latest.setdefault(event["code"], {"code": event["code"]})
+            state.update({key: event[key] for key in LATEST_STATE_FIELDS if key in event})
+            state["seq"] = self.seq
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._drop(queue)
+
+    def _drop(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+        self.dropped += 1
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+
+class PubSubSink(Sink):
+    """把 minute / phase 事件和去掉原始 tick 字段的 tick 事件转发给 EventHub。
+
+    EventHub.publish 不会阻塞，因此由 MACD 阶段直接调用（inline），省掉一次排队，降低推送延迟。
+    """
+
+    name = "pubsub"
+    inline = True
+
+    def __init__(self, hub: EventHub, **kwargs):
+        super().__init__(**kwargs)
+        self.hub = hub
+
+    async def handle(self, event: dict) -> None:
+        if event["type"] == "tick":
+            event = {key: value for key, value in event.items() if key != "tick"}
+        self.hub.publish(event)
+
+
+# ---------------------------------------------------------------------------
+# 流水线
+# ---------------------------------------------------------------------------
+
+@dataclass
+class PipelineStats:
+    cycles: int = 0
+    batches: int = 0
+    fetch_errors: int = 0
+    ticks: int = 0
+    events: int = 0
+    fetch_ms_total: float = 0.0
+    fetch_ms_max: float = 0.0
+
+    def reset(self) -> None:
+        self.__init__()
+
+
+def in_session(now: datetime) -> bool:
+    hm = now.hour * 60 + now.minute
+    return SESSION_OPEN <= hm < SESSION_LUNCH_START or SESSION_LUNCH_END <= hm < SESSION_CLOSE
+
+
+def seconds_until_session(now: datetime) -> float:
+    """距下一个连续竞价时段开始的秒数；已收盘返回 -1。"""
+    hm = now.hour * 60 + now.minute
+    if hm >= SESSION_CLOSE:
+        return -1
+    target = SESSION_OPEN if hm < SESSION_OPEN else SESSION_LUNCH_END
+    return max(0.0, (target - hm) * 60 - now.second)
+
+
+class TickPipeline:
+    """拉取 → 解析 → MACD 状态机 → sinks 的四段流水线。"""
+
+    def __init__(
+        self,
+        codes: list[str],
+        sinks: list[Sink],
+        cadence: float = STREAM_CADENCE_SECONDS,
+        concurrency: int = FETCH_CONCURRENCY,
+        client_factory: Callable[[], QuoteClient] = QuoteClient,
+        machines: Optional[dict[str, MinuteMACDMachine]] = None,
+        session_check: bool = True,
+        max_cycles: int = 0,
+        checkpoint_db: Optional[Path] = None,
+    ):
+        self.codes = [normalize_code(code) for code in codes]
+        self.sinks = sinks
+        self.cadence = cadence
+        self.concurrency = max(1, concurrency)
+        self.client_factory = client_factory
+        self.machines = machines if machines is not None else {code: MinuteMACDMachine(code) for code in self.codes}
+        self.session_check = session_check
+        self.max_cycles = max_cycles
+        self.checkpoint_db = checkpoint_db
+        self._checkpoint_minute: Optional[str] = None
+        self._checkpoint_conn: Optional[sqlite3.Connection] = None
+        self.raw_queue: asyncio.Queue = asyncio.Queue(maxsize=RAW_QUEUE_SIZE)
+        self.tick_queue: asyncio.Queue = asyncio.Queue(maxsize=TICK_QUEUE_SIZE)
+        self.stats = PipelineStats()
+        self._stop = asyncio.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    async def run(self) -> None:
+        tasks = [
+            asyncio.create_task(self._fetch_stage()),
+            asyncio.create_task(self._parse_stage()),
+            asyncio.create_task(self._macd_stage()),
+            asyncio.create_task(self._status_stage()),
+            *(asyncio.create_task(sink.run()) for sink in self.sinks),
+        ]
+        try:
+            await asyncio.gather(*tasks[:3], *tasks[4:])
+        finally:
+            # 任一阶段或 sink 出错时 gather 立即抛出，其余任务要一并取消并等待退出，
+            # 否则拉取阶段会在服务已报错的情况下继续每轮拉取行情
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self._checkpoint_conn is not None:
+                self._checkpoint_conn.close()
+                self._checkpoint_conn = None
+
+    async def _fetch_stage(self) -> None:
+        clients: asyncio.Queue = asyncio.Queue()
+        for _ in range(self.concurrency):
+            clients.put_nowait(self.client_factory())
+        batches = [self.codes[i:i + QUOTE_BATCH_SIZE] for i in range(0, len(self.codes), QUOTE_BATCH_SIZE)]
+
+        async def fetch_batch(batch: list[str]) -> None:
+            client = await clients.get()
+            started = time.perf_counter()
+            try:
+                raw = await asyncio.to_thread(client.fetch, batch)
+            except Exception:
+                self.stats.fetch_errors += 1
+                return
+            finally:
+                clients.put_nowait(client)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats.batches += 1
+            self.stats.fetch_ms_total += elapsed_ms
+            self.stats.fetch_ms_max = max(self.stats.fetch_ms_max, elapsed_ms)
+            # 解析跟不上时在这里阻塞，拉取周期自然拉长
+            await self.raw_queue.put(raw)
+
+        cycles = 0
+        try:
+            if self.session_check and not get_trade_calendar(DB_PATH, read_only=True).is_trading_day(datetime.now().strftime("%Y-%m-%d")):
+                print("今日非交易日，流水线不拉取行情")
+                return
+            while not self._stop.is_set():
+                if self.session_check and not in_session(datetime.now()):
+                    wait_seconds = seconds_until_session(datetime.now())
+                    if wait_seconds < 0:
+                        break
+                    await self._sleep_or_stop(wait_seconds)
+                    continue
+                cycle_start = time.monotonic()
+                await asyncio.gather(*(fetch_batch(batch) for batch in batches))
+                self.stats.cycles += 1
+                cycles += 1
+                if self.max_cycles and cycles >= self.max_cycles:
+                    break
+                await self._sleep_or_stop(self.cadence - (time.monotonic() - cycle_start))
+        finally:
+            while not clients.empty():
+                clients.get_nowait().close()
+            await self.raw_queue.put(None)
+
+    async def _sleep_or_stop(self, seconds: float) -> None:
+        if seconds <= 0:
+            return
+        try:
+            await asyncio.wait_for(self._stop.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _parse_stage(self) -> None:
+        while True:
+            raw = await self.raw_queue.get()
+            if raw is None:
+                await self.tick_queue.put(None)
+                return
+            # 整批作为一个队列元素，减少排队开销
+            await self.tick_queue.put(parse_batch(raw))
+            # 队列未满时 put 不会让出；这里让出一次，整批先走完 MACD 和推送，而不是等本轮全部解析完
+            await asyncio.sleep(0)
+
+    async def _macd_stage(self) -> None:
+        while True:
+            ticks = await self.tick_queue.get()
+            if ticks is None:
+                break
+            for symbol, tick in ticks.items():
+                machine = self.machines.get(symbol)
+                if machine is None:
+                    continue
+                self.stats.ticks += 1
+                for event in machine.on_tick(tick):
+                    await self._dispatch(event)
+            await self._maybe_checkpoint()
+            # 每批处理完让出事件循环，推送与落地不被整轮行情饿住
+            await asyncio.sleep(0)
+        for index, machine in enumerate(self.machines.values(), 1):
+            for event in machine.close_session():
+                await self._dispatch(event)
+            # 收盘固化一次产出全部股票的分钟事件，按批让出，订阅者队列不至于被一口气挤满
+            if index % QUOTE_BATCH_SIZE == 0:
+                await asyncio.sleep(0)
+        await self._maybe_checkpoint(force=True)
+        for sink in self.sinks:
+            await sink.queue.put(None)
+
+    async def _maybe_checkpoint(self, force: bool = False) -> None:
+        """跨分钟时写一次当日检查点；矩阵在事件循环内生成，写库放到线程里，整个运行期复用一条连接。"""
+        if self.checkpoint_db is None:
+            return
+        now = datetime.now()
+        minute = now.strftime("%H:%M")
+        if minute == self._checkpoint_minute and not force:
+            return
+        self._checkpoint_minute = minute
+        codes, matrix = machine_checkpoint(self.machines)
+        if not codes:
+            return
+        try:
+            await asyncio.to_thread(self._write_checkpoint, now.strftime("%Y-%m-%d"), codes, matrix)
+        except sqlite3.Error as e:
+            print(f"[!] 写入 MACD 检查点失败: {e}")
+
+    def _write_checkpoint(self, trade_date: str, codes: list[str], matrix: np.ndarray) -> None:
+        # 各次写入在不同的线程池线程里执行，但前一次 await 完成才会开始下一次，不会并发使用连接
+        if self._checkpoint_conn is None:
+            self._checkpoint_conn = sqlite3.connect(str(self.checkpoint_db), check_same_thread=False, timeout=10)
+        save_state_checkpoint(self._checkpoint_conn, trade_date, codes, matrix)
+
+    async def _dispatch(self, event: dict) -> None:
+        self.stats.events += 1
+        for sink in self.sinks:
+            if sink.inline:
+                await sink.handle(event)
+            else:
+                await sink.queue.put(event)
+
+    async def _status_stage(self) -> None:
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL_SECONDS)
+            stats = self.stats
+            avg_fetch = stats.fetch_ms_total / stats.batches if stats.batches else 0.0
+            sink_depth = " ".join(f"{sink.name}:{sink.queue.qsize()}" for sink in self.sinks)
+            print(
+                f"[{datetime.now().strftime('%H:%M:%S')}] {len(self.codes)} 只  周期 {stats.cycles}  "
+                f"批次 {stats.batches}(失败 {stats.fetch_errors})  拉取 avg {avg_fetch:.0f}ms / max {stats.fetch_ms_max:.0f}ms  "
+                f"tick {stats.ticks}  事件 {stats.events}  队列 raw:{self.raw_queue.qsize()} tick:{self.tick_queue.qsize()} {sink_depth}",
+                flush=True,
+            )
+            stats.reset()
+
+
+# ---------------------------------------------------------------------------
+# CLI 入口
+# ---------------------------------------------------------------------------
+
+def load_allowed_board_codes(db_path: Path = DB_PATH) -> list[str]:
+    conn = sqlite3.connect(str(db_path))
+    try:
+        placeholders = ",".join("?" for _ in ALLOWED_BOARDS)
+        rows = conn.execute(
+            f"SELECT code FROM stocks WHERE is_st = 0 AND board IN ({placeholders}) ORDER BY code",
+            ALLOWED_BOARDS,
+        ).fetchall()
+    finally:
+        conn.close()
+    return [str(row[0]) for row in rows]
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="A-share 日内分钟级 MACD 流式监控（asyncio 流水线）")
+    parser.add_argument("--stocks", type=str, default=None, help="监控股票代码列表，逗号分隔")
+    parser.add_argument("--config", type=str, default=None, help="JSON 配置文件路径，格式: {\"stocks\": [...]}")
+    parser.add_argument("--allowed-boards", action="store_true", help="监控默认允许板块的全部非 ST 股票")
+    parser.add_argument("--cadence", type=float, default=STREAM_CADENCE_SECONDS, help="拉取周期（秒）")
+    parser.add_argument("--concurrency", type=int, default=FETCH_CONCURRENCY, help="并发 keep-alive 连接数")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="tick 落盘格式")
+    parser.add_argument("--no-sqlite", action="store_true", help="不写 intraday_macd_minutes 分钟表")
+    return parser
+
+
+def build_pipeline(
+    codes: list[str],
+    cadence: float = STREAM_CADENCE_SECONDS,
+    concurrency: int = FETCH_CONCURRENCY,
+    file_format: Optional[str] = "csv",
+    write_sqlite: bool = True,
+    hub: Optional[EventHub] = None,
+    client_factory: Callable[[], QuoteClient] = QuoteClient,
+    session_check: bool = True,
+) -> TickPipeline:
+    """预热并组装流水线；file_format 为 None 时不写 tick 文件，write_sqlite 同时控制分钟表与检查点。
+    client_factory / session_check 供基准测试注入假行情、忽略交易时段。预热会读库，异步环境里放到线程中调用。"""
+    symbols = [normalize_code(code) for code in codes]
+    if write_sqlite:
+        apply_stream_schema()
+    machines = warmup_machines(symbols)
+    warmed = sum(1 for machine in machines.values() if machine.dyn is not None)
+    print(f"预热完成: {warmed}/{len(symbols)} 只从昨日分钟数据恢复，其余首 tick 冷启动")
+    sinks: list[Sink] = []
+    if hub is not None:
+        sinks.append(PubSubSink(hub))
+    if file_format:
+        sinks.append(TickFileSink(file_format=file_format))
+    if write_sqlite:
+        sinks.append(SqliteMinuteSink())
+    return TickPipeline(
+        symbols,
+        sinks,
+        cadence=cadence,
+        concurrency=concurrency,
+        client_factory=client_factory,
+        machines=machines,
+        session_check=session_check,
+        checkpoint_db=DB_PATH if write_sqlite else None,
+    )
+
+
+async def run_stream(args: argparse.Namespace, codes: list[str], hub: Optional[EventHub] = None) -> None:
+    pipeline = await asyncio.to_thread(
+        build_pipeline,
+        codes,
+        cadence=args.cadence,
+        concurrency=args.concurrency,
+        file_format=args.format,
+        write_sqlite=not args.no_sqlite,
+        hub=hub,
+    )
+    await pipeline.run()
+
+
+def main() -> None:
+    args = build_arg_parser().parse_args()
+    codes: list[str] = []
+    if args.allowed_boards:
+        codes = load_allowed_board_codes()
+    elif args.config:
+        config_path = Path(args.config)
+        if not config_path.exists():
+            print(f"配置文件不存在: {args.config}")
+            sys.exit(1)
+        codes = json.loads(config_path.read_text(encoding="utf-8")).get("stocks", [])
+    elif args.stocks:
+        codes = [code.strip() for code in args.stocks.split(",") if code.strip()]
+    if not codes:
+        print("请通过 --stocks、--config 或 --allowed-boards 指定监控股票")
+        sys.exit(1)
+
+    print(f"监控股票: {len(codes)} 只  周期 {args.cadence:.1f}s  并发连接 {args.concurrency}")
+    print(f"数据目录: {MONITOR_DIR}")
+    try:
+        asyncio.run(run_stream(args, codes))
+    except KeyboardInterrupt:
+        print("\n用户中断，程序退出")
+
+
+if __name__ == "__main__":
+    main()
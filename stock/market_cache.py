@@ -0,0 +1,315 @@
+"""行情接口响应的本地分段缓存。
+
+替代原先按 (code, start, end, adjust) 哈希出一个 .pkl 的做法：每次同步窗口不同导致缓存
+几乎无法复用、无限增长，而且 pickle 整个 DataFrame 既慢又不安全。
+
+- 索引：SQLite 里的 market_segments 表，一行描述一段 (kind, code, adjust, variant, [start, end])；
+  variant 区分同一接口的不同请求参数（如五日分时的回看天数）。
+- 内容：按 sha256 寻址的 market_objects 表，存压缩后的 JSON（{"columns", "dtypes", "data"}），
+  安装了 zstandard 用 zstd，否则用 zlib；相同内容只存一份。
+- 合并：写入区间时，与仍在有效期内且有重叠的区间合并成一段，同一键值以新数据为准；
+  请求区间只要落在某一段内即命中，按 key_column 截取返回。
+- 淘汰：总字节数超过 MARKET_CACHE_MAX_BYTES 时按最近访问时间淘汰区间，再清理无引用的内容；
+  命中只在内存里记下访问时间，写入时再批量落库，读缓存不产生写事务。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Optional
+
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 行情缓存的总字节上限（压缩后）
+MARKET_CACHE_MAX_BYTES = 512 * 1024 * 1024
+MARKET_CACHE_INDEX_NAME = "index.db"
+ZSTD_LEVEL = 3
+
+
+def frame_to_bytes(df: pd.DataFrame) -> bytes:
+    data = df.astype(object).where(df.notna(), None).values.tolist()
+    payload = {"columns": list(df.columns), "dtypes": [str(dtype) for dtype in df.dtypes], "data": data}
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def frame_from_bytes(body: bytes) -> pd.DataFrame:
+    payload = json.loads(body)
+    df = pd.DataFrame(payload["data"], columns=payload["columns"])
+    # JSON 里的 null 会把数值列读成 object，按原 dtype 还原，NaN 保持为 NaN
+    for column, dtype in zip(payload["columns"], payload.get("dtypes", [])):
+        if dtype != "object" and str(df[column].dtype) != dtype:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def compress(body: bytes) -> tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return "zlib", zlib.compress(body, 6)
+
+
+def decompress(codec: str, blob: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("缓存内容为 zstd 压缩，但未安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return zlib.decompress(blob)
+
+
+class MarketSegmentCache:
+    def __init__(self, cache_dir: Path, max_bytes: int = MARKET_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # 命中过的区间 → 最近访问时间，put 时落库
+        self._accessed: dict[tuple, float] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.cache_dir / MARKET_CACHE_INDEX_NAME, check_same_thread=False, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = {str(row[1]) for row in conn.execute("PRAGMA table_info(market_segments)").fetchall()}
+            if columns and "variant" not in columns:
+                # 旧索引的主键不含 variant，缓存可以重建，直接清空
+                conn.executescript("DROP TABLE market_segments; DROP TABLE IF EXISTS market_objects;")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS market_objects (
+                    digest TEXT PRIMARY KEY,
+                    codec TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    body BLOB NOT NULL
+                );
+
+                CREATE TABLE IF NOT EXISTS market_segments (
+                    kind TEXT NOT NULL,
+                    code TEXT NOT NULL,
+                    adjust TEXT NOT NULL,
+                    variant TEXT NOT NULL,
+                    start TEXT NOT NULL,
+                    end TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (kind, code, adjust, variant, start, end)
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_market_segments_accessed_at
+                    ON market_segments(accessed_at);
+
+                CREATE INDEX IF NOT EXISTS idx_market_segments_digest
+                    ON market_segments(digest);
+                """
+            )
+            conn.commit()
+            self._purge_legacy_pickles()
+            self._conn = conn
+        return self._conn
+
+    def _purge_legacy_pickles(self) -> None:
+        for path in self.cache_dir.glob("*.pkl"):
+            try:
+                path.unlink()
+            except OSError:
+                continue
+
+    def _find(self, kind: str, code: str, adjust: str, variant: str, start: str, end: str, min_fetched_at: float):
+        return self._connection().execute(
+            """
+            SELECT start, end, digest, fetched_at FROM market_segments
+            WHERE kind = ? AND code = ? AND adjust = ? AND variant = ? AND start <= ? AND end >= ? AND fetched_at >= ?
+            ORDER BY fetched_at DESC LIMIT 1
+            """,
+            (kind, code, adjust, variant, start, end, min_fetched_at),
+        ).fetchone()
+
+    def _read_object(self, digest: str) -> Optional[pd.DataFrame]:
+        row = self._connection().execute("SELECT codec, body FROM market_objects WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return frame_from_bytes(decompress(str(row[0]), bytes(row[1])))
+        except Exception:
+            return None
+
+    @staticmethod
+    def _slice(df: pd.DataFrame, key_column: Optional[str], start: str, end: str) -> pd.DataFrame:
+        if key_column is None or not start:
+            return df
+        values = df[key_column].astype(str)
+        return df[(values >= start) & (values <= end)].reset_index(drop=True)
+
+    def get(
+        self,
+        kind: str,
+        code: str,
+        start: str = "",
+        end: str = "",
+        ttl_seconds: float = 0,
+        adjust: str = "",
+        key_column: Optional[str] = None,
+        variant: str = "",
+    ) -> Optional[pd.DataFrame]:
+        """返回完整覆盖 [start, end] 且在有效期内的数据；ttl_seconds 为 None 时不限新旧（失败回退用）。
+
+        回退同样要求整段覆盖：只有部分重叠的区间截出来是残缺数据，调用方无从分辨，不如当作未命中。
+        """
+        with self._lock:
+            min_fetched_at = 0.0 if ttl_seconds is None else time.time() - ttl_seconds
+            row = self._find(kind, code, adjust, variant, start, end, min_fetched_at)
+            df = self._read_object(str(row[2])) if row is not None else None
+            if df is None:
+                if ttl_seconds is not None:
+                    self.misses += 1
+                return None
+            self._accessed[(kind, code, adjust, variant, row[0], row[1])] = time.time()
+            if ttl_seconds is None:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return self._slice(df, key_column, start, end)
+
+    def put(
+        self,
+        kind: str,
+        code: str,
+        df: pd.DataFrame,
+        start: str = "",
+        end: str = "",
+        ttl_seconds: float = 0,
+        adjust: str = "",
+        key_column: Optional[str] = None,
+        variant: str = "",
+    ) -> None:
+        """写入区间数据；有 key_column 时与有效期内重叠的区间合并，重叠的过期区间直接替换。"""
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            overlapping = conn.execute(
+                """
+                SELECT start, end, digest, fetched_at FROM market_segments
+                WHERE kind = ? AND code = ? AND adjust = ? AND variant = ? AND start <= ? AND end >= ?
+                """,
+                (kind, code, adjust, variant, end, start),
+            ).fetchall()
+
+            merged_start, merged_end, fetched_at = start, end, now
+            frames = []
+            if key_column is not None:
+                for seg_start, seg_end, digest, seg_fetched_at in overlapping:
+                    if seg_fetched_at < now - ttl_seconds:
+                        continue
+                    cached = self._read_object(str(digest))
+                    if cached is None:
+                        continue
+                    frames.append(cached)
+                    merged_start, merged_end = min(merged_start, seg_start), max(merged_end, seg_end)
+                    # 合并后的区间按最早一次抓取计算有效期，不延长旧数据的寿命
+                    fetched_at = min(fetched_at, seg_fetched_at)
+            if frames:
+                merged = pd.concat(frames + [df], ignore_index=True)
+                df = merged.drop_duplicates(subset=[key_column], keep="last").sort_values(key_column).reset_index(drop=True)
+
+            codec, blob = compress(frame_to_bytes(df))
+            digest = hashlib.sha256(blob).hexdigest()
+            conn.execute(
+                "INSERT OR IGNORE INTO market_objects(digest, codec, size, body) VALUES (?, ?, ?, ?)",
+                (digest, codec, len(blob), blob),
+            )
+            conn.executemany(
+                "DELETE FROM market_segments WHERE kind = ? AND code = ? AND adjust = ? AND variant = ? AND start = ? AND end = ?",
+                [(kind, code, adjust, variant, seg[0], seg[1]) for seg in overlapping],
+            )
+            for seg in overlapping:
+                self._accessed.pop((kind, code, adjust, variant, seg[0], seg[1]), None)
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO market_segments(kind, code, adjust, variant, start, end, digest, fetched_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (kind, code, adjust, variant, merged_start, merged_end, digest, fetched_at, now),
+            )
+            self._release([str(seg[2]) for seg in overlapping])
+            self._enforce_budget()
+            conn.commit()
+
+    def _release(self, digests: list[str]) -> int:
+        """删除不再被任何区间引用的内容，返回释放的字节数。"""
+        conn = self._connection()
+        freed = 0
+        for digest in set(digests):
+            if conn.execute("SELECT 1 FROM market_segments WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+                continue
+            row = conn.execute("SELECT size FROM market_objects WHERE digest = ?", (digest,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM market_objects WHERE digest = ?", (digest,))
+                freed += int(row[0])
+        return freed
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return int(self._connection().execute("SELECT COALESCE(SUM(size), 0) FROM market_objects").fetchone()[0])
+
+    def _flush_access_times(self) -> None:
+        """把内存里记下的命中时间批量写回索引，随 put 的事务一起提交。"""
+        if not self._accessed:
+            return
+        accessed, self._accessed = self._accessed, {}
+        self._connection().executemany(
+            """
+            UPDATE market_segments SET accessed_at = ?
+            WHERE kind = ? AND code = ? AND adjust = ? AND variant = ? AND start = ? AND end = ?
+            """,
+            [(accessed_at, *key) for key, accessed_at in accessed.items()],
+        )
+
+    def _enforce_budget(self) -> None:
+        conn = self._connection()
+        self._flush_access_times()
+        total = int(conn.execute("SELECT COALESCE(SUM(size), 0) FROM market_objects").fetchone()[0])
+        if total <= self.max_bytes:
+            return
+        victims = conn.execute(
+            "SELECT kind, code, adjust, variant, start, end, digest FROM market_segments ORDER BY accessed_at"
+        ).fetchall()
+        for kind, code, adjust, variant, start, end, digest in victims:
+            if total <= self.max_bytes:
+                break
+            conn.execute(
+                "DELETE FROM market_segments WHERE kind = ? AND code = ? AND adjust = ? AND variant = ? AND start = ? AND end = ?",
+                (kind, code, adjust, variant, start, end),
+            )
+            # 内容可能被多段共享，只有最后一个引用删除时才真正释放字节
+            total -= self._release([str(digest)])
+            self.evictions += 1
+
+    def reset_stats(self) -> None:
+        self.hits = self.stale_hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self.size_bytes(),
+        }
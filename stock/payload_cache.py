@@ -0,0 +1,313 @@
+"""前端市场载荷缓存。
+
+StockMarketDataReader 组装的载荷以序列化后的 JSON 字节缓存：命中时直接返回字节（或反序列化出
+一份新对象），不再 deepcopy。进程内按字节数做 LRU 淘汰；可选再挂一层本地 SQLite 共享库，
+让多个 uvicorn worker 复用同一份载荷。
+
+失效依据 stock.db 里的 payload_generations 表：同步每写完一只股票就把它的代数 +1，
+缓存条目记录生成时的代数，读取时代数不一致即视为过期，各 worker 都能立即感知数据变化。
+TTL 只作为兜底。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 进程内载荷缓存的字节上限
+PAYLOAD_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# 代数未变化时的兜底有效期
+PAYLOAD_CACHE_TTL_SECONDS = 10 * 60
+# 共享库字节上限；超过后按写入时间淘汰最旧的条目
+SHARED_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# 每写入多少条检查一次共享库大小
+SHARED_CACHE_TRIM_EVERY = 200
+# 设置为 1 时启用跨 worker 的共享库
+SHARED_CACHE_ENV = "STOCK_PAYLOAD_SHARED_CACHE"
+
+
+def _json_default(value):
+    """orjson/json 不认识的类型：Neo4j 时间类型、numpy 标量、集合等。"""
+    if hasattr(value, "iso_format"):
+        return value.iso_format()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+def dumps_payload(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def loads_payload(body: bytes) -> dict:
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def columnar_rows(rows: list) -> dict:
+    """[{字段: 值}, ...] → {字段: [值, ...]}；字段顺序取第一行。"""
+    if not rows:
+        return {}
+    return {field: [row.get(field) for row in rows] for field in rows[0]}
+
+
+def to_columnar_market(payload: dict) -> dict:
+    """市场载荷的列式版本：各序列由逐根对象改为每个字段一个数组，其余结构不变。"""
+    columnar = dict(payload)
+    columnar["layout"] = "columnar"
+    columnar["daily_series"] = columnar_rows(payload.get("daily_series", []))
+    columnar["intraday_series"] = columnar_rows(payload.get("intraday_series", []))
+    columnar["candle_windows"] = {name: columnar_rows(rows) for name, rows in payload.get("candle_windows", {}).items()}
+    columnar["daily_distributions"] = [
+        {
+            **item,
+            "buy_sell_bins": columnar_rows(item.get("buy_sell_bins", [])),
+            "price_histogram": columnar_rows(item.get("price_histogram", [])),
+        }
+        for item in payload.get("daily_distributions", [])
+    ]
+    return columnar
+
+
+def bump_payload_generation(conn: sqlite3.Connection, code: str) -> None:
+    """同步写完一只股票后调用，使所有进程里该股票的载荷缓存失效（由调用方提交事务）。"""
+    conn.execute(
+        """
+        INSERT INTO payload_generations(code, generation, updated_at) VALUES (?, 1, ?)
+        ON CONFLICT(code) DO UPDATE SET generation = generation + 1, updated_at = excluded.updated_at
+        """,
+        (code, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+    )
+
+
+class GenerationReader:
+    """按线程复用只读连接查询股票代数；库或表不存在时代数为 0。"""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if not self.db_path.exists():
+                return None
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=10)
+            self._local.conn = conn
+        return conn
+
+    def get(self, code: str) -> int:
+        conn = self._connection()
+        if conn is None:
+            return 0
+        try:
+            row = conn.execute("SELECT generation FROM payload_generations WHERE code = ?", (code,)).fetchone()
+        except sqlite3.OperationalError:
+            return 0
+        return int(row[0]) if row else 0
+
+
+class PayloadLRU:
+    """进程内 LRU：code → (代数, 写入时间, JSON 字节)，按总字节数淘汰。"""
+
+    def __init__(self, max_bytes: int = PAYLOAD_CACHE_MAX_BYTES, ttl_seconds: float = PAYLOAD_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size_bytes = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[int, float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, code: str, generation: int) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry is None:
+                return None
+            if entry[0] != generation or time.time() - entry[1] > self.ttl_seconds:
+                self._remove(code)
+                return None
+            self._entries.move_to_end(code)
+            return entry[2]
+
+    def put(self, code: str, generation: int, body: bytes, stored_at: Optional[float] = None) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(code)
+            self._entries[code] = (generation, time.time() if stored_at is None else stored_at, body)
+            self.size_bytes += len(body)
+            while self.size_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def discard(self, code: str) -> None:
+        with self._lock:
+            self._remove(code)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def _remove(self, code: str) -> None:
+        entry = self._entries.pop(code, None)
+        if entry is not None:
+            self.size_bytes -= len(entry[2])
+
+
+class SharedPayloadStore:
+    """多个 worker 共用的本地 SQLite 载荷库（WAL 模式，按线程复用连接）。"""
+
+    def __init__(self, path: Path, max_bytes: int = SHARED_CACHE_MAX_BYTES, ttl_seconds: float = PAYLOAD_CACHE_TTL_SECONDS):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._put_count = 0
+        self._put_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS market_payloads (
+                    code TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL,
+                    stored_at REAL NOT NULL,
+                    body BLOB NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_market_payloads_stored_at ON market_payloads(stored_at)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, code: str, generation: int) -> Optional[tuple[float, bytes]]:
+        row = self._connection().execute(
+            "SELECT stored_at, body FROM market_payloads WHERE code = ? AND generation = ?",
+            (code, generation),
+        ).fetchone()
+        if row is None or time.time() - float(row[0]) > self.ttl_seconds:
+            return None
+        return float(row[0]), bytes(row[1])
+
+    def put(self, code: str, generation: int, body: bytes, stored_at: float) -> None:
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO market_payloads(code, generation, stored_at, body) VALUES (?, ?, ?, ?)",
+            (code, generation, stored_at, body),
+        )
+        with self._put_lock:
+            self._put_count += 1
+            should_trim = self._put_count % SHARED_CACHE_TRIM_EVERY == 0
+        if should_trim:
+            self.trim()
+
+    def trim(self) -> int:
+        """超过字节上限时删除最旧的条目，返回删除条数。"""
+        conn = self._connection()
+        total = int(conn.execute("SELECT COALESCE(SUM(LENGTH(body)), 0) FROM market_payloads").fetchone()[0])
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for code, size in conn.execute("SELECT code, LENGTH(body) FROM market_payloads ORDER BY stored_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM market_payloads WHERE code = ?", (code,))
+            total -= int(size)
+            removed += 1
+        return removed
+
+
+class MarketPayloadCache:
+    """进程内 LRU + 可选共享库，按 stock.db 中的股票代数失效。"""
+
+    def __init__(
+        self,
+        db_path: Path,
+        shared_path: Optional[Path] = None,
+        max_bytes: int = PAYLOAD_CACHE_MAX_BYTES,
+        ttl_seconds: float = PAYLOAD_CACHE_TTL_SECONDS,
+    ):
+        self.generations = GenerationReader(db_path)
+        self.memory = PayloadLRU(max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+        self.shared = SharedPayloadStore(shared_path, ttl_seconds=ttl_seconds) if shared_path else None
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._variants: set = set()
+
+    @classmethod
+    def from_env(cls, db_path: Path, shared_path: Path) -> "MarketPayloadCache":
+        enabled = os.environ.get(SHARED_CACHE_ENV, "").strip().lower() in {"1", "true", "yes"}
+        return cls(db_path, shared_path=shared_path if enabled else None)
+
+    def get_or_build(self, code: str, builder: Callable[[], dict], variant: Optional[str] = None) -> bytes:
+        """variant 区分同一股票的不同编码（如列式），各自缓存，按同一代数失效。"""
+        generation = self.generations.get(code)
+        key = f"{code}:{variant}" if variant else code
+        if variant:
+            self._variants.add(variant)
+        body = self.memory.get(key, generation)
+        if body is not None:
+            self.hits += 1
+            return body
+        if self.shared is not None:
+            entry = self.shared.get(key, generation)
+            if entry is not None:
+                self.shared_hits += 1
+                self.memory.put(key, generation, entry[1], stored_at=entry[0])
+                return entry[1]
+
+        self.misses += 1
+        body = dumps_payload(builder())
+        stored_at = time.time()
+        self.memory.put(key, generation, body, stored_at=stored_at)
+        if self.shared is not None:
+            self.shared.put(key, generation, body, stored_at)
+        return body
+
+    def discard(self, code: str) -> None:
+        self.memory.discard(code)
+        for variant in list(self._variants):
+            self.memory.discard(f"{code}:{variant}")
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.memory),
+            "size_bytes": self.memory.size_bytes,
+            "max_bytes": self.memory.max_bytes,
+            "evictions": self.memory.evictions,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "shared": self.shared is not None,
+        }
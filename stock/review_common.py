@@ -9,6 +9,7 @@
     --skip-sync: 跳过当日同步完整性检查，直接使用 SQLite 现有数据
     --skip-email: 仅生成 Markdown 和 CSV，不发送邮件
     --force-run: 忽略启动时间和当日运行记录，强制执行复盘
+    --workers: 计算技术指标的进程数，0 表示按 CPU 核数自动选择，1 表示单进程
 
 用法：
     - 对指定日期进行增量数据检查并分析打分，生成复盘报告：
@@ -24,7 +25,9 @@
 from __future__ import annotations
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import json
+import os
 import smtplib
 import sqlite3
 import time
@@ -38,8 +41,19 @@ from email.mime.text import MIMEText
 from email.utils import formataddr, parseaddr
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
+try:
+    from frame_rows import column_values, stock_rows
+except ImportError:
+    from .frame_rows import column_values, stock_rows
+
+try:
+    from trade_calendar import get_trade_calendar
+except ImportError:
+    from .trade_calendar import get_trade_calendar
+
 SIGNAL_WEIGHTS = {
     "golden_cross_first": 50,
     "golden_cross_second": 35,
@@ -124,6 +138,10 @@ MIN_LIQUIDITY_RATIO_PCT = 2.0
 SQLITE_BUSY_TIMEOUT_MS = 10000
 SQLITE_LOCK_RETRY_COUNT = 3
 SQLITE_LOCK_RETRY_DELAY_SECONDS = 1.0
+KLINE_BATCH_SIZE = 500
+# run_compute 打分进程数，0 表示按 CPU 核数自动选择
+DEFAULT_COMPUTE_WORKERS = 0
+COMPUTE_CHUNKS_PER_WORKER = 4
 
 EMAIL_CONFIG_PATH = BASE_DIR / "stock" / "doc" / "stock_email.config"
 
@@ -155,6 +173,7 @@ def get_db_connection() -> sqlite3.Connection:
     schema_sql = SCHEMA_PATH.read_text(encoding="utf-8")
     conn.executescript(schema_sql)
     ensure_schema_migrations(conn)
+    ensure_latest_daily(conn)
     return conn
 
 
@@ -231,6 +250,50 @@ def ensure_schema_migrations(conn: sqlite3.Connection) -> None:
     conn.commit()
 
 
+# daily_bars 中有、latest_daily 中没有的股票代码；沿主键 (code, trade_date) 逐个跳到下一个代码，
+# 代价与股票数量成正比，不随日线行数增长
+LATEST_DAILY_MISSING_CODES_CTE = """
+    bar_codes(code) AS (
+        SELECT MIN(code) FROM daily_bars
+        UNION ALL
+        SELECT (SELECT MIN(code) FROM daily_bars WHERE code > bar_codes.code)
+        FROM bar_codes
+        WHERE code IS NOT NULL
+    ),
+    missing_codes(code) AS (
+        SELECT code FROM bar_codes WHERE code IS NOT NULL
+        EXCEPT
+        SELECT code FROM latest_daily
+    )
+"""
+
+
+def ensure_latest_daily(conn: sqlite3.Connection) -> None:
+    """latest_daily 由同步引擎逐只维护；旧库升级或有股票缺行时，只为缺失的股票回填。
+
+    LATEST_BARS_CTE 与 latest_daily 做内连接，缺行的股票会从候选中静默消失，因此按代码检查而不是只看表是否为空。
+    """
+    if not conn.execute(f"WITH RECURSIVE {LATEST_DAILY_MISSING_CODES_CTE} SELECT 1 FROM missing_codes LIMIT 1").fetchone():
+        return
+    with conn:
+        conn.execute(
+            f"""
+            WITH RECURSIVE {LATEST_DAILY_MISSING_CODES_CTE}
+            INSERT OR REPLACE INTO latest_daily(code, trade_date, open, high, low, close, volume, previous_close)
+            SELECT code, trade_date, open, high, low, close, volume, previous_close
+            FROM (
+                SELECT
+                    code, trade_date, open, high, low, close, volume,
+                    LAG(close) OVER (PARTITION BY code ORDER BY trade_date) AS previous_close,
+                    ROW_NUMBER() OVER (PARTITION BY code ORDER BY trade_date DESC) AS rn
+                FROM daily_bars
+                WHERE code IN (SELECT code FROM missing_codes)
+            )
+            WHERE rn = 1
+            """
+        )
+
+
 def is_locked_error(exc: Exception) -> bool:
     return isinstance(exc, sqlite3.OperationalError) and "database is locked" in str(exc).lower()
 
@@ -321,10 +384,7 @@ def fetch_daily_bars(code: str, start_date: str, end_date: str, adjust: str) ->
 
 
 def upsert_stocks(conn: sqlite3.Connection, stocks_df: pd.DataFrame) -> int:
-    rows = [
-        (row.code, row.name, row.board, int(row.is_st), now_ts())
-        for row in stocks_df.itertuples(index=False)
-    ]
+    rows = stock_rows(stocks_df, now_ts())
     conn.executemany(
         """
         INSERT INTO stocks(code, name, board, is_st, updated_at)
@@ -355,8 +415,10 @@ def replace_qfq_history(conn: sqlite3.Connection, code: str, bars_df: pd.DataFra
 
 def select_sync_candidates(stocks_df: pd.DataFrame, realtime: dict[str, dict]) -> list[dict]:
     candidates = []
-    for row in stocks_df.itertuples(index=False):
-        quote = realtime.get(row.code)
+    for code, name, board in zip(
+        column_values(stocks_df, "code"), column_values(stocks_df, "name"), column_values(stocks_df, "board")
+    ):
+        quote = realtime.get(code)
         if not quote:
             continue
         liquidity_ratio_pct = calc_liquidity_ratio_pct(quote.get("amount_wan"), quote.get("float_mv_yi"))
@@ -366,9 +428,9 @@ def select_sync_candidates(stocks_df: pd.DataFrame, realtime: dict[str, dict]) -
             continue
         candidates.append(
             {
-                "code": row.code,
-                "name": quote.get("name", row.name),
-                "board": row.board,
+                "code": code,
+                "name": quote.get("name", name),
+                "board": board,
                 "amount_wan": quote["amount_wan"],
                 "float_mv_yi": quote["float_mv_yi"],
                 "liquidity_ratio_pct": liquidity_ratio_pct,
@@ -542,29 +604,45 @@ def to_csv_rows(results: list[dict]) -> list[dict]:
     return rows
 
 
+# 每只股票在复盘日（含）之前的最后一根日线及其前收盘价。
+# 复盘日不早于 latest_daily 记录时直接命中该表；回看历史日期的股票再按 (code, trade_date) 索引定位。
+# 参数依次为三个复盘日。
+LATEST_BARS_CTE = """
+        latest_bars AS (
+            SELECT code, trade_date, open, high, low, close, volume, previous_close
+            FROM latest_daily
+            WHERE trade_date <= ?
+            UNION ALL
+            SELECT
+                d.code, d.trade_date, d.open, d.high, d.low, d.close, d.volume,
+                (
+                    SELECT p.close
+                    FROM daily_bars p
+                    WHERE p.code = d.code AND p.trade_date < d.trade_date
+                    ORDER BY p.trade_date DESC
+                    LIMIT 1
+                ) AS previous_close
+            FROM latest_daily ld
+            INNER JOIN daily_bars d ON d.code = ld.code
+                AND d.trade_date = (
+                    SELECT MAX(x.trade_date)
+                    FROM daily_bars x
+                    WHERE x.code = ld.code AND x.trade_date <= ?
+                )
+            WHERE ld.trade_date > ?
+        )"""
+
+
 def load_candidates(conn: sqlite3.Connection, review_date: str, include_all_boards: bool) -> list[sqlite3.Row]:
     board_condition = ""
-    params: list[object] = [review_date]
+    params: list[object] = [review_date, review_date, review_date]
     if not include_all_boards:
         placeholders = ",".join("?" for _ in ALLOWED_BOARDS)
         board_condition = f"AND s.board IN ({placeholders})"
         params.extend(ALLOWED_BOARDS)
 
     query = f"""
-        WITH ordered_daily AS (
-            SELECT
-                code,
-                trade_date,
-                open,
-                high,
-                low,
-                close,
-                volume,
-                LAG(close) OVER (PARTITION BY code ORDER BY trade_date) AS previous_close_calc,
-                ROW_NUMBER() OVER (PARTITION BY code ORDER BY trade_date DESC) AS rn
-            FROM daily_bars
-            WHERE trade_date <= ?
-        ),
+        WITH {LATEST_BARS_CTE},
         latest_market AS (
             SELECT
                 code,
@@ -576,11 +654,6 @@ def load_candidates(conn: sqlite3.Connection, review_date: str, include_all_boar
                     ELSE NULL
                 END AS liquidity_ratio_pct
             FROM latest_market_value
-        ),
-        latest_daily AS (
-            SELECT *
-            FROM ordered_daily
-            WHERE rn = 1
         )
         SELECT
             s.code,
@@ -591,7 +664,7 @@ def load_candidates(conn: sqlite3.Connection, review_date: str, include_all_boar
             ld.high,
             ld.low,
             CASE
-                WHEN ld.previous_close_calc IS NOT NULL AND ld.previous_close_calc > 0 THEN ((ld.close / ld.previous_close_calc) - 1) * 100
+                WHEN ld.previous_close IS NOT NULL AND ld.previous_close > 0 THEN ((ld.close / ld.previous_close) - 1) * 100
                 ELSE 0
             END AS pct_change,
             ld.volume AS volume,
@@ -599,7 +672,7 @@ def load_candidates(conn: sqlite3.Connection, review_date: str, include_all_boar
             lmv.float_mv_yi,
             lmv.liquidity_ratio_pct
         FROM stocks s
-        INNER JOIN latest_daily ld ON ld.code = s.code
+        INNER JOIN latest_bars ld ON ld.code = s.code
         LEFT JOIN latest_market lmv ON lmv.code = s.code
         WHERE s.is_st = 0
           {board_condition}
@@ -617,12 +690,230 @@ def load_qfq_bars(conn: sqlite3.Connection, code: str, required_rows: int) -> pd
         SELECT trade_date AS date, open, high, low, close, volume, volume AS amount
         FROM daily_bars
         WHERE code = ?
-        ORDER BY trade_date
+        ORDER BY trade_date DESC
+        LIMIT ?
     """
-    df = pd.read_sql_query(query, conn, params=[code])
+    df = pd.read_sql_query(query, conn, params=[code, required_rows])
     if df.empty:
         return df
-    return df.tail(required_rows)
+    return df.iloc[::-1].reset_index(drop=True)
+
+
+KLINE_COLUMNS = ["date", "open", "high", "low", "close", "volume", "amount"]
+
+
+def _latest_bar_date(conn: sqlite3.Connection) -> str | None:
+    row = conn.execute("SELECT MAX(trade_date) FROM daily_bars").fetchone()
+    return str(row[0]) if row and row[0] is not None else None
+
+
+def load_market_trade_dates(conn: sqlite3.Connection, start_date: str | None = None, end_date: str | None = None) -> list[str]:
+    """库中有日线的交易日（升序）。
+
+    在交易日历上取区间内的交易日，再逐日用 trade_date 索引确认库中有数据（跳过漏同步的日子），
+    避免对整张 daily_bars 做 DISTINCT 扫描。
+    """
+    first = conn.execute("SELECT MIN(trade_date) FROM daily_bars").fetchone()[0]
+    last = _latest_bar_date(conn)
+    if first is None or last is None:
+        return []
+    start = max(start_date, str(first)) if start_date else str(first)
+    end = min(end_date, last) if end_date else last
+    calendar = get_trade_calendar(DB_PATH, conn=conn)
+    return [
+        trade_date
+        for trade_date in calendar.trading_days(start, end)
+        if conn.execute("SELECT 1 FROM daily_bars WHERE trade_date = ? LIMIT 1", (trade_date,)).fetchone()
+    ]
+
+
+def _kline_date_lower_bound(conn: sqlite3.Connection, required_rows: int, review_date: str | None) -> str | None:
+    """交易日历上从 review_date（默认库中最新日期）往前数 required_rows 个交易日的日期，作为批量读取的下界。"""
+    upper = review_date or _latest_bar_date(conn)
+    if upper is None:
+        return None
+    return get_trade_calendar(DB_PATH, conn=conn).trading_days_back(upper, required_rows)
+
+
+def _split_kline_frame(df: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    if df.empty:
+        return {}
+    codes = df["code"].to_numpy()
+    boundaries = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(df)]))
+    frame = df[KLINE_COLUMNS]
+    return {
+        str(codes[start]): frame.iloc[start:end].reset_index(drop=True)
+        for start, end in zip(starts, ends)
+    }
+
+
+def load_qfq_bars_batch(
+    conn: sqlite3.Connection,
+    codes: list[str],
+    required_rows: int,
+    review_date: str | None = None,
+) -> dict[str, pd.DataFrame]:
+    """批量读取多只股票截至 review_date（None 表示最新）的最近 required_rows 根日线。
+
+    先按交易日历下界做区间读取；区间内不足 required_rows 根的股票（停牌、新股）
+    再用 ROW_NUMBER 窗口补查。每 KLINE_BATCH_SIZE 只股票一条 SQL。
+    """
+    klines: dict[str, pd.DataFrame] = {}
+    if not codes:
+        return klines
+    lower_bound = _kline_date_lower_bound(conn, required_rows, review_date)
+    upper_condition = "AND trade_date <= ?" if review_date else ""
+    upper_params: list[object] = [review_date] if review_date else []
+
+    short_codes: list[str] = []
+    for start in range(0, len(codes), KLINE_BATCH_SIZE):
+        chunk = list(codes[start : start + KLINE_BATCH_SIZE])
+        placeholders = ",".join("?" for _ in chunk)
+        df = pd.read_sql_query(
+            f"""
+            SELECT code, trade_date AS date, open, high, low, close, volume, volume AS amount
+            FROM daily_bars
+            WHERE code IN ({placeholders})
+              AND trade_date >= ?
+              {upper_condition}
+            ORDER BY code, trade_date
+            """,
+            conn,
+            params=[*chunk, lower_bound or "", *upper_params],
+        )
+        chunk_klines = _split_kline_frame(df)
+        for code in chunk:
+            kline = chunk_klines.get(code)
+            if kline is None or len(kline) < required_rows:
+                short_codes.append(code)
+            else:
+                klines[code] = kline
+
+    for start in range(0, len(short_codes), KLINE_BATCH_SIZE):
+        chunk = short_codes[start : start + KLINE_BATCH_SIZE]
+        placeholders = ",".join("?" for _ in chunk)
+        df = pd.read_sql_query(
+            f"""
+            SELECT code, date, open, high, low, close, volume, amount
+            FROM (
+                SELECT
+                    code, trade_date AS date, open, high, low, close, volume, volume AS amount,
+                    ROW_NUMBER() OVER (PARTITION BY code ORDER BY trade_date DESC) AS rn
+                FROM daily_bars
+                WHERE code IN ({placeholders})
+                  {upper_condition}
+            )
+            WHERE rn <= ?
+            ORDER BY code, date
+            """,
+            conn,
+            params=[*chunk, *upper_params, required_rows],
+        )
+        klines.update(_split_kline_frame(df))
+    return klines
+
+
+def load_indicator_states(conn: sqlite3.Connection) -> dict[str, dict]:
+    indicator_api = load_indicator_api()
+    width = len(indicator_api.INDICATOR_STATE_COLUMNS)
+    states: dict[str, dict] = {}
+    for row in conn.execute("SELECT code, last_trade_date, bar_count, window_blob FROM indicator_state"):
+        states[str(row["code"])] = {
+            "last_trade_date": str(row["last_trade_date"]),
+            "bar_count": int(row["bar_count"]),
+            "window": np.frombuffer(row["window_blob"], dtype="<f8").reshape(-1, width),
+        }
+    return states
+
+
+def load_bars_since_state(conn: sqlite3.Connection) -> dict[str, list[tuple]]:
+    """一次查询取出每只股票自状态最后一根 K 线（含）以来的全部日线。"""
+    rows = conn.execute(
+        """
+        SELECT d.code, d.trade_date, d.open, d.high, d.low, d.close, d.volume
+        FROM indicator_state st
+        INNER JOIN daily_bars d ON d.code = st.code AND d.trade_date >= st.last_trade_date
+        ORDER BY d.code, d.trade_date
+        """
+    ).fetchall()
+    bars_by_code: dict[str, list[tuple]] = {}
+    for row in rows:
+        bars_by_code.setdefault(str(row["code"]), []).append(tuple(row)[1:])
+    return bars_by_code
+
+
+def advance_indicator_state(state: dict | None, bars_since: list[tuple]) -> tuple[dict, bool] | None:
+    """在已有状态上追加新 K 线，返回 (最新状态, 是否需要落库)。
+
+    状态缺失或末根 K 线被改写（复权、补数）时返回 None，由调用方全量重算。
+    """
+    if state is None or not bars_since or bars_since[0][0] != state["last_trade_date"]:
+        return None
+    indicator_api = load_indicator_api()
+    bar_width = len(indicator_api.INDICATOR_STATE_BAR_COLUMNS)
+    stored_last = state["window"][-1, :bar_width]
+    current_last = np.array(bars_since[0][1:], dtype=float)
+    if not np.array_equal(stored_last, current_last, equal_nan=True):
+        return None
+    new_bars = bars_since[1:]
+    if not new_bars:
+        return state, False
+    window = indicator_api.append_indicator_bars(
+        state["window"],
+        np.array([bar[1:] for bar in new_bars], dtype=float),
+    )
+    return {
+        "last_trade_date": str(new_bars[-1][0]),
+        "bar_count": state["bar_count"] + len(new_bars),
+        "window": window,
+    }, True
+
+
+def build_indicator_state(kline: pd.DataFrame) -> dict:
+    return {
+        "last_trade_date": str(kline["date"].iloc[-1]),
+        "bar_count": len(kline),
+        "window": load_indicator_api().build_indicator_window(kline),
+    }
+
+
+def store_indicator_states(conn: sqlite3.Connection, states: list[tuple[str, dict]]) -> None:
+    if not states:
+        return
+
+    def _write() -> None:
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO indicator_state(code, last_trade_date, bar_count, window_blob, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(code) DO UPDATE SET
+                    last_trade_date=excluded.last_trade_date,
+                    bar_count=excluded.bar_count,
+                    window_blob=excluded.window_blob,
+                    updated_at=excluded.updated_at
+                """,
+                [
+                    (
+                        code,
+                        state["last_trade_date"],
+                        state["bar_count"],
+                        np.ascontiguousarray(state["window"], dtype="<f8").tobytes(),
+                        now_ts(),
+                    )
+                    for code, state in states
+                ],
+            )
+
+    try:
+        run_with_sqlite_lock_retry("写入 indicator_state", _write)
+    except Exception as exc:
+        if not is_locked_error(exc):
+            raise
+        conn.rollback()
+        print("[DB] indicator_state 持续被锁定，下次复盘将重新计算这些股票")
 
 
 def store_indicator_snapshots(conn: sqlite3.Connection, review_date: str, results: list[dict]) -> None:
@@ -668,13 +959,57 @@ def store_indicator_snapshots(conn: sqlite3.Connection, review_date: str, result
         print("[DB] indicator_snapshots 持续被锁定，已跳过本次快照写入")
 
 
+def resolve_compute_workers(workers: int, task_count: int) -> int:
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return max(1, min(workers, task_count))
+
+
+def _analyze_candidate_chunk(tasks: list[tuple], scoring_mode: str) -> list[dict | None]:
+    """对一批 (code, name, 状态矩阵, 流通市值, 换手率) 逐只打分，不访问数据库。"""
+    indicator_api = load_indicator_api()
+    return [
+        indicator_api.analyze_stock(
+            code,
+            name,
+            indicator_api.indicator_window_frame(window),
+            scoring_mode=scoring_mode,
+            float_mv_yi=float_mv_yi,
+            liquidity_ratio_pct=liquidity_ratio_pct,
+        )
+        for code, name, window, float_mv_yi, liquidity_ratio_pct in tasks
+    ]
+
+
+def analyze_candidates(tasks: list[tuple], scoring_mode: str, workers: int = DEFAULT_COMPUTE_WORKERS) -> list[dict | None]:
+    """按候选顺序返回打分结果；多进程时按连续分片下发预加载的数组，再按分片顺序拼回。"""
+    worker_count = resolve_compute_workers(workers, len(tasks))
+    if worker_count <= 1:
+        return _analyze_candidate_chunk(tasks, scoring_mode)
+
+    chunk_count = min(len(tasks), worker_count * COMPUTE_CHUNKS_PER_WORKER)
+    chunk_size = -(-len(tasks) // chunk_count)
+    chunks = [tasks[start : start + chunk_size] for start in range(0, len(tasks), chunk_size)]
+    chunk_results: list[list[dict | None]] = [[] for _ in chunks]
+    with ProcessPoolExecutor(max_workers=worker_count) as executor:
+        futures = {executor.submit(_analyze_candidate_chunk, chunk, scoring_mode): index for index, chunk in enumerate(chunks)}
+        done_count = 0
+        for future in as_completed(futures):
+            chunk_results[futures[future]] = future.result()
+            done_count += len(chunks[futures[future]])
+            print(f"\r计算技术指标 x{worker_count}: {done_count}/{len(tasks)}", end="", flush=True)
+    print()
+    return [result for chunk_result in chunk_results for result in chunk_result]
+
+
 def run_compute(
     review_date: str | None = None,
     limit: int = 0,
     include_all_boards: bool = False,
     scoring_mode: str = "dedup",
+    workers: int = DEFAULT_COMPUTE_WORKERS,
 ) -> dict:
-    lookback_days, analyze_stock = load_indicator_module()
+    lookback_days, _ = load_indicator_module()
     trade_date, _ = parse_review_date(review_date)
     conn = get_db_connection()
     try:
@@ -685,25 +1020,45 @@ def run_compute(
         results: list[dict] = []
         analyzed_count = 0
         missing_kline = 0
+        required_rows = lookback_days + 80
+        states = load_indicator_states(conn)
+        bars_since_state = load_bars_since_state(conn)
 
+        current_states: dict[str, dict] = {}
+        dirty_states: list[tuple[str, dict]] = []
+        rebuild_codes: list[str] = []
+        for row in candidates:
+            advanced = advance_indicator_state(states.get(row["code"]), bars_since_state.get(row["code"], []))
+            if advanced is None:
+                rebuild_codes.append(row["code"])
+                continue
+            state, dirty = advanced
+            current_states[row["code"]] = state
+            if dirty:
+                dirty_states.append((row["code"], state))
+        for code, kline in load_qfq_bars_batch(conn, rebuild_codes, required_rows).items():
+            state = build_indicator_state(kline)
+            current_states[code] = state
+            dirty_states.append((code, state))
+
+        analyzed_rows: list[sqlite3.Row] = []
+        tasks: list[tuple] = []
         for row in candidates:
-            kline = load_qfq_bars(conn, row["code"], required_rows=lookback_days + 80)
-            if kline.empty or len(kline) < lookback_days // 2:
+            state = current_states.get(row["code"])
+            if state is None or min(state["bar_count"], required_rows) < lookback_days // 2:
                 missing_kline += 1
                 continue
             analyzed_count += 1
             float_mv_yi = row["float_mv_yi"] if "float_mv_yi" in row.keys() else None
             liquidity_ratio_pct = row["liquidity_ratio_pct"] if "liquidity_ratio_pct" in row.keys() else None
-            result = analyze_stock(
-                row["code"],
-                row["name"],
-                kline,
-                scoring_mode=scoring_mode,
-                float_mv_yi=float_mv_yi,
-                liquidity_ratio_pct=liquidity_ratio_pct,
-            )
+            analyzed_rows.append(row)
+            tasks.append((row["code"], row["name"], state["window"], float_mv_yi, liquidity_ratio_pct))
+
+        analyzed = analyze_candidates(tasks, scoring_mode, workers)
+        for row, result in zip(analyzed_rows, analyzed):
             if result is None:
                 continue
+            liquidity_ratio_pct = row["liquidity_ratio_pct"] if "liquidity_ratio_pct" in row.keys() else None
             result["board"] = row["board"]
             result["close"] = round(float(row["close"]), 2) if row["close"] is not None else result["close"]
             result["open"] = round(float(row["open"]), 2) if row["open"] is not None else None
@@ -717,6 +1072,7 @@ def run_compute(
             results.append(result)
 
         results.sort(key=lambda item: item["score"], reverse=True)
+        store_indicator_states(conn, dirty_states)
         store_indicator_snapshots(conn, trade_date, results)
 
         return {
@@ -739,27 +1095,8 @@ def load_snapshots(review_date: str | None = None) -> list[dict]:
     trade_date, _ = parse_review_date(review_date)
     conn = get_db_connection()
     rows = conn.execute(
-        """
-        WITH ordered_daily AS (
-            SELECT
-                code,
-                trade_date,
-                open,
-                high,
-                low,
-                close,
-                volume,
-                float_mv_yi,
-                LAG(close) OVER (PARTITION BY code ORDER BY trade_date) AS previous_close_calc,
-                ROW_NUMBER() OVER (PARTITION BY code ORDER BY trade_date DESC) AS rn
-            FROM daily_bars
-            WHERE trade_date <= ?
-        ),
-        latest_daily AS (
-            SELECT *
-            FROM ordered_daily
-            WHERE rn = 1
-        )
+        f"""
+        WITH {LATEST_BARS_CTE}
         SELECT
             snap.*,
             s.name,
@@ -769,18 +1106,19 @@ def load_snapshots(review_date: str | None = None) -> list[dict]:
             ld.low,
             ld.close,
             ld.volume AS volume,
-            ld.float_mv_yi,
+            lmv.float_mv_yi,
             CASE
-                WHEN ld.previous_close_calc IS NOT NULL AND ld.previous_close_calc > 0 THEN ((ld.close / ld.previous_close_calc) - 1) * 100
+                WHEN ld.previous_close IS NOT NULL AND ld.previous_close > 0 THEN ((ld.close / ld.previous_close) - 1) * 100
                 ELSE 0
             END AS pct_change
         FROM indicator_snapshots snap
         INNER JOIN stocks s ON s.code = snap.code
-        LEFT JOIN latest_daily ld ON ld.code = snap.code
+        LEFT JOIN latest_bars ld ON ld.code = snap.code
+        LEFT JOIN latest_market_value lmv ON lmv.code = snap.code
         WHERE snap.run_date = ?
         ORDER BY snap.score DESC, snap.code ASC
         """,
-        (trade_date, trade_date),
+        (trade_date, trade_date, trade_date, trade_date),
     ).fetchall()
     conn.close()
     result = []
@@ -1042,6 +1380,7 @@ def run_daily_review(
     send_email: bool = True,
     recent_days: int = 45,
     scoring_mode: str = "dedup",
+    workers: int = DEFAULT_COMPUTE_WORKERS,
 ) -> dict:
     """
     复盘主流程：
@@ -1059,6 +1398,7 @@ def run_daily_review(
 - send_email: 是否在报告生成后发送邮件，默认为 True
 - recent_days: 保留兼容参数，不再触发实际行情同步，默认为 45
 - scoring_mode: 评分模式，支持 legacy 和 dedup，默认为 dedup
+- workers: 计算技术指标的进程数，0 表示按 CPU 核数自动选择，1 表示单进程
     """
     trade_date, compact_date = parse_review_date(review_date)
     file_suffix = "" if scoring_mode == "dedup" else f"_{scoring_mode}"
@@ -1102,6 +1442,7 @@ def run_daily_review(
             limit=limit,
             include_all_boards=include_all_boards,
             scoring_mode=scoring_mode,
+            workers=workers,
         )
 
         csv_rows = to_csv_rows(compute_summary["results"])
@@ -1176,6 +1517,7 @@ def run_daily_review_on_startup(
     recent_days: int = 45,
     send_email: bool = True,
     scoring_mode: str = "dedup",
+    workers: int = DEFAULT_COMPUTE_WORKERS,
 ) -> dict | None:
     should_run, review_date, message = evaluate_auto_run()
     print(message)
@@ -1191,6 +1533,7 @@ def run_daily_review_on_startup(
         recent_days=recent_days,
         send_email=send_email,
         scoring_mode=scoring_mode,
+        workers=workers,
     )
 
 
@@ -1218,6 +1561,7 @@ def build_daily_review_arg_parser() -> argparse.ArgumentParser:
     parser.add_argument("--recent-days", type=int, default=45, help="保留兼容参数，不再触发实际行情同步")
     parser.add_argument("--scoring-mode", choices=["legacy", "dedup"], default="dedup", help="评分模式")
     parser.add_argument("--force-run", action="store_true", help="忽略启动时间和当日运行记录，直接执行今日复盘")
+    parser.add_argument("--workers", type=int, default=DEFAULT_COMPUTE_WORKERS, help="计算技术指标的进程数，0 表示按 CPU 核数自动选择")
     return parser
 
 
@@ -1231,6 +1575,7 @@ def main_daily_review() -> None:
             recent_days=args.recent_days,
             send_email=not args.skip_email,
             scoring_mode=args.scoring_mode,
+            workers=args.workers,
         )
         return
 
@@ -1243,6 +1588,7 @@ def main_daily_review() -> None:
         recent_days=args.recent_days,
         send_email=not args.skip_email,
         scoring_mode=args.scoring_mode,
+        workers=args.workers,
     )
 
 if __name__ == "__main__":
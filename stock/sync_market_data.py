@@ -4,6 +4,7 @@
     --start-date: 同步起始日期，格式 YYYY-MM-DD；不指定时默认使用 FULL_REFRESH_START
     --end-date: 同步结束日期，格式 YYYY-MM-DD；不指定时默认使用当天
     --limit: 仅同步前 N 只股票，便于调试，默认为 0（不限制）
+    --intraday-retention-days: 分钟线保留天数，默认 INTRADAY_RETENTION_DAYS
 
 用法：
     - 同步某一天的数据：
@@ -19,16 +20,14 @@
     - 市值只同步本日最新的，每次运行都会刷新
     - 日线会检查是否价格一致，如果不一致，应当是触发了复权，就会重新拉取该股票的全部日线数据（不区分前后复权），以保证数据一致性
     - 日线的时间支持用户自己指定，通过 --start-date 和 --end-date 参数控制，默认会从 FULL_REFRESH_START 同步到当天
-    - 分时数据拉当天向前 INTRADAY_FETCH_WINDOW_DAYS 天的，前端展示时会根据日期过滤到 INTRADAY_LOOKBACK_DAYS 天内的，尽量覆盖节假日和周末带来的日期间隔问题
+    - 分时数据按交易日历取最近 INTRADAY_LOOKBACK_DAYS 个交易日，节假日和周末由日历（stock/trade_calendar.py）跳过
+    - 分时按月分区存储（intraday_bars_YYYYMM），只写入库中没有的新分钟；同步结束后把保留期之前的分钟压缩为日度聚合并删除
 """
 
 from __future__ import annotations
 
 import argparse
-import copy
-import hashlib
 import json
-import pickle
 import random
 import sqlite3
 import sys
@@ -45,19 +44,64 @@ socket.setdefaulttimeout(60.0)
 from typing import Dict, List, Optional, Any
 
 import akshare
+import numpy as np
 import pandas as pd
 import requests
 from requests.adapters import HTTPAdapter
 
-# 进程内前端载荷缓存的有效期。
-PAYLOAD_CACHE_TTL_SECONDS = 10 * 60
+try:
+    from intraday_store import (
+        INTRADAY_RETENTION_DAYS,
+        compact_intraday,
+        count_bars_on,
+        load_intraday_rows,
+        migrate_legacy_intraday,
+        recent_trade_dates,
+        write_intraday_bars,
+    )
+except ImportError:
+    from .intraday_store import (
+        INTRADAY_RETENTION_DAYS,
+        compact_intraday,
+        count_bars_on,
+        load_intraday_rows,
+        migrate_legacy_intraday,
+        recent_trade_dates,
+        write_intraday_bars,
+    )
+try:
+    from frame_rows import daily_bar_rows, intraday_bar_rows, stock_rows
+except ImportError:
+    from .frame_rows import daily_bar_rows, intraday_bar_rows, stock_rows
+
+try:
+    from market_cache import MarketSegmentCache
+except ImportError:
+    from .market_cache import MarketSegmentCache
+
+try:
+    from review_common import ensure_latest_daily
+except ImportError:
+    from .review_common import ensure_latest_daily
+
+try:
+    from trade_calendar import TradeCalendar, get_trade_calendar
+except ImportError:
+    from .trade_calendar import TradeCalendar, get_trade_calendar
+
+try:
+    from payload_cache import MarketPayloadCache, bump_payload_generation, loads_payload, to_columnar_market
+except ImportError:
+    from .payload_cache import MarketPayloadCache, bump_payload_generation, loads_payload, to_columnar_market
+
 FULL_REFRESH_START = "2010-01-01"  # 从历史上该日开始拉取数据，建立前复权日线
 # 腾讯快照接口支持批量代码，单次请求尽量按批处理，避免过细碎请求。
 TENCENT_BATCH_SIZE = 50
 # 读取时保留最近多少个交易日的分时和价格分布数据。
 INTRADAY_LOOKBACK_DAYS = 5
-# 分时同步会多取一段时间窗口，尽量覆盖节假日和周末带来的日期间隔。
-INTRADAY_FETCH_WINDOW_DAYS = 14
+# 价格分布分箱数；每个交易日的分布以 (DISTRIBUTION_FIELDS, bin_count) 的 float64 矩阵二进制存储
+DISTRIBUTION_BIN_COUNT = 8
+DISTRIBUTION_FIELDS = ("lower_price", "upper_price", "buy_volume", "sell_volume", "neutral_volume", "total_volume", "count")
 STOCK_LIST_CACHE_TTL_SECONDS = 12 * 60 * 60
 DAILY_BARS_CACHE_TTL_SECONDS = 12 * 60 * 60
 INTRADAY_CACHE_TTL_SECONDS = 60 * 60
@@ -73,6 +117,7 @@ DATA_DIR = BASE_DIR / "data"
 SCHEMA_PATH = DATA_DIR / "schema" / "stock.sql"
 DB_PATH = DATA_DIR / "stock.db"
 MARKET_CACHE_DIR = DATA_DIR / "cache" / "market"
+PAYLOAD_SHARED_CACHE_PATH = DATA_DIR / "cache" / "payload_cache.db"
 
 BOARD_CATEGORIES = {
     "主板-沪（60）": lambda code: code.startswith("60"),
@@ -130,6 +175,33 @@ def safe_float(value: Any) -> Optional[float]:
     return round(number, 4)
 
 
+def pack_distribution(matrix: np.ndarray) -> bytes:
+    """分布矩阵 (len(DISTRIBUTION_FIELDS), bin_count) → 小端 float64 字节串。"""
+    return np.ascontiguousarray(matrix, dtype="<f8").tobytes()
+
+
+def unpack_distribution(blob: bytes, bin_count: int) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<f8").reshape(len(DISTRIBUTION_FIELDS), bin_count)
+
+
+def distribution_payload(matrix: np.ndarray) -> tuple[List[dict], List[dict]]:
+    """由分布矩阵组装前端所需的 buy_sell_bins / price_histogram（与原 JSON 结构一致）。"""
+    lower, upper, buy, sell, neutral, total, count = (row.tolist() for row in matrix)
+    buy_sell_bins, price_histogram = [], []
+    for index in range(len(lower)):
+        label = f"{lower[index]:.2f}-{upper[index]:.2f}"
+        lower_price, upper_price = round(lower[index], 4), round(upper[index], 4)
+        buy_sell_bins.append({
+            "label": label, "lower_price": lower_price, "upper_price": upper_price,
+            "buy_volume": buy[index], "sell_volume": sell[index], "neutral_volume": neutral[index], "total_volume": total[index],
+        })
+        price_histogram.append({
+            "label": label, "lower_price": lower_price, "upper_price": upper_price,
+            "count": int(count[index]), "volume": total[index],
+        })
+    return buy_sell_bins, price_histogram
+
+
 def fill_daily_amount(df: pd.DataFrame) -> pd.DataFrame:
     if df is None or df.empty:
         return df
@@ -181,37 +253,6 @@ def is_retryable_fetch_error(exc: Exception) -> bool:
     return any(fragment in message for fragment in retryable_fragments)
 
 
-def load_pickle_cache(cache_path: Path, ttl_seconds: int) -> Any:
-    if not cache_path.exists():
-        return None
-    if time.time() - cache_path.stat().st_mtime > ttl_seconds:
-        return None
-    try:
-        with cache_path.open("rb") as cache_file:
-            return pickle.load(cache_file)
-    except Exception:
-        return None
-
-
-def load_pickle_cache_any_age(cache_path: Path) -> Any:
-    if not cache_path.exists():
-        return None
-    try:
-        with cache_path.open("rb") as cache_file:
-            return pickle.load(cache_file)
-    except Exception:
-        return None
-
-
-def save_pickle_cache(cache_path: Path, data: Any) -> None:
-    cache_path.parent.mkdir(parents=True, exist_ok=True)
-    try:
-        with cache_path.open("wb") as cache_file:
-            pickle.dump(data, cache_file)
-    except Exception:
-        return
-
-
 class ApiRateLimiter:
     _lock = threading.Lock()
     _last_called_at: Dict[str, float] = {}
@@ -264,36 +305,18 @@ class DbManager:
     def ensure_legacy_tables_dropped(conn: sqlite3.Connection) -> None:
         conn.execute("DROP INDEX IF EXISTS idx_corporate_actions_code_date")
         conn.execute("DROP TABLE IF EXISTS corporate_actions")
+        # 按交易日单行的检查点会被终端监控与流水线互相覆盖，已改为按代码存储的 macd_code_checkpoints
+        conn.execute("DROP TABLE IF EXISTS macd_state_checkpoints")
 
     @staticmethod
     def ensure_intraday_schema(conn: sqlite3.Connection) -> None:
         conn.executescript(
             """
-            CREATE TABLE IF NOT EXISTS intraday_bars (
-                code TEXT NOT NULL,
-                trade_date TEXT NOT NULL,
-                trade_time TEXT NOT NULL,
-                trade_timestamp TEXT NOT NULL,
-                open REAL,
-                close REAL,
-                high REAL,
-                low REAL,
-                avg_price REAL,
-                volume REAL,
-                amount REAL,
-                change_pct REAL,
-                change_amount REAL,
-                PRIMARY KEY (code, trade_timestamp)
-            );
-
-            CREATE INDEX IF NOT EXISTS idx_intraday_bars_code_date_time
-                ON intraday_bars(code, trade_date DESC, trade_timestamp DESC);
-
             CREATE TABLE IF NOT EXISTS daily_price_distributions (
                 code TEXT NOT NULL,
                 trade_date TEXT NOT NULL,
-                buy_sell_bins_json TEXT NOT NULL,
-                price_histogram_json TEXT NOT NULL,
+                bin_count INTEGER NOT NULL,
+                bins BLOB NOT NULL,
                 PRIMARY KEY (code, trade_date)
             );
 
@@ -301,46 +324,8 @@ class DbManager:
                 ON daily_price_distributions(code, trade_date DESC);
             """
         )
-        intraday_columns = {str(row[1]) for row in conn.execute("PRAGMA table_info(intraday_bars)").fetchall()}
-        if "fetched_at" in intraday_columns:
-            conn.execute("ALTER TABLE intraday_bars RENAME TO intraday_bars_legacy_migrating")
-            conn.executescript(
-                """
-                CREATE TABLE IF NOT EXISTS intraday_bars (
-                    code TEXT NOT NULL,
-                    trade_date TEXT NOT NULL,
-                    trade_time TEXT NOT NULL,
-                    trade_timestamp TEXT NOT NULL,
-                    open REAL,
-                    close REAL,
-                    high REAL,
-                    low REAL,
-                    avg_price REAL,
-                    volume REAL,
-                    amount REAL,
-                    change_pct REAL,
-                    change_amount REAL,
-                    PRIMARY KEY (code, trade_timestamp),
-                    FOREIGN KEY (code) REFERENCES stocks(code)
-                );
-
-                CREATE INDEX IF NOT EXISTS idx_intraday_bars_code_date_time
-                    ON intraday_bars(code, trade_date DESC, trade_timestamp DESC);
-                """
-            )
-            conn.execute(
-                """
-                INSERT OR REPLACE INTO intraday_bars(
-                    code, trade_date, trade_time, trade_timestamp, open, close, high, low,
-                    avg_price, volume, amount, change_pct, change_amount
-                )
-                SELECT
-                    code, trade_date, trade_time, trade_timestamp, open, close, high, low,
-                    avg_price, volume, amount, change_pct, change_amount
-                FROM intraday_bars_legacy_migrating
-                """
-            )
-            conn.execute("DROP TABLE intraday_bars_legacy_migrating")
+        # 旧版单表 intraday_bars（含更早带 fetched_at 的版本）迁入按月分区
+        migrate_legacy_intraday(conn)
 
     @staticmethod
     def ensure_latest_market_value_schema(conn: sqlite3.Connection) -> None:
@@ -476,19 +461,118 @@ class DbManager:
             )
             conn.execute("DROP TABLE daily_bars_legacy_migrating")
 
+    @staticmethod
+    def ensure_latest_daily_schema(conn: sqlite3.Connection) -> None:
+        # 与复盘脚本共用同一实现：按代码补齐 latest_daily 中缺失的股票，之后由日线写入逐只维护
+        ensure_latest_daily(conn)
+
+    @staticmethod
+    def refresh_latest_daily(conn: sqlite3.Connection, code: str) -> None:
+        """按索引取该股最新两根日线，刷新 latest_daily 中的一行。"""
+        conn.execute("DELETE FROM latest_daily WHERE code = ?", (code,))
+        conn.execute(
+            """
+            INSERT INTO latest_daily(code, trade_date, open, high, low, close, volume, previous_close)
+            SELECT
+                d.code, d.trade_date, d.open, d.high, d.low, d.close, d.volume,
+                (
+                    SELECT p.close
+                    FROM daily_bars p
+                    WHERE p.code = d.code AND p.trade_date < d.trade_date
+                    ORDER BY p.trade_date DESC
+                    LIMIT 1
+                )
+            FROM daily_bars d
+            WHERE d.code = ?
+            ORDER BY d.trade_date DESC
+            LIMIT 1
+            """,
+            (code,),
+        )
+
+    @staticmethod
+    def ensure_daily_bar_coverage_schema(conn: sqlite3.Connection) -> None:
+        if conn.execute("SELECT 1 FROM daily_bar_coverage LIMIT 1").fetchone():
+            return
+        if not conn.execute("SELECT 1 FROM daily_bars LIMIT 1").fetchone():
+            return
+        # 旧库首次升级时整表扫描回填一次；历史起点未知，先记为最早一根日线的日期
+        with conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO daily_bar_coverage(code, first_date, first_close, last_date, last_close, fetched_from, updated_at)
+                SELECT
+                    g.code, g.first_date,
+                    (SELECT close FROM daily_bars WHERE code = g.code AND trade_date = g.first_date),
+                    g.last_date,
+                    (SELECT close FROM daily_bars WHERE code = g.code AND trade_date = g.last_date),
+                    g.first_date, ?
+                FROM (
+                    SELECT code, MIN(trade_date) AS first_date, MAX(trade_date) AS last_date
+                    FROM daily_bars
+                    GROUP BY code
+                ) g
+                """,
+                (now_ts(),),
+            )
+
+    @staticmethod
+    def refresh_daily_coverage(conn: sqlite3.Connection, code: str, fetched_from: Optional[str] = None) -> Optional[dict]:
+        """按主键索引取首尾两根日线，刷新 daily_bar_coverage 中的一行并返回。"""
+        first = conn.execute(
+            "SELECT trade_date, close FROM daily_bars WHERE code = ? ORDER BY trade_date ASC LIMIT 1", (code,)
+        ).fetchone()
+        if first is None:
+            conn.execute("DELETE FROM daily_bar_coverage WHERE code = ?", (code,))
+            return None
+        last = conn.execute(
+            "SELECT trade_date, close FROM daily_bars WHERE code = ? ORDER BY trade_date DESC LIMIT 1", (code,)
+        ).fetchone()
+        existing = conn.execute("SELECT fetched_from FROM daily_bar_coverage WHERE code = ?", (code,)).fetchone()
+        candidates = [str(first[0])]
+        if fetched_from:
+            candidates.append(fetched_from)
+        if existing:
+            candidates.append(str(existing[0]))
+        coverage = {
+            "code": code,
+            "first_date": str(first[0]),
+            "first_close": first[1],
+            "last_date": str(last[0]),
+            "last_close": last[1],
+            "fetched_from": min(candidates),
+        }
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO daily_bar_coverage(code, first_date, first_close, last_date, last_close, fetched_from, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (code, coverage["first_date"], coverage["first_close"], coverage["last_date"], coverage["last_close"], coverage["fetched_from"], now_ts()),
+        )
+        return coverage
+
+    @staticmethod
+    def load_daily_coverage(conn: sqlite3.Connection) -> Dict[str, dict]:
+        rows = conn.execute(
+            "SELECT code, first_date, first_close, last_date, last_close, fetched_from FROM daily_bar_coverage"
+        ).fetchall()
+        return {str(row["code"]): dict(row) for row in rows}
+
     @staticmethod
     def ensure_daily_distribution_schema(conn: sqlite3.Connection) -> None:
         columns = {str(row[1]) for row in conn.execute("PRAGMA table_info(daily_price_distributions)").fetchall()}
-        if "summary_json" not in columns and "fetched_at" not in columns:
+        if "bins" in columns or "buy_sell_bins_json" not in columns:
             return
+        # 旧版以 JSON 文本存分箱（更早的版本还带 summary_json / fetched_at），统一转为二进制矩阵
         conn.execute("ALTER TABLE daily_price_distributions RENAME TO daily_price_distributions_legacy_migrating")
+        conn.execute("DROP INDEX IF EXISTS idx_daily_price_distributions_code_date")
         conn.executescript(
             """
             CREATE TABLE IF NOT EXISTS daily_price_distributions (
                 code TEXT NOT NULL,
                 trade_date TEXT NOT NULL,
-                buy_sell_bins_json TEXT NOT NULL,
-                price_histogram_json TEXT NOT NULL,
+                bin_count INTEGER NOT NULL,
+                bins BLOB NOT NULL,
                 PRIMARY KEY (code, trade_date),
                 FOREIGN KEY (code) REFERENCES stocks(code)
             );
@@ -497,14 +581,32 @@ class DbManager:
                 ON daily_price_distributions(code, trade_date DESC);
             """
         )
-        conn.execute(
-            """
-            INSERT OR REPLACE INTO daily_price_distributions(code, trade_date, buy_sell_bins_json, price_histogram_json)
-            SELECT code, trade_date, buy_sell_bins_json, price_histogram_json
-            FROM daily_price_distributions_legacy_migrating
-            """
+        cursor = conn.execute(
+            "SELECT code, trade_date, buy_sell_bins_json, price_histogram_json FROM daily_price_distributions_legacy_migrating"
         )
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            converted = []
+            for code, trade_date, bins_json, histogram_json in rows:
+                bins, histogram = json.loads(bins_json), json.loads(histogram_json)
+                matrix = np.array([
+                    [item["lower_price"] for item in bins],
+                    [item["upper_price"] for item in bins],
+                    [item["buy_volume"] for item in bins],
+                    [item["sell_volume"] for item in bins],
+                    [item["neutral_volume"] for item in bins],
+                    [item["total_volume"] for item in bins],
+                    [item["count"] for item in histogram],
+                ], dtype=np.float64)
+                converted.append((code, trade_date, len(bins), pack_distribution(matrix)))
+            conn.executemany(
+                "INSERT OR REPLACE INTO daily_price_distributions(code, trade_date, bin_count, bins) VALUES (?, ?, ?, ?)",
+                converted,
+            )
         conn.execute("DROP TABLE daily_price_distributions_legacy_migrating")
+        conn.commit()
 
     @staticmethod
     def get_connection() -> sqlite3.Connection:
@@ -520,20 +622,22 @@ class DbManager:
         DbManager.ensure_latest_market_value_schema(conn)
         DbManager.ensure_intraday_schema(conn)
         DbManager.ensure_daily_bar_schema(conn)
+        DbManager.ensure_latest_daily_schema(conn)
+        DbManager.ensure_daily_bar_coverage_schema(conn)
         DbManager.ensure_daily_distribution_schema(conn)
         return conn
 
 class MarketDataFetcher:
     """封装同步链路所需的市场数据抓取逻辑。"""
 
-    @staticmethod
-    def _cache_path(name: str) -> Path:
-        safe_name = hashlib.md5(name.encode("utf-8")).hexdigest()
-        return MARKET_CACHE_DIR / f"{safe_name}.pkl"
+    # 接口响应按 (类型, 股票, 区间) 分段缓存，重叠区间合并，超出字节上限按 LRU 淘汰
+    cache = MarketSegmentCache(MARKET_CACHE_DIR)
 
     @staticmethod
-    def _load_stale_cache(cache_path: Path, label: str) -> Any:
-        cached = load_pickle_cache_any_age(cache_path)
+    def _load_stale_cache(label: str, kind: str, code: str = "", start: str = "", end: str = "",
+                          adjust: str = "", key_column: Optional[str] = None, variant: str = "") -> Optional[pd.DataFrame]:
+        cached = MarketDataFetcher.cache.get(kind, code, start, end, ttl_seconds=None, adjust=adjust,
+                                             key_column=key_column, variant=variant)
         if cached is None:
             return None
         sys.stdout.write(f"\n[缓存回退] {label} 使用最近一次成功缓存\n")
@@ -554,18 +658,17 @@ class MarketDataFetcher:
     
     @staticmethod
     def get_all_stock_codes() -> pd.DataFrame:
-        cache_path = MarketDataFetcher._cache_path("stock_info_a_code_name")
-        cached = load_pickle_cache(cache_path, STOCK_LIST_CACHE_TTL_SECONDS)
-        if isinstance(cached, pd.DataFrame) and not cached.empty:
-            return cached.copy()
+        cached = MarketDataFetcher.cache.get("stock_list", "", ttl_seconds=STOCK_LIST_CACHE_TTL_SECONDS)
+        if cached is not None and not cached.empty:
+            return cached
 
         ApiRateLimiter.wait("stock_list")
         try:
             df = retry_call(lambda: akshare.stock_info_a_code_name(), label="A股股票列表获取", attempts=4, delay_seconds=1.0)
         except Exception:
-            stale_cached = MarketDataFetcher._load_stale_cache(cache_path, "A股股票列表获取")
-            if isinstance(stale_cached, pd.DataFrame) and not stale_cached.empty:
-                return stale_cached.copy()
+            stale_cached = MarketDataFetcher._load_stale_cache("A股股票列表获取", "stock_list")
+            if stale_cached is not None and not stale_cached.empty:
+                return stale_cached
             db_cached = MarketDataFetcher._load_stock_codes_from_db()
             if not db_cached.empty:
                 sys.stdout.write("\n[缓存回退] A股股票列表获取 使用数据库中的现有股票表\n")
@@ -576,7 +679,7 @@ class MarketDataFetcher:
         df["board"] = df["code"].apply(classify_board)
         df["is_st"] = df["name"].apply(is_st).astype(int)
         result = df[["code", "name", "board", "is_st"]].copy()
-        save_pickle_cache(cache_path, result)
+        MarketDataFetcher.cache.put("stock_list", "", result, ttl_seconds=STOCK_LIST_CACHE_TTL_SECONDS)
         return result
 
     @staticmethod
@@ -605,10 +708,20 @@ class MarketDataFetcher:
                         float_mv_yi = float(parts[44]) if parts[44] else 0
                     except (TypeError, ValueError):
                         continue
+                    quote_ts = parts[30]
                     result[code_str] = {
                         "name": parts[1],
                         "amount_wan": amount_wan,
                         "float_mv_yi": float_mv_yi,
+                        # 当日行情，供日线规划器用快照直接补最新一根日线、用昨收判断除权
+                        "trade_date": f"{quote_ts[:4]}-{quote_ts[4:6]}-{quote_ts[6:8]}" if len(quote_ts) >= 14 else None,
+                        "quote_time": f"{quote_ts[8:10]}:{quote_ts[10:12]}:{quote_ts[12:14]}" if len(quote_ts) >= 14 else None,
+                        "open": safe_float(parts[5]),
+                        "high": safe_float(parts[33]),
+                        "low": safe_float(parts[34]),
+                        "close": safe_float(parts[3]),
+                        "prev_close": safe_float(parts[4]),
+                        "volume": safe_float(parts[6]),
                     }
             except requests.RequestException:
                 continue
@@ -617,16 +730,23 @@ class MarketDataFetcher:
         return result
 
     @staticmethod
-    def fetch_daily_bars(code: str, start_date: str, end_date: str, adjust: str) -> pd.DataFrame:
-        cache_path = MarketDataFetcher._cache_path(f"daily_bars:{code}:{start_date}:{end_date}:{adjust}")
-        cached = load_pickle_cache(cache_path, DAILY_BARS_CACHE_TTL_SECONDS)
-        if isinstance(cached, pd.DataFrame) and not cached.empty:
-            return fill_daily_amount(cached.copy())
+    def fetch_daily_bars(code: str, start_date: str, end_date: str, adjust: str, expected_bars: Optional[int] = None,
+                         use_cache: bool = True) -> pd.DataFrame:
+        """expected_bars 为交易日历算出的区间交易日数，用作单页条数，只缺几天时不再整页拉 640 根。
+
+        use_cache=False 时既不读也不写区间缓存（含失败回退），用于复权校验这类必须以接口当前数据为准的场景。
+        """
+        cache_key = {"kind": "daily_bars", "code": code, "start": start_date, "end": end_date, "adjust": adjust, "key_column": "date"}
+        if use_cache:
+            cached = MarketDataFetcher.cache.get(ttl_seconds=DAILY_BARS_CACHE_TTL_SECONDS, **cache_key)
+            if cached is not None and not cached.empty:
+                return fill_daily_amount(cached)
             
         symbol = to_symbol(code)
         is_bj_symbol = symbol.startswith("bj")
         adjust_type = "qfq" if adjust == "qfq" else ""
-        limit = 640
+        # 北交所接口忽略起止日期，只能按最近 N 根整页拉取后再截取
+        limit = 640 if is_bj_symbol or not expected_bars else max(1, min(640, expected_bars))
         all_data = []
         current_end = end_date
         
@@ -672,9 +792,9 @@ class MarketDataFetcher:
                 break
                 
         if not all_data:
-            cached = MarketDataFetcher._load_stale_cache(cache_path, f"{code} 日线行情获取({adjust})")
-            if isinstance(cached, pd.DataFrame) and not cached.empty:
-                return fill_daily_amount(cached.copy())
+            cached = MarketDataFetcher._load_stale_cache(f"{code} 日线行情获取({adjust})", **cache_key) if use_cache else None
+            if cached is not None and not cached.empty:
+                return fill_daily_amount(cached)
             return pd.DataFrame(columns=["date", "open", "high", "low", "close", "volume", "amount"])
             
         # Re-reverse to chronological order
@@ -699,16 +819,16 @@ class MarketDataFetcher:
             normalized = normalized[
                 (normalized["date"] >= start_date) & (normalized["date"] <= end_date)
             ].copy()
-        if not normalized.empty:
-            save_pickle_cache(cache_path, normalized)
+        if use_cache and not normalized.empty:
+            MarketDataFetcher.cache.put(df=normalized, ttl_seconds=DAILY_BARS_CACHE_TTL_SECONDS, **cache_key)
         return normalized
 
     @staticmethod
     def fetch_intraday_bars(code: str, start_datetime: str, end_datetime: str) -> pd.DataFrame:
-        cache_path = MarketDataFetcher._cache_path(f"intraday:{code}:{start_datetime}:{end_datetime}")
-        cached = load_pickle_cache(cache_path, INTRADAY_CACHE_TTL_SECONDS)
-        if isinstance(cached, pd.DataFrame) and not cached.empty:
-            return cached.copy()
+        cache_key = {"kind": "intraday", "code": code, "start": start_datetime, "end": end_datetime, "key_column": "trade_timestamp"}
+        cached = MarketDataFetcher.cache.get(ttl_seconds=INTRADAY_CACHE_TTL_SECONDS, **cache_key)
+        if cached is not None and not cached.empty:
+            return cached
             
         ApiRateLimiter.wait("intraday")
         symbol = to_symbol(code)
@@ -733,9 +853,9 @@ class MarketDataFetcher:
             y_close = 0.0
             
         if not raw_minutes:
-            cached = MarketDataFetcher._load_stale_cache(cache_path, f"{code} 分时行情获取")
-            if isinstance(cached, pd.DataFrame) and not cached.empty:
-                return cached.copy()
+            cached = MarketDataFetcher._load_stale_cache(f"{code} 分时行情获取", **cache_key)
+            if cached is not None and not cached.empty:
+                return cached
             return MarketDataFetcher._normalize_intraday_df(pd.DataFrame())
             
         records = []
@@ -783,15 +903,15 @@ class MarketDataFetcher:
         df = pd.DataFrame(records)
         normalized = MarketDataFetcher._normalize_intraday_df(df)
         if not normalized.empty:
-            save_pickle_cache(cache_path, normalized)
+            MarketDataFetcher.cache.put(df=normalized, ttl_seconds=INTRADAY_CACHE_TTL_SECONDS, **cache_key)
         return normalized
 
     @staticmethod
     def fetch_recent_intraday_bars(code: str, lookback_days: int = INTRADAY_LOOKBACK_DAYS) -> pd.DataFrame:
-        cache_path = MarketDataFetcher._cache_path(f"intraday_recent:{code}:{lookback_days}")
-        cached = load_pickle_cache(cache_path, INTRADAY_CACHE_TTL_SECONDS)
-        if isinstance(cached, pd.DataFrame) and not cached.empty:
-            return cached.copy()
+        cache_key = {"kind": "intraday_recent", "code": code, "variant": f"lookback_days={lookback_days}"}
+        cached = MarketDataFetcher.cache.get(ttl_seconds=INTRADAY_CACHE_TTL_SECONDS, **cache_key)
+        if cached is not None and not cached.empty:
+            return cached
 
         ApiRateLimiter.wait("intraday")
         symbol = to_symbol(code)
@@ -861,13 +981,13 @@ class MarketDataFetcher:
         df = pd.DataFrame(records)
         normalized = MarketDataFetcher._normalize_intraday_df(df)
         if not normalized.empty:
-            save_pickle_cache(cache_path, normalized)
+            MarketDataFetcher.cache.put(df=normalized, ttl_seconds=INTRADAY_CACHE_TTL_SECONDS, **cache_key)
             return normalized
 
         today = datetime.now().strftime("%Y-%m-%d")
         fallback = MarketDataFetcher.fetch_intraday_bars(code, f"{today} 09:30:00", f"{today} 15:00:00")
         if not fallback.empty:
-            save_pickle_cache(cache_path, fallback)
+            MarketDataFetcher.cache.put(df=fallback, ttl_seconds=INTRADAY_CACHE_TTL_SECONDS, **cache_key)
         return fallback
 
     @staticmethod
@@ -918,6 +1038,72 @@ class MarketDataFetcher:
         return data[columns].sort_values("trade_timestamp").drop_duplicates(subset=["trade_timestamp"], keep="last")
 
 
+def snapshot_daily_bar(snapshot: Optional[dict], trade_date: str) -> Optional[dict]:
+    """收盘后的腾讯快照即当日完整日线；未收盘、停牌或日期不符时返回 None。"""
+    if not snapshot or snapshot.get("trade_date") != trade_date:
+        return None
+    if (snapshot.get("quote_time") or "") < "15:00:00":
+        return None
+    values = [snapshot.get(field) for field in ("open", "high", "low", "close", "volume")]
+    if any(value is None for value in values) or not values[0] or not values[4]:
+        return None
+    return {"date": trade_date, "open": values[0], "high": values[1], "low": values[2], "close": values[3], "volume": values[4]}
+
+
+def snapshot_adjustment_changed(coverage: Optional[dict], snapshot: Optional[dict], calendar: TradeCalendar) -> Optional[bool]:
+    """用快照昨收核对库中最新收盘价判断复权基准是否变化，无法判断时返回 None。
+
+    前复权下最新一根日线就是真实价格；除权除息日交易所公布的昨收是除权参考价，
+    与库中上一交易日收盘价不一致即说明需要整段重刷。
+    """
+    if not coverage or not snapshot:
+        return None
+    trade_date, prev_close = snapshot.get("trade_date"), snapshot.get("prev_close")
+    if not trade_date or not prev_close or coverage.get("last_close") is None:
+        return None
+    if coverage["last_date"] >= trade_date:
+        return False
+    if calendar.prev_trading_day(trade_date) != coverage["last_date"]:
+        return None
+    return abs(float(prev_close) - float(coverage["last_close"])) > 0.01
+
+
+def plan_daily_fetch(
+    coverage: Optional[dict],
+    start_trade_date: str,
+    end_trade_date: str,
+    calendar: TradeCalendar,
+    snapshot: Optional[dict] = None,
+    signature_changed: bool = False,
+) -> dict:
+    """根据覆盖元数据和交易日历决定一只股票的日线怎么补。
+
+    action: skip（已覆盖）/ snapshot（只缺最新一天且快照已收盘）/
+            range（只拉缺失的交易日，days 为交易日数）/ full（整段重刷）。
+    """
+    first_day = calendar.first_on_or_after(start_trade_date)
+    last_day = calendar.last_on_or_before(end_trade_date)
+    if first_day is None or last_day is None or first_day > last_day:
+        return {"action": "skip"}
+    if signature_changed:
+        return {"action": "full", "start": FULL_REFRESH_START, "end": last_day, "reason": "adjustment"}
+    if not coverage or coverage["fetched_from"] > first_day:
+        if start_trade_date == FULL_REFRESH_START:
+            return {"action": "full", "start": FULL_REFRESH_START, "end": last_day, "reason": "backfill"}
+        return {"action": "range", "start": first_day, "end": last_day, "days": calendar.count_between(first_day, last_day)}
+
+    next_day = calendar.next_trading_day(coverage["last_date"])
+    if next_day is None or next_day > last_day:
+        return {"action": "skip"}
+    missing_start = max(first_day, next_day)
+    days = calendar.count_between(missing_start, last_day)
+    if days == 1:
+        bar = snapshot_daily_bar(snapshot, missing_start)
+        if bar is not None:
+            return {"action": "snapshot", "bar": bar}
+    return {"action": "range", "start": missing_start, "end": last_day, "days": days}
+
+
 class StockMarketSyncEngine:
     """
     行情同步引擎，按串行方式同步全市场股票数据。
@@ -926,25 +1112,25 @@ class StockMarketSyncEngine:
         self,
         limit: int = 0,
         request_pause: float = 0.15,
+        intraday_retention_days: int = INTRADAY_RETENTION_DAYS,
     ):
         self.limit = limit
         self.request_pause = request_pause
-
-    def _resolve_first_trade_day_on_or_after(self, value: str) -> str:
-        current = datetime.strptime(value, "%Y-%m-%d")
-        while current.weekday() >= 5:
-            current += timedelta(days=1)
-        return current.strftime("%Y-%m-%d")
+        self.intraday_retention_days = intraday_retention_days
+        self.calendar: Optional[TradeCalendar] = None
+        self.coverage: Dict[str, dict] = {}
 
     def run_sync(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> dict:
         """主同步逻辑"""
         end_trade_date = parse_cli_date(end_date, fallback=datetime.now())
         start_trade_date = parse_cli_date(start_date, fallback=datetime.strptime(FULL_REFRESH_START, "%Y-%m-%d"))
 
-        intraday_anchor_dt = datetime.now()
-        intra_start_date = (intraday_anchor_dt - timedelta(days=INTRADAY_FETCH_WINDOW_DAYS)).strftime("%Y-%m-%d")
+        self.calendar = get_trade_calendar(DB_PATH)
+        today = datetime.now().strftime("%Y-%m-%d")
+        intra_end_date = self.calendar.last_on_or_before(today) or today
+        intra_start_date = self.calendar.trading_days_back(intra_end_date, INTRADAY_LOOKBACK_DAYS) or intra_end_date
         intra_start = f"{intra_start_date} 09:30:00"
-        intra_end = (intraday_anchor_dt + timedelta(days=1)).strftime("%Y-%m-%d 15:00:00")
+        intra_end = f"{intra_end_date} 15:00:00"
 
         self.summary = {
             "review_date": f"{start_trade_date} ~ {end_trade_date}",
@@ -959,13 +1145,24 @@ class StockMarketSyncEngine:
             "coverage_backfill_codes": [],
             "adjustment_event_updates": 0, 
             "skipped_daily_codes": 0,
+            "snapshot_daily_codes": 0,
+            "delta_daily_codes": 0,
             "retry_attempted_codes": 0,
             "retry_recovered_codes": 0,
+            "intraday_compacted_days": 0,
+            "intraday_deleted_rows": 0,
+            "intraday_dropped_partitions": [],
+            "market_cache_hits": 0,
+            "market_cache_misses": 0,
+            "market_cache_hit_rate": 0.0,
+            "market_cache_bytes": 0,
             "errors": []
         }
+        MarketDataFetcher.cache.reset_stats()
 
         conn = DbManager.get_connection()
         try:
+            self.coverage = DbManager.load_daily_coverage(conn)
             stocks_df = MarketDataFetcher.get_all_stock_codes()
             self.summary["universe_count"] = self._upsert_stocks(conn, stocks_df)
 
@@ -976,14 +1173,9 @@ class StockMarketSyncEngine:
             tencent_spot = MarketDataFetcher.fetch_tencent_realtime(sync_df["code"].tolist())
             total_tasks = len(sync_df)
             completed_tasks = 0
-            failed_rows: List[tuple[Any, str]] = []
-
-            for _, row in sync_df.iterrows():
-                StockMarketDataReader.clear_cache(str(row["code"]))
-
-            for row in sync_df.itertuples(index=False):
-                code_str = str(row.code)
+            failed_codes: List[tuple[str, str]] = []
 
+            for code_str in sync_df["code"].astype(str).tolist():
                 error_message = self._process_single_stock(
                     conn=conn, code=code_str, start_trade_date=start_trade_date, end_trade_date=end_trade_date,
                     intra_start=intra_start, intra_end=intra_end,
@@ -992,19 +1184,19 @@ class StockMarketSyncEngine:
                     enable_intraday=True,
                 )
                 if error_message:
-                    failed_rows.append((row, error_message))
+                    failed_codes.append((code_str, error_message))
                 completed_tasks += 1
                 sys.stdout.write(f"\r同步进度: [{completed_tasks}/{total_tasks}] {completed_tasks/total_tasks*100:.1f}%")
                 sys.stdout.flush()
 
-            if failed_rows:
-                self.summary["retry_attempted_codes"] = len(failed_rows)
-                sys.stdout.write(f"\n开始重试失败股票: {len(failed_rows)} 只\n")
+            if failed_codes:
+                self.summary["retry_attempted_codes"] = len(failed_codes)
+                sys.stdout.write(f"\n开始重试失败股票: {len(failed_codes)} 只\n")
                 sys.stdout.flush()
                 time.sleep(1.5)
-                for row, first_error in failed_rows:
+                for code_str, first_error in failed_codes:
                     retry_error = self._process_single_stock(
-                        conn=conn, code=str(row.code), start_trade_date=start_trade_date, end_trade_date=end_trade_date,
+                        conn=conn, code=code_str, start_trade_date=start_trade_date, end_trade_date=end_trade_date,
                         intra_start=intra_start, intra_end=intra_end,
                         tencent_spot=tencent_spot,
                         enable_spot_enrichment=True,
@@ -1016,6 +1208,15 @@ class StockMarketSyncEngine:
                         self.summary["retry_recovered_codes"] += 1
 
             sys.stdout.write("\n")
+            compaction = compact_intraday(conn, retention_days=self.intraday_retention_days)
+            self.summary["intraday_compacted_days"] = compaction["aggregated_days"]
+            self.summary["intraday_deleted_rows"] = compaction["deleted_rows"]
+            self.summary["intraday_dropped_partitions"] = compaction["dropped_partitions"]
+            cache_stats = MarketDataFetcher.cache.stats()
+            self.summary["market_cache_hits"] = cache_stats["hits"]
+            self.summary["market_cache_misses"] = cache_stats["misses"]
+            self.summary["market_cache_hit_rate"] = cache_stats["hit_rate"]
+            self.summary["market_cache_bytes"] = cache_stats["size_bytes"]
             return self.summary
         finally:
             conn.close()
@@ -1036,72 +1237,54 @@ class StockMarketSyncEngine:
                     spot["float_mv_yi"],
                 )
 
-            coverage_row = self._get_daily_bar_coverage(conn, code)
-            oldest_db_record = conn.execute(
-                "SELECT trade_date, close FROM daily_bars WHERE code = ? ORDER BY trade_date ASC LIMIT 1",
-                (code,)
-            ).fetchone()
-
+            coverage = self.coverage.get(code)
             signature_changed = False
-            effective_start_trade_date = self._resolve_first_trade_day_on_or_after(start_trade_date)
-
-            if oldest_db_record:
-                anchor_date = str(oldest_db_record["trade_date"])
-                db_anchor_close = float(oldest_db_record["close"])
-                
-                anchor_df = MarketDataFetcher.fetch_daily_bars(code, start_date=anchor_date, end_date=anchor_date, adjust="qfq")
-                if not anchor_df.empty:
-                    api_anchor_close = float(anchor_df.iloc[0]["close"])
-                    if abs(api_anchor_close - db_anchor_close) > 0.01:
-                        signature_changed = True
-
-            coverage_matches = bool(
-                coverage_row
-                and not signature_changed
-                and str(coverage_row["coverage_start_date"]) <= effective_start_trade_date
-                and str(coverage_row["coverage_end_date"]) >= end_trade_date
-            )
-
+            if coverage:
+                verdict = snapshot_adjustment_changed(coverage, spot, self.calendar)
+                if verdict is None:
+                    verdict = self._anchor_signature_changed(code, coverage)
+                signature_changed = verdict
             if signature_changed:
                 self.summary["adjustment_event_updates"] += 1
 
-            if coverage_matches:
+            plan = plan_daily_fetch(coverage, start_trade_date, end_trade_date, self.calendar, spot, signature_changed)
+            if plan["action"] == "skip":
                 self.summary["skipped_daily_codes"] += 1
+            elif plan["action"] == "snapshot":
+                self.summary["daily_bar_rows"] += self._upsert_daily_bars(conn, code, "qfq", pd.DataFrame([plan["bar"]]))
+                self.summary["snapshot_daily_codes"] += 1
+            elif plan["action"] == "full":
+                # 复权变动后缓存里的前复权价格已经作废，整段重拉必须绕过缓存
+                qfq_bars = MarketDataFetcher.fetch_daily_bars(
+                    code, start_date=plan["start"], end_date=plan["end"], adjust="qfq",
+                    use_cache=plan["reason"] != "adjustment",
+                )
+                self.summary["daily_bar_rows"] += self._replace_qfq_history(conn, code, qfq_bars, fetched_from=plan["start"])
+                if plan["reason"] == "adjustment":
+                    self.summary["full_refresh_codes"].append(code)
+                else:
+                    self.summary["coverage_backfill_codes"].append(code)
             else:
-                needs_full = signature_changed or (
-                    start_trade_date == FULL_REFRESH_START
-                    and (not coverage_row or str(coverage_row["coverage_start_date"]) > effective_start_trade_date)
+                qfq_bars = MarketDataFetcher.fetch_daily_bars(
+                    code, start_date=plan["start"], end_date=plan["end"], adjust="qfq", expected_bars=plan["days"],
                 )
-                fetch_start_date = FULL_REFRESH_START if needs_full else start_trade_date
-                if not needs_full and coverage_row:
-                    coverage_end_date = str(coverage_row["coverage_end_date"])
-                    if coverage_end_date >= start_trade_date:
-                        fetch_start_date = (
-                            datetime.strptime(coverage_end_date, "%Y-%m-%d") + timedelta(days=1)
-                        ).strftime("%Y-%m-%d")
-
-                if fetch_start_date <= end_trade_date:
-                    qfq_bars = MarketDataFetcher.fetch_daily_bars(code, start_date=fetch_start_date, end_date=end_trade_date, adjust="qfq")
-                    if needs_full:
-                        qfq_rows = self._replace_qfq_history(conn, code, qfq_bars)
-                        if signature_changed:
-                            self.summary["full_refresh_codes"].append(code)
-                        else:
-                            self.summary["coverage_backfill_codes"].append(code)
-                    else:
-                        qfq_rows = self._upsert_daily_bars(conn, code, "qfq", qfq_bars)
-                    self.summary["daily_bar_rows"] += qfq_rows
+                self.summary["daily_bar_rows"] += self._upsert_daily_bars(conn, code, "qfq", qfq_bars)
+                self.summary["delta_daily_codes"] += 1
 
             if enable_intraday:
                 intra_df = MarketDataFetcher.fetch_recent_intraday_bars(code)
                 if not intra_df.empty:
-                    intra_rows = self._replace_intraday_bars(conn, code, intra_df)
+                    intra_rows = self._write_intraday_bars(conn, code, intra_df)
                     recent_intra_df = intra_df[intra_df["trade_date"].isin(sorted(intra_df["trade_date"].unique())[-INTRADAY_LOOKBACK_DAYS:])]
                     distributions = self._build_daily_distributions(recent_intra_df)
                     dist_rows = self._replace_daily_distributions(conn, code, distributions)
                     self.summary["intraday_bar_rows"] += intra_rows
                     self.summary["distribution_rows"] += dist_rows
 
+            # 代数 +1：所有 worker 中该股票的载荷缓存随之失效
+            bump_payload_generation(conn, code)
+            conn.commit()
+            StockMarketDataReader.clear_cache(code)
             self.summary["synced_codes"] += 1
             
         except Exception as exc:
@@ -1113,7 +1296,7 @@ class StockMarketSyncEngine:
 
     # 数据库写入相关逻辑
     def _upsert_stocks(self, conn: sqlite3.Connection, stocks_df: pd.DataFrame) -> int:
-        rows = [(r.code, r.name, r.board, int(r.is_st), now_ts()) for r in stocks_df.itertuples(index=False)]
+        rows = stock_rows(stocks_df, now_ts())
         conn.executemany("""
             INSERT INTO stocks(code, name, board, is_st, updated_at) VALUES (?, ?, ?, ?, ?)
             ON CONFLICT(code) DO UPDATE SET name=excluded.name, board=excluded.board, is_st=excluded.is_st, updated_at=excluded.updated_at
@@ -1137,15 +1320,13 @@ class StockMarketSyncEngine:
                 float_mv_yi=excluded.float_mv_yi
         """, (code, trade_date, amount_wan, float_mv_yi))
 
-    def _upsert_daily_bars(self, conn: sqlite3.Connection, code: str, adjust_type: str, bars_df: pd.DataFrame) -> int:
+    def _upsert_daily_bars(self, conn: sqlite3.Connection, code: str, adjust_type: str, bars_df: pd.DataFrame,
+                           fetched_from: Optional[str] = None) -> int:
         if bars_df.empty:
             return 0
         if adjust_type != "qfq":
             raise ValueError(f"daily bars only support qfq, got: {adjust_type}")
-        rows = [
-            (code, r.date, r.open, r.high, r.low, r.close, r.volume)
-            for r in bars_df.itertuples(index=False)
-        ]
+        rows = daily_bar_rows(code, bars_df)
         conn.executemany(
             """
             INSERT INTO daily_bars(code, trade_date, open, high, low, close, volume)
@@ -1159,102 +1340,119 @@ class StockMarketSyncEngine:
             """,
             rows,
         )
+        DbManager.refresh_latest_daily(conn, code)
+        coverage = DbManager.refresh_daily_coverage(conn, code, fetched_from=fetched_from)
+        if coverage is not None:
+            self.coverage[code] = coverage
         conn.commit()
         return len(rows)
 
-    def _replace_qfq_history(self, conn: sqlite3.Connection, code: str, bars_df: pd.DataFrame) -> int:
+    def _replace_qfq_history(self, conn: sqlite3.Connection, code: str, bars_df: pd.DataFrame, fetched_from: Optional[str] = None) -> int:
         with conn:
             conn.execute("DELETE FROM daily_bars WHERE code = ?", (code,))
-        return self._upsert_daily_bars(conn, code, "qfq", bars_df)
+            conn.execute("DELETE FROM latest_daily WHERE code = ?", (code,))
+            conn.execute("DELETE FROM daily_bar_coverage WHERE code = ?", (code,))
+            # 复权后历史价格整体改变，作废增量复盘的滚动指标状态
+            conn.execute("DELETE FROM indicator_state WHERE code = ?", (code,))
+        self.coverage.pop(code, None)
+        return self._upsert_daily_bars(conn, code, "qfq", bars_df, fetched_from=fetched_from)
 
-    def _get_daily_bar_coverage(self, conn: sqlite3.Connection, code: str) -> Optional[sqlite3.Row]:
-        row = conn.execute(
-            "SELECT MIN(trade_date) AS coverage_start_date, MAX(trade_date) AS coverage_end_date FROM daily_bars WHERE code = ?",
-            (code,),
-        ).fetchone()
-        if not row or row["coverage_start_date"] is None or row["coverage_end_date"] is None:
-            return None
-        return row
+    def _anchor_signature_changed(self, code: str, coverage: dict) -> bool:
+        """快照无法判断时的回退：重新拉取最早一根前复权日线，与库中的基准收盘价比对。
 
-    def _replace_intraday_bars(self, conn: sqlite3.Connection, code: str, intra_df: pd.DataFrame) -> int:
+        缓存里的区间最长可能是 12 小时前抓的，复权恰好发生在这之间就比对不出来，所以基准必须直接问接口。
+        """
+        if coverage.get("first_close") is None:
+            return False
+        anchor_date = coverage["first_date"]
+        anchor_df = MarketDataFetcher.fetch_daily_bars(
+            code, start_date=anchor_date, end_date=anchor_date, adjust="qfq", expected_bars=1, use_cache=False,
+        )
+        if anchor_df.empty:
+            return False
+        return abs(float(anchor_df.iloc[0]["close"]) - float(coverage["first_close"])) > 0.01
+
+    def _write_intraday_bars(self, conn: sqlite3.Connection, code: str, intra_df: pd.DataFrame) -> int:
+        """只写入库中尚没有的分钟，返回写入行数。"""
         if intra_df.empty: return 0
-        rows = [
-            (code, r.trade_date, r.trade_time, r.trade_timestamp, r.open, r.close, r.high, r.low, r.avg_price, r.volume, r.amount, r.change_pct, r.change_amount)
-            for r in intra_df.itertuples(index=False)
-        ]
-        conn.executemany("""
-            INSERT INTO intraday_bars(code, trade_date, trade_time, trade_timestamp, open, close, high, low, avg_price, volume, amount, change_pct, change_amount)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(code, trade_timestamp) DO UPDATE SET 
-                trade_date=excluded.trade_date, trade_time=excluded.trade_time,
-                open=excluded.open, close=excluded.close, high=excluded.high, low=excluded.low,
-                avg_price=excluded.avg_price, volume=excluded.volume, amount=excluded.amount,
-                change_pct=excluded.change_pct, change_amount=excluded.change_amount
-        """, rows)
+        written = write_intraday_bars(conn, code, intraday_bar_rows(intra_df))
         conn.commit()
-        return len(rows)
+        return written
 
     def _replace_daily_distributions(self, conn: sqlite3.Connection, code: str, distributions: List[dict]) -> int:
         if not distributions: return 0
-        rows = [
-            (code, item["date"], json.dumps(item["buy_sell_bins"], ensure_ascii=False), json.dumps(item["price_histogram"], ensure_ascii=False))
-            for item in distributions
-        ]
+        rows = [(code, item["date"], item["bins"].shape[1], pack_distribution(item["bins"])) for item in distributions]
         conn.executemany("""
-            INSERT INTO daily_price_distributions(code, trade_date, buy_sell_bins_json, price_histogram_json)
+            INSERT INTO daily_price_distributions(code, trade_date, bin_count, bins)
             VALUES (?, ?, ?, ?)
-            ON CONFLICT(code, trade_date) DO UPDATE SET 
-                buy_sell_bins_json=excluded.buy_sell_bins_json,
-                price_histogram_json=excluded.price_histogram_json
+            ON CONFLICT(code, trade_date) DO UPDATE SET
+                bin_count=excluded.bin_count,
+                bins=excluded.bins
         """, rows)
         conn.commit()
         return len(rows)
 
-    def _build_daily_distributions(self, intra_df: pd.DataFrame, bin_count: int = 8) -> List[dict]:
+    def _build_daily_distributions(self, intra_df: pd.DataFrame, bin_count: int = DISTRIBUTION_BIN_COUNT) -> List[dict]:
+        """按交易日把分钟成交量分到价格区间，返回 [{"date", "bins": 分布矩阵}]，按日期升序。
+
+        全部交易日一起向量化：每分钟算出 (交易日, 分箱) 的组合下标后用 bincount 累加，
+        累加顺序与逐行循环相同，结果逐位一致。
+        """
+        valid = intra_df.dropna(subset=["close", "volume"])
+        if valid.empty:
+            return []
+        dates, date_index = np.unique(valid["trade_date"].astype(str).to_numpy(), return_inverse=True)
+        prices = valid["close"].astype(float).to_numpy()
+        volumes = valid["volume"].astype(float).to_numpy()
+        opens = pd.to_numeric(valid["open"], errors="coerce").to_numpy(dtype=float)
+
+        low = np.full(len(dates), np.inf)
+        high = np.full(len(dates), -np.inf)
+        np.minimum.at(low, date_index, prices)
+        np.maximum.at(high, date_index, prices)
+        effective_bins = np.where(high <= low, 1, bin_count)
+        step = np.maximum((high - low) / effective_bins, 0.01)
+
+        row_bins = effective_bins[date_index]
+        bin_index = np.where(
+            row_bins == 1,
+            0,
+            np.minimum(((prices - low[date_index]) / step[date_index]).astype(np.int64), row_bins - 1),
+        )
+        slot = date_index * bin_count + bin_index
+        size = len(dates) * bin_count
+        # 开盘价缺失（NaN）时比较结果为 False，按中性成交处理
+        is_buy = prices > opens
+        is_sell = prices < opens
+        totals = np.bincount(slot, weights=volumes, minlength=size).reshape(len(dates), bin_count)
+        buys = np.bincount(slot[is_buy], weights=volumes[is_buy], minlength=size).reshape(len(dates), bin_count)
+        sells = np.bincount(slot[is_sell], weights=volumes[is_sell], minlength=size).reshape(len(dates), bin_count)
+        neutral = ~(is_buy | is_sell)
+        neutrals = np.bincount(slot[neutral], weights=volumes[neutral], minlength=size).reshape(len(dates), bin_count)
+        counts = np.bincount(slot, minlength=size).reshape(len(dates), bin_count)
+
         dists = []
-        for trade_date, group in intra_df.groupby("trade_date"):
-            valid = group.dropna(subset=["close", "volume"]).copy()
-            if valid.empty: continue
-
-            prices = valid["close"].astype(float).tolist()
-            low_p, high_p = min(prices), max(prices)
-            effective_bins = 1 if high_p <= low_p else bin_count
-            step = max((high_p - low_p) / effective_bins, 0.01)
-
-            buy_sell_bins, price_hist = [], []
-            for i in range(effective_bins):
-                lp = low_p + i * step
-                up = high_p if i == effective_bins - 1 else lp + step
-                lbl = f"{lp:.2f}-{up:.2f}"
-                buy_sell_bins.append({"label": lbl, "lower_price": round(lp, 4), "upper_price": round(up, 4), "buy_volume": 0.0, "sell_volume": 0.0, "neutral_volume": 0.0, "total_volume": 0.0})
-                price_hist.append({"label": lbl, "lower_price": round(lp, 4), "upper_price": round(up, 4), "count": 0, "volume": 0.0})
-
-            for row in valid.to_dict("records"):
-                price, vol = float(row["close"]), float(row.get("volume") or 0)
-                b_idx = 0 if effective_bins == 1 else min(int((price - low_p) / step), effective_bins - 1)
-                c_o, c_c = row.get("open"), row.get("close")
-                
-                if c_o is not None and c_c is not None and c_c > c_o: buy_sell_bins[b_idx]["buy_volume"] += vol
-                elif c_o is not None and c_c is not None and c_c < c_o: buy_sell_bins[b_idx]["sell_volume"] += vol
-                else: buy_sell_bins[b_idx]["neutral_volume"] += vol
-                
-                buy_sell_bins[b_idx]["total_volume"] += vol
-                price_hist[b_idx]["count"] += 1
-                price_hist[b_idx]["volume"] += vol
-                
+        for index, trade_date in enumerate(dates):
+            bins = int(effective_bins[index])
+            lower = low[index] + np.arange(bins) * step[index]
+            upper = lower + step[index]
+            upper[-1] = high[index]
             dists.append({
                 "date": str(trade_date),
-                "buy_sell_bins": buy_sell_bins, "price_histogram": price_hist
+                "bins": np.vstack([
+                    lower, upper,
+                    buys[index, :bins], sells[index, :bins], neutrals[index, :bins], totals[index, :bins],
+                    counts[index, :bins],
+                ]),
             })
-        dists.sort(key=lambda i: i["date"])
         return dists
 
 
 class StockMarketDataReader:
     """提供给下游查询和组装结构化前端市场数据载荷的读取器"""
     
-    _payload_cache_lock = threading.Lock()
-    _payload_cache: Dict[str, dict] = {}
+    # 载荷以 JSON 字节缓存，按 stock.db 中的股票代数失效；设置 STOCK_PAYLOAD_SHARED_CACHE=1 时多 worker 共享
+    payload_cache = MarketPayloadCache.from_env(DB_PATH, PAYLOAD_SHARED_CACHE_PATH)
 
     @classmethod
     def get_empty_payload(cls) -> Dict[str, object]:
@@ -1262,13 +1460,13 @@ class StockMarketDataReader:
 
     @classmethod
     def clear_cache(cls, code: str):
-        with cls._payload_cache_lock:
-            cls._payload_cache.pop(code, None)
+        cls.payload_cache.discard(code)
 
     @classmethod
     def is_trade_day(cls, value: Optional[str] = None) -> bool:
         trade_date = parse_cli_date(value, fallback=datetime.now())
-        return datetime.strptime(trade_date, "%Y-%m-%d").weekday() < 5
+        # Web 侧只读日历：不联网、不写库，日历刷新交给同步任务
+        return get_trade_calendar(DB_PATH, read_only=True).is_trading_day(trade_date)
 
     @staticmethod
     def has_market_data_for_date(value: Optional[str] = None) -> dict:
@@ -1277,7 +1475,7 @@ class StockMarketDataReader:
         try:
             db_vars = {
                 "daily_bar_count": int(conn.execute("SELECT COUNT(*) FROM daily_bars WHERE trade_date = ?", (trade_date,)).fetchone()[0]),
-                "intraday_bar_count": int(conn.execute("SELECT COUNT(*) FROM intraday_bars WHERE trade_date = ?", (trade_date,)).fetchone()[0]),
+                "intraday_bar_count": count_bars_on(conn, trade_date),
                 "distribution_count": int(conn.execute("SELECT COUNT(*) FROM daily_price_distributions WHERE trade_date = ?", (trade_date,)).fetchone()[0]),
             }
             return {
@@ -1289,13 +1487,19 @@ class StockMarketDataReader:
 
     @classmethod
     def build_stock_market_payload(cls, stock_info: dict) -> dict:
+        """返回一份新的载荷字典（由缓存的 JSON 字节反序列化，调用方可随意修改）。"""
+        return loads_payload(cls.build_stock_market_payload_json(stock_info))
+
+    @classmethod
+    def build_stock_market_payload_json(cls, stock_info: dict, layout: str = "rows") -> bytes:
+        """返回序列化后的载荷 JSON 字节；命中缓存时不做任何复制。layout="columnar" 时各序列按字段给出数组。"""
         code = str(stock_info["code"])
-        
-        with cls._payload_cache_lock:
-            entry = cls._payload_cache.get(code)
-            if entry and time.time() - entry["timestamp"] <= PAYLOAD_CACHE_TTL_SECONDS:
-                return copy.deepcopy(entry["payload"])
+        if layout == "columnar":
+            return cls.payload_cache.get_or_build(code, lambda: to_columnar_market(cls._assemble_market_payload(code)), variant="columnar")
+        return cls.payload_cache.get_or_build(code, lambda: cls._assemble_market_payload(code))
 
+    @classmethod
+    def _assemble_market_payload(cls, code: str) -> dict:
         payload = cls.get_empty_payload()
         conn = DbManager.get_connection()
         try:
@@ -1311,9 +1515,6 @@ class StockMarketDataReader:
         if not payload["daily_series"]: payload["warnings"].append("数据库中没有该股票的日线行情")
         if not payload["intraday_series"]: payload["warnings"].append("数据库中没有该股票最近分时行情")
         if not payload["daily_distributions"]: payload["warnings"].append("数据库中没有该股票的价格分布数据")
-
-        with cls._payload_cache_lock:
-            cls._payload_cache[code] = {"timestamp": time.time(), "payload": copy.deepcopy(payload)}
         return payload
 
     @staticmethod
@@ -1323,28 +1524,17 @@ class StockMarketDataReader:
 
     @staticmethod
     def _load_recent_intraday_series(conn: sqlite3.Connection, code: str, lookback_days: int = INTRADAY_LOOKBACK_DAYS) -> List[dict]:
-        trade_dates_desc = [
-            str(row["trade_date"])
-            for row in conn.execute(
-                "SELECT DISTINCT trade_date FROM intraday_bars WHERE code = ? ORDER BY trade_date DESC LIMIT ?",
-                (code, lookback_days),
-            ).fetchall()
-        ]
-        if not trade_dates_desc:
+        trade_dates = recent_trade_dates(conn, code, lookback_days)
+        if not trade_dates:
             return []
 
-        trade_dates = sorted(trade_dates_desc)
-        rows = conn.execute(
-            f"SELECT trade_timestamp, trade_date, trade_time, open, close, high, low, avg_price, volume, amount, change_pct, change_amount FROM intraday_bars WHERE code = ? AND trade_date IN ({','.join('?' * len(trade_dates))}) ORDER BY trade_timestamp",
-            [code, *trade_dates],
-        ).fetchall()
-
-        return [{"timestamp": str(r["trade_timestamp"]), "date": str(r["trade_date"]), "time": str(r["trade_time"])[:5], "open": safe_float(r["open"]), "close": safe_float(r["close"]), "high": safe_float(r["high"]), "low": safe_float(r["low"]), "avg_price": safe_float(r["avg_price"]), "volume": safe_float(r["volume"]), "amount": safe_float(r["amount"]), "change_pct": safe_float(r["change_pct"]), "change_amount": safe_float(r["change_amount"])} for r in rows]
+        rows = load_intraday_rows(conn, code, trade_dates[0], trade_dates[-1])
+        return [{"timestamp": r[0], "date": r[1], "time": r[2][:5], "open": safe_float(r[3]), "close": safe_float(r[4]), "high": safe_float(r[5]), "low": safe_float(r[6]), "avg_price": safe_float(r[7]), "volume": safe_float(r[8]), "amount": safe_float(r[9]), "change_pct": safe_float(r[10]), "change_amount": safe_float(r[11])} for r in rows]
 
     @staticmethod
     def _load_daily_distributions(conn: sqlite3.Connection, code: str, lookback_days: int = INTRADAY_LOOKBACK_DAYS) -> List[dict]:
         rows = conn.execute(
-            "SELECT trade_date, buy_sell_bins_json, price_histogram_json FROM daily_price_distributions WHERE code = ? ORDER BY trade_date DESC LIMIT ?",
+            "SELECT trade_date, bin_count, bins FROM daily_price_distributions WHERE code = ? ORDER BY trade_date DESC LIMIT ?",
             (code, lookback_days),
         ).fetchall()
         rows = sorted(rows, key=lambda row: str(row["trade_date"]))[-lookback_days:]
@@ -1364,6 +1554,7 @@ class StockMarketDataReader:
         for r in rows:
             trade_date = str(r["trade_date"])
             daily = daily_map.get(trade_date)
+            buy_sell_bins, price_histogram = distribution_payload(unpack_distribution(r["bins"], int(r["bin_count"])))
             result.append({
                 "date": trade_date,
                 "summary": {
@@ -1374,8 +1565,8 @@ class StockMarketDataReader:
                     "total_volume": safe_float(daily["volume"]) if daily else None,
                     "total_amount": safe_float(daily["volume"]) if daily else None,
                 },
-                "buy_sell_bins": json.loads(r["buy_sell_bins_json"]),
-                "price_histogram": json.loads(r["price_histogram_json"]),
+                "buy_sell_bins": buy_sell_bins,
+                "price_histogram": price_histogram,
             })
         return result
 
@@ -1438,6 +1629,7 @@ def main() -> None:
     parser.add_argument("--end-date", type=str, default=None, help="结束同步日期。格式 YYYY-MM-DD")
     parser.add_argument("--limit", type=int, default=0, help="仅同步前 N 只股票，便于调试")
     parser.add_argument("--plot", type=str, default=None, help="输入股票代码（如 000001），直接拉取库中数据并展示K线图（不会进行同步操作）")
+    parser.add_argument("--intraday-retention-days", type=int, default=INTRADAY_RETENTION_DAYS, help="分钟线保留天数，更早的分钟压缩为日度聚合")
     args = parser.parse_args()
 
     if args.plot:
@@ -1447,13 +1639,26 @@ def main() -> None:
     engine = StockMarketSyncEngine(
         limit=args.limit,
         request_pause=0.15,
+        intraday_retention_days=args.intraday_retention_days,
     )
     summary = engine.run_sync(start_date=args.start_date, end_date=args.end_date)
 
     print(
         f"同步完成: 目标股票 {summary['target_universe_count']} 只, "
         f"实际同步 {summary['synced_codes']} 只, 日线 {summary['daily_bar_rows']} 行, "
-        f"最近5日分时 {summary['intraday_bar_rows']} 行, 分布 {summary['distribution_rows']} 条"
+        f"新增分时 {summary['intraday_bar_rows']} 行, 分布 {summary['distribution_rows']} 条"
+    )
+    print(
+        f"日线规划: 已覆盖跳过 {summary['skipped_daily_codes']} 只, 快照补当日 {summary['snapshot_daily_codes']} 只, "
+        f"增量拉取 {summary['delta_daily_codes']} 只, 整段重刷 {len(summary['full_refresh_codes']) + len(summary['coverage_backfill_codes'])} 只"
+    )
+    print(
+        f"分时压缩: 汇总 {summary['intraday_compacted_days']} 个股票日, 删除过期分钟 {summary['intraday_deleted_rows']} 行"
+        + (f", 删除分区 {', '.join(summary['intraday_dropped_partitions'])}" if summary["intraday_dropped_partitions"] else "")
+    )
+    print(
+        f"行情缓存: 命中 {summary['market_cache_hits']} 次, 未命中 {summary['market_cache_misses']} 次, "
+        f"命中率 {summary['market_cache_hit_rate'] * 100:.1f}%, 占用 {summary['market_cache_bytes'] / 1024 / 1024:.1f} MB"
     )
     print(f"核心库: {summary['db_path']}")
     if summary["full_refresh_codes"]:
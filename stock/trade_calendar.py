@@ -0,0 +1,245 @@
+"""A 股交易日历。
+
+交易日存放在 stock.db 的 trade_calendar 表，首次使用或表中日期已不覆盖今天时，
+依次尝试 akshare 的新浪交易日历、随仓库提供的 data/schema/trade_calendar.txt（每行一个日期，
+可用 `python stock/trade_calendar.py --export` 从库中导出）。仍拿不到时在已知日期之后按工作日补齐，
+保证同步仍能运行（只是节假日会被当作交易日）。
+
+同步、复盘、回测和盘中监控统一通过 get_trade_calendar() 取进程内共享的日历，每个自然日最多加载一次；
+Web 请求路径用 read_only=True 只读打开 stock.db，不联网也不写表，日历过期时只用随仓库的文件和工作日补齐，
+刷新留给同步任务。查询全部基于有序列表二分：是否交易日、区间内交易日、前后第 N 个交易日都是 O(log n)。
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterable, Optional
+
+try:
+    import akshare as ak
+except ImportError:
+    ak = None
+
+# 工作日补齐的最早日期与向后延伸天数
+CALENDAR_FALLBACK_START = "2010-01-01"
+CALENDAR_FALLBACK_HORIZON_DAYS = 370
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DB_PATH = BASE_DIR / "data" / "stock.db"
+BUNDLED_CALENDAR_PATH = BASE_DIR / "data" / "schema" / "trade_calendar.txt"
+
+
+def _to_date_text(value) -> str:
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)[:10]
+
+
+def weekday_dates(start: str, end: str) -> list[str]:
+    current = datetime.strptime(start, "%Y-%m-%d")
+    stop = datetime.strptime(end, "%Y-%m-%d")
+    dates = []
+    while current <= stop:
+        if current.weekday() < 5:
+            dates.append(current.strftime("%Y-%m-%d"))
+        current += timedelta(days=1)
+    return dates
+
+
+def load_trade_dates(conn: sqlite3.Connection) -> list[str]:
+    try:
+        rows = conn.execute("SELECT trade_date FROM trade_calendar ORDER BY trade_date").fetchall()
+    except sqlite3.OperationalError:
+        return []
+    return [str(row[0]) for row in rows]
+
+
+def save_trade_dates(conn: sqlite3.Connection, dates: Iterable[str]) -> int:
+    rows = [(_to_date_text(value),) for value in dates]
+    conn.execute("CREATE TABLE IF NOT EXISTS trade_calendar (trade_date TEXT PRIMARY KEY) WITHOUT ROWID")
+    conn.executemany("INSERT OR IGNORE INTO trade_calendar(trade_date) VALUES (?)", rows)
+    conn.commit()
+    return len(rows)
+
+
+def read_bundled_trade_dates(path: Path = BUNDLED_CALENDAR_PATH) -> list[str]:
+    if not path.exists():
+        return []
+    lines = path.read_text(encoding="utf-8").splitlines()
+    return sorted(line.strip()[:10] for line in lines if line.strip() and not line.startswith("#"))
+
+
+def fetch_trade_dates() -> list[str]:
+    """从 akshare 拉取交易所交易日历（含当年剩余日期）；失败返回空列表。"""
+    if ak is None:
+        return []
+    try:
+        df = ak.tool_trade_date_hist_sina()
+    except Exception:
+        return []
+    if df is None or df.empty:
+        return []
+    return sorted(_to_date_text(value) for value in df["trade_date"].tolist())
+
+
+class TradeCalendar:
+    def __init__(self, dates: Iterable[str], exact: bool = True):
+        self.dates = sorted(set(dates))
+        # False 表示部分日期由工作日补齐
+        self.exact = exact
+
+    @classmethod
+    def load(cls, conn: sqlite3.Connection, today: Optional[str] = None, refresh: bool = True) -> "TradeCalendar":
+        """读取库中日历；不覆盖今天时尝试刷新，仍不足则按工作日补齐到一年后。
+
+        refresh=False 时不联网、不写库，只合并随仓库提供的日历文件。
+        """
+        today = today or datetime.now().strftime("%Y-%m-%d")
+        dates = load_trade_dates(conn)
+        sources = (fetch_trade_dates, read_bundled_trade_dates) if refresh else (read_bundled_trade_dates,)
+        for source in sources:
+            if dates and dates[-1] >= today:
+                break
+            fetched = source()
+            if fetched and (not dates or fetched[-1] > dates[-1]):
+                if refresh:
+                    save_trade_dates(conn, fetched)
+                    dates = load_trade_dates(conn)
+                else:
+                    dates = sorted(set(dates).union(fetched))
+
+        exact = bool(dates) and dates[-1] >= today
+        if not exact:
+            horizon = (datetime.strptime(today, "%Y-%m-%d") + timedelta(days=CALENDAR_FALLBACK_HORIZON_DAYS)).strftime("%Y-%m-%d")
+            if dates:
+                tail_start = (datetime.strptime(dates[-1], "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+            else:
+                tail_start = CALENDAR_FALLBACK_START
+            dates = dates + weekday_dates(tail_start, horizon)
+        return cls(dates, exact=exact)
+
+    def is_trading_day(self, value: str) -> bool:
+        index = bisect.bisect_left(self.dates, value)
+        return index < len(self.dates) and self.dates[index] == value
+
+    def trading_days(self, start: str, end: str) -> list[str]:
+        """[start, end] 闭区间内的交易日。"""
+        return self.dates[bisect.bisect_left(self.dates, start):bisect.bisect_right(self.dates, end)]
+
+    def count_between(self, start: str, end: str) -> int:
+        return max(0, bisect.bisect_right(self.dates, end) - bisect.bisect_left(self.dates, start))
+
+    def first_on_or_after(self, value: str) -> Optional[str]:
+        index = bisect.bisect_left(self.dates, value)
+        return self.dates[index] if index < len(self.dates) else None
+
+    def last_on_or_before(self, value: str) -> Optional[str]:
+        index = bisect.bisect_right(self.dates, value)
+        return self.dates[index - 1] if index > 0 else None
+
+    def next_trading_day(self, value: str) -> Optional[str]:
+        """严格晚于 value 的第一个交易日。"""
+        index = bisect.bisect_right(self.dates, value)
+        return self.dates[index] if index < len(self.dates) else None
+
+    def prev_trading_day(self, value: str) -> Optional[str]:
+        """严格早于 value 的最后一个交易日。"""
+        index = bisect.bisect_left(self.dates, value)
+        return self.dates[index - 1] if index > 0 else None
+
+    def trading_days_back(self, value: str, count: int) -> Optional[str]:
+        """截至 value（含）的最近 count 个交易日中最早的一天；日历不够长时返回最早的交易日。"""
+        index = bisect.bisect_right(self.dates, value)
+        if index == 0:
+            return None
+        return self.dates[max(0, index - max(1, count))]
+
+
+_calendar_lock = threading.Lock()
+# 库路径 → (加载日期, 日历, 是否刷新过)
+_calendar_cache: dict[str, tuple[str, TradeCalendar, bool]] = {}
+
+
+def _load_read_only(db_path: Path, today: str) -> TradeCalendar:
+    path = Path(db_path)
+    if path.exists():
+        conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True, timeout=10)
+    else:
+        conn = sqlite3.connect(":memory:")
+    try:
+        return TradeCalendar.load(conn, today=today, refresh=False)
+    finally:
+        conn.close()
+
+
+def get_trade_calendar(
+    db_path: Path = DB_PATH,
+    conn: Optional[sqlite3.Connection] = None,
+    read_only: bool = False,
+) -> TradeCalendar:
+    """进程内共享的交易日历，按库路径缓存，跨自然日后重新加载一次。
+
+    read_only=True 供 Web 请求路径使用：只读打开库，不联网、不写 trade_calendar；
+    同一天里已有同步刷新过的日历时直接复用。
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    key = str(db_path)
+    with _calendar_lock:
+        cached = _calendar_cache.get(key)
+        if cached is not None and cached[0] == today and (read_only or cached[2]):
+            return cached[1]
+        if read_only:
+            calendar = _load_read_only(db_path, today)
+        elif conn is not None:
+            calendar = TradeCalendar.load(conn, today=today)
+        else:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            own_conn = sqlite3.connect(str(db_path), timeout=10)
+            try:
+                calendar = TradeCalendar.load(own_conn, today=today)
+            finally:
+                own_conn.close()
+        _calendar_cache[key] = (today, calendar, not read_only)
+        return calendar
+
+
+def export_bundled_calendar(db_path: Path = DB_PATH, path: Path = BUNDLED_CALENDAR_PATH) -> int:
+    """把库中的交易日历导出为随仓库提供的文本文件。"""
+    conn = sqlite3.connect(str(db_path))
+    try:
+        dates = load_trade_dates(conn)
+        if not dates:
+            dates = fetch_trade_dates()
+    finally:
+        conn.close()
+    if not dates:
+        raise RuntimeError("库中没有交易日历，且无法从 akshare 获取")
+    path.write_text("# A 股交易日历，每行一个交易日\n" + "\n".join(dates) + "\n", encoding="utf-8")
+    return len(dates)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="A 股交易日历")
+    parser.add_argument("--export", action="store_true", help="导出到 data/schema/trade_calendar.txt")
+    parser.add_argument("--date", help="查询某日是否为交易日，格式 YYYY-MM-DD")
+    args = parser.parse_args()
+
+    if args.export:
+        count = export_bundled_calendar()
+        print(f"已导出 {count} 个交易日到 {BUNDLED_CALENDAR_PATH}")
+        return
+    calendar = get_trade_calendar()
+    value = args.date or datetime.now().strftime("%Y-%m-%d")
+    print(f"{value} 交易日: {'是' if calendar.is_trading_day(value) else '否'}")
+    print(f"上一交易日: {calendar.prev_trading_day(value)}  下一交易日: {calendar.next_trading_day(value)}")
+    if not calendar.exact:
+        print("注意: 日历未覆盖今天，部分日期按工作日补齐")
+
+
+if __name__ == "__main__":
+    main()
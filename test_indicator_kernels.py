@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+金叉识别 / 缩量回踩内核的一致性校验与基准测试
+
+运行方式：
+    python -m pytest test_indicator_kernels.py --benchmark-only      # 只跑基准
+    python -m pytest test_indicator_kernels.py                       # 一致性 + 基准
+
+基准依赖 pytest-benchmark；未安装时基准用例自动跳过，一致性用例照常执行。
+"""
+
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stock"))
+
+import compute_indicators as ci  # noqa: E402
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    @pytest.fixture
+    def benchmark():
+        pytest.skip("未安装 pytest-benchmark")
+
+
+# ---- 旧版逐元素实现，作为行为基准 ----
+def legacy_golden_cross_type_and_age(ma5, ma20, close):
+    n = len(ma5)
+    if n < ci.MA_LONG + 5:
+        return "none", None
+    if pd.isna(ma5.iloc[-1]) or pd.isna(ma20.iloc[-1]) or ma5.iloc[-1] <= ma20.iloc[-1]:
+        return "none", None
+
+    cross_idx = None
+    for index in range(n - 1, max(0, n - 60), -1):
+        if any(pd.isna(series.iloc[index]) or pd.isna(series.iloc[index - 1]) for series in (ma5, ma20)):
+            continue
+        if ma5.iloc[index] > ma20.iloc[index] and ma5.iloc[index - 1] <= ma20.iloc[index - 1]:
+            cross_idx = index
+            break
+    if cross_idx is None:
+        return "none", None
+
+    cross_age = n - 1 - cross_idx
+    if cross_age > ci.GOLDEN_CROSS_DECAY_DAYS:
+        return "none", None
+
+    low_60 = close.iloc[-min(60, len(close)):].min()
+    if low_60 > 0 and (close.iloc[-1] / low_60 - 1) > 0.30:
+        return "high", cross_age
+
+    start = max(0, cross_idx - min(30, n - 1))
+    for index in range(cross_idx - 1, start, -1):
+        if any(pd.isna(series.iloc[index]) or pd.isna(series.iloc[index - 1]) for series in (ma5, ma20)):
+            continue
+        if ma5.iloc[index] < ma20.iloc[index] and ma5.iloc[index - 1] >= ma20.iloc[index - 1]:
+            return "second", cross_age
+    return "first", cross_age
+
+
+def legacy_shrinking_down_day_volumes(close, volume, lookback=ci.SHRINKING_DOWN_LOOKBACK):
+    if len(close) < 2 or len(volume) < lookback:
+        return []
+    recent_close = close.iloc[-lookback:]
+    recent_volume = volume.iloc[-lookback:]
+    pre_high_idx = int(recent_close.argmax())
+    volume_mean = recent_volume.mean()
+    if volume_mean <= 0 or math.isnan(volume_mean):
+        return []
+    volumes = []
+    for index in range(pre_high_idx + 1, len(recent_close)):
+        volume_value = recent_volume.iloc[index]
+        if (
+            recent_close.iloc[index] < recent_close.iloc[index - 1]
+            and volume_value < volume_mean * ci.SHRINKING_DOWN_RATIO
+            and volume_value < recent_volume.iloc[index - 1]
+        ):
+            volumes.append(float(volume_value))
+    return volumes
+
+
+def build_samples(count=300, size=200, seed=7):
+    rng = np.random.default_rng(seed)
+    samples = []
+    for _ in range(count):
+        close = pd.Series(np.cumprod(1 + rng.normal(0, 0.03, size)) * 10)
+        volume = pd.Series(rng.integers(1_000, 100_000, size).astype(float))
+        if rng.random() < 0.2:
+            close.iloc[rng.integers(0, size, 3)] = np.nan
+            volume.iloc[rng.integers(0, size, 3)] = np.nan
+        samples.append((ci.calc_ma(close, 5), ci.calc_ma(close, 20), close, volume))
+    return samples
+
+
+SAMPLES = build_samples()
+
+
+def test_golden_cross_matches_legacy():
+    for ma5, ma20, close, _ in SAMPLES:
+        assert ci.detect_golden_cross_type_and_age(ma5, ma20, close) == legacy_golden_cross_type_and_age(ma5, ma20, close)
+
+
+def test_shrinking_down_matches_legacy():
+    for _, _, close, volume in SAMPLES:
+        assert ci.get_shrinking_down_day_volumes(close, volume) == legacy_shrinking_down_day_volumes(close, volume)
+
+
+def test_numpy_kernel_matches_active_backend():
+    for ma5, ma20, close, _ in SAMPLES:
+        arrays = [series.to_numpy(dtype=float) for series in (ma5, ma20, close)]
+        assert ci._golden_cross_numpy_kernel(*arrays) == tuple(ci._golden_cross_kernel(*arrays))
+
+
+def test_shrinking_down_all_nan_close_window():
+    size = ci.SHRINKING_DOWN_LOOKBACK + 10
+    close = pd.Series(np.r_[np.linspace(10, 12, 10), np.full(ci.SHRINKING_DOWN_LOOKBACK, np.nan)])
+    volume = pd.Series(np.linspace(50_000, 1_000, size))
+    assert ci.get_shrinking_down_day_volumes(close, volume) == []
+    # 两个后端都要覆盖：未安装 numba 时循环版内核按纯 Python 执行
+    recent_close = close.to_numpy(dtype=float)[-ci.SHRINKING_DOWN_LOOKBACK:]
+    recent_volume = volume.to_numpy(dtype=float)[-ci.SHRINKING_DOWN_LOOKBACK:]
+    for kernel in (ci._shrinking_down_numpy_kernel, ci._shrinking_down_loop_kernel):
+        assert kernel(recent_close, recent_volume, 1e9).tolist() == []
+
+
+def _run_golden_cross(func):
+    for ma5, ma20, close, _ in SAMPLES:
+        func(ma5, ma20, close)
+
+
+def _run_shrinking_down(func):
+    for _, _, close, volume in SAMPLES:
+        func(close, volume)
+
+
+def test_bench_golden_cross_legacy(benchmark):
+    benchmark(_run_golden_cross, legacy_golden_cross_type_and_age)
+
+
+def test_bench_golden_cross_kernel(benchmark):
+    benchmark.extra_info["backend"] = ci.INDICATOR_KERNEL_BACKEND
+    benchmark(_run_golden_cross, ci.detect_golden_cross_type_and_age)
+
+
+def test_bench_shrinking_down_legacy(benchmark):
+    benchmark(_run_shrinking_down, legacy_shrinking_down_day_volumes)
+
+
+def test_bench_shrinking_down_kernel(benchmark):
+    benchmark.extra_info["backend"] = ci.INDICATOR_KERNEL_BACKEND
+    benchmark(_run_shrinking_down, ci.get_shrinking_down_day_volumes)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
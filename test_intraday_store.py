@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+分时按月分区存储的行为校验：旧表迁移、增量写入、跨月读取与保留期压缩
+
+运行方式：
+    python -m pytest test_intraday_store.py
+"""
+
+import os
+import random
+import sqlite3
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "stock"))
+
+import intraday_store as store  # noqa: E402
+
+SCHEMA_PATH = os.path.join(ROOT, "data", "schema", "stock.sql")
+
+# 迁移前的单表结构（TEXT 时间戳）
+LEGACY_SCHEMA = """
+CREATE TABLE intraday_bars (
+    code TEXT NOT NULL,
+    trade_date TEXT NOT NULL,
+    trade_time TEXT NOT NULL,
+    trade_timestamp TEXT NOT NULL,
+    open REAL,
+    close REAL,
+    high REAL,
+    low REAL,
+    avg_price REAL,
+    volume REAL,
+    amount REAL,
+    change_pct REAL,
+    change_amount REAL,
+    PRIMARY KEY (code, trade_timestamp)
+);
+CREATE INDEX idx_intraday_bars_code_date_time
+    ON intraday_bars(code, trade_date DESC, trade_timestamp DESC);
+"""
+
+MINUTES = ["09:30", "09:31", "09:32", "11:29", "13:00", "14:59"]
+DAYS = ["2024-01-30", "2024-01-31", "2024-02-01", "2024-02-02"]
+
+
+@pytest.fixture
+def conn():
+    connection = sqlite3.connect(":memory:")
+    with open(SCHEMA_PATH, encoding="utf-8") as f:
+        connection.executescript(f.read())
+    yield connection
+    connection.close()
+
+
+def minute_rows(trade_date, seed):
+    """一个交易日的 (ts, open, close, high, low, avg_price, volume, amount, change_pct, change_amount) 行。"""
+    rng = random.Random(seed)
+    rows = []
+    for minute in MINUTES:
+        low = round(rng.uniform(9, 10), 2)
+        high = round(low + rng.uniform(0, 0.5), 2)
+        open_, close = round(rng.uniform(low, high), 2), round(rng.uniform(low, high), 2)
+        volume = float(rng.randint(100, 5000))
+        avg_price = round((low + high) / 2, 3)
+        rows.append((
+            store.timestamp_to_epoch(f"{trade_date} {minute}:00"),
+            open_, close, high, low, avg_price, volume, round(volume * avg_price, 2), 0.1, 0.01,
+        ))
+    return rows
+
+
+def write_days(conn, code, days):
+    rows = []
+    for index, trade_date in enumerate(days):
+        rows.extend(minute_rows(trade_date, seed=f"{code}-{index}"))
+    with conn:
+        store.write_intraday_bars(conn, code, rows)
+    return rows
+
+
+def partition_rows(conn, name):
+    return conn.execute(f"SELECT code, ts FROM {name} ORDER BY code, ts").fetchall()
+
+
+def test_epoch_conversion_is_wall_clock_as_utc():
+    ts = store.timestamp_to_epoch("2024-02-01 09:30:00")
+    assert ts == store.date_to_epoch("2024-02-01") + (9 * 60 + 30) * 60
+    assert store.epoch_to_timestamp(ts) == "2024-02-01 09:30:00"
+    assert store.partition_for_epoch(ts) == "intraday_bars_202402"
+
+
+def test_migrate_legacy_intraday_splits_months_and_converts_epochs(conn):
+    conn.executescript(LEGACY_SCHEMA)
+    legacy = []
+    for code in ("600000", "000001"):
+        for trade_date in DAYS:
+            for minute in MINUTES:
+                legacy.append((
+                    code, trade_date, f"{minute}:00", f"{trade_date} {minute}:00",
+                    10.0, 10.1, 10.2, 9.9, 10.05, 100.0, 1005.0, 0.5, 0.05,
+                ))
+    conn.executemany("INSERT INTO intraday_bars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", legacy)
+    conn.commit()
+
+    assert store.migrate_legacy_intraday(conn) == len(legacy)
+    assert store.list_partitions(conn) == ["intraday_bars_202401", "intraday_bars_202402"]
+    per_month = len(legacy) // 2
+    assert len(partition_rows(conn, "intraday_bars_202401")) == per_month
+    assert len(partition_rows(conn, "intraday_bars_202402")) == per_month
+
+    migrated = conn.execute(
+        "SELECT code, ts, datetime(ts, 'unixepoch'), open, close, volume FROM intraday_bars_202402 ORDER BY code, ts"
+    ).fetchall()
+    for code, ts, text, open_, close, volume in migrated:
+        assert ts == store.timestamp_to_epoch(text)
+        assert text[:10] in ("2024-02-01", "2024-02-02")
+        assert (open_, close, volume) == (10.0, 10.1, 100.0)
+
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name LIKE '%intraday_bars' OR name LIKE 'idx_intraday_bars%'").fetchall() == []
+    assert store.migrate_legacy_intraday(conn) == 0
+
+
+def test_write_intraday_bars_only_writes_from_latest_stored_minute(conn):
+    first = minute_rows("2024-01-31", seed=1)[:3]
+    with conn:
+        assert store.write_intraday_bars(conn, "600000", first) == 3
+
+    # 重新抓取到的整段：更早的分钟带着不同的值，不应覆盖；最新那一分钟（可能未走完）及之后的要写入
+    refetched = [(ts, 99.0, *rest) for ts, _, *rest in minute_rows("2024-01-31", seed=1)]
+    with conn:
+        assert store.write_intraday_bars(conn, "600000", refetched) == len(MINUTES) - 2
+
+    stored = dict(conn.execute("SELECT ts, open FROM intraday_bars_202401 WHERE code = '600000'").fetchall())
+    assert len(stored) == len(MINUTES)
+    assert stored[first[0][0]] == first[0][1]
+    assert stored[first[1][0]] == first[1][1]
+    assert stored[first[2][0]] == 99.0
+
+    # 其他股票互不影响；跨月的新分钟写进新分区
+    with conn:
+        assert store.write_intraday_bars(conn, "000001", first) == 3
+        assert store.write_intraday_bars(conn, "600000", minute_rows("2024-02-01", seed=2)) == len(MINUTES)
+    assert store.latest_epoch(conn, "600000") == store.timestamp_to_epoch(f"2024-02-01 {MINUTES[-1]}:00")
+    assert store.list_partitions(conn) == ["intraday_bars_202401", "intraday_bars_202402"]
+
+
+def test_recent_trade_dates_and_load_rows_across_month_boundary(conn):
+    rows = write_days(conn, "600000", DAYS)
+    write_days(conn, "000001", DAYS[1:3])
+
+    assert store.recent_trade_dates(conn, "600000", 3) == ["2024-01-31", "2024-02-01", "2024-02-02"]
+    assert store.recent_trade_dates(conn, "600000", 10) == DAYS
+    assert store.recent_trade_dates(conn, "000001", 5) == DAYS[1:3]
+    assert store.recent_trade_dates(conn, "300750", 5) == []
+
+    loaded = store.load_intraday_rows(conn, "600000", "2024-01-31", "2024-02-01")
+    expected = [row for row in rows if "2024-01-31" <= store.epoch_to_timestamp(row[0])[:10] <= "2024-02-01"]
+    assert len(loaded) == len(expected) == 2 * len(MINUTES)
+    for got, want in zip(loaded, expected):
+        timestamp = store.epoch_to_timestamp(want[0])
+        assert got[:3] == (timestamp, timestamp[:10], timestamp[11:])
+        assert got[3:] == want[1:]
+
+    open_ended = store.load_intraday_rows(conn, "600000", "2024-02-01")
+    assert [row[1] for row in open_ended] == ["2024-02-01"] * len(MINUTES) + ["2024-02-02"] * len(MINUTES)
+
+
+def test_compact_intraday_aggregates_raw_minutes_and_drops_expired_partition(conn):
+    raw = {code: write_days(conn, code, DAYS) for code in ("600000", "000001")}
+
+    # 2024-03-03 往前 30 天是 2024-02-02：一月整月过期，2 月 1 日压缩，2 月 2 日保留
+    summary = store.compact_intraday(conn, retention_days=30, today="2024-03-03")
+
+    assert summary["dropped_partitions"] == ["intraday_bars_202401"]
+    assert summary["aggregated_days"] == 2 * 3
+    assert summary["deleted_rows"] == 2 * 3 * len(MINUTES)
+    assert store.list_partitions(conn) == ["intraday_bars_202402"]
+    remaining = conn.execute("SELECT DISTINCT date(ts, 'unixepoch') FROM intraday_bars_202402").fetchall()
+    assert remaining == [("2024-02-02",)]
+
+    aggregates = {
+        (row[0], row[1]): row[2:]
+        for row in conn.execute(
+            "SELECT code, trade_date, open, close, high, low, volume, amount, vwap, minute_count FROM intraday_daily_aggregates"
+        )
+    }
+    assert len(aggregates) == 2 * 3
+    for code, rows in raw.items():
+        for trade_date in DAYS[:3]:
+            day = [row for row in rows if store.epoch_to_timestamp(row[0])[:10] == trade_date]
+            open_, close, high, low, volume, amount, vwap, minute_count = aggregates[(code, trade_date)]
+            assert open_ == day[0][1]
+            assert close == day[-1][2]
+            assert high == max(row[3] for row in day)
+            assert low == min(row[4] for row in day)
+            assert volume == pytest.approx(sum(row[6] for row in day))
+            assert amount == pytest.approx(sum(row[7] for row in day))
+            assert vwap == pytest.approx(sum(row[5] * row[6] for row in day) / sum(row[6] for row in day))
+            assert minute_count == len(day)
+
+    # 全部过期后最后一个分区也整表删除，聚合保留
+    summary = store.compact_intraday(conn, retention_days=30, today="2024-04-30")
+    assert summary["dropped_partitions"] == ["intraday_bars_202402"]
+    assert store.list_partitions(conn) == []
+    assert conn.execute("SELECT COUNT(*) FROM intraday_daily_aggregates").fetchone()[0] == 2 * len(DAYS)
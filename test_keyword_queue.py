@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+天眼查关键词队列的行为校验：入队去重与失败重排、租约过期恢复、注销文件时保留共享关键词、失败与放回的尝试计数、触发器维护的计数与实际状态一致
+
+运行方式：
+    python -m pytest test_keyword_queue.py
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from tyc.keyword_queue import (  # noqa: E402
+    STATUS_DONE,
+    STATUS_FAILED,
+    STATUS_PENDING,
+    STATUS_RUNNING,
+    KeywordQueue,
+)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return KeywordQueue(db_file=str(tmp_path / "spider_progress.db"))
+
+
+def keyword_row(queue, keyword):
+    """返回 (status, attempts, source_file, error)，关键词不在表中时返回 None。"""
+    conn = queue._connect()
+    try:
+        return conn.execute(
+            "SELECT status, attempts, source_file, error FROM keyword_queue WHERE keyword = ?", (keyword,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+
+def claim_keyword(queue, keyword):
+    claimed = queue.claim()
+    assert claimed == keyword
+    return claimed
+
+
+def test_enqueue_skips_done_and_running_and_requeues_failed(queue):
+    assert queue.enqueue(["甲", "乙", "甲", " 丙 ", ""]) == 3
+
+    queue.complete(claim_keyword(queue, "甲"))
+    claim_keyword(queue, "乙")
+    queue.fail(claim_keyword(queue, "丙"), "timeout", max_attempts=1)
+    assert keyword_row(queue, "丙")[0] == STATUS_FAILED
+
+    # 已完成、正在搜索的不重复入队；失败的重新排队并清零尝试次数
+    assert queue.enqueue(["甲", "乙", "丙", "丁"]) == 2
+    assert keyword_row(queue, "甲")[0] == STATUS_DONE
+    assert keyword_row(queue, "乙")[:2] == (STATUS_RUNNING, 1)
+    assert keyword_row(queue, "丙") == (STATUS_PENDING, 0, None, None)
+    assert keyword_row(queue, "丁")[0] == STATUS_PENDING
+
+
+def test_recover_expired_only_touches_expired_leases(queue):
+    queue.enqueue(["过期", "存活"])
+    claim_keyword(queue, "过期")
+    claim_keyword(queue, "存活")
+    conn = queue._connect()
+    try:
+        conn.execute("UPDATE keyword_queue SET lease_expires = ? WHERE keyword = ?", (time.time() - 1, "过期"))
+    finally:
+        conn.close()
+
+    assert queue.recover_expired() == 1
+    # 中断的那次不计入尝试次数
+    assert keyword_row(queue, "过期")[:2] == (STATUS_PENDING, 0)
+    assert keyword_row(queue, "存活")[:2] == (STATUS_RUNNING, 1)
+    assert queue.recover_expired() == 0
+
+    # 续约后的租约同样不会被回收
+    assert queue.renew_leases() == 1
+    assert queue.recover_expired() == 0
+
+
+def test_forget_file_keeps_keywords_shared_with_other_files(queue):
+    queue.enqueue_file("first.txt", keywords=["甲", "乙", "丙"])
+    queue.enqueue_file("second.txt", keywords=["乙", "丁"])
+    claim_keyword(queue, "甲")
+
+    # 丙只属于 first.txt 且未开始，撤下；乙在 second.txt 中，保留并改记来源；正在搜索的甲保留
+    assert queue.forget_file("first.txt") == 1
+    assert keyword_row(queue, "丙") is None
+    assert keyword_row(queue, "乙")[0] == STATUS_PENDING
+    assert keyword_row(queue, "乙")[2] == "second.txt"
+    assert keyword_row(queue, "甲")[0] == STATUS_RUNNING
+    assert queue.registered_files() == {"second.txt"}
+
+    assert queue.forget_file("second.txt") == 2
+    assert keyword_row(queue, "乙") is None
+    assert keyword_row(queue, "丁") is None
+    assert queue.registered_files() == set()
+
+
+def test_fail_and_release_attempt_counting(queue):
+    queue.enqueue(["甲"])
+
+    queue.fail(claim_keyword(queue, "甲"), "HTTP 500", max_attempts=3)
+    assert keyword_row(queue, "甲") == (STATUS_PENDING, 1, None, "HTTP 500")
+
+    # 放回不计入尝试次数
+    queue.release(claim_keyword(queue, "甲"))
+    assert keyword_row(queue, "甲")[:2] == (STATUS_PENDING, 1)
+
+    queue.fail(claim_keyword(queue, "甲"), "HTTP 500", max_attempts=3)
+    assert keyword_row(queue, "甲")[:2] == (STATUS_PENDING, 2)
+
+    queue.fail(claim_keyword(queue, "甲"), "HTTP 502", max_attempts=3)
+    assert keyword_row(queue, "甲") == (STATUS_FAILED, 3, None, "HTTP 502")
+    assert queue.claim() is None
+
+
+def test_counters_match_status_counts_after_every_operation(queue):
+    def assert_counters_match():
+        stats = queue.stats()
+        counts = queue.status_counts()
+        for status in (STATUS_PENDING, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED):
+            assert stats[status] == counts.get(status, 0), status
+        assert stats["total"] == sum(counts.values())
+        assert stats["files"] == len(queue.registered_files())
+        return stats["version"]
+
+    version = assert_counters_match()
+    steps = [
+        lambda: queue.enqueue_file("first.txt", keywords=["甲", "乙", "丙", "丁"]),
+        lambda: queue.enqueue_file("second.txt", keywords=["丙", "戊"]),
+        lambda: queue.complete(claim_keyword(queue, "甲")),
+        lambda: queue.fail(claim_keyword(queue, "乙"), "timeout", max_attempts=1),
+        lambda: claim_keyword(queue, "丙"),
+        lambda: queue.forget_file("first.txt"),
+        lambda: queue.enqueue(["乙"]),
+    ]
+    for step in steps:
+        step()
+        new_version = assert_counters_match()
+        # 每一步都改动了队列或文件登记，版本号随之增加
+        assert new_version > version
+        version = new_version
+
+    assert queue.stats()["files"] == 1
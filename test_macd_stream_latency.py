@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+日内 MACD 推送延迟基准：假行情源 3000 只股票、3 秒周期，Web 事件循环同时承受 50 req/s 的普通 JSON 请求，
+统计「一批行情拉取返回 → EventHub 订阅者取到并序列化该 tick 事件」的延迟，要求 p99 < 100ms。
+
+运行方式：
+    python -m pytest test_macd_stream_latency.py -s
+
+假行情每批模拟 QUOTE_RTT_SECONDS 的网络往返，并把拉取返回时刻（time.perf_counter）写进价格字段，
+事件里的 price 即该 tick 的到达时刻。
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stock.macd_stream import EventHub  # noqa: E402
+from stock.payload_cache import dumps_payload  # noqa: E402
+from web_app.backend.services.macd_push_service import MACDStreamService  # noqa: E402
+
+CODE_COUNT = 3000
+CADENCE_SECONDS = 3.0
+MEASURE_CYCLES = 4
+REQUESTS_PER_SECOND = 50
+LATENCY_P99_LIMIT_MS = 100.0
+QUOTE_RTT_SECONDS = 0.03
+
+CODES = [f"{600000 + i}" for i in range(CODE_COUNT // 2)] + [f"{i:06d}" for i in range(1, CODE_COUNT - CODE_COUNT // 2 + 1)]
+REQUEST_PAYLOAD = [{"code": f"{i:06d}", "close": i * 1.01, "name": "股票"} for i in range(3000)]
+
+
+class FakeQuoteClient:
+    """模拟一次网络往返后按腾讯行情格式生成整批报价，价格字段为拉取返回时刻。"""
+
+    def fetch(self, symbols: list[str]) -> str:
+        time.sleep(QUOTE_RTT_SECONDS)
+        stamp = f"{time.perf_counter():.6f}"
+        quote_time = datetime.now().strftime("%Y%m%d%H%M%S")
+        lines = []
+        for symbol in symbols:
+            fields = [""] * 90
+            fields[1] = "名"
+            fields[2] = symbol[2:]
+            fields[3] = stamp
+            fields[4] = fields[5] = fields[85] = stamp
+            fields[6] = "1000"
+            fields[30] = quote_time
+            fields[32] = "1.0"
+            fields[37] = "100.0"
+            lines.append(f'v_{symbol}="{"~".join(fields)}";')
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        pass
+
+
+def percentile_ms(values: list[float], ratio: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))] * 1000
+
+
+async def measure() -> tuple[list[float], list[float], MACDStreamService]:
+    hub = EventHub()
+    service = MACDStreamService(hub)
+    queue = hub.subscribe()
+    tick_latency: list[float] = []
+    request_latency: list[float] = []
+
+    async def consume() -> None:
+        while True:
+            event = await queue.get()
+            if event is None:
+                return
+            # 与 SSE 路由一样逐条序列化
+            dumps_payload(event).decode()
+            if event["type"] == "tick":
+                tick_latency.append(time.perf_counter() - event["price"])
+
+    async def one_request() -> None:
+        started = time.perf_counter()
+        await asyncio.sleep(0)
+        json.dumps(REQUEST_PAYLOAD)
+        await asyncio.sleep(0)
+        request_latency.append(time.perf_counter() - started)
+
+    async def load() -> None:
+        while True:
+            asyncio.create_task(one_request())
+            await asyncio.sleep(1 / REQUESTS_PER_SECOND)
+
+    consumer = asyncio.create_task(consume())
+    await service.start(
+        CODES,
+        cadence=CADENCE_SECONDS,
+        write_files=False,
+        client_factory=FakeQuoteClient,
+        session_check=False,
+    )
+    # 首轮是冷启动，等首个 tick 到达后再开始统计并施加请求负载
+    while not tick_latency and service.running:
+        await asyncio.sleep(0.1)
+    tick_latency.clear()
+    loader = asyncio.create_task(load())
+    await asyncio.sleep(CADENCE_SECONDS * MEASURE_CYCLES)
+    await service.stop()
+    loader.cancel()
+    consumer.cancel()
+    return tick_latency, request_latency, service
+
+
+def test_tick_to_subscriber_latency_p99():
+    tick_latency, request_latency, service = asyncio.run(measure())
+    assert service.status()["error"] is None
+    assert len(tick_latency) >= CODE_COUNT * (MEASURE_CYCLES - 1)
+    p99 = percentile_ms(tick_latency, 0.99)
+    print(
+        f"\ntick→订阅者 n={len(tick_latency)} p50 {percentile_ms(tick_latency, 0.5):.1f}ms p99 {p99:.1f}ms  |  "
+        f"请求 n={len(request_latency)} p50 {percentile_ms(request_latency, 0.5):.1f}ms "
+        f"p99 {percentile_ms(request_latency, 0.99):.1f}ms"
+    )
+    assert service.status()["dropped_subscribers"] == 0
+    assert p99 < LATENCY_P99_LIMIT_MS
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+同步写库 / 股票目录的 DataFrame 行转换一致性校验与基准测试
+
+运行方式：
+    python -m pytest test_sync_row_conversion.py --benchmark-only      # 只跑基准
+    python -m pytest test_sync_row_conversion.py                       # 一致性 + 基准
+
+基准依赖 pytest-benchmark；未安装时基准用例自动跳过，一致性用例照常执行。
+"""
+
+import math
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stock"))
+
+import directory  # noqa: E402
+import frame_rows as fr  # noqa: E402
+
+try:
+    import pytest_benchmark  # noqa: F401
+except ImportError:
+    @pytest.fixture
+    def benchmark():
+        pytest.skip("未安装 pytest-benchmark")
+
+
+UPDATED_AT = "2024-01-02 15:00:00"
+
+
+# ---- 旧版逐行实现，作为行为基准 ----
+def legacy_stock_rows(stocks_df, updated_at):
+    return [(r.code, r.name, r.board, int(r.is_st), updated_at) for r in stocks_df.itertuples(index=False)]
+
+
+def legacy_daily_bar_rows(code, bars_df):
+    return [(code, r.date, r.open, r.high, r.low, r.close, r.volume) for r in bars_df.itertuples(index=False)]
+
+
+def legacy_intraday_bar_rows(intra_df):
+    epochs = (pd.to_datetime(intra_df["trade_timestamp"]) - pd.Timestamp("1970-01-01")) // pd.Timedelta(seconds=1)
+    return [
+        (int(ts), r.open, r.close, r.high, r.low, r.avg_price, r.volume, r.amount, r.change_pct, r.change_amount)
+        for ts, r in zip(epochs, intra_df.itertuples(index=False))
+    ]
+
+
+def legacy_build_record(code, name, exchange, full_name=None):
+    return {
+        "code": str(code).strip().zfill(6),
+        "name": str(name).strip(),
+        "full_name": str(full_name).strip() if full_name else None,
+        "exchange": exchange,
+    }
+
+
+def legacy_directory(frames):
+    records = []
+    for df, code_column, name_column, exchange, full_name_column in frames:
+        for _, row in df.iterrows():
+            records.append(
+                legacy_build_record(
+                    code=row[code_column],
+                    name=row[name_column],
+                    full_name=row.get(full_name_column) if full_name_column else None,
+                    exchange=exchange,
+                )
+            )
+    records_by_code, records_by_name = {}, {}
+    for record in records:
+        records_by_code[record["code"]] = record
+        for raw_name in (record.get("name"), record.get("full_name")):
+            key = directory.normalize_company_name(raw_name)
+            if key:
+                records_by_name.setdefault(key, []).append(record)
+    return records_by_code, records_by_name
+
+
+def vectorized_directory(frames):
+    records = []
+    for df, code_column, name_column, exchange, full_name_column in frames:
+        records += directory.build_directory_records(df, code_column, name_column, exchange, full_name_column)
+    return directory.index_directory_records(records)
+
+
+# ---- 合成数据 ----
+def make_stocks(n=5000, seed=7):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "code": [f"{i:06d}" for i in rng.choice(1_000_000, n, replace=False)],
+        "name": [f"股票{i}" for i in range(n)],
+        "board": rng.choice(["main", "chinext", "star", "bj"], n),
+        "is_st": rng.integers(0, 2, n),
+    })
+
+
+def make_bars(n=2500, seed=11):
+    rng = np.random.default_rng(seed)
+    close = 10 + np.cumsum(rng.normal(0, 0.2, n))
+    df = pd.DataFrame({
+        "date": pd.bdate_range("2014-01-01", periods=n).strftime("%Y-%m-%d"),
+        "open": close + rng.normal(0, 0.05, n),
+        "high": close + 0.3,
+        "low": close - 0.3,
+        "close": close,
+        "volume": rng.integers(1_000, 1_000_000, n).astype(float),
+    })
+    df.loc[5, "volume"] = np.nan
+    return df
+
+
+def make_intraday(n=1200, seed=13):
+    rng = np.random.default_rng(seed)
+    price = 10 + np.cumsum(rng.normal(0, 0.01, n))
+    timestamps = pd.date_range("2024-01-02 09:30", periods=n, freq="min")
+    return pd.DataFrame({
+        "trade_timestamp": timestamps.strftime("%Y-%m-%d %H:%M:%S"),
+        "open": price, "close": price, "high": price + 0.01, "low": price - 0.01,
+        "avg_price": price, "volume": rng.integers(100, 10_000, n).astype(float),
+        "amount": price * 1000, "change_pct": rng.normal(0, 1, n), "change_amount": rng.normal(0, 0.1, n),
+    })
+
+
+def make_directory_frames(n=2000):
+    sh = pd.DataFrame({
+        "证券代码": [str(600000 + i) for i in range(n)],
+        "证券简称": [f" 沪股{i} " for i in range(n)],
+        "公司全称": [f"上海　第{i}股份有限公司" if i % 3 else "" for i in range(n)],
+    })
+    sz = pd.DataFrame({
+        "A股代码": [str(i + 1) for i in range(n)],
+        "A股简称": [f"深Ａ{i}" for i in range(n)],
+    })
+    bj = pd.DataFrame({
+        "证券代码": [str(830000 + i) for i in range(n // 4)],
+        "证券简称": [f"北证 {i}" for i in range(n // 4)],
+    })
+    return [
+        (sh, "证券代码", "证券简称", "SH", "公司全称"),
+        (sz, "A股代码", "A股简称", "SZ", None),
+        (bj, "证券代码", "证券简称", "BJ", None),
+    ]
+
+
+def _same_rows(left, right):
+    assert len(left) == len(right)
+    for a, b in zip(left, right):
+        assert len(a) == len(b)
+        for x, y in zip(a, b):
+            if isinstance(x, float) and math.isnan(x):
+                assert isinstance(y, float) and math.isnan(y)
+            else:
+                assert x == y
+
+
+def test_stock_rows_match_legacy():
+    stocks = make_stocks(500)
+    rows = fr.stock_rows(stocks, UPDATED_AT)
+    _same_rows(rows, legacy_stock_rows(stocks, UPDATED_AT))
+    # sqlite3 只接受 Python 原生类型
+    assert all(type(row[3]) is int for row in rows)
+
+
+def test_daily_bar_rows_match_legacy():
+    bars = make_bars(300)
+    _same_rows(fr.daily_bar_rows("600000", bars), legacy_daily_bar_rows("600000", bars))
+
+
+def test_intraday_bar_rows_match_legacy():
+    intra = make_intraday(240)
+    rows = fr.intraday_bar_rows(intra)
+    _same_rows(rows, legacy_intraday_bar_rows(intra))
+    assert all(type(row[0]) is int for row in rows)
+
+
+def test_directory_records_match_legacy():
+    frames = make_directory_frames(300)
+    assert vectorized_directory(frames) == legacy_directory(frames)
+
+
+def test_normalize_company_names_matches_scalar():
+    values = pd.Series(["  平安银行 ", "ＡＢＣ　科技", None, "", "a b\tc"], dtype=object)
+    expected = [directory.normalize_company_name(value) for value in values]
+    assert directory.normalize_company_names(values).tolist() == expected
+
+
+def test_bench_stock_rows_legacy(benchmark):
+    stocks = make_stocks()
+    benchmark(legacy_stock_rows, stocks, UPDATED_AT)
+
+
+def test_bench_stock_rows_columnar(benchmark):
+    stocks = make_stocks()
+    benchmark(fr.stock_rows, stocks, UPDATED_AT)
+
+
+def test_bench_daily_bar_rows_legacy(benchmark):
+    bars = make_bars()
+    benchmark(legacy_daily_bar_rows, "600000", bars)
+
+
+def test_bench_daily_bar_rows_columnar(benchmark):
+    bars = make_bars()
+    benchmark(fr.daily_bar_rows, "600000", bars)
+
+
+def test_bench_intraday_bar_rows_legacy(benchmark):
+    intra = make_intraday()
+    benchmark(legacy_intraday_bar_rows, intra)
+
+
+def test_bench_intraday_bar_rows_columnar(benchmark):
+    intra = make_intraday()
+    benchmark(fr.intraday_bar_rows, intra)
+
+
+def test_bench_directory_legacy(benchmark):
+    frames = make_directory_frames()
+    benchmark(legacy_directory, frames)
+
+
+def test_bench_directory_columnar(benchmark):
+    frames = make_directory_frames()
+    benchmark(vectorized_directory, frames)
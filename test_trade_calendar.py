@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+交易日历的查询与加载校验：向前数交易日、前后交易日、日历过期时的工作日补齐，以及 Web 侧只读加载
+
+运行方式：
+    python -m pytest test_trade_calendar.py
+"""
+
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import pytest
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "stock"))
+
+import trade_calendar as tc  # noqa: E402
+
+# 2024 年春节前后：2 月 9 日（周五）至 2 月 17 日休市
+DATES = [
+    "2024-02-05", "2024-02-06", "2024-02-07", "2024-02-08",
+    "2024-02-19", "2024-02-20", "2024-02-21",
+]
+
+
+@pytest.fixture(autouse=True)
+def offline(monkeypatch):
+    """默认不联网、不读仓库自带的日历文件，需要时在用例里单独替换。"""
+    monkeypatch.setattr(tc, "fetch_trade_dates", lambda: [])
+    monkeypatch.setattr(tc, "read_bundled_trade_dates", lambda: [])
+    tc._calendar_cache.clear()
+    yield
+    tc._calendar_cache.clear()
+
+
+def stored_calendar_db(path, dates):
+    conn = sqlite3.connect(str(path))
+    tc.save_trade_dates(conn, dates)
+    conn.close()
+
+
+def test_trading_days_back_counts_only_trading_days():
+    calendar = tc.TradeCalendar(DATES)
+    assert calendar.trading_days_back("2024-02-20", 1) == "2024-02-20"
+    assert calendar.trading_days_back("2024-02-20", 3) == "2024-02-08"
+    # 非交易日从之前最近的交易日开始数
+    assert calendar.trading_days_back("2024-02-12", 2) == "2024-02-07"
+    # 日历不够长时返回最早的交易日，早于日历时没有结果
+    assert calendar.trading_days_back("2024-02-21", 100) == "2024-02-05"
+    assert calendar.trading_days_back("2024-02-01", 1) is None
+
+
+def test_prev_and_next_trading_day_skip_holidays():
+    calendar = tc.TradeCalendar(DATES)
+    assert calendar.next_trading_day("2024-02-08") == "2024-02-19"
+    assert calendar.next_trading_day("2024-02-10") == "2024-02-19"
+    assert calendar.prev_trading_day("2024-02-19") == "2024-02-08"
+    assert calendar.prev_trading_day("2024-02-14") == "2024-02-08"
+    assert calendar.prev_trading_day("2024-02-06") == "2024-02-05"
+    assert calendar.next_trading_day("2024-02-21") is None
+    assert calendar.prev_trading_day("2024-02-05") is None
+
+
+def test_stale_calendar_is_filled_with_weekdays():
+    conn = sqlite3.connect(":memory:")
+    tc.save_trade_dates(conn, DATES)
+
+    calendar = tc.TradeCalendar.load(conn, today="2024-03-04")
+
+    assert not calendar.exact
+    # 已知日期保持原样（节假日仍是非交易日）
+    assert not calendar.is_trading_day("2024-02-12")
+    # 之后按工作日补齐到今天之后一年
+    assert calendar.trading_days("2024-02-22", "2024-03-04") == [
+        "2024-02-22", "2024-02-23", "2024-02-26", "2024-02-27", "2024-02-28",
+        "2024-02-29", "2024-03-01", "2024-03-04",
+    ]
+    assert calendar.dates[-1] >= "2025-03-01"
+    assert all(datetime.strptime(value, "%Y-%m-%d").weekday() < 5 for value in calendar.dates)
+    # 补齐的日期只在内存里，不写回库
+    assert tc.load_trade_dates(conn) == DATES
+
+
+def test_refresh_saves_newer_dates(monkeypatch):
+    conn = sqlite3.connect(":memory:")
+    tc.save_trade_dates(conn, DATES[:4])
+    monkeypatch.setattr(tc, "fetch_trade_dates", lambda: DATES)
+
+    calendar = tc.TradeCalendar.load(conn, today="2024-02-20")
+
+    assert calendar.exact
+    assert calendar.dates == DATES
+    assert tc.load_trade_dates(conn) == DATES
+
+
+def test_read_only_calendar_never_fetches_or_writes(tmp_path, monkeypatch):
+    db_path = tmp_path / "stock.db"
+    stored_calendar_db(db_path, DATES[:4])
+
+    def no_network():
+        raise AssertionError("只读日历不应联网")
+
+    monkeypatch.setattr(tc, "fetch_trade_dates", no_network)
+    monkeypatch.setattr(tc, "read_bundled_trade_dates", lambda: DATES)
+    modified = db_path.stat().st_mtime_ns
+
+    calendar = tc.get_trade_calendar(db_path, read_only=True)
+
+    # 随仓库的日历文件照样合并进来，其后按工作日补齐
+    assert calendar.is_trading_day("2024-02-19")
+    assert not calendar.exact
+    assert db_path.stat().st_mtime_ns == modified
+    conn = sqlite3.connect(str(db_path))
+    assert tc.load_trade_dates(conn) == DATES[:4]
+    conn.close()
+
+    # 库不存在时也不会创建
+    missing = tmp_path / "missing" / "stock.db"
+    assert tc.get_trade_calendar(missing, read_only=True).dates
+    assert not missing.parent.exists()
+
+
+def test_read_only_reuses_refreshed_calendar_but_not_the_reverse(tmp_path):
+    db_path = tmp_path / "stock.db"
+    stored_calendar_db(db_path, DATES)
+
+    read_only = tc.get_trade_calendar(db_path, read_only=True)
+    refreshed = tc.get_trade_calendar(db_path)
+    assert refreshed is not read_only
+    assert tc.get_trade_calendar(db_path, read_only=True) is refreshed
@@ -0,0 +1,582 @@
+# -*- coding: utf-8 -*-
+
+# financeKG_spider/tyc/keyword_queue.py
+# Description: 天眼查关键词的持久化队列与搜索工作线程池
+#              - 上传接口直接把关键词写入 spider_progress.db 的 keyword_queue 表（按关键词去重）
+#              - 已完成关键词以 status='done' 记录在同一张表里，代替逐次读取 .finished.txt
+#              - 工作线程被入队事件立即唤醒，多个线程并行调用 search_companies
+#              - 手工拷进关键词目录的文件仍会被低频扫描入队
+#              - keyword_counters 表由触发器维护各状态数量和版本号，统计接口只读这几行
+
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+# back to main directory
+cur_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(cur_dir)
+
+from base_spider import logger
+
+DB_FILE = os.path.join(cur_dir, "data", "spider_progress.db")
+
+KEYWORD_WORKERS = 2              # 默认搜索线程数，可由 spider.cfg 的 TYCSpider.keyword_workers 覆盖
+KEYWORD_MAX_ATTEMPTS = 3         # 单个关键词最多尝试次数
+KEYWORD_RETRY_DELAY_SECONDS = 30 # 搜索失败后该线程暂停的时间，避免请求头失效时连续烧掉重试次数
+KEYWORD_IDLE_POLL_SECONDS = 5    # 没有入队通知时的轮询间隔（其他进程写入的关键词靠它发现）
+KEYWORD_DIR_SCAN_SECONDS = 60    # 关键词目录的兜底扫描间隔
+KEYWORD_LEASE_SECONDS = 120      # 领取租约时长；搜索中的关键词由心跳线程每 1/3 租期续约一次
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+KEYWORD_STATUSES = (STATUS_PENDING, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED)
+COUNTER_FILES = "files"
+COUNTER_VERSION = "version"  # 队列或文件登记有任何变化都加一，用作统计接口的 ETag
+
+# 触发器保证任何写入路径（包括其他进程）都会同步更新计数
+COUNTER_TRIGGERS = [
+    '''
+    CREATE TRIGGER IF NOT EXISTS keyword_queue_counter_insert AFTER INSERT ON keyword_queue
+    BEGIN
+        UPDATE keyword_counters SET value = value + 1 WHERE name IN (NEW.status, 'version');
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS keyword_queue_counter_update AFTER UPDATE OF status ON keyword_queue
+    WHEN OLD.status != NEW.status
+    BEGIN
+        UPDATE keyword_counters SET value = value - 1 WHERE name = OLD.status;
+        UPDATE keyword_counters SET value = value + 1 WHERE name IN (NEW.status, 'version');
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS keyword_queue_counter_delete AFTER DELETE ON keyword_queue
+    BEGIN
+        UPDATE keyword_counters SET value = value - 1 WHERE name = OLD.status;
+        UPDATE keyword_counters SET value = value + 1 WHERE name = 'version';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS keyword_files_counter_insert AFTER INSERT ON keyword_files
+    BEGIN
+        UPDATE keyword_counters SET value = value + 1 WHERE name IN ('files', 'version');
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS keyword_files_counter_update AFTER UPDATE ON keyword_files
+    BEGIN
+        UPDATE keyword_counters SET value = value + 1 WHERE name = 'version';
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS keyword_files_counter_delete AFTER DELETE ON keyword_files
+    BEGIN
+        UPDATE keyword_counters SET value = value - 1 WHERE name = 'files';
+        UPDATE keyword_counters SET value = value + 1 WHERE name = 'version';
+    END
+    ''',
+]
+
+
+def now_str():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def read_keywords(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class KeywordQueue:
+    """基于 SQLite 的关键词队列，进程内用条件变量唤醒工作线程，跨进程依靠事务保证同一关键词只被领取一次。"""
+
+    def __init__(self, db_file=DB_FILE):
+        self.db_file = db_file
+        self.logger = logger.bind(spider="KeywordQueue")
+        self._cond = threading.Condition()
+        self._init_db()
+
+    @staticmethod
+    def owner():
+        # 按调用时的 pid 计算：uvicorn 多 worker 由同一父进程 fork，模块级实例在各 worker 中共享创建时的状态
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout = 10000")
+        return conn
+
+    def _init_db(self):
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS keyword_queue (
+                    keyword TEXT PRIMARY KEY,
+                    source_file TEXT,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    enqueued_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    error TEXT,
+                    lease_owner TEXT,
+                    lease_expires REAL
+                )
+            ''')
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(keyword_queue)").fetchall()}
+            for column, column_type in (("lease_owner", "TEXT"), ("lease_expires", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE keyword_queue ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_keyword_queue_status ON keyword_queue(status, enqueued_at)")
+            # 已登记的关键词文件，目录扫描时跳过
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS keyword_files (
+                    filename TEXT PRIMARY KEY,
+                    keyword_count INTEGER NOT NULL,
+                    added_count INTEGER NOT NULL,
+                    uploaded_at TEXT NOT NULL
+                )
+            ''')
+            # 文件与关键词的包含关系：关键词按首个上传文件去重入队，注销文件时据此判断关键词是否还属于其他文件
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS keyword_file_members (
+                    filename TEXT NOT NULL,
+                    keyword TEXT NOT NULL,
+                    PRIMARY KEY (filename, keyword)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_keyword_file_members_keyword ON keyword_file_members(keyword)")
+            self._init_counters(conn)
+        finally:
+            conn.close()
+
+    def _init_counters(self, conn):
+        '''
+        keyword_counters 由触发器随 keyword_queue / keyword_files 的增删改同步更新；
+        表第一次创建时按现有数据初始化一次
+        '''
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS keyword_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            if conn.execute("SELECT 1 FROM keyword_counters WHERE name = ?", (COUNTER_VERSION,)).fetchone() is None:
+                counts = dict(conn.execute("SELECT status, COUNT(*) FROM keyword_queue GROUP BY status").fetchall())
+                rows = [(status, counts.get(status, 0)) for status in KEYWORD_STATUSES]
+                rows.append((COUNTER_FILES, conn.execute("SELECT COUNT(*) FROM keyword_files").fetchone()[0]))
+                rows.append((COUNTER_VERSION, 1))
+                conn.executemany("INSERT OR REPLACE INTO keyword_counters (name, value) VALUES (?, ?)", rows)
+            for statement in COUNTER_TRIGGERS:
+                conn.execute(statement)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    ## ** 入队 ** ##
+    def enqueue(self, keywords, source_file=None):
+        '''
+        批量入队，返回新增数量；已完成或已在队列中的关键词被忽略，之前失败的关键词重新排队
+        '''
+        time_str = now_str()
+        rows = [(kw, source_file, STATUS_PENDING, time_str) for kw in dict.fromkeys(k.strip() for k in keywords) if kw]
+        if not rows:
+            return 0
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            added = conn.executemany('''
+                INSERT INTO keyword_queue (keyword, source_file, status, enqueued_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(keyword) DO UPDATE SET
+                    status = excluded.status, attempts = 0, enqueued_at = excluded.enqueued_at, error = NULL
+                WHERE keyword_queue.status = 'failed'
+            ''', rows).rowcount
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        if added:
+            with self._cond:
+                self._cond.notify_all()
+        return added
+
+    def enqueue_file(self, path, keywords=None):
+        '''
+        登记并入队一个关键词文件，返回 (文件内关键词数, 新增入队数)
+        '''
+        if keywords is None:
+            keywords = read_keywords(path)
+        filename = os.path.basename(path)
+        added = self.enqueue(keywords, source_file=filename)
+        members = [(filename, kw) for kw in dict.fromkeys(k.strip() for k in keywords) if kw]
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute('''
+                INSERT INTO keyword_files (filename, keyword_count, added_count, uploaded_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(filename) DO UPDATE SET
+                    keyword_count = excluded.keyword_count,
+                    added_count = excluded.added_count,
+                    uploaded_at = excluded.uploaded_at
+            ''', (filename, len(keywords), added, now_str()))
+            # 同名文件重新上传时以新内容为准
+            conn.execute("DELETE FROM keyword_file_members WHERE filename = ?", (filename,))
+            conn.executemany("INSERT INTO keyword_file_members (filename, keyword) VALUES (?, ?)", members)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        self.logger.info(f"关键词文件 {filename} 入队: 共 {len(keywords)} 个，新增 {added} 个")
+        return len(keywords), added
+
+    def registered_files(self):
+        conn = self._connect()
+        try:
+            return {row[0] for row in conn.execute("SELECT filename FROM keyword_files")}
+        finally:
+            conn.close()
+
+    def list_files(self):
+        conn = self._connect()
+        try:
+            return [row[0] for row in conn.execute("SELECT filename FROM keyword_files ORDER BY uploaded_at, filename")]
+        finally:
+            conn.close()
+
+    def forget_file(self, filename):
+        '''
+        注销关键词文件，并撤下只属于该文件、尚未开始搜索的关键词；其他已登记文件也包含的关键词保留，
+        来源改记为其中一个文件；已完成的记录保留
+        '''
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            keywords = [(row[0],) for row in conn.execute(
+                "SELECT keyword FROM keyword_file_members WHERE filename = ?", (filename,)
+            )]
+            conn.execute("DELETE FROM keyword_files WHERE filename = ?", (filename,))
+            conn.execute("DELETE FROM keyword_file_members WHERE filename = ?", (filename,))
+            removed = conn.executemany(
+                '''
+                DELETE FROM keyword_queue
+                WHERE keyword = ? AND status = 'pending'
+                  AND NOT EXISTS (SELECT 1 FROM keyword_file_members m WHERE m.keyword = keyword_queue.keyword)
+                ''',
+                keywords,
+            ).rowcount
+            conn.execute(
+                '''
+                UPDATE keyword_queue
+                SET source_file = (SELECT MIN(m.filename) FROM keyword_file_members m WHERE m.keyword = keyword_queue.keyword)
+                WHERE source_file = ?
+                ''',
+                (filename,),
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return removed
+
+    def import_finished_file(self, finished_file):
+        '''
+        把旧版 .finished.txt 中的关键词登记为已完成（只插入表中没有的）
+        '''
+        if not finished_file or not os.path.exists(finished_file):
+            return 0
+        time_str = now_str()
+        rows = [(kw, STATUS_DONE, time_str, time_str) for kw in read_keywords(finished_file)]
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            imported = conn.executemany('''
+                INSERT OR IGNORE INTO keyword_queue (keyword, status, enqueued_at, finished_at) VALUES (?, ?, ?, ?)
+            ''', rows).rowcount
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return imported
+
+    ## ** 领取与完成 ** ##
+    def claim(self):
+        '''
+        领取最早入队的待处理关键词并标记为 running，同时记下本进程的租约；没有则返回 None
+        '''
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT keyword FROM keyword_queue WHERE status = ? ORDER BY enqueued_at, rowid LIMIT 1",
+                (STATUS_PENDING,),
+            ).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None
+            conn.execute(
+                '''
+                UPDATE keyword_queue SET status = ?, started_at = ?, attempts = attempts + 1, lease_owner = ?, lease_expires = ?
+                WHERE keyword = ?
+                ''',
+                (STATUS_RUNNING, now_str(), self.owner(), time.time() + KEYWORD_LEASE_SECONDS, row[0]),
+            )
+            conn.execute("COMMIT")
+            return row[0]
+        finally:
+            conn.close()
+
+    def wait_for_work(self, timeout=KEYWORD_IDLE_POLL_SECONDS):
+        with self._cond:
+            self._cond.wait(timeout)
+
+    def complete(self, keyword):
+        self._set_status(keyword, STATUS_DONE, finished_at=now_str(), error=None)
+
+    def fail(self, keyword, error, max_attempts=KEYWORD_MAX_ATTEMPTS):
+        '''
+        记录失败；未达到最大尝试次数时重新排到队尾
+        '''
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT attempts FROM keyword_queue WHERE keyword = ?", (keyword,)).fetchone()
+        finally:
+            conn.close()
+        attempts = row[0] if row else max_attempts
+        if attempts < max_attempts:
+            self._set_status(keyword, STATUS_PENDING, enqueued_at=now_str(), error=str(error))
+        else:
+            self._set_status(keyword, STATUS_FAILED, finished_at=now_str(), error=str(error))
+
+    def release(self, keyword):
+        '''
+        放回队列且不计入尝试次数（请求头失效等与关键词本身无关的失败）
+        '''
+        conn = self._connect()
+        try:
+            conn.execute(
+                '''
+                UPDATE keyword_queue SET status = ?, attempts = MAX(attempts - 1, 0), lease_owner = NULL, lease_expires = NULL
+                WHERE keyword = ?
+                ''',
+                (STATUS_PENDING, keyword),
+            )
+        finally:
+            conn.close()
+
+    def _set_status(self, keyword, status, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._connect()
+        try:
+            conn.execute(
+                f"UPDATE keyword_queue SET status = ?, {assignments}, lease_owner = NULL, lease_expires = NULL WHERE keyword = ?",
+                (status, *fields.values(), keyword),
+            )
+        finally:
+            conn.close()
+
+    def renew_leases(self):
+        '''
+        为本进程正在搜索的关键词续约
+        '''
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "UPDATE keyword_queue SET lease_expires = ? WHERE status = ? AND lease_owner = ?",
+                (time.time() + KEYWORD_LEASE_SECONDS, STATUS_RUNNING, self.owner()),
+            ).rowcount
+        finally:
+            conn.close()
+
+    def recover_expired(self):
+        '''
+        把租约已过期（领取它的进程已退出或卡死）的 running 关键词放回队列，中断的那次不计入尝试次数；
+        其他存活进程正在搜索的关键词租约有效，不受影响
+        '''
+        conn = self._connect()
+        try:
+            recovered = conn.execute(
+                '''
+                UPDATE keyword_queue
+                SET status = ?, attempts = MAX(attempts - 1, 0), lease_owner = NULL, lease_expires = NULL
+                WHERE status = ? AND (lease_expires IS NULL OR lease_expires < ?)
+                ''',
+                (STATUS_PENDING, STATUS_RUNNING, time.time()),
+            ).rowcount
+        finally:
+            conn.close()
+        if recovered:
+            with self._cond:
+                self._cond.notify_all()
+        return recovered
+
+    def is_finished(self, keyword):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT status FROM keyword_queue WHERE keyword = ?", (keyword,)).fetchone()
+        finally:
+            conn.close()
+        return bool(row) and row[0] == STATUS_DONE
+
+    def status_counts(self):
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM keyword_queue GROUP BY status").fetchall())
+        finally:
+            conn.close()
+
+    def stats(self):
+        '''
+        读取计数表（固定几行，与关键词和文件数量无关）
+        '''
+        conn = self._connect()
+        try:
+            counters = dict(conn.execute("SELECT name, value FROM keyword_counters").fetchall())
+        finally:
+            conn.close()
+        result = {status: counters.get(status, 0) for status in KEYWORD_STATUSES}
+        return {
+            "total": sum(result.values()),
+            "finished": result[STATUS_DONE],
+            **result,
+            "files": counters.get(COUNTER_FILES, 0),
+            "version": counters.get(COUNTER_VERSION, 0),
+        }
+
+    def version(self):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM keyword_counters WHERE name = ?", (COUNTER_VERSION,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+
+
+class KeywordWorkerPool:
+    """若干搜索线程，每个线程持有独立的 TYCSpider（requests.Session 不跨线程共享）。"""
+
+    def __init__(self, keyword_queue, spider_factory, workers=KEYWORD_WORKERS, finished_file=None):
+        self.keyword_queue = keyword_queue
+        self.spider_factory = spider_factory
+        self.workers = max(1, int(workers))
+        self.finished_file = finished_file
+        self.threads = []
+        self._file_lock = threading.Lock()
+
+    def start(self):
+        recovered = self.keyword_queue.recover_expired()
+        if recovered:
+            logger.info(f"恢复 {recovered} 个中断的关键词")
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"tyc-keyword-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        threading.Thread(target=self._heartbeat, name="tyc-keyword-lease", daemon=True).start()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(KEYWORD_LEASE_SECONDS / 3)
+            try:
+                self.keyword_queue.renew_leases()
+            except Exception:
+                logger.exception("关键词租约续约失败")
+
+    def _append_finished(self, keyword):
+        # 保留旧版 .finished.txt 的追加写入，供仍在读取该文件的工具使用
+        if not self.finished_file:
+            return
+        with self._file_lock:
+            with open(self.finished_file, 'a', encoding='utf-8') as ff:
+                ff.write(keyword + '\n')
+
+    def _run(self):
+        spider = self.spider_factory()
+        while True:
+            if not getattr(spider, "headers_is_valid", True):
+                # 请求头失效需要人工更新配置并重启，期间不再领取关键词
+                time.sleep(KEYWORD_RETRY_DELAY_SECONDS)
+                continue
+            keyword = self.keyword_queue.claim()
+            if keyword is None:
+                self.keyword_queue.wait_for_work()
+                continue
+            try:
+                spider.search_companies(keyword, max_page=2, save_to_file=True)
+            except Exception as e:
+                spider.logger.exception(f"关键词搜索失败: {keyword}")
+                if getattr(spider, "headers_is_valid", True):
+                    self.keyword_queue.fail(keyword, e)
+                else:
+                    self.keyword_queue.release(keyword)
+                time.sleep(KEYWORD_RETRY_DELAY_SECONDS)
+                continue
+            self.keyword_queue.complete(keyword)
+            self._append_finished(keyword)
+
+
+def scan_keyword_dir(keyword_queue, kw_dir, finished_file=None):
+    '''
+    把目录中尚未登记的关键词文件入队（兼容手工拷入目录的文件），返回新登记的文件数
+    '''
+    registered = keyword_queue.registered_files()
+    finished_name = os.path.basename(finished_file) if finished_file else None
+    count = 0
+    for fn in os.listdir(kw_dir):
+        if fn.startswith('.') or fn == finished_name or fn in registered:
+            continue
+        path = os.path.join(kw_dir, fn)
+        if not os.path.isfile(path):
+            continue
+        try:
+            keyword_queue.enqueue_file(path)
+            count += 1
+        except Exception:
+            logger.exception(f"读取关键词文件失败: {path}")
+    return count
+
+
+def keyword_paths(s_cfg):
+    '''
+    由 TYCSpider 配置得到 (关键词目录, 旧版已完成文件) 的绝对路径
+    '''
+    kw_dir = os.path.abspath(os.path.join(cur_dir, s_cfg.get("keywords_direc", "./data/tyc_keywords/")))
+    finished_file = s_cfg.get("keywords_finised_fn", os.path.join(kw_dir, "keywords_finished.txt"))
+    if not os.path.isabs(finished_file):
+        finished_file = os.path.abspath(os.path.join(cur_dir, finished_file))
+    return kw_dir, finished_file
+
+
+def start_keyword_pipeline(spider_factory, s_cfg):
+    '''
+    启动关键词流水线：导入旧版已完成文件、启动搜索线程池，并低频扫描关键词目录
+    '''
+    kw_dir, finished_file = keyword_paths(s_cfg)
+    os.makedirs(kw_dir, exist_ok=True)
+
+    imported = keyword_queue.import_finished_file(finished_file)
+    if imported:
+        logger.info(f"从 {finished_file} 导入 {imported} 个已完成关键词")
+
+    pool = KeywordWorkerPool(keyword_queue, spider_factory, workers=s_cfg.get("keyword_workers", KEYWORD_WORKERS), finished_file=finished_file)
+    pool.start()
+
+    def _scan_loop():
+        while True:
+            try:
+                scan_keyword_dir(keyword_queue, kw_dir, finished_file)
+                # 其他进程异常退出留下的关键词，租约过期后由仍在运行的进程接手
+                recovered = keyword_queue.recover_expired()
+                if recovered:
+                    logger.info(f"接手 {recovered} 个租约过期的关键词")
+            except Exception:
+                logger.exception(f"扫描关键词目录失败: {kw_dir}")
+            time.sleep(KEYWORD_DIR_SCAN_SECONDS)
+
+    threading.Thread(target=_scan_loop, name="tyc-keyword-scan", daemon=True).start()
+    return pool
+
+
+# 进程内共享的队列实例：上传接口入队后直接唤醒本进程的工作线程
+keyword_queue = KeywordQueue()
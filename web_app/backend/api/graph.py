@@ -1,6 +1,7 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
 
-from ..services.graph_service import get_company_graph, get_example_companies, search_companies
+from ..encoding import FastJSONResponse, ndjson_response
+from ..services.graph_service import get_company_graph, get_example_companies, iter_company_graph_chunks, search_companies
 
 router = APIRouter()
 
@@ -11,8 +12,14 @@ def search_graph_companies(keyword: str):
 
 
 @router.get("/company/{company_id}/graph")
-def get_company_graph_view(company_id: str, hops: int = 2):
-    return get_company_graph(company_id=company_id, hops=hops)
+def get_company_graph_view(
+    company_id: str,
+    hops: int = 2,
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
+    if response_format == "ndjson":
+        return ndjson_response(iter_company_graph_chunks(company_id=company_id, hops=hops))
+    return FastJSONResponse(get_company_graph(company_id=company_id, hops=hops))
 
 
 @router.get("/examples")
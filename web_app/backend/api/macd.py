@@ -0,0 +1,136 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from ..services.macd_push_service import macd_event_hub, macd_stream_service
+from stock.macd_stream import FETCH_CONCURRENCY, STREAM_CADENCE_SECONDS, normalize_code
+from stock.payload_cache import dumps_payload
+
+router = APIRouter()
+
+# 空闲时发送心跳，防止代理断开长连接
+HEARTBEAT_SECONDS = 15.0
+
+
+class MonitorStartRequest(BaseModel):
+    stocks: list[str] = []
+    allowed_boards: bool = False
+    cadence: float = STREAM_CADENCE_SECONDS
+    concurrency: int = FETCH_CONCURRENCY
+    write_files: bool = True
+
+
+def _parse_codes(codes: Optional[str]) -> Optional[set[str]]:
+    if not codes:
+        return None
+    return {normalize_code(code.strip()) for code in codes.split(",") if code.strip()}
+
+
+def _parse_since(since: Optional[int], last_event_id: Optional[str]) -> Optional[int]:
+    if since is not None:
+        return since
+    if last_event_id and last_event_id.isdigit():
+        return int(last_event_id)
+    return None
+
+
+def _filter_snapshot(codes: Optional[set[str]]) -> dict:
+    snapshot = macd_event_hub.snapshot()
+    if codes is not None:
+        snapshot["states"] = [state for state in snapshot["states"] if state["code"] in codes]
+    return snapshot
+
+
+@router.post("/monitor/start")
+async def start_monitor(request: MonitorStartRequest):
+    try:
+        return await macd_stream_service.start(
+            request.stocks,
+            allowed_boards=request.allowed_boards,
+            cadence=request.cadence,
+            concurrency=request.concurrency,
+            write_files=request.write_files,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.post("/monitor/stop")
+async def stop_monitor():
+    return await macd_stream_service.stop()
+
+
+@router.get("/monitor/status")
+async def monitor_status():
+    return macd_stream_service.status()
+
+
+@router.get("/states")
+async def get_states(codes: Optional[str] = Query(None)):
+    return _filter_snapshot(_parse_codes(codes))
+
+
+@router.get("/stream")
+async def stream_events(
+    request: Request,
+    codes: Optional[str] = Query(None),
+    since: Optional[int] = Query(None),
+):
+    """Server-Sent Events 推送；断线重连时浏览器带 Last-Event-ID，从环形缓冲补齐。"""
+    code_filter = _parse_codes(codes)
+    queue = macd_event_hub.subscribe(_parse_since(since, request.headers.get("last-event-id")))
+
+    async def event_source():
+        try:
+            if since is None and not request.headers.get("last-event-id"):
+                yield f"event: snapshot\ndata: {dumps_payload(_filter_snapshot(code_filter)).decode()}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    # 消费过慢被踢出，浏览器会带 Last-Event-ID 自动重连
+                    return
+                if code_filter is not None and event["code"] not in code_filter:
+                    continue
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {dumps_payload(event).decode()}\n\n"
+        finally:
+            macd_event_hub.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/ws")
+async def websocket_events(
+    websocket: WebSocket,
+    codes: Optional[str] = Query(None),
+    since: Optional[int] = Query(None),
+):
+    """WebSocket 推送；未带 since 时先发送最新状态快照。"""
+    await websocket.accept()
+    code_filter = _parse_codes(codes)
+    queue = macd_event_hub.subscribe(since)
+    try:
+        if since is None:
+            await websocket.send_text(dumps_payload({"type": "snapshot", **_filter_snapshot(code_filter)}).decode())
+        while True:
+            event = await queue.get()
+            if event is None:
+                await websocket.close(code=1013, reason="client too slow")
+                return
+            if code_filter is not None and event["code"] not in code_filter:
+                continue
+            await websocket.send_text(dumps_payload(event).decode())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        macd_event_hub.unsubscribe(queue)
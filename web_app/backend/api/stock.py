@@ -1,9 +1,12 @@
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
 
+from ..encoding import FastJSONResponse
 from ..services.stock_service import (
-    get_stock_detail_payload,
+    get_stock_detail_json,
     get_stock_graph_payload,
     get_stock_lookup_payload,
+    get_stock_search_payload,
 )
 
 router = APIRouter()
@@ -20,6 +23,10 @@ def _run_stock_operation(operation, *args, **kwargs):
         raise HTTPException(status_code=500, detail=f"股票服务执行失败: {exc}") from exc
 
 
+def _server_timing(timings):
+    return ", ".join(f"{name};dur={duration:.1f}" for name, duration in timings.items())
+
+
 @router.get("/lookup")
 def lookup_stock(
     query_type: str = Query(..., pattern="^(code|name)$"),
@@ -28,17 +35,27 @@ def lookup_stock(
     return _run_stock_operation(get_stock_lookup_payload, query_type, keyword)
 
 
+@router.get("/search")
+def search_stock(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+):
+    return _run_stock_operation(get_stock_search_payload, q, limit)
+
+
 @router.get("/graph")
 def get_stock_graph(
     query_type: str = Query(..., pattern="^(code|name)$"),
     keyword: str = Query(..., min_length=1),
 ):
-    return _run_stock_operation(get_stock_graph_payload, query_type, keyword)
+    return FastJSONResponse(_run_stock_operation(get_stock_graph_payload, query_type, keyword))
 
 
 @router.get("/detail")
 def get_stock_detail(
     query_type: str = Query(..., pattern="^(code|name)$"),
     keyword: str = Query(..., min_length=1),
+    layout: str = Query("rows", pattern="^(rows|columnar)$"),
 ):
-    return _run_stock_operation(get_stock_detail_payload, query_type, keyword)
\ No newline at end of file
+    body, timings = _run_stock_operation(get_stock_detail_json, query_type, keyword, layout)
+    return Response(content=body, media_type="application/json", headers={"Server-Timing": _server_timing(timings)})
\ No newline at end of file
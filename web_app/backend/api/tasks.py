@@ -1,4 +1,5 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import os
@@ -31,8 +32,10 @@ async def upload_keywords(file: UploadFile = File(...)):
         contents = await file.read()
         with open(dest, 'wb') as f:
             f.write(contents)
-        # return count
+        # 写入关键词队列（SQLite 写在线程池中执行），后台搜索线程被立即唤醒
+        from tyc.keyword_queue import keyword_queue
         lines = [ln.strip() for ln in contents.decode('utf-8').split('\n') if ln.strip()]
-        return UploadResponse(success=True, message=f"成功上传 {len(lines)} 个关键词")
+        keywords_cnt, added_cnt = await run_in_threadpool(keyword_queue.enqueue_file, dest, lines)
+        return UploadResponse(success=True, message=f"成功上传 {keywords_cnt} 个关键词，新增待搜索 {added_cnt} 个")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,9 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from typing import List
-import os, sqlite3, json
+import asyncio, os, sqlite3, json, time
+
+from tyc.keyword_queue import keyword_queue
 
 router = APIRouter(prefix="/api/tyc", tags=["tyc"])
 
+# 长轮询：客户端带 If-None-Match 和 wait 参数时，计数版本不变就挂起，最多等待 KEYWORD_STATS_MAX_WAIT 秒后返回 304
+KEYWORD_STATS_MAX_WAIT = 60
+# 挂起期间重新读取版本号的间隔（其他进程的写入没有进程内通知，只能轮询计数表的一行）
+KEYWORD_STATS_POLL_SECONDS = 1.0
+
 # helper to locate keyword directory and finished file
 
 def _get_paths():
@@ -41,35 +49,47 @@ def _get_paths():
     return direc, finished_fn
 
 
+def _keywords_etag(version):
+    return f'"kw-{version}"'
+
+
+async def _changed_keyword_stats(request: Request, wait: float):
+    """返回最新计数；客户端的 ETag 仍是最新且等到超时都没有变化时返回 None。
+    读计数表是阻塞的 SQLite 调用（可能等其他进程的写锁），放到线程池里，不占用事件循环"""
+    deadline = time.monotonic() + wait
+    stats = await run_in_threadpool(keyword_queue.stats)
+    client_etag = request.headers.get('if-none-match')
+    while client_etag == _keywords_etag(stats["version"]):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or await request.is_disconnected():
+            return None
+        await asyncio.sleep(min(KEYWORD_STATS_POLL_SECONDS, remaining))
+        stats = await run_in_threadpool(keyword_queue.stats)
+    return stats
+
+
+def _not_modified(request: Request):
+    return Response(status_code=304, headers={"ETag": request.headers.get('if-none-match')})
+
+
 @router.get('/files', response_model=List[str])
-async def list_keyword_files():
-    direc, _ = _get_paths()
-    if not os.path.isdir(direc):
-        return []
-    return [fn for fn in os.listdir(direc) if fn.endswith('.txt') and not fn.startswith('.')]
+async def list_keyword_files(request: Request, response: Response, wait: float = Query(0, ge=0, le=KEYWORD_STATS_MAX_WAIT)):
+    """已登记的关键词文件（来自 keyword_files 表，不再遍历目录）"""
+    stats = await _changed_keyword_stats(request, wait)
+    if stats is None:
+        return _not_modified(request)
+    response.headers["ETag"] = _keywords_etag(stats["version"])
+    return await run_in_threadpool(keyword_queue.list_files)
 
 
 @router.get('/keywords/stats')
-async def keyword_counts():
-    """返回总关键词数量和已完成数量"""
-    direc, finished_fn = _get_paths()
-    total = 0
-    finished = 0
-    if os.path.isdir(direc):
-        for fn in os.listdir(direc):
-            if fn.endswith('.txt') and not fn.startswith('.') and not fn.startswith('.processed'):
-                try:
-                    with open(os.path.join(direc, fn), 'r', encoding='utf-8') as f:
-                        total += sum(1 for line in f if line.strip())
-                except Exception:
-                    pass
-    if os.path.isfile(finished_fn):
-        try:
-            with open(finished_fn, 'r', encoding='utf-8') as f:
-                finished = sum(1 for line in f if line.strip())
-        except Exception:
-            pass
-    return {"total": total, "finished": finished}
+async def keyword_counts(request: Request, response: Response, wait: float = Query(0, ge=0, le=KEYWORD_STATS_MAX_WAIT)):
+    """返回总关键词数量和已完成数量（读计数表，O(1)），并附带各状态数量和版本号"""
+    stats = await _changed_keyword_stats(request, wait)
+    if stats is None:
+        return _not_modified(request)
+    response.headers["ETag"] = _keywords_etag(stats["version"])
+    return stats
 
 
 @router.get('/stats')
@@ -113,10 +133,14 @@ async def stats():
 async def delete_file(filename: str):
     direc, _ = _get_paths()
     path = os.path.join(direc, filename)
-    if not os.path.isfile(path):
+    registered = filename in keyword_queue.registered_files()
+    if not os.path.isfile(path) and not registered:
         raise HTTPException(status_code=404, detail="file not found")
     try:
-        os.remove(path)
-        return {"deleted": filename}
+        if os.path.isfile(path):
+            os.remove(path)
+        # 注销文件并撤下其中还没开始搜索的关键词，计数随之更新
+        removed = keyword_queue.forget_file(filename)
+        return {"deleted": filename, "removed_keywords": removed}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
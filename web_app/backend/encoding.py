@@ -0,0 +1,60 @@
+"""响应编码：orjson 序列化、NDJSON 流和 br/gzip 压缩。
+
+- FastJSONResponse 直接用 stock.payload_cache.dumps_payload 序列化（安装了 orjson 时走 orjson），
+  路由直接返回它可以绕过 FastAPI 默认的 jsonable_encoder 逐层遍历。
+- ndjson_response 把一组可迭代的对象逐行序列化为 application/x-ndjson 流，前端可边收边渲染。
+- CompressionMiddleware 对普通响应做压缩（安装 brotli-asgi 时优先 br，否则 gzip），
+  SSE 和 NDJSON 这类流式响应原样逐块发送，避免被压缩缓冲拖住。
+"""
+
+from typing import Iterable
+
+from fastapi.responses import Response, StreamingResponse
+from starlette.middleware.gzip import GZipMiddleware
+
+from stock.payload_cache import dumps_payload
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+# 小于该字节数的响应不压缩
+COMPRESSION_MINIMUM_SIZE = 1024
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps_payload(content)
+
+
+def ndjson_response(items: Iterable, headers=None) -> StreamingResponse:
+    def lines():
+        for item in items:
+            yield dumps_payload(item) + b"\n"
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+
+def _is_streaming_request(scope) -> bool:
+    path = scope.get("path", "")
+    query = scope.get("query_string", b"")
+    return path.endswith("/stream") or b"format=ndjson" in query
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        if BrotliMiddleware is not None:
+            self.compressed_app = BrotliMiddleware(app, minimum_size=minimum_size, gzip_fallback=True)
+        else:
+            self.compressed_app = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and not _is_streaming_request(scope):
+            await self.compressed_app(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
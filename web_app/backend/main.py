@@ -1,16 +1,29 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from .api import config, graph, qxb, stock, tasks, tyc
+from .api import config, graph, macd, qxb, stock, tasks, tyc
+from .encoding import CompressionMiddleware, FastJSONResponse
 from .services.background_tasks import start_background_tasks
+from .services.macd_push_service import macd_stream_service
+from stock.company_mapping import migrate_company_mapping
+from stock.directory import stock_directory_service
 import os
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # 启动后台爬虫监控线程
 @app.on_event("startup")
 async def startup_event():
     start_background_tasks()
+    # 从 stock.db 加载股票目录，缺失或过期时后台刷新
+    stock_directory_service.warm()
+    # 股票公司映射表的建表/补列只在启动时做一次，请求路径直接查表
+    migrate_company_mapping()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await macd_stream_service.stop()
 
 # CORS - allow frontend dev server or any origin in production
 app.add_middleware(
@@ -21,6 +34,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 大体积的图谱/行情 JSON 压缩传输；SSE 与 NDJSON 流不压缩
+app.add_middleware(CompressionMiddleware)
+
 # mount routers
 app.include_router(tasks.router)
 app.include_router(tyc.router)
@@ -28,6 +44,7 @@ app.include_router(config.router)
 app.include_router(qxb.router)
 app.include_router(graph.router, prefix="/api/graph", tags=["graph"])
 app.include_router(stock.router, prefix="/api/stock", tags=["stock"])
+app.include_router(macd.router, prefix="/api/macd", tags=["macd"])
 
 # serve built frontend if exists
 frontend_dist = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'frontend', 'dist'))
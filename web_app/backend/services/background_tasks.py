@@ -12,71 +12,17 @@ if root_dir not in sys.path:
 
 from base_spider import ThreadSafeUniqueQueue
 from tyc.spider import TYCSpider
+from tyc.keyword_queue import start_keyword_pipeline
 
 # 全局队列
 tyc_id_collect_queue = ThreadSafeUniqueQueue()
 
 
-def _tyc_kw_watcher(poll_interval=10):
+def _tyc_kw_pipeline():
     time.sleep(5)  # 延迟启动，避免阻塞 FastAPI 主循环
-    watcher_spider = TYCSpider(tyc_id_collect_queue)
-    kw_dir_rel = watcher_spider.s_cfg.get("keywords_direc", "./data/tyc_keywords/")
-    kw_dir = os.path.abspath(os.path.join(root_dir, kw_dir_rel))
-    os.makedirs(kw_dir, exist_ok=True)
-
-    finished_file = watcher_spider.s_cfg.get("keywords_finised_fn", os.path.join(kw_dir, "keywords_finished.txt"))
-    if not os.path.exists(finished_file):
-        open(finished_file, 'a', encoding='utf-8').close()
-
-    def _load_finished():
-        try:
-            with open(finished_file, 'r', encoding='utf-8') as f:
-                return set([l.strip() for l in f if l.strip()])
-        except Exception:
-            return set()
-
-    while True:
-        finished = _load_finished()
-        for fn in os.listdir(kw_dir):
-            if fn == os.path.basename(finished_file):
-                continue
-            if fn.startswith('.'): # 避开重命名为.processed开头，也避开.finished开头
-                continue
-            path = os.path.join(kw_dir, fn)
-            if not os.path.isfile(path):
-                continue
-
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    kws = [ln.strip() for ln in f if ln.strip()]
-            except Exception:
-                watcher_spider.logger.exception(f"读取关键词文件失败: {path}")
-                continue
-
-            for kw in kws:
-                if kw in finished:
-                    continue
-
-                try:
-                    # 假设 search_companies 是用来处理关键字查询的
-                    result = watcher_spider.search_companies(kw, max_page=2, save_to_file=True)
-
-                    with open(finished_file, 'a', encoding='utf-8') as ff:
-                        ff.write(kw + '\n')
-                    finished.add(kw)
-                except Exception:
-                    watcher_spider.logger.exception(f"Watcher 搜索失败: {kw}")
-
-            # 尝试将已处理的文件重命名，避免再次扫描同一上传文件
-            try:
-                processed_fn = ".processed_" + fn
-                processed_path = os.path.join(kw_dir, processed_fn)
-                if not os.path.exists(processed_path):
-                    os.rename(path, processed_path)
-            except Exception:
-                watcher_spider.logger.debug(f"无法重命名文件: {path}")
-            
-        time.sleep(poll_interval)
+    # 上传接口直接写入关键词队列并唤醒搜索线程；目录扫描只兜底处理手工拷入的文件
+    s_cfg = TYCSpider(tyc_id_collect_queue).s_cfg
+    start_keyword_pipeline(lambda: TYCSpider(tyc_id_collect_queue), s_cfg)
 
 
 def _tyc_id_watcher(poll_interval=60):
@@ -108,9 +54,9 @@ def _tyc_id_watcher(poll_interval=60):
 
 
 def start_background_tasks():
-    kw_thread = threading.Thread(target=_tyc_kw_watcher, args=(10,), daemon=True)
+    kw_thread = threading.Thread(target=_tyc_kw_pipeline, daemon=True)
     kw_thread.start()
-    print("✅ 关键词监控已启动（后台线程）")
+    print("✅ 关键词队列已启动（后台线程）")
 
     id_thread = threading.Thread(target=_tyc_id_watcher, args=(10,), daemon=True)
     id_thread.start()
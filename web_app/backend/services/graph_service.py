@@ -4,60 +4,42 @@ import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))))
 
 from neo4j_utils import Neo4jManager
-from stock.directory import normalize_company_name
+from stock.company_mapping import lookup_company_mapping, remember_company_mapping, resolve_company
 
 neo4j_mgr = Neo4jManager()
 
+# NDJSON 流式返回子图时每行携带的节点/关系数
+GRAPH_STREAM_CHUNK_SIZE = 500
 
-def find_company_by_stock(stock_info):
-    candidate_names = []
-    for value in [stock_info.get("full_name"), stock_info.get("name")]:
-        cleaned = str(value).strip() if value else ""
-        if cleaned and cleaned not in candidate_names:
-            candidate_names.append(cleaned)
-
-    exact_query = """
-    MATCH (c:Company)
-    WHERE c.name IN $candidate_names
-    RETURN c.id AS id, c.name AS name
-    LIMIT 5
-    """
-    exact_matches = neo4j_mgr.graph.run(exact_query, candidate_names=candidate_names).data()
-    if exact_matches:
-        exact_matches.sort(key=lambda item: len(str(item.get("name", ""))))
-        return exact_matches[0]
-
-    contains_query = """
-    MATCH (c:Company)
-    WHERE ANY(name IN $candidate_names WHERE c.name CONTAINS name)
-    RETURN c.id AS id, c.name AS name
-    LIMIT 20
-    """
-    contains_matches = neo4j_mgr.graph.run(contains_query, candidate_names=candidate_names).data()
-    if not contains_matches:
-        return None
-
-    normalized_targets = {normalize_company_name(name) for name in candidate_names if name}
-    normalized_exact = [
-        row for row in contains_matches
-        if normalize_company_name(row.get("name")) in normalized_targets
-    ]
-    if normalized_exact:
-        normalized_exact.sort(key=lambda item: len(str(item.get("name", ""))))
-        return normalized_exact[0]
 
-    if stock_info.get("full_name"):
-        full_name = str(stock_info["full_name"]).strip()
-        full_name_matches = [row for row in contains_matches if full_name in str(row.get("name", ""))]
-        if len(full_name_matches) == 1:
-            return full_name_matches[0]
+def find_company_by_stock(stock_info):
+    """优先查预计算的 stock_company_map，只有表中没有（或股票已改名）时才实时查询图谱并写回。"""
+    found, company = lookup_company_mapping(stock_info)
+    if found:
+        return company
+    company, match_type = resolve_company(neo4j_mgr.graph, stock_info)
+    remember_company_mapping(stock_info, company, match_type)
+    return company
+
+
+def _format_node(node):
+    node_id = dict(node).get("id")
+    labels = list(node.labels)
+    return {
+        "id": str(node_id),
+        "label": dict(node).get("name", str(node_id)),
+        "type": labels[0] if labels else "Unknown",
+        "properties": dict(node),
+    }
 
-    short_name = str(stock_info.get("name") or "").strip()
-    short_name_matches = [row for row in contains_matches if short_name and short_name in str(row.get("name", ""))]
-    if len(short_name_matches) == 1:
-        return short_name_matches[0]
 
-    return None
+def _format_edge(rel):
+    return {
+        "source": str(dict(rel.start_node).get("id")),
+        "target": str(dict(rel.end_node).get("id")),
+        "label": type(rel).__name__,
+        "properties": dict(rel),
+    }
 
 
 def format_neo4j_data_to_graph(records):
@@ -68,23 +50,10 @@ def format_neo4j_data_to_graph(records):
         for node in record["nodes"]:
             node_id = dict(node).get("id")
             if node_id not in nodes_map:
-                labels = list(node.labels)
-                nodes_map[node_id] = {
-                    "id": str(node_id),
-                    "label": dict(node).get("name", str(node_id)),
-                    "type": labels[0] if labels else "Unknown",
-                    "properties": dict(node),
-                }
+                nodes_map[node_id] = _format_node(node)
 
         for rel in record["links"]:
-            edges.append(
-                {
-                    "source": str(dict(rel.start_node).get("id")),
-                    "target": str(dict(rel.end_node).get("id")),
-                    "label": type(rel).__name__,
-                    "properties": dict(rel),
-                }
-            )
+            edges.append(_format_edge(rel))
 
     unique_edges = []
     seen_edges = set()
@@ -122,6 +91,49 @@ def get_company_graph(company_id: str, hops: int = 2):
     return format_neo4j_data_to_graph(result)
 
 
+def iter_company_graph_chunks(company_id: str, hops: int = 2, chunk_size: int = GRAPH_STREAM_CHUNK_SIZE):
+    """按 NDJSON 行流式给出子图：首行 type=meta，随后边读 Cypher 游标边分批给出节点、关系，
+    末行 type=end 带节点和关系总数。关系所引用的节点总在它之前或同一批次之前给出。"""
+    bounded_hops = max(1, min(hops, 2))
+    query = f"""
+    MATCH path = (c {{id: $company_id}})-[*1..{bounded_hops}]-(m)
+    UNWIND relationships(path) AS r
+    WITH DISTINCT r
+    RETURN startNode(r) AS source, endNode(r) AS target, r AS rel
+    """
+    yield {"type": "meta", "company_id": company_id}
+    seen_nodes, seen_edges = set(), set()
+    nodes, edges = [], []
+    node_count = edge_count = 0
+    for record in neo4j_mgr.graph.run(query, company_id=company_id):
+        for node in (record["source"], record["target"]):
+            node_id = dict(node).get("id")
+            if node_id not in seen_nodes:
+                seen_nodes.add(node_id)
+                nodes.append(_format_node(node))
+        edge = _format_edge(record["rel"])
+        edge_id = f"{edge['source']}-{edge['label']}-{edge['target']}"
+        if edge_id not in seen_edges:
+            seen_edges.add(edge_id)
+            edges.append(edge)
+        if len(nodes) >= chunk_size or len(edges) >= chunk_size:
+            if nodes:
+                node_count += len(nodes)
+                yield {"type": "nodes", "items": nodes}
+                nodes = []
+            if len(edges) >= chunk_size:
+                edge_count += len(edges)
+                yield {"type": "edges", "items": edges}
+                edges = []
+    if nodes:
+        node_count += len(nodes)
+        yield {"type": "nodes", "items": nodes}
+    if edges:
+        edge_count += len(edges)
+        yield {"type": "edges", "items": edges}
+    yield {"type": "end", "node_count": node_count, "edge_count": edge_count}
+
+
 def get_example_companies(limit: int = 10):
     query = "MATCH (c:Company) RETURN c.id AS id, c.name AS name LIMIT $limit"
     return neo4j_mgr.graph.run(query, limit=limit).data()
\ No newline at end of file
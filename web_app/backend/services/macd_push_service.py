@@ -0,0 +1,94 @@
+import asyncio
+import gc
+from typing import Callable, Optional
+
+from stock.macd_stream import (
+    FETCH_CONCURRENCY,
+    STREAM_CADENCE_SECONDS,
+    EventHub,
+    QuoteClient,
+    TickPipeline,
+    build_pipeline,
+    load_allowed_board_codes,
+)
+
+# 全局事件中心：所有 SSE / WebSocket 连接都从这里订阅
+macd_event_hub = EventHub()
+
+
+class MACDStreamService:
+    """在 FastAPI 事件循环内运行日内 MACD 流水线，事件实时发布到 macd_event_hub。
+
+    流水线每批行情处理完就让出事件循环，推送延迟与请求延迟见 test_macd_stream_latency.py；
+    放到独立线程或子进程里反而多一次跨线程/跨进程交接，单核上两者都更慢。
+    """
+
+    def __init__(self, hub: EventHub):
+        self.hub = hub
+        self._pipeline: Optional[TickPipeline] = None
+        self._task: Optional[asyncio.Task] = None
+        self._error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(
+        self,
+        stocks: list[str],
+        allowed_boards: bool = False,
+        cadence: float = STREAM_CADENCE_SECONDS,
+        concurrency: int = FETCH_CONCURRENCY,
+        write_files: bool = True,
+        client_factory: Callable[[], QuoteClient] = QuoteClient,
+        session_check: bool = True,
+    ) -> dict:
+        if self.running:
+            raise ValueError("MACD 监控已在运行")
+        codes = await asyncio.to_thread(load_allowed_board_codes) if allowed_boards else list(stocks)
+        if not codes:
+            raise ValueError("未指定监控股票")
+        self._pipeline = await asyncio.to_thread(
+            build_pipeline,
+            codes,
+            cadence=cadence,
+            concurrency=concurrency,
+            file_format="csv" if write_files else None,
+            write_sqlite=write_files,
+            hub=self.hub,
+            client_factory=client_factory,
+            session_check=session_check,
+        )
+        # Web 进程常驻对象多（股票目录、行情缓存等），一次全量 GC 要扫几十毫秒，推送会整段卡住；
+        # 开始推送前把已有对象移出回收范围，之后的全量回收只扫描新产生的对象
+        gc.freeze()
+        self._error = None
+        self._task = asyncio.create_task(self._run(self._pipeline))
+        return self.status()
+
+    async def _run(self, pipeline: TickPipeline) -> None:
+        try:
+            await pipeline.run()
+        except Exception as exc:
+            self._error = str(exc)
+
+    async def stop(self) -> dict:
+        if self.running:
+            self._pipeline.stop()
+            await self._task
+        return self.status()
+
+    def status(self) -> dict:
+        pipeline = self._pipeline
+        return {
+            "running": self.running,
+            "code_count": len(pipeline.codes) if pipeline else 0,
+            "cycles": pipeline.stats.cycles if pipeline else 0,
+            "seq": self.hub.seq,
+            "subscribers": len(self.hub.subscribers),
+            "dropped_subscribers": self.hub.dropped,
+            "error": self._error,
+        }
+
+
+macd_stream_service = MACDStreamService(macd_event_hub)
@@ -1,7 +1,20 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from fastapi.encoders import jsonable_encoder
+
 from .graph_service import find_company_by_stock, get_company_graph
 from stock.directory import stock_directory_service
+from stock.payload_cache import dumps_payload
 from stock.sync_market_data import StockMarketDataReader
 
+# 详情接口里图谱和行情两部分互不依赖，并发执行；各自超时后返回部分结果并附带提示
+DETAIL_GRAPH_TIMEOUT_SECONDS = 5.0
+DETAIL_MARKET_TIMEOUT_SECONDS = 3.0
+DETAIL_WORKERS = 8
+
+_detail_executor = ThreadPoolExecutor(max_workers=DETAIL_WORKERS, thread_name_prefix="stock-detail")
+
 
 def lookup_stock_info(query_type: str, keyword: str):
     return stock_directory_service.lookup(query_type=query_type, keyword=keyword)
@@ -31,6 +44,11 @@ def build_stock_graph_payload(stock_info):
     }
 
 
+def get_stock_search_payload(keyword: str, limit: int):
+    items = stock_directory_service.search(keyword, limit=limit)
+    return {"query": keyword, "count": len(items), "items": items}
+
+
 def get_stock_lookup_payload(query_type: str, keyword: str):
     stock_info = lookup_stock_info(query_type=query_type, keyword=keyword)
     return {
@@ -55,22 +73,83 @@ def get_stock_graph_payload(query_type: str, keyword: str):
     return build_stock_graph_payload(stock_info)
 
 
-def get_stock_detail_payload(query_type: str, keyword: str):
+def _empty_graph_payload(stock_info, message):
+    return {
+        "matched": True,
+        "has_data": False,
+        "message": message,
+        "stock": stock_info,
+        "company": None,
+        "graph": {"nodes": [], "edges": []},
+    }
+
+
+def _timed(operation, *args):
+    started = time.perf_counter()
+    result = operation(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def _fan_out_detail(stock_info, market_builder):
+    """并发构建图谱和行情；返回 (各部分结果, 各部分耗时毫秒, 提示)，超时或失败的部分不在结果里。"""
+    started = time.perf_counter()
+    parts = {
+        "graph": (_detail_executor.submit(_timed, build_stock_graph_payload, stock_info), DETAIL_GRAPH_TIMEOUT_SECONDS),
+        "market": (_detail_executor.submit(_timed, market_builder, stock_info), DETAIL_MARKET_TIMEOUT_SECONDS),
+    }
+    results, timings, warnings = {}, {}, []
+    # 两部分同时开始，超时从同一起点计算，按截止时间先后等待
+    for name, (future, timeout) in sorted(parts.items(), key=lambda item: item[1][1]):
+        remaining = max(0.0, timeout - (time.perf_counter() - started))
+        try:
+            results[name], timings[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            # 还在排队的任务直接取消，不再占用线程池；已在运行的只能等它自己结束
+            future.cancel()
+            timings[name] = (time.perf_counter() - started) * 1000
+            warnings.append(f"{name} 超过 {timeout:g}s 未返回，已跳过")
+        except Exception as exc:
+            timings[name] = (time.perf_counter() - started) * 1000
+            warnings.append(f"{name} 加载失败: {exc}")
+    return results, timings, warnings
+
+
+def _unmatched_detail_payload():
+    return {
+        "matched": False,
+        "message": "未找到匹配的A股公司",
+        "stock": None,
+        "company": None,
+        "has_data": False,
+        "graph": {"nodes": [], "edges": []},
+        "market": StockMarketDataReader.get_empty_payload(),
+        "warnings": [],
+    }
+
+
+def _timed_lookup(query_type: str, keyword: str):
+    started = time.perf_counter()
     stock_info = lookup_stock_info(query_type=query_type, keyword=keyword)
+    return stock_info, (time.perf_counter() - started) * 1000
+
+
+def get_stock_detail_json(query_type: str, keyword: str, layout: str = "rows"):
+    """股票详情：图谱载荷加上 market 字段，直接拼接缓存中的市场载荷 JSON 字节，避免反序列化再序列化。
+
+    layout="columnar" 时市场序列按字段给出数组。返回 (JSON 字节, 各阶段耗时毫秒)，耗时用于 Server-Timing 响应头。
+    """
+    stock_info, lookup_ms = _timed_lookup(query_type, keyword)
     if not stock_info:
-        return {
-            "matched": False,
-            "message": "未找到匹配的A股公司",
-            "stock": None,
-            "company": None,
-            "has_data": False,
-            "graph": {"nodes": [], "edges": []},
-            "market": StockMarketDataReader.get_empty_payload(),
-        }
+        return dumps_payload(_unmatched_detail_payload()), {"lookup": lookup_ms}
 
-    graph_payload = build_stock_graph_payload(stock_info)
-    market_payload = StockMarketDataReader.build_stock_market_payload(stock_info)
-    return {
-        **graph_payload,
-        "market": market_payload,
-    }
\ No newline at end of file
+    results, timings, warnings = _fan_out_detail(
+        stock_info, lambda info: StockMarketDataReader.build_stock_market_payload_json(info, layout=layout)
+    )
+    graph_payload = results.get("graph") or _empty_graph_payload(stock_info, "图谱数据暂时不可用")
+    market_json = results.get("market") or dumps_payload(StockMarketDataReader.get_empty_payload())
+
+    started = time.perf_counter()
+    # 图谱属性可能含 Neo4j 的日期等类型，先按 FastAPI 默认规则转成 JSON 兼容结构
+    head = dumps_payload(jsonable_encoder({**graph_payload, "warnings": warnings}))
+    body = head[:-1] + b',"market":' + market_json + b"}"
+    return body, {"lookup": lookup_ms, **timings, "encode": (time.perf_counter() - started) * 1000}
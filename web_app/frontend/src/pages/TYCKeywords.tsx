@@ -46,7 +46,33 @@ export default function TYCKeywords(){
     }
   }
 
-  useEffect(()=>{refresh();},[]);
+  // 长轮询：带上次的 ETag 请求统计，计数没有变化时后端挂起直到超时返回 304，变化后才重新渲染
+  useEffect(()=>{
+    let active = true;
+    let etag: string | null = null;
+    const poll = async ()=>{
+      while(active){
+        try{
+          const statsResp = await axios.get('/api/tyc/keywords/stats', {
+            params: etag ? {wait: 25} : {},
+            headers: etag ? {'If-None-Match': etag} : {},
+            validateStatus: status => status === 200 || status === 304,
+          });
+          if(!active || statsResp.status === 304) continue;
+          etag = statsResp.headers['etag'] || null;
+          setKwStats(statsResp.data);
+          const resp = await axios.get('/api/tyc/files');
+          setFiles(resp.data);
+          if(!etag) await new Promise(resolve => setTimeout(resolve, 5000));
+        }catch(e){
+          console.error(e);
+          await new Promise(resolve => setTimeout(resolve, 5000));
+        }
+      }
+    }
+    poll();
+    return ()=>{ active = false; };
+  },[]);
 
   return (
     <div className={styles.container}>